@@ -11,6 +11,8 @@ __all__ = (
 
     'configparser',
 
+    'queue',
+
     'urlparse',
     'url_quote',
     'url_quote_plus',
@@ -36,6 +38,11 @@ try:
 except ImportError:
     import configparser
 
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
 try:
     from urllib import parse as urlparse
     url_quote = urlparse.quote
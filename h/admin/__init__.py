@@ -3,6 +3,7 @@
 
 def includeme(config):
     config.register_service_factory('.services.user.rename_user_factory', name='rename_user')
+    config.register_service_factory('.services.user.delete_user_factory', name='delete_user')
 
     config.include('.views')
 
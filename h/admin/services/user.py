@@ -2,14 +2,25 @@
 
 from __future__ import unicode_literals
 
+import datetime
+
+import sqlalchemy as sa
+
 from h import models
 from memex.search import index
 
+#: The number of annotations updated or deleted in each transaction.
+BATCH_SIZE = 1000
+
 
 class UserRenameError(Exception):
     pass
 
 
+class UserDeletionError(Exception):
+    pass
+
+
 class RenameUserService(object):
     """
     Renames a user and updates all its annotations.
@@ -21,12 +32,17 @@ class RenameUserService(object):
     list of annotation ids, it is then the function's responsibility to reindex
     these annotations in the search index.
 
+    Annotations are updated in batches and ``reindex`` is called once for each
+    batch. The progress of the rename is recorded in a :py:class:`h.models.Job`,
+    either the one with the given ``job_id`` or a new one.
+
     May raise a ValueError if the new username does not validate or
     UserRenameError if the new username is already taken by another account.
     """
-    def __init__(self, session, reindex):
+    def __init__(self, session, reindex, batch_size=BATCH_SIZE):
         self.session = session
         self.reindex = reindex
+        self.batch_size = batch_size
 
     def check(self, new_username):
         existing_user = models.User.get_by_username(self.session, new_username)
@@ -35,32 +51,152 @@ class RenameUserService(object):
 
         return True
 
-    def rename(self, user, new_username):
+    def rename(self, user, new_username, job_id=None):
         self.check(new_username)
 
         old_userid = user.userid
+        job_id = _start_job(self.session, job_id, 'rename_user', old_userid)
 
         user.username = new_username
         new_userid = user.userid
+        self.session.flush()
 
-        ids = self._change_annotations(old_userid, new_userid)
+        for ids in self._change_annotations(old_userid, new_userid):
+            _job(self.session, job_id).processed += len(ids)
+            self.reindex(ids)
 
-        self.reindex(ids)
+        _job(self.session, job_id).status = models.Job.DONE
 
     def _change_annotations(self, old_userid, new_userid):
-        annotations = self._fetch_annotations(old_userid)
+        """
+        Update the userid of annotations in batches, yielding their ids.
+
+        The annotations' updated time is bumped too, as their presentations
+        are cached by it (see :py:mod:`memex.presentation`).
+        """
+        table = models.Annotation.__table__
+        batch = (sa.select([table.c.id])
+                 .where(table.c.userid == old_userid)
+                 .limit(self.batch_size))
+        stmt = (table.update()
+                .where(table.c.id.in_(batch))
+                .values(userid=new_userid,
+                        updated=datetime.datetime.utcnow())
+                .returning(table.c.id))
+
+        return _run_in_batches(self.session, stmt)
+
+
+class DeleteUserService(object):
+    """
+    Deletes a user with all their group memberships and annotations.
+
+    It accepts a ``delete_from_index`` function that gets a list of annotation
+    ids, it is then the function's responsibility to remove these annotations
+    from the search index. The counts of the annotations of the URIs the user
+    had annotated are refreshed with the given ``annotation_counts`` service
+    once the annotations are deleted.
+
+    Annotations are deleted in batches and ``delete_from_index`` is called once
+    for each batch. The progress of the deletion is recorded in a
+    :py:class:`h.models.Job`, either the one with the given ``job_id`` or a new
+    one.
+
+    May raise UserDeletionError if the user cannot be deleted.
+    """
+    def __init__(self, session, delete_from_index, annotation_counts,
+                 batch_size=BATCH_SIZE):
+        self.session = session
+        self.delete_from_index = delete_from_index
+        self.annotation_counts = annotation_counts
+        self.batch_size = batch_size
+
+    def check(self, user):
+        if models.Group.created_by(self.session, user).count() > 0:
+            raise UserDeletionError('Cannot delete user who is a group creator.')
+
+        return True
+
+    def delete(self, user, job_id=None):
+        self.check(user)
+
+        user_id = user.id
+        userid = user.userid
+        job_id = _start_job(self.session, job_id, 'delete_user', userid)
+        uris = self._annotated_uris(userid)
+
+        for ids in self._delete_annotations(userid):
+            _job(self.session, job_id).processed += len(ids)
+            self.delete_from_index(ids)
+
+        user = self.session.query(models.User).get(user_id)
+        user.groups = []
+        self.session.delete(user)
+        self.annotation_counts.refresh(uris)
+
+        _job(self.session, job_id).status = models.Job.DONE
+
+    def _annotated_uris(self, userid):
+        """Return the normalized URIs of the user's shared annotations."""
+        uris = (self.session.query(models.Annotation.target_uri_normalized)
+                .filter(models.Annotation.userid == userid,
+                        models.Annotation.shared.is_(True))
+                .distinct())
+        return [u for u, in uris]
 
-        ids = set()
-        for annotation in annotations:
-            annotation.userid = new_userid
-            ids.add(annotation.id)
+    def _delete_annotations(self, userid):
+        """Delete the user's annotations in batches, yielding their ids."""
+        table = models.Annotation.__table__
+        batch = (sa.select([table.c.id])
+                 .where(table.c.userid == userid)
+                 .limit(self.batch_size))
+        stmt = (table.delete()
+                .where(table.c.id.in_(batch))
+                .returning(table.c.id))
 
-        return ids
+        return _run_in_batches(self.session, stmt)
 
-    def _fetch_annotations(self, userid):
-        return (self.session.query(models.Annotation)
-                .filter(models.Annotation.userid == userid)
-                .yield_per(100))
+
+def _start_job(session, job_id, type_, userid):
+    """
+    Mark the job with the id ``job_id`` as running, creating it if it's None.
+
+    Returns the id of the job. As the session is closed whenever the batches
+    are committed, the job is looked up again by its id (see :py:func:`_job`)
+    each time it is updated.
+    """
+    if job_id is None:
+        job = models.Job(type=type_, userid=userid)
+        session.add(job)
+    else:
+        job = _job(session, job_id)
+
+    job.status = models.Job.RUNNING
+    job.total = (session.query(models.Annotation)
+                 .filter(models.Annotation.userid == userid)
+                 .count())
+    job.processed = 0
+    session.flush()
+    return job.id
+
+
+def _job(session, job_id):
+    return session.query(models.Job).get(job_id)
+
+
+def _run_in_batches(session, stmt):
+    """
+    Execute ``stmt`` repeatedly, yielding the set of ids it returns each time.
+
+    ``stmt`` must return fewer rows each time it is executed, eventually
+    returning none, for example by updating a batch of the rows it matches so
+    that they no longer match.
+    """
+    while True:
+        ids = {row.id for row in session.execute(stmt)}
+        if not ids:
+            return
+        yield ids
 
 
 def make_indexer(request):
@@ -74,7 +210,26 @@ def make_indexer(request):
     return _reindex
 
 
+def make_deleter(request):
+    def _delete(ids):
+        if not ids:
+            return
+
+        request.tm.commit()
+        deleter = index.BatchDeleter(request.db, request.es)
+        deleter.delete(ids)
+    return _delete
+
+
 def rename_user_factory(context, request):
     """Return a RenameUserService instance for the passed context and request."""
     return RenameUserService(session=request.db,
                              reindex=make_indexer(request))
+
+
+def delete_user_factory(context, request):
+    """Return a DeleteUserService instance for the passed context and request."""
+    return DeleteUserService(
+        session=request.db,
+        delete_from_index=make_deleter(request),
+        annotation_counts=request.find_service(name='annotation_counts'))
@@ -1,6 +1,5 @@
 # -*- coding: utf-8 -*-
 
-from elasticsearch import helpers as es_helpers
 import jinja2
 from pyramid import httpexceptions
 from pyramid.view import view_config
@@ -8,15 +7,11 @@ from pyramid.view import view_config
 from h import models
 from h.accounts.events import ActivationEvent
 from h.admin import worker
+from h.admin.services.user import UserDeletionError
 from h.admin.services.user import UserRenameError
-from memex import storage
 from h.i18n import TranslationString as _
 
 
-class UserDeletionError(Exception):
-    pass
-
-
 class UserNotFoundError(Exception):
     pass
 
@@ -39,7 +34,12 @@ def users_index(request):
         n_annots = _all_user_annotations(request, user).count()
         user_meta['annotations_count'] = n_annots
 
-    return {'username': username, 'user': user, 'user_meta': user_meta}
+    jobs = models.Job.recent(request.db)
+
+    return {'username': username,
+            'user': user,
+            'user_meta': user_meta,
+            'jobs': jobs}
 
 
 @view_config(route_name='admin_users_activate',
@@ -75,7 +75,9 @@ def users_rename(request):
         svc = request.find_service(name='rename_user')
         svc.check(new_username)
 
-        worker.rename_user.delay(user.id, new_username)
+        job_id = _queue_job(request, 'rename_user', user.userid)
+        _delay_after_commit(request, worker.rename_user,
+                            user.id, new_username, job_id)
 
         request.session.flash(
             'The user "%s" will be renamed to "%s" in the backgroud. Refresh this page to see if it\'s already done' %
@@ -99,9 +101,15 @@ def users_delete(request):
     user = _form_request_user(request)
 
     try:
-        delete_user(request, user)
+        svc = request.find_service(name='delete_user')
+        svc.check(user)
+
+        job_id = _queue_job(request, 'delete_user', user.userid)
+        _delay_after_commit(request, worker.delete_user, user.id, job_id)
+
         request.session.flash(
-            'Successfully deleted user %s' % user.username, 'success')
+            'The user "%s" will be deleted in the background. Refresh this '
+            'page to follow its progress' % user.username, 'success')
     except UserDeletionError as e:
         request.session.flash(str(e), 'error')
 
@@ -115,41 +123,31 @@ def user_not_found(exc, request):
     return httpexceptions.HTTPFound(location=request.route_path('admin_users'))
 
 
-def delete_user(request, user):
-    """
-    Deletes a user with all their group memberships and annotations.
-
-    Raises UserDeletionError when deletion fails with the appropriate error
-    message.
-    """
-
-    if models.Group.created_by(request.db, user).count() > 0:
-        raise UserDeletionError('Cannot delete user who is a group creator.')
-
-    user.groups = []
-
-    query = _all_user_annotations_query(request, user)
-    annotations = es_helpers.scan(client=request.es.conn, query={'query': query})
-    for annotation in annotations:
-        storage.delete_annotation(request.db, annotation['_id'])
+def _all_user_annotations(request, user):
+    return (request.db.query(models.Annotation)
+            .filter(models.Annotation.userid == user.userid)
+            .yield_per(100))
 
-    request.db.delete(user)
 
+def _queue_job(request, type_, userid):
+    """Record a queued job of the given type for the user, returning its id."""
+    job = models.Job(type=type_, userid=userid, status=models.Job.QUEUED)
+    request.db.add(job)
+    request.db.flush()
+    return job.id
 
-def _all_user_annotations_query(request, user):
-    """Query matching all annotations (shared and private) owned by user."""
-    return {
-        'filtered': {
-            'filter': {'term': {'user': user.userid.lower()}},
-            'query': {'match_all': {}}
-        }
-    }
 
+def _delay_after_commit(request, task, *args):
+    """
+    Queue the Celery ``task`` once the request's transaction has committed.
 
-def _all_user_annotations(request, user):
-    return (request.db.query(models.Annotation)
-            .filter(models.Annotation.userid == user.userid)
-            .yield_per(100))
+    The task looks up the job queued by the request, so it mustn't start
+    before the job has been committed.
+    """
+    def _delay(success):
+        if success:
+            task.delay(*args)
+    request.tm.get().addAfterCommitHook(_delay)
 
 
 def _form_request_user(request):
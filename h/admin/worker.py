@@ -2,6 +2,8 @@
 
 from __future__ import unicode_literals
 
+import contextlib
+
 from h import models
 from h.celery import celery
 from h.celery import get_task_logger
@@ -11,10 +13,43 @@ log = get_task_logger(__name__)
 
 
 @celery.task
-def rename_user(user_id, new_username):
-    user = celery.request.db.query(models.User).get(user_id)
-    if user is None:
-        raise ValueError("Could not find user with id %d" % user_id)
+def rename_user(user_id, new_username, job_id=None):
+    with _recording_failure(job_id):
+        user = celery.request.db.query(models.User).get(user_id)
+        if user is None:
+            raise ValueError("Could not find user with id %d" % user_id)
+
+        svc = celery.request.find_service(name='rename_user')
+        svc.rename(user, new_username, job_id=job_id)
+
+
+@celery.task
+def delete_user(user_id, job_id=None):
+    with _recording_failure(job_id):
+        user = celery.request.db.query(models.User).get(user_id)
+        if user is None:
+            raise ValueError("Could not find user with id %d" % user_id)
+
+        svc = celery.request.find_service(name='delete_user')
+        svc.delete(user, job_id=job_id)
+
+
+@contextlib.contextmanager
+def _recording_failure(job_id):
+    """
+    Mark the job with the id ``job_id`` as failed if the block raises.
 
-    svc = celery.request.find_service(name='rename_user')
-    svc.rename(user, new_username)
+    The task's transaction is aborted when it fails, so the job's status is
+    committed in a transaction of its own.
+    """
+    try:
+        yield
+    except Exception:
+        if job_id is not None:
+            request = celery.request
+            request.tm.abort()
+            job = request.db.query(models.Job).get(job_id)
+            if job is not None:
+                job.status = models.Job.FAILED
+            request.tm.commit()
+        raise
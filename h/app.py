@@ -10,6 +10,7 @@ import transaction
 from pyramid.settings import asbool
 from pyramid.tweens import EXCVIEW
 
+from h import outbox
 from h.config import configure
 
 log = logging.getLogger(__name__)
@@ -40,10 +41,8 @@ def includeme(config):
 
     config.add_subscriber('h.subscribers.add_renderer_globals',
                           'pyramid.events.BeforeRender')
-    config.add_subscriber('h.subscribers.publish_annotation_event',
-                          'memex.events.AnnotationEvent')
-    config.add_subscriber('h.subscribers.send_reply_notifications',
-                          'memex.events.AnnotationEvent')
+    outbox.add_subscriber(config, 'h.subscribers.publish_annotation_event')
+    outbox.add_subscriber(config, 'h.subscribers.send_reply_notifications')
 
     config.add_tween('h.tweens.conditional_http_tween_factory', under=EXCVIEW)
     config.add_tween('h.tweens.redirect_tween_factory')
@@ -102,6 +101,13 @@ def includeme(config):
     # - we can override behaviour from `memex` if necessary.
     config.include('memex', route_prefix='/api')
 
+    # With the outbox enabled, annotation events are also written to the
+    # database by the request which makes the change (see `h.outbox`).
+    if outbox.enabled(config.registry.settings):
+        config.add_request_method('h.outbox.OutboxQueue',
+                                  name='notify_after_commit',
+                                  reify=True)
+
     # Core site modules
     config.include('h.assets')
     config.include('h.auth')
@@ -1,5 +1,14 @@
 # -*- coding: utf-8 -*-
 
+from h.badge import services
+
 
 def includeme(config):
+    # Keep the materialized annotation counts up to date.
+    config.add_subscriber('h.badge.subscribers.update_annotation_counts',
+                          'memex.events.AnnotationEvent')
+
+    config.register_service_factory(services.annotation_counts_factory,
+                                    name='annotation_counts')
+
     config.include('.views')
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+"""
+Materialized counts of the annotations of each document URI.
+
+Counting the annotations of a page with a search request is expensive, and
+the badge API does it for every page a browser extension user visits. The
+:py:class:`h.models.AnnotationCount` table instead holds the number of
+shared annotations of each normalized URI in each group, which the
+:py:class:`AnnotationCountService` keeps up to date as annotations are
+created, updated and deleted.
+
+Rather than applying increments and decrements, which would drift out of step
+with the annotation table if an event was ever lost or delivered twice, the
+service recounts every affected URI from Postgres. This is cheap (there is an
+index on the annotation table's normalized target URI) and idempotent, and
+the whole table can be rebuilt the same way with
+``hypothesis annotation-counts rebuild``.
+"""
+
+from __future__ import unicode_literals
+
+import sqlalchemy as sa
+
+from h.models import Annotation
+from h.models import AnnotationCount
+from h.nipsa.services import flagged_userids
+from memex import uri as uri_util
+
+#: The key in ``session.info`` under which we collect the normalized URIs that
+#: annotations were moved away from in the current session, so that their
+#: counts can be refreshed as well as those of the annotations' new URIs.
+CHANGED_URIS_KEY = 'h.badge.changed_annotation_uris'
+
+#: The groups whose annotations are counted as public.
+PUBLIC_GROUPS = ('__world__',)
+
+
+class AnnotationCountService(object):
+
+    """A service for reading and maintaining per-URI annotation counts."""
+
+    def __init__(self, session, uri_equivalence=None):
+        """
+        Create a new annotation count service.
+
+        :param session: the database session
+        :type session: sqlalchemy.orm.session.Session
+
+        :param uri_equivalence: if given, an equivalence resolver (see
+            :py:mod:`memex.equivalence`) used to count the annotations of all
+            URIs which refer to the same document
+        """
+        self.session = session
+        self.uri_equivalence = uri_equivalence
+
+    def count(self, uri, groupids=PUBLIC_GROUPS):
+        """
+        Return the number of shared annotations of `uri` in `groupids`.
+
+        By default this is the number of public annotations of `uri`.
+        """
+        uris = self._expand(uri)
+        total = (self.session.query(sa.func.sum(AnnotationCount.count))
+                 .filter(AnnotationCount.uri.in_(uris),
+                         AnnotationCount.groupid.in_(groupids))
+                 .scalar())
+        return total or 0
+
+    def refresh(self, uris):
+        """Recount the annotations of the given normalized URIs."""
+        # Lock in a consistent order so that concurrent refreshes of
+        # overlapping sets of URIs can't deadlock.
+        uris = sorted({u for u in uris if u})
+        if not uris:
+            return
+
+        # Wait for any rebuild of the whole table to finish first, and then
+        # serialize refreshes of the same URI, so that two transactions can't
+        # both find a count missing and try to insert it.
+        self.session.execute('LOCK TABLE annotation_count IN ROW EXCLUSIVE MODE')
+        for uri in uris:
+            self.session.execute(sa.select([
+                sa.func.pg_advisory_xact_lock(sa.func.hashtext(uri))]))
+
+        (self.session.query(AnnotationCount)
+         .filter(AnnotationCount.uri.in_(uris))
+         .delete(synchronize_session=False))
+        self._insert_counts(Annotation.target_uri_normalized.in_(uris))
+
+    def refresh_user(self, userid):
+        """Recount the annotations of every URI annotated by `userid`."""
+        uris = (self.session.query(Annotation.target_uri_normalized)
+                .filter(Annotation.userid == userid,
+                        Annotation.shared.is_(True))
+                .distinct())
+        self.refresh([u for u, in uris])
+
+    def rebuild(self):
+        """Recount the annotations of every URI."""
+        self.session.execute('LOCK TABLE annotation_count IN EXCLUSIVE MODE')
+        self.session.query(AnnotationCount).delete(synchronize_session=False)
+        self._insert_counts()
+
+    def _expand(self, uri):
+        if self.uri_equivalence is None:
+            return [uri_util.normalize(uri)]
+        return self.uri_equivalence.expand_normalized(self.session, uri)
+
+    def _insert_counts(self, *criteria):
+        counts = (self.session.query(Annotation.target_uri_normalized,
+                                     Annotation.groupid,
+                                     sa.func.count())
+                  .filter(Annotation.shared.is_(True),
+                          Annotation.target_uri_normalized.isnot(None),
+                          Annotation.userid.notin_(flagged_userids()),
+                          *criteria)
+                  .group_by(Annotation.target_uri_normalized,
+                            Annotation.groupid))
+
+        insert = AnnotationCount.__table__.insert().from_select(
+            ['uri', 'groupid', 'count'], counts.statement)
+        self.session.execute(insert)
+
+
+@sa.event.listens_for(sa.orm.Session, 'before_flush')
+def _record_moved_annotations(session, flush_context, instances):
+    for obj in session.dirty:
+        if not isinstance(obj, Annotation):
+            continue
+        history = sa.inspect(obj).attrs._target_uri_normalized.history
+        if history.deleted:
+            changed = session.info.setdefault(CHANGED_URIS_KEY, set())
+            changed.update(history.deleted)
+
+
+def annotation_counts_factory(context, request):
+    """Return an AnnotationCountService for the passed context and request."""
+    return AnnotationCountService(request.db,
+                                  request.find_service(name='uri_equivalence'))
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+from h.badge import worker
+from h.badge.services import CHANGED_URIS_KEY
+from memex import storage
+from memex import uri
+
+
+def update_annotation_counts(event):
+    """
+    Recount the annotations of the URIs affected by an annotation event.
+
+    Recounting locks the counts of the URIs until the end of the transaction,
+    which would serialize writes to popular URIs if it was done in the request
+    that changed the annotation, so it is left to a Celery task.
+    """
+    request = event.request
+    uris = set(request.db.info.pop(CHANGED_URIS_KEY, ()))
+
+    if event.action == 'delete':
+        if event.annotation_dict and event.annotation_dict.get('uri'):
+            uris.add(uri.normalize(event.annotation_dict['uri']))
+    else:
+        annotation = storage.fetch_annotation(request.db, event.annotation_id)
+        if annotation is not None:
+            uris.add(annotation.target_uri_normalized)
+
+    if uris:
+        worker.refresh_annotation_counts.delay(sorted(uris))
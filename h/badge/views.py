@@ -2,7 +2,12 @@ from pyramid import httpexceptions
 
 from h import models
 from h.util.view import json_view
-from memex import search
+from memex.singleflight import SingleFlight
+
+#: The key in the registry under which the
+#: :py:class:`memex.singleflight.SingleFlight` used to coalesce identical
+#: concurrent badge requests is stored.
+COALESCER_KEY = 'h.badge.coalescer'
 
 
 @json_view(route_name='badge')
@@ -15,21 +20,36 @@ def badge(request):
     those pages. The Chrome extension is oblivious to this, we just tell it
     that there are 0 annotations.
 
+    The number is read from the materialized annotation counts (see
+    :py:mod:`h.badge.services`) rather than by searching.
+
     """
     uri = request.params.get('uri')
 
     if not uri:
         raise httpexceptions.HTTPBadRequest()
 
-    if models.Blocklist.is_blocked(request.db, uri):
-        return {'total': 0}
+    coalescer = request.registry.get(COALESCER_KEY)
+    if coalescer is None:
+        return {'total': _count(request, uri)}
+
+    # Identical concurrent badge requests share a single count.
+    total, shared = coalescer.do(uri, lambda: _count(request, uri))
+    if shared:
+        request.stats.incr('badge.coalesced')
 
-    query = {'uri': uri, 'limit': 0}
-    result = search.Search(request).run(query)
+    return {'total': total}
+
+
+def _count(request, uri):
+    if models.Blocklist.is_blocked(request.db, uri):
+        return 0
 
-    return {'total': result.total}
+    counts = request.find_service(name='annotation_counts')
+    return counts.count(uri)
 
 
 def includeme(config):
+    config.registry[COALESCER_KEY] = SingleFlight()
     config.scan(__name__)
     config.add_route('badge', '/api/badge')
@@ -0,0 +1,13 @@
+# -*- coding: utf-8 -*-
+"""Worker functions for the badge feature."""
+
+from __future__ import unicode_literals
+
+from h.celery import celery
+
+
+@celery.task
+def refresh_annotation_counts(uris):
+    """Recount the annotations of the given normalized URIs."""
+    counts = celery.request.find_service(name='annotation_counts')
+    counts.refresh(uris)
@@ -15,13 +15,17 @@ from h import __version__
 log = logging.getLogger('h')
 
 SUBCOMMANDS = (
+    'h.cli.commands.annotation_counts.annotation_counts',
     'h.cli.commands.celery.celery',
     'h.cli.commands.devserver.devserver',
+    'h.cli.commands.export.export',
     'h.cli.commands.initdb.initdb',
     'h.cli.commands.migrate.migrate',
     'h.cli.commands.move_uri.move_uri',
     'h.cli.commands.normalize_uris.normalize_uris',
+    'h.cli.commands.outbox_relay.outbox_relay',
     'h.cli.commands.reindex.reindex',
+    'h.cli.commands.render_annotations.render_annotations',
     'h.cli.commands.shell.shell',
     'h.cli.commands.user.user',
 )
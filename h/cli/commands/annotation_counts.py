@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+
+import click
+
+
+@click.group('annotation-counts')
+def annotation_counts():
+    """Manage the materialized per-URI annotation counts."""
+
+
+@annotation_counts.command()
+@click.pass_context
+def rebuild(ctx):
+    """
+    Rebuild the annotation counts from the database.
+
+    The counts are normally kept up to date as annotations are created,
+    updated and deleted. Run this after changing annotations in bulk (for
+    example with ``move-uri`` or ``normalize-uris``), or if the counts are
+    suspected to be wrong.
+    """
+    request = ctx.obj['bootstrap']()
+
+    request.find_service(name='annotation_counts').rebuild()
+    request.tm.commit()
+
+    click.echo('annotation counts rebuilt', err=True)
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+
+import click
+
+from memex import export as export_lib
+from memex import renderers
+
+
+@click.command()
+@click.option('--user', help='Only export annotations by this userid.')
+@click.option('--group', help='Only export annotations in this group (pubid).')
+@click.option('--uri', multiple=True,
+              help='Only export annotations of the document at this URI. '
+                   'May be given more than once.')
+@click.option('--format', 'format_', type=click.Choice(export_lib.FORMATS),
+              default=export_lib.FORMAT_JSON, show_default=True,
+              help='Newline-delimited API JSON, or a JSON-LD array.')
+@click.option('--output', type=click.File('wb'), default='-',
+              help='File to write the annotations to (default: stdout).')
+@click.pass_context
+def export(ctx, user, group, uri, format_, output):
+    """
+    Export all annotations matching the given query.
+
+    Annotations are streamed from the database oldest first, so exports of
+    any size can be made with constant memory use. All matching annotations
+    are exported, regardless of their permissions, except for those excluded
+    by the filters registered by the application (such as the annotations of
+    NIPSA'd users).
+    """
+    if not (user or group or uri):
+        raise click.UsageError('at least one of --user, --group or --uri '
+                               'must be given')
+
+    request = ctx.obj['bootstrap']()
+
+    uris = None
+    if uri:
+        resolver = request.find_service(name='uri_equivalence')
+        uris = set()
+        for u in uri:
+            uris.update(resolver.expand_normalized(request.db, u))
+
+    annotations_export = export_lib.Export(
+        user=user, group=group, uris=uris,
+        filters=export_lib.get_filters(request))
+    links_service = request.find_service(name='links')
+    annotations = annotations_export.present(request.db, links_service,
+                                             format_)
+
+    chunks = renderers.render(annotations,
+                              ndjson=format_ != export_lib.FORMAT_JSONLD,
+                              encode=renderers.get_encoder(request))
+    for chunk in chunks:
+        output.write(chunk)
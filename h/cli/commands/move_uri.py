@@ -1,33 +1,45 @@
 # -*- coding: utf-8 -*-
 
+import datetime
+
 import click
+import sqlalchemy as sa
+from zope.sqlalchemy import mark_changed
 
 from h import models
 from memex import uri
 from memex.search.index import BatchIndexer
 from memex.models import merge_documents
 
+BATCH_SIZE = 1000
+
 
 @click.command('move-uri')
 @click.option('--old', required=True,
               help='Old URI with annotations and documents.')
 @click.option('--new', required=True, confirmation_prompt=True,
               help='New URI for matching annotations and documents.')
+@click.option('--batch-size', type=int, default=BATCH_SIZE, show_default=True,
+              help='Number of rows to update in each transaction.')
 @click.pass_context
-def move_uri(ctx, old, new):
+def move_uri(ctx, old, new, batch_size):
     """
     Move annotations and document equivalence data from one URL to another.
 
     This will **replace** the annotation's ``target_uri`` and all the
     document uri's ``claimant``, plus the matching ``uri`` for self-claim and
     canonical uris.
+
+    Rows are updated in batches, each in its own transaction, so that moving
+    a URI with many annotations doesn't hold locks on all of them at once.
     """
 
     request = ctx.obj['bootstrap']()
 
-    annotations = _fetch_annotations(request.db, old)
-    docuris_claimant = _fetch_document_uri_claimants(request.db, old)
-    docuris_uri = _fetch_document_uri_canonical_self_claim(request.db, old)
+    ann_count = _annotations_query(request.db, old).count()
+    doc_claimant = _document_uri_claimants_query(request.db, old).count()
+    doc_uri = _document_uri_canonical_self_claim_query(request.db, old).count()
+    request.tm.commit()
 
     prompt = ('Changing all annotations and document data matching:\n' +
               '"{old}"\nto:\n"{new}"\n' +
@@ -35,53 +47,146 @@ def move_uri(ctx, old, new):
               'document uri claimants, and {doc_uri} document uri self-claims ' +
               'or canonical uris.\n' +
               'Are you sure? [y/N]').format(old=old, new=new,
-                                            ann_count=len(annotations),
-                                            doc_claimant=len(docuris_claimant),
-                                            doc_uri=len(docuris_uri))
+                                            ann_count=ann_count,
+                                            doc_claimant=doc_claimant,
+                                            doc_uri=doc_uri)
     c = click.prompt(prompt, default='n', show_default=False)
 
     if c != 'y':
-        print('Aborted')
+        click.echo('Aborted')
         return
 
-    for annotation in annotations:
-        annotation.target_uri = new
+    move_annotations(request, old, new, batch_size=batch_size)
+    move_document_uri_claimants(request, old, new, batch_size=batch_size)
+    move_document_uri_canonical_self_claims(request, old, new,
+                                            batch_size=batch_size)
+    merge_new_documents(request, new)
+
 
-    for docuri in docuris_claimant:
-        docuri.claimant = new
+def move_annotations(request, old, new, batch_size=BATCH_SIZE):
+    """
+    Move annotations to `new` and reindex them, one batch at a time.
 
-    for docuri in docuris_uri:
-        docuri.uri = new
+    The annotations' updated time is bumped, as their presentations are
+    cached by it, and the annotation counts of both URIs are refreshed once
+    all the annotations have been moved.
+    """
+    indexer = BatchIndexer(request.db, request.es, request)
+    values = {'target_uri': new, 'target_uri_normalized': uri.normalize(new),
+              'updated': datetime.datetime.utcnow()}
 
-    if annotations:
-        indexer = BatchIndexer(request.db, request.es, request)
-        ids = [a.id for a in annotations]
+    def reindex(ids):
+        request.tm.begin()
         indexer.index(ids)
+        request.tm.commit()
+
+    total = _move_in_batches(request,
+                             _annotations_query(request.db, old),
+                             models.Annotation,
+                             values,
+                             batch_size,
+                             'annotations',
+                             after_commit=reindex)
+
+    request.tm.begin()
+    counts = request.find_service(name='annotation_counts')
+    counts.refresh([uri.normalize(old), uri.normalize(new)])
+    request.tm.commit()
+
+    return total
+
 
-    request.db.flush()
+def move_document_uri_claimants(request, old, new, batch_size=BATCH_SIZE):
+    """Move document URIs claimed by `old` to `new`, one batch at a time."""
+    values = {'claimant': new, 'claimant_normalized': uri.normalize(new)}
+    return _move_in_batches(request,
+                            _document_uri_claimants_query(request.db, old),
+                            models.DocumentURI,
+                            values,
+                            batch_size,
+                            'document uri claimants')
 
+
+def move_document_uri_canonical_self_claims(request, old, new,
+                                            batch_size=BATCH_SIZE):
+    """Move self-claim and canonical document URIs to `new` in batches."""
+    values = {'uri': new, 'uri_normalized': uri.normalize(new)}
+    return _move_in_batches(request,
+                            _document_uri_canonical_self_claim_query(request.db,
+                                                                     old),
+                            models.DocumentURI,
+                            values,
+                            batch_size,
+                            'document uri self-claims or canonical uris')
+
+
+def merge_new_documents(request, new):
+    """Merge the documents which now share the `new` URI."""
+    request.tm.begin()
     documents = models.Document.find_by_uris(request.db, [new])
     if documents.count() > 1:
         merge_documents(request.db, documents)
-
     request.tm.commit()
 
 
-def _fetch_annotations(session, uri_):
+def _move_in_batches(request, query, model, values, batch_size, label,
+                     after_commit=None):
+    """
+    Apply `values` to the rows matched by `query`, in batches ordered by id.
+
+    Each batch is updated with a single ``UPDATE`` statement and committed in
+    its own transaction, after which ``after_commit`` is called with the ids
+    of the updated rows.
+
+    :returns: the number of rows updated
+    """
+    table = model.__table__
+    # `values` is keyed by column name, which may differ from the (hybrid)
+    # attribute names of the model.
+    values = {table.c[name]: value for name, value in values.items()}
+
+    total = 0
+    last_id = None
+    while True:
+        request.tm.begin()
+        batch = query.with_entities(model.id).order_by(model.id)
+        if last_id is not None:
+            batch = batch.filter(model.id > last_id)
+        ids = [row.id for row in batch.limit(batch_size)]
+        if not ids:
+            request.tm.commit()
+            break
+
+        request.db.execute(sa.update(table)
+                             .where(table.c.id.in_(ids))
+                             .values(values))
+        # The session doesn't know about the UPDATE statement, so it has to
+        # be told to commit it.
+        mark_changed(request.db)
+        request.tm.commit()
+
+        if after_commit is not None:
+            after_commit(ids)
+
+        total += len(ids)
+        last_id = ids[-1]
+        click.echo('Moved {total} {label}'.format(total=total, label=label),
+                   err=True)
+
+    return total
+
+
+def _annotations_query(session, uri_):
     return session.query(models.Annotation).filter(
-        models.Annotation.target_uri_normalized == uri.normalize(uri_)).all()
+        models.Annotation.target_uri_normalized == uri.normalize(uri_))
 
 
-def _fetch_document_uri_claimants(session, uri_):
+def _document_uri_claimants_query(session, uri_):
     return session.query(models.DocumentURI).filter(
-        models.DocumentURI.claimant_normalized == uri.normalize(uri_)).all()
+        models.DocumentURI.claimant_normalized == uri.normalize(uri_))
 
 
-def _fetch_document_uri_canonical_self_claim(session, uri_):
+def _document_uri_canonical_self_claim_query(session, uri_):
     return session.query(models.DocumentURI).filter(
         models.DocumentURI.uri_normalized == uri.normalize(uri_),
-        models.DocumentURI.type.in_([u'self-claim', u'rel-canonical'])).all()
-
-
-def _fetch_documents(session, uri_):
-    return models.Document.find_by_uris(session, [uri_]).all()
+        models.DocumentURI.type.in_([u'self-claim', u'rel-canonical']))
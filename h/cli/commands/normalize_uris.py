@@ -1,143 +1,379 @@
 # -*- coding: utf-8 -*-
 
-from collections import namedtuple
+"""
+Renormalize all stored URIs after a change to :py:func:`memex.uri.normalize`.
+
+Rows are processed in batches ordered by primary key. New normalized values
+are computed by a pool of worker processes, and each batch is then applied
+with a handful of set-based statements in its own transaction: changed rows
+are updated in bulk, rows whose new normalized form duplicates an existing row
+are deleted, and documents which have come to share a URI are merged.
+
+The primary key of the last completed batch of each table can be recorded in
+a state file, so that an interrupted run can be resumed where it stopped.
+"""
+
+import datetime
+import multiprocessing
+
 import click
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql as pg
+from zope.sqlalchemy import mark_changed
 
+from h.cli.progress import Progress
 from memex import models
 from memex import uri
+from memex.db import types
 from memex.search import index
 
-
-class Window(namedtuple('Window', ['start', 'end'])):
-    pass
+BATCH_SIZE = 2000
+
+_UPDATE_DOCUMENT_URIS = sa.text("""
+    UPDATE document_uri
+    SET claimant_normalized = new.claimant_normalized,
+        uri_normalized = new.uri_normalized
+    FROM unnest(:ids, :claimants, :uris)
+        AS new(id, claimant_normalized, uri_normalized)
+    WHERE document_uri.id = new.id
+""").bindparams(sa.bindparam('ids', type_=pg.ARRAY(sa.Integer)),
+                sa.bindparam('claimants', type_=pg.ARRAY(sa.UnicodeText)),
+                sa.bindparam('uris', type_=pg.ARRAY(sa.UnicodeText)))
+
+_EXISTING_DOCUMENT_URIS = sa.text("""
+    SELECT document_uri.id, document_uri.claimant_normalized,
+           document_uri.uri_normalized, document_uri.type,
+           document_uri.content_type, document_uri.document_id
+    FROM document_uri
+    JOIN (SELECT DISTINCT * FROM unnest(:claimants, :uris)
+          AS k(claimant_normalized, uri_normalized)) AS key
+    ON document_uri.claimant_normalized = key.claimant_normalized
+    AND document_uri.uri_normalized = key.uri_normalized
+""").bindparams(sa.bindparam('claimants', type_=pg.ARRAY(sa.UnicodeText)),
+                sa.bindparam('uris', type_=pg.ARRAY(sa.UnicodeText)))
+
+_SHARED_DOCUMENT_URIS = sa.text("""
+    SELECT array_agg(DISTINCT document_id)
+    FROM document_uri
+    WHERE uri_normalized = ANY(:uris)
+    GROUP BY uri_normalized
+    HAVING count(DISTINCT document_id) > 1
+""").bindparams(sa.bindparam('uris', type_=pg.ARRAY(sa.UnicodeText)))
+
+_MOVE_TO_MASTER = """
+    UPDATE {table}
+    SET document_id = merge.master, updated = :updated
+    FROM unnest(:duplicates, :masters) AS merge(duplicate, master)
+    WHERE {table}.document_id = merge.duplicate
+"""
+
+_DELETE_DOCUMENTS = sa.text("""
+    DELETE FROM document WHERE id = ANY(:ids)
+""").bindparams(sa.bindparam('ids', type_=pg.ARRAY(sa.Integer)))
+
+_UPDATE_DOCUMENT_META = sa.text("""
+    UPDATE document_meta
+    SET claimant_normalized = new.claimant_normalized
+    FROM unnest(:ids, :claimants) AS new(id, claimant_normalized)
+    WHERE document_meta.id = new.id
+""").bindparams(sa.bindparam('ids', type_=pg.ARRAY(sa.Integer)),
+                sa.bindparam('claimants', type_=pg.ARRAY(sa.UnicodeText)))
+
+_EXISTING_DOCUMENT_META = sa.text("""
+    SELECT document_meta.id, document_meta.claimant_normalized,
+           document_meta.type
+    FROM document_meta
+    JOIN (SELECT DISTINCT * FROM unnest(:claimants, :types)
+          AS k(claimant_normalized, type)) AS key
+    ON document_meta.claimant_normalized = key.claimant_normalized
+    AND document_meta.type = key.type
+""").bindparams(sa.bindparam('claimants', type_=pg.ARRAY(sa.UnicodeText)),
+                sa.bindparam('types', type_=pg.ARRAY(sa.UnicodeText)))
+
+_UPDATE_ANNOTATIONS = sa.text("""
+    UPDATE annotation
+    SET target_uri_normalized = new.target_uri_normalized, updated = :updated
+    FROM unnest(:ids, :uris) AS new(id, target_uri_normalized)
+    WHERE annotation.id = new.id
+""").bindparams(sa.bindparam('ids', type_=pg.ARRAY(types.URLSafeUUID)),
+                sa.bindparam('uris', type_=pg.ARRAY(sa.UnicodeText)))
 
 
 @click.command('normalize-uris')
+@click.option('--workers', type=int, default=multiprocessing.cpu_count(),
+              show_default=True,
+              help='Number of processes to compute normalized URIs with.')
+@click.option('--batch-size', type=int, default=BATCH_SIZE, show_default=True,
+              help='Number of rows to update in each transaction.')
+@click.option('--state-file', type=click.Path(dir_okay=False),
+              help='File to record progress in, so that an interrupted run '
+                   'can be resumed by passing the same file again.')
 @click.pass_context
-def normalize_uris(ctx):
+def normalize_uris(ctx, workers, batch_size, state_file):
     """
     Normalize all URIs in the database and reindex the changed annotations.
     """
 
-    request = ctx.obj['bootstrap']()
-
-    normalize_document_uris(request)
-    normalize_document_meta(request)
-    normalize_annotations(request)
-
-
-def normalize_document_uris(request):
-    windows = _fetch_windows(request.db, models.DocumentURI.updated)
-    request.tm.commit()
-
-    for window in windows:
-        request.tm.begin()
-        _normalize_document_uris_window(request.db, window)
-        request.tm.commit()
-
-
-def normalize_document_meta(request):
-    windows = _fetch_windows(request.db, models.DocumentMeta.updated)
-    request.tm.commit()
-
-    for window in windows:
-        request.tm.begin()
-        _normalize_document_meta_window(request.db, window)
-        request.tm.commit()
-
+    # The worker processes are started before the application is bootstrapped,
+    # so that they don't inherit its database connections.
+    pool = None
+    map_ = map
+    if workers > 1:
+        pool = multiprocessing.Pool(workers)
+        map_ = pool.map
+
+    try:
+        request = ctx.obj['bootstrap']()
+        progress = Progress(state_file)
+
+        normalize_document_uris(request, progress, map_, batch_size)
+        normalize_document_meta(request, progress, map_, batch_size)
+        normalize_annotations(request, progress, map_, batch_size)
+    finally:
+        if pool is not None:
+            pool.terminate()
+
+
+def normalize_document_uris(request, progress=None, map_=map,
+                            batch_size=BATCH_SIZE):
+    docuri = models.DocumentURI
+    columns = [docuri.id, docuri.claimant, docuri.uri,
+               docuri.claimant_normalized, docuri.uri_normalized,
+               docuri.type, docuri.content_type, docuri.document_id]
+    _process(request, progress, 'document_uri', columns,
+             _normalize_document_uris_batch, map_, batch_size)
+
+
+def normalize_document_meta(request, progress=None, map_=map,
+                            batch_size=BATCH_SIZE):
+    docmeta = models.DocumentMeta
+    columns = [docmeta.id, docmeta.claimant, docmeta.claimant_normalized,
+               docmeta.type]
+    _process(request, progress, 'document_meta', columns,
+             _normalize_document_meta_batch, map_, batch_size)
+
+
+def normalize_annotations(request, progress=None, map_=map,
+                          batch_size=BATCH_SIZE):
+    if progress is None:
+        progress = Progress()
+
+    # Reindex any annotations changed by an earlier, interrupted run.
+    pending = progress.get('reindex')
+    if pending:
+        _reindex_annotations(request, set(pending))
+        progress.update(reindex=[])
+
+    ann = models.Annotation
+    columns = [ann.id, ann.target_uri, ann.target_uri_normalized]
+    changed = set()
+    counts = request.find_service(name='annotation_counts')
+
+    def apply_batch(session, rows, map_):
+        ids, uris = _normalize_annotations_batch(session, rows, map_)
+        # Move the counts of the changed annotations to their new URIs.
+        counts.refresh(uris)
+        # Record the changed ids before committing, so that they are
+        # reindexed on resume even if we are interrupted after the commit.
+        progress.update(reindex=list(ids))
+        changed.update(ids)
+
+    def after_commit():
+        if changed:
+            _reindex_annotations(request, set(changed))
+            changed.clear()
+        progress.update(reindex=[])
+
+    _process(request, progress, 'annotation', columns, apply_batch, map_,
+             batch_size, after_commit=after_commit)
+
+
+def _process(request, progress, name, columns, apply_batch, map_,
+             batch_size, after_commit=None):
+    """
+    Run `apply_batch` over the rows selected by `columns` in key order.
 
-def normalize_annotations(request):
-    windows = _fetch_windows(request.db, models.Annotation.updated)
-    request.tm.commit()
+    Each batch is applied and committed in its own transaction, after which
+    the key of its last row is recorded in `progress` under `name`.
+    """
+    if progress is None:
+        progress = Progress()
 
-    for window in windows:
+    last_id = progress.get(name)
+    while True:
         request.tm.begin()
-        ids = _normalize_annotations_window(request.db, window)
+        query = request.db.query(*columns).order_by(columns[0])
+        if last_id is not None:
+            query = query.filter(columns[0] > last_id)
+        rows = [tuple(r) for r in query.limit(batch_size)]
+        if not rows:
+            request.tm.commit()
+            return
+
+        apply_batch(request.db, rows, map_)
+        # The batch is applied with plain SQL statements, which the session
+        # doesn't know about, so it has to be told to commit them.
+        mark_changed(request.db)
         request.tm.commit()
 
-        request.tm.begin()
-        _reindex_annotations(request, ids)
-        request.tm.commit()
+        last_id = rows[-1][0]
+        progress.update(**{name: last_id})
+        if after_commit is not None:
+            after_commit()
+
+
+def _normalize_document_uris_batch(session, rows, map_):
+    normalized = list(map_(_normalize_row,
+                           [(r[0], r[1], r[2]) for r in rows]))
+
+    changed = {}
+    for row, (id_, claimant_normalized, uri_normalized) in zip(rows, normalized):
+        if (claimant_normalized, uri_normalized) != (row[3], row[4]):
+            changed[id_] = (claimant_normalized, uri_normalized) + row[5:]
+
+    if changed:
+        # Find the rows which already hold the normalized values we are about
+        # to write, so that we delete our row rather than create a duplicate.
+        keys = list(set(c[:2] for c in changed.values()))
+        existing = session.execute(_EXISTING_DOCUMENT_URIS, {
+            'claimants': [k[0] for k in keys],
+            'uris': [k[1] for k in keys],
+        })
+        taken = {tuple(r[1:5]): r[5] for r in existing if r[0] not in changed}
+
+        updates = []
+        deletes = []
+        merges = []
+        for id_ in sorted(changed):
+            key = changed[id_][:4]
+            document_id = changed[id_][4]
+            if key in taken:
+                deletes.append(id_)
+                if taken[key] != document_id:
+                    merges.append([taken[key], document_id])
+            else:
+                taken[key] = document_id
+                updates.append((id_,) + key[:2])
+
+        if deletes:
+            session.execute(sa.delete(models.DocumentURI.__table__).where(
+                models.DocumentURI.id.in_(deletes)))
+        if updates:
+            ids, claimants, uris = zip(*updates)
+            session.execute(_UPDATE_DOCUMENT_URIS, {'ids': list(ids),
+                                                    'claimants': list(claimants),
+                                                    'uris': list(uris)})
+    else:
+        merges = []
+
+    # Merge any documents which now share a normalized URI.
+    uris = list(set(n[2] for n in normalized))
+    merges.extend(r[0] for r in session.execute(_SHARED_DOCUMENT_URIS,
+                                                {'uris': uris}))
+    _merge_documents(session, merges)
+
+
+def _normalize_document_meta_batch(session, rows, map_):
+    normalized = list(map_(_normalize_row, [(r[0], r[1]) for r in rows]))
+
+    changed = {}
+    for row, (id_, claimant_normalized) in zip(rows, normalized):
+        if claimant_normalized != row[2]:
+            changed[id_] = (claimant_normalized, row[3])
+
+    if not changed:
+        return
+
+    keys = list(set(changed.values()))
+    existing = session.execute(_EXISTING_DOCUMENT_META, {
+        'claimants': [k[0] for k in keys],
+        'types': [k[1] for k in keys],
+    })
+    taken = set(tuple(r[1:]) for r in existing if r[0] not in changed)
+
+    updates = []
+    deletes = []
+    for id_ in sorted(changed):
+        if changed[id_] in taken:
+            deletes.append(id_)
+        else:
+            taken.add(changed[id_])
+            updates.append((id_, changed[id_][0]))
 
+    if deletes:
+        session.execute(sa.delete(models.DocumentMeta.__table__).where(
+            models.DocumentMeta.id.in_(deletes)))
+    if updates:
+        ids, claimants = zip(*updates)
+        session.execute(_UPDATE_DOCUMENT_META, {'ids': list(ids),
+                                                'claimants': list(claimants)})
 
-def _normalize_document_uris_window(session, window):
-    query = session.query(models.DocumentURI) \
-        .filter(models.DocumentURI.updated.between(window.start, window.end)) \
-        .order_by(models.DocumentURI.updated.asc())
 
-    for docuri in query:
-        documents = models.Document.find_by_uris(session, [docuri.uri])
-        if documents.count() > 1:
-            models.merge_documents(session, documents)
+def _normalize_annotations_batch(session, rows, map_):
+    """
+    Renormalize the target URIs of a batch of annotations.
 
-        existing = session.query(models.DocumentURI).filter(
-            models.DocumentURI.id != docuri.id,
-            models.DocumentURI.document_id == docuri.document_id,
-            models.DocumentURI.claimant_normalized == uri.normalize(docuri.claimant),
-            models.DocumentURI.uri_normalized == uri.normalize(docuri.uri),
-            models.DocumentURI.type == docuri.type,
-            models.DocumentURI.content_type == docuri.content_type)
+    Returns the ids of the changed annotations, and the normalized URIs they
+    were moved from and to.
+    """
+    normalized = list(map_(_normalize_row, [(r[0], r[1]) for r in rows]))
 
-        if existing.count() > 0:
-            session.delete(docuri)
-        else:
-            docuri._claimant_normalized = uri.normalize(docuri.claimant)
-            docuri._uri_normalized = uri.normalize(docuri.uri)
+    changed = [(row, n) for row, n in zip(rows, normalized) if n[1] != row[2]]
+    if not changed:
+        return set(), set()
 
-        session.flush()
+    ids, uris = zip(*[n for _, n in changed])
+    session.execute(_UPDATE_ANNOTATIONS, {'ids': list(ids),
+                                          'uris': list(uris),
+                                          'updated': datetime.datetime.utcnow()})
+    return set(ids), set(uris) | set(row[2] for row, _ in changed)
 
 
-def _normalize_document_meta_window(session, window):
-    query = session.query(models.DocumentMeta) \
-        .filter(models.DocumentMeta.updated.between(window.start, window.end)) \
-        .order_by(models.DocumentMeta.updated.asc())
+def _merge_documents(session, groups):
+    """
+    Merge each group of document ids into the oldest document of the group.
 
-    for docmeta in query:
-        existing = session.query(models.DocumentMeta).filter(
-            models.DocumentMeta.id != docmeta.id,
-            models.DocumentMeta.claimant_normalized == uri.normalize(docmeta.claimant),
-            models.DocumentMeta.type == docmeta.type)
+    Groups which overlap are merged together, so that each document ends up
+    with exactly one master.
+    """
+    parent = {}
 
-        if existing.count() > 0:
-            session.delete(docmeta)
-        else:
-            docmeta._claimant_normalized = uri.normalize(docmeta.claimant)
+    def find(id_):
+        while parent.get(id_, id_) != id_:
+            id_ = parent[id_]
+        return id_
 
-        session.flush()
+    for group in groups:
+        root = min(find(id_) for id_ in group)
+        for id_ in group:
+            parent[find(id_)] = root
 
+    masters = {id_: find(id_) for id_ in parent if find(id_) != id_}
+    if not masters:
+        return
 
-def _normalize_annotations_window(session, window):
-    query = session.query(models.Annotation) \
-        .filter(models.Annotation.updated.between(window.start, window.end)) \
-        .order_by(models.Annotation.updated.asc())
+    params = {'duplicates': list(masters.keys()),
+              'masters': list(masters.values()),
+              'updated': datetime.datetime.utcnow()}
+    for table in ['document_uri', 'document_meta']:
+        stmt = sa.text(_MOVE_TO_MASTER.format(table=table)).bindparams(
+            sa.bindparam('duplicates', type_=pg.ARRAY(sa.Integer)),
+            sa.bindparam('masters', type_=pg.ARRAY(sa.Integer)))
+        session.execute(stmt, params)
+    session.execute(_DELETE_DOCUMENTS, {'ids': list(masters.keys())})
 
-    ids = set()
-    for a in query:
-        normalized = uri.normalize(a.target_uri)
-        if normalized != a.target_uri_normalized:
-            a._target_uri_normalized = normalized
-            ids.add(a.id)
 
-    return ids
+def _normalize_row(row):
+    """Normalize all but the first (key) column of `row`."""
+    return (row[0],) + tuple(uri.normalize(value) for value in row[1:])
 
 
 def _reindex_annotations(request, ids):
+    request.tm.begin()
     indexer = index.BatchIndexer(request.db, request.es, request)
 
     for _ in range(2):
         ids = indexer.index(ids)
         if not ids:
             break
-
-
-def _fetch_windows(session, column, chunksize=100):
-    updated = session.query(column). \
-        execution_options(stream_results=True). \
-        order_by(column.desc()).all()
-
-    count = len(updated)
-    windows = [Window(start=updated[min(x+chunksize, count)-1].updated,
-                      end=updated[x].updated)
-               for x in xrange(0, count, chunksize)]
-
-    return windows
+    request.tm.commit()
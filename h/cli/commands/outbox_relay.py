@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+
+"""
+Deliver the annotation events waiting in the outbox.
+
+With the ``h.outbox`` setting enabled, annotation events are written to the
+outbox by the requests which change annotations, and this command delivers
+them to the realtime message broker, the search indexer and the reply
+notifications (see :py:mod:`h.outbox`). It should run alongside the web
+application for as long as it does.
+
+Events are delivered in batches, each event in its own transaction. Once the
+outbox is empty the command waits for a while before looking again.
+"""
+
+import logging
+import time
+
+import click
+
+from h import outbox
+from h import realtime
+
+log = logging.getLogger(__name__)
+
+
+@click.command('outbox-relay')
+@click.option('--batch-size', type=int, default=outbox.DEFAULT_BATCH_SIZE,
+              show_default=True,
+              help='Number of events to deliver in each batch.')
+@click.option('--max-attempts', type=int,
+              default=outbox.DEFAULT_MAX_ATTEMPTS, show_default=True,
+              help='Number of times to try to deliver an event.')
+@click.option('--interval', type=float, default=1.0, show_default=True,
+              help='Seconds to wait between polls of an empty outbox.')
+@click.option('--once', is_flag=True,
+              help='Deliver the waiting events and exit.')
+@click.pass_context
+def outbox_relay(ctx, batch_size, max_attempts, interval, once):
+    """
+    Deliver annotation events from the outbox.
+    """
+    request = ctx.obj['bootstrap']()
+
+    # An event is only deleted from the outbox once its realtime message has
+    # been published, so publish messages as they are sent rather than in the
+    # background.
+    request.registry[realtime.SENDER_KEY] = realtime.Sender(
+        request.registry.settings, background=False)
+
+    while True:
+        try:
+            delivered = deliver(request, batch_size, max_attempts)
+        except Exception:
+            if once:
+                raise
+            log.exception('Failed to deliver outbox events.')
+            request.tm.abort()
+            delivered = 0
+
+        if once:
+            click.echo('Delivered {} events'.format(delivered))
+            return
+        time.sleep(interval)
+
+
+def deliver(request, batch_size=outbox.DEFAULT_BATCH_SIZE,
+            max_attempts=outbox.DEFAULT_MAX_ATTEMPTS):
+    """
+    Deliver batches of events until a batch isn't fully delivered.
+
+    Returns the number of events delivered.
+    """
+    stats = getattr(request, 'stats', None)
+    total = 0
+    while True:
+        delivered = outbox.relay(request,
+                                 batch_size=batch_size,
+                                 max_attempts=max_attempts,
+                                 stats=stats)
+        total += delivered
+        if delivered < batch_size:
+            return total
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+
+"""
+Re-render the stored HTML of all annotations' text.
+
+The rendered form of each annotation's Markdown text is stored alongside it
+when it is created or updated, so a change to :py:func:`memex.markdown.render`
+(for example to the set of allowed HTML tags) only affects annotations saved
+afterwards. This command brings the rest up to date.
+
+Annotations are processed in batches ordered by id. Their text is rendered by
+a pool of worker processes, and the rows whose rendered text has changed are
+then updated with a single statement per batch, each in its own transaction.
+The updated time of these annotations is bumped too, so that presentations of
+their old text cached by :py:mod:`memex.presentation` aren't served any more.
+As with ``hypothesis normalize-uris``, progress can be recorded in a state
+file so that an interrupted run can be resumed.
+"""
+
+import datetime
+import multiprocessing
+
+import click
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql as pg
+from zope.sqlalchemy import mark_changed
+
+from h.cli.progress import Progress
+from memex import markdown
+from memex import models
+from memex.db import types
+
+BATCH_SIZE = 1000
+
+_UPDATE_ANNOTATIONS = sa.text("""
+    UPDATE annotation
+    SET text_rendered = new.text_rendered, updated = :updated
+    FROM unnest(:ids, :rendered) AS new(id, text_rendered)
+    WHERE annotation.id = new.id
+""").bindparams(sa.bindparam('ids', type_=pg.ARRAY(types.URLSafeUUID)),
+                sa.bindparam('rendered', type_=pg.ARRAY(sa.UnicodeText)))
+
+
+@click.command('render-annotations')
+@click.option('--workers', type=int, default=multiprocessing.cpu_count(),
+              show_default=True,
+              help='Number of processes to render annotations with.')
+@click.option('--batch-size', type=int, default=BATCH_SIZE, show_default=True,
+              help='Number of annotations to update in each transaction.')
+@click.option('--state-file', type=click.Path(dir_okay=False),
+              help='File to record progress in, so that an interrupted run '
+                   'can be resumed by passing the same file again.')
+@click.pass_context
+def render_annotations(ctx, workers, batch_size, state_file):
+    """
+    Re-render the text of all annotations.
+    """
+
+    # As with normalize-uris, the worker processes are started before the
+    # application is bootstrapped, so that they don't inherit its database
+    # connections.
+    pool = None
+    map_ = map
+    if workers > 1:
+        pool = multiprocessing.Pool(workers)
+        map_ = pool.map
+
+    try:
+        request = ctx.obj['bootstrap']()
+        progress = Progress(state_file)
+
+        checked, changed = rerender(request, progress, map_, batch_size)
+    finally:
+        if pool is not None:
+            pool.terminate()
+
+    click.echo('Re-rendered {} of {} annotations'.format(changed, checked))
+
+
+def rerender(request, progress=None, map_=map, batch_size=BATCH_SIZE):
+    """
+    Re-render the text of every annotation.
+
+    Returns a ``(checked, changed)`` tuple of the number of annotations whose
+    text was rendered and the number whose stored rendering was updated.
+    """
+    if progress is None:
+        progress = Progress()
+
+    ann = models.Annotation
+    checked = changed = 0
+    last_id = progress.get('annotation')
+    while True:
+        request.tm.begin()
+        query = (request.db.query(ann.id, ann.text, ann.text_rendered)
+                 .order_by(ann.id))
+        if last_id is not None:
+            query = query.filter(ann.id > last_id)
+        rows = [tuple(r) for r in query.limit(batch_size)]
+        if not rows:
+            request.tm.commit()
+            return checked, changed
+
+        rendered = list(map_(_render_row, [(r[0], r[1]) for r in rows]))
+        updates = [(id_, text_rendered)
+                   for row, (id_, text_rendered) in zip(rows, rendered)
+                   if text_rendered != row[2]]
+        if updates:
+            ids, texts = zip(*updates)
+            request.db.execute(_UPDATE_ANNOTATIONS, {
+                'ids': list(ids),
+                'rendered': list(texts),
+                'updated': datetime.datetime.utcnow(),
+            })
+            # The batch is updated with a plain SQL statement, which the
+            # session doesn't know about, so it has to be told to commit it.
+            mark_changed(request.db)
+        request.tm.commit()
+
+        checked += len(rows)
+        changed += len(updates)
+        last_id = rows[-1][0]
+        progress.update(annotation=last_id)
+
+
+def _render_row(row):
+    """Render the text of an ``(id, text)`` row."""
+    id_, text = row
+    return id_, markdown.render(text)
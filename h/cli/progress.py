@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+
+import json
+import os
+
+
+class Progress(object):
+
+    """
+    The progress of a long-running command, optionally persisted to a file.
+
+    The state is a small JSON object, typically mapping each table name to the
+    primary key of the last row processed, so that an interrupted run can be
+    resumed where it stopped.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.state = {}
+        if path is not None and os.path.exists(path):
+            with open(path) as fp:
+                self.state = json.load(fp)
+
+    def get(self, key, default=None):
+        return self.state.get(key, default)
+
+    def update(self, **kwargs):
+        self.state.update(kwargs)
+        if self.path is None:
+            return
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as fp:
+            json.dump(self.state, fp)
+        os.rename(tmp_path, self.path)
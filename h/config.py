@@ -74,9 +74,29 @@ SETTINGS = [
     EnvSetting('h.client_secret', 'CLIENT_SECRET'),
     EnvSetting('h.db.should_create_all', 'MODEL_CREATE_ALL', type=asbool),
     EnvSetting('h.db.should_drop_all', 'MODEL_DROP_ALL', type=asbool),
+    EnvSetting('h.outbox', 'OUTBOX', type=asbool),
     EnvSetting('h.proxy_auth', 'PROXY_AUTH', type=asbool),
+    EnvSetting('h.realtime.background', 'REALTIME_BACKGROUND', type=asbool),
+    EnvSetting('h.realtime.batch_size', 'REALTIME_BATCH_SIZE', type=int),
+    EnvSetting('h.realtime.confirm_publish', 'REALTIME_CONFIRM_PUBLISH',
+               type=asbool),
+    EnvSetting('h.realtime.partitions', 'REALTIME_PARTITIONS', type=int),
+    EnvSetting('h.realtime.queue_size', 'REALTIME_QUEUE_SIZE', type=int),
     EnvSetting('h.search.autoconfig', 'SEARCH_AUTOCONFIG', type=asbool),
+    EnvSetting('h.streamer.coalesce_window', 'STREAMER_COALESCE_WINDOW',
+               type=float),
+    EnvSetting('h.streamer.outbox_policy', 'STREAMER_OUTBOX_POLICY'),
+    EnvSetting('h.streamer.outbox_size', 'STREAMER_OUTBOX_SIZE', type=int),
+    EnvSetting('h.streamer.replay_size', 'STREAMER_REPLAY_SIZE', type=int),
+    EnvSetting('h.streamer.shards', 'STREAMER_SHARDS', type=int),
     EnvSetting('h.websocket_url', 'WEBSOCKET_URL'),
+    EnvSetting('memex.json_encoder', 'JSON_ENCODER'),
+    EnvSetting('memex.presentation_cache', 'PRESENTATION_CACHE', type=asbool),
+    EnvSetting('memex.presentation_cache.size', 'PRESENTATION_CACHE_SIZE',
+               type=int),
+    EnvSetting('memex.search.coalesce', 'SEARCH_COALESCE', type=asbool),
+    EnvSetting('memex.sidebar_cache', 'SIDEBAR_CACHE', type=asbool),
+    EnvSetting('memex.sidebar_cache.ttl', 'SIDEBAR_CACHE_TTL', type=int),
     # The client Sentry DSN should be of the public kind, lacking the password
     # component in the DSN URI.
     EnvSetting('h.client.sentry_dsn', 'SENTRY_DSN_CLIENT'),
@@ -5,6 +5,7 @@ from pyramid import i18n
 from h import presenters
 from h import util
 import h.feeds.util
+from h.feeds.util import present_entries
 
 _ = i18n.TranslationStringFactory(__package__)
 
@@ -52,16 +53,22 @@ def _utc_iso8601_string(timestamp):
 
 def feed_from_annotations(
         annotations, atom_url, annotation_url, annotation_api_url=None,
-        html_url=None, title=None, subtitle=None):
+        html_url=None, title=None, subtitle=None, cache=None):
     """Return an Atom feed for the given list of annotations.
 
+    :param cache: an optional presentation cache in which to keep the feed's
+        entries (see :py:func:`h.feeds.util.present_entries`)
+
     :returns: A logical representation of an Atom feed as a Python dict
         containing all of the data that a template would need to render the
         feed to XML (including a list of dicts for the feed's entries).
     :rtype: dict
 
     """
-    annotations = [presenters.AnnotationHTMLPresenter(a) for a in annotations]
+    def present(annotation):
+        return _feed_entry_from_annotation(
+            presenters.AnnotationHTMLPresenter(annotation), annotation_url,
+            annotation_api_url)
 
     links = [{"rel": "self", "type": "application/atom+xml", "href": atom_url}]
 
@@ -69,9 +76,8 @@ def feed_from_annotations(
         links.append(
             {"rel": "alternate", "type": "text/html", "href": html_url})
 
-    entries = [
-        _feed_entry_from_annotation(a, annotation_url, annotation_api_url)
-        for a in annotations]
+    entries = present_entries(
+        annotations, present, cache=cache, variant=('atom', atom_url))
 
     feed = {
         "id": atom_url,
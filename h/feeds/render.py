@@ -2,6 +2,7 @@ from pyramid import renderers
 
 from h.feeds import atom
 from h.feeds import rss
+from memex import presentation
 
 
 def render_atom(request, annotations, atom_url, html_url, title, subtitle):
@@ -38,7 +39,8 @@ def render_atom(request, annotations, atom_url, html_url, title, subtitle):
     feed = atom.feed_from_annotations(
         annotations=annotations, atom_url=atom_url,
         annotation_url=annotation_url, annotation_api_url=annotation_api_url,
-        html_url=html_url, title=title, subtitle=subtitle)
+        html_url=html_url, title=title, subtitle=subtitle,
+        cache=presentation.get_cache(request.registry))
 
     return renderers.render_to_response(
         'h:templates/atom.xml.jinja2', {"feed": feed}, request=request)
@@ -74,7 +76,8 @@ def render_rss(request, annotations, rss_url, html_url, title, description):
     feed = rss.feed_from_annotations(
         annotations=annotations, annotation_url=annotation_url,
         rss_url=rss_url, html_url=html_url, title=title,
-        description=description)
+        description=description,
+        cache=presentation.get_cache(request.registry))
 
     return renderers.render_to_response(
         'h:templates/rss.xml.jinja2', {"feed": feed}, request=request)
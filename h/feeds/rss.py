@@ -4,6 +4,7 @@ from pyramid import i18n
 from h import presenters
 from h import util
 import h.feeds.util
+from h.feeds.util import present_entries
 
 
 _ = i18n.TranslationStringFactory(__package__)
@@ -47,16 +48,21 @@ def _feed_item_from_annotation(annotation, annotation_url):
 
 
 def feed_from_annotations(annotations, annotation_url, rss_url, html_url,
-                          title, description):
+                          title, description, cache=None):
     """Return an RSS feed for the given list of annotations.
 
+    :param cache: an optional presentation cache in which to keep the feed's
+        items (see :py:func:`h.feeds.util.present_entries`)
+
     :returns: A logical representation of an RSS feed as a Python dict
         containing all of the data that a template would need to render the
         feed to XML (including a list of dicts for the feed's items).
     :rtype: dict
 
     """
-    annotations = [presenters.AnnotationHTMLPresenter(a) for a in annotations]
+    def present(annotation):
+        return _feed_item_from_annotation(
+            presenters.AnnotationHTMLPresenter(annotation), annotation_url)
 
     feed = {
         'title': title,
@@ -65,9 +71,8 @@ def feed_from_annotations(annotations, annotation_url, rss_url, html_url,
         'description': description,
         # This is called entries not items so as not to clash with the dict's
         # standard .items() method.
-        'entries': [
-            _feed_item_from_annotation(annotation, annotation_url)
-            for annotation in annotations]
+        'entries': present_entries(
+            annotations, present, cache=cache, variant=('rss', rss_url)),
     }
 
     if annotations:
@@ -21,3 +21,31 @@ def tag_uri_for_annotation(annotation, annotation_url):
     return u"tag:{domain},{date}:{id_}".format(domain=domain,
                                                date=FEED_TAG_DATE,
                                                id_=annotation.id)
+
+
+def present_entries(annotations, present, cache=None, variant=None):
+    """Return the feed entries of the given annotations.
+
+    Each entry is ``present(annotation)``. If a presentation cache (see
+    :py:mod:`memex.presentation`) is given, entries are kept in it under
+    `variant`, which must identify the feed and so the format and URLs of its
+    entries.
+
+    The titles of annotations of untitled documents are taken from the
+    documents' URIs, which can change without the documents' updated times
+    changing, so their entries aren't cached.
+
+    :rtype: list
+
+    """
+    if cache is None:
+        return [present(a) for a in annotations]
+
+    entries = []
+    for annotation in annotations:
+        document = annotation.document
+        if document is not None and not document.title:
+            entries.append(present(annotation))
+        else:
+            entries.append(cache.present(annotation, variant, present))
+    return entries
@@ -2,6 +2,7 @@
 
 import logging
 
+from h import outbox
 from h.celery import celery
 
 from memex import storage
@@ -44,5 +45,4 @@ def subscribe_annotation_event(event):
 
 
 def includeme(config):
-    config.add_subscriber('h.indexer.subscribe_annotation_event',
-                          'memex.events.AnnotationEvent')
+    outbox.add_subscriber(config, 'h.indexer.subscribe_annotation_event')
@@ -5,12 +5,13 @@ Provides links to different representations of annotations.
 """
 
 
+from memex import links
+
 from h._compat import urlparse
 
 
-def html_link(request, annotation):
-    """Generate a link to an HTML representation of an annotation."""
-    return request.route_url('annotation', id=annotation.id)
+#: Generate a link to an HTML representation of an annotation.
+html_link = links.route_link('annotation')
 
 
 def incontext_link(request, annotation):
@@ -20,6 +21,32 @@ def incontext_link(request, annotation):
         return None
 
     link = urlparse.urljoin(bouncer_url, annotation.thread_root_id)
+    return _incontext_link_with_uri(link, annotation)
+
+
+def _compile_incontext_link(request):
+    bouncer_url = request.registry.settings.get('h.bouncer_url')
+    if not bouncer_url:
+        return lambda annotation: None
+
+    template = links.compile_link_template(
+        urlparse.urljoin(bouncer_url, links.ID_PLACEHOLDER))
+    if template is None:
+        return lambda annotation: incontext_link(request, annotation)
+
+    def compiled(annotation):
+        link = template(annotation.thread_root_id)
+        if link is None:
+            link = urlparse.urljoin(bouncer_url, annotation.thread_root_id)
+        return _incontext_link_with_uri(link, annotation)
+
+    return compiled
+
+
+incontext_link.compile = _compile_incontext_link
+
+
+def _incontext_link_with_uri(link, annotation):
     uri = annotation.target_uri
     if uri.startswith(('http://', 'https://')):
         # We can't use urljoin here, because if it detects the second argument
@@ -0,0 +1,27 @@
+"""
+Add an index on annotation.target_uri_normalized
+
+Revision ID: 3e1727613916
+Revises: 8d5a1e2f6c3b
+Create Date: 2016-10-11 15:20:41.337214
+"""
+
+from __future__ import unicode_literals
+
+from alembic import op
+
+
+revision = '3e1727613916'
+down_revision = '8d5a1e2f6c3b'
+
+
+def upgrade():
+    op.execute('COMMIT')
+    op.create_index(op.f('ix__annotation_target_uri_normalized'),
+                    'annotation',
+                    ['target_uri_normalized'],
+                    postgresql_concurrently=True)
+
+
+def downgrade():
+    op.drop_index(op.f('ix__annotation_target_uri_normalized'), 'annotation')
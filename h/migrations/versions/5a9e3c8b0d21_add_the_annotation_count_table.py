@@ -0,0 +1,45 @@
+"""
+Add the annotation_count table
+
+Revision ID: 5a9e3c8b0d21
+Revises: 3e1727613916
+Create Date: 2016-10-11 15:34:02.118520
+"""
+
+from __future__ import unicode_literals
+
+import sqlalchemy as sa
+from alembic import op
+
+
+revision = '5a9e3c8b0d21'
+down_revision = '3e1727613916'
+
+
+def upgrade():
+    op.create_table(
+        'annotation_count',
+        sa.Column('uri', sa.UnicodeText(), nullable=False),
+        sa.Column('groupid', sa.UnicodeText(), nullable=False),
+        sa.Column('count', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('uri', 'groupid',
+                                name=op.f('pk__annotation_count')))
+
+    # Populate the table from the existing annotations. This is the same query
+    # as `hypothesis annotation-counts rebuild` runs.
+    op.execute("""
+        INSERT INTO annotation_count (uri, groupid, count)
+        SELECT target_uri_normalized, groupid, count(*)
+        FROM annotation
+        WHERE shared
+          AND target_uri_normalized IS NOT NULL
+          AND userid NOT IN (
+            SELECT 'acct:' || username || '@' || authority
+            FROM "user"
+            WHERE nipsa)
+        GROUP BY target_uri_normalized, groupid
+    """)
+
+
+def downgrade():
+    op.drop_table('annotation_count')
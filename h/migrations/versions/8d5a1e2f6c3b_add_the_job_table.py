@@ -0,0 +1,41 @@
+"""
+Add the job table
+
+Revision ID: 8d5a1e2f6c3b
+Revises: f9d3058bec5f
+Create Date: 2016-10-04 11:32:07.211548
+"""
+
+from __future__ import unicode_literals
+
+import sqlalchemy as sa
+from alembic import op
+
+
+revision = '8d5a1e2f6c3b'
+down_revision = 'f9d3058bec5f'
+
+
+def upgrade():
+    op.create_table(
+        'job',
+        sa.Column('created',
+                  sa.DateTime,
+                  server_default=sa.func.now(),
+                  nullable=False),
+        sa.Column('updated',
+                  sa.DateTime,
+                  server_default=sa.func.now(),
+                  nullable=False),
+        sa.Column('id', sa.Integer(), autoincrement=True, primary_key=True),
+        sa.Column('type', sa.UnicodeText(), nullable=False),
+        sa.Column('userid', sa.UnicodeText(), nullable=False),
+        sa.Column('status', sa.UnicodeText(), nullable=False),
+        sa.Column('total', sa.Integer(), nullable=False),
+        sa.Column('processed', sa.Integer(), nullable=False))
+    op.create_index(op.f('ix__job_userid'), 'job', ['userid'])
+
+
+def downgrade():
+    op.drop_index(op.f('ix__job_userid'), 'job')
+    op.drop_table('job')
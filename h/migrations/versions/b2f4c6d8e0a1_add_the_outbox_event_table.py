@@ -0,0 +1,45 @@
+"""
+Add the outbox_event table
+
+Revision ID: b2f4c6d8e0a1
+Revises: 5a9e3c8b0d21
+Create Date: 2016-10-14 10:21:45.630182
+"""
+
+from __future__ import unicode_literals
+
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+from memex.db import types
+
+
+revision = 'b2f4c6d8e0a1'
+down_revision = '5a9e3c8b0d21'
+
+
+def upgrade():
+    op.create_table(
+        'outbox_event',
+        sa.Column('created',
+                  sa.DateTime,
+                  server_default=sa.func.now(),
+                  nullable=False),
+        sa.Column('updated',
+                  sa.DateTime,
+                  server_default=sa.func.now(),
+                  nullable=False),
+        sa.Column('id', sa.Integer(), autoincrement=True, primary_key=True),
+        sa.Column('annotation_id', types.URLSafeUUID, nullable=False),
+        sa.Column('action', sa.UnicodeText(), nullable=False),
+        sa.Column('annotation_dict', postgresql.JSONB, nullable=True),
+        sa.Column('src_client_id', sa.UnicodeText(), nullable=True),
+        sa.Column('attempts',
+                  sa.Integer(),
+                  server_default=sa.text('0'),
+                  nullable=False))
+
+
+def downgrade():
+    op.drop_table('outbox_event')
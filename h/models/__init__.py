@@ -23,11 +23,14 @@ from memex.models.document import Document, DocumentMeta, DocumentURI
 from h.notification import models as notification_models
 
 from h.models.activation import Activation
+from h.models.annotation_count import AnnotationCount
 from h.models.auth_client import AuthClient
 from h.models.blocklist import Blocklist
 from h.models.feature import Feature
 from h.models.feature_cohort import FeatureCohort
 from h.models.group import Group
+from h.models.job import Job
+from h.models.outbox import OutboxEvent
 from h.models.token import Token
 from h.models.user import User
 from h.models.uri import Uri
@@ -35,6 +38,7 @@ from h.models.uri import Uri
 __all__ = (
     'Activation',
     'Annotation',
+    'AnnotationCount',
     'AuthClient',
     'Blocklist',
     'Document',
@@ -43,6 +47,8 @@ __all__ = (
     'Feature',
     'FeatureCohort',
     'Group',
+    'Job',
+    'OutboxEvent',
     'Subscriptions',
     'Token',
     'User',
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import sqlalchemy as sa
+
+from h.db import Base
+
+
+class AnnotationCount(Base):
+
+    """
+    The number of shared annotations of a document URI in a group.
+
+    Rows are keyed by normalized URI and group, so that the number of public
+    annotations of a page is the count for the ``__world__`` group. Only
+    shared annotations by users who aren't NIPSA'd are counted, as these are
+    the ones which other users can see.
+
+    The counts are derived from the ``annotation`` table and are maintained by
+    :py:class:`h.badge.services.AnnotationCountService`.
+    """
+
+    __tablename__ = 'annotation_count'
+
+    #: The normalized target URI of the counted annotations.
+    uri = sa.Column(sa.UnicodeText(), primary_key=True)
+
+    #: The pubid of the group of the counted annotations.
+    groupid = sa.Column(sa.UnicodeText(), primary_key=True)
+
+    count = sa.Column(sa.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return '<AnnotationCount {} {} {}>'.format(self.uri,
+                                                   self.groupid,
+                                                   self.count)
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import sqlalchemy as sa
+
+from h.db import Base
+from h.db import mixins
+
+
+class Job(Base, mixins.Timestamps):
+
+    """
+    The progress of a long-running background job.
+
+    Jobs such as renaming or deleting a user process a user's annotations in
+    batches, committing after each one. They record how far they have got here
+    so that the admin pages can show it while the job is still running, and
+    whether it failed.
+    """
+
+    __tablename__ = 'job'
+
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+
+    id = sa.Column(sa.Integer, autoincrement=True, primary_key=True)
+
+    #: The kind of job, for example "rename_user" or "delete_user".
+    type = sa.Column(sa.UnicodeText(), nullable=False)
+
+    #: The userid of the user this job acts on.
+    userid = sa.Column(sa.UnicodeText(), nullable=False, index=True)
+
+    status = sa.Column(sa.UnicodeText(), nullable=False, default=QUEUED)
+
+    #: The number of items (annotations) this job expects to process, and the
+    #: number it has processed so far.
+    total = sa.Column(sa.Integer, nullable=False, default=0)
+    processed = sa.Column(sa.Integer, nullable=False, default=0)
+
+    @property
+    def finished(self):
+        return self.status == self.DONE
+
+    @classmethod
+    def recent(cls, session, limit=10):
+        """Return the most recently created jobs, newest first."""
+        return (session.query(cls)
+                .order_by(cls.created.desc(), cls.id.desc())
+                .limit(limit)
+                .all())
+
+    def __repr__(self):
+        return '<Job {} {} {}/{}>'.format(self.type,
+                                          self.status,
+                                          self.processed,
+                                          self.total)
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql as pg
+
+from h.db import Base
+from h.db import mixins
+from memex.db import types
+
+
+class OutboxEvent(Base, mixins.Timestamps):
+
+    """
+    An annotation event waiting to be delivered by the outbox relay.
+
+    Outbox events are written in the same transaction as the annotation change
+    they describe, so that an event is recorded if and only if the change is
+    committed. The relay (see :py:mod:`h.outbox`) delivers them and deletes
+    them once they have been delivered.
+    """
+
+    __tablename__ = 'outbox_event'
+
+    id = sa.Column(sa.Integer, autoincrement=True, primary_key=True)
+
+    annotation_id = sa.Column(types.URLSafeUUID, nullable=False)
+
+    #: The action on the annotation: "create", "update" or "delete".
+    action = sa.Column(sa.UnicodeText(), nullable=False)
+
+    #: The presented annotation, for "delete" events, as it can no longer be
+    #: fetched once the event is delivered.
+    annotation_dict = sa.Column(pg.JSONB, nullable=True)
+
+    #: The X-Client-Id header of the request which made the change.
+    src_client_id = sa.Column(sa.UnicodeText(), nullable=True)
+
+    #: The number of times delivering this event has failed.
+    attempts = sa.Column(sa.Integer, nullable=False, default=0,
+                         server_default=sa.text('0'))
+
+    @classmethod
+    def pending(cls, session, limit, max_attempts, after=None):
+        """
+        Return and lock the oldest events still to be delivered.
+
+        Events which have failed `max_attempts` times or more are left alone.
+        If `after` is given, only events with a greater id are returned.
+
+        Events locked by another transaction, such as that of another relay
+        delivering them, are skipped rather than waited for, so that relays
+        can run side by side.
+        """
+        query = session.query(cls).filter(cls.attempts < max_attempts)
+        if after is not None:
+            query = query.filter(cls.id > after)
+        return (query
+                .order_by(cls.id)
+                .limit(limit)
+                # This version of SQLAlchemy can't render SKIP LOCKED with
+                # with_for_update().
+                .suffix_with('FOR UPDATE SKIP LOCKED')
+                .all())
+
+    def __repr__(self):
+        return '<OutboxEvent {} {} {}>'.format(self.id,
+                                               self.action,
+                                               self.annotation_id)
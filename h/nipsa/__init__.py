@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 
+from h.nipsa import export
 from h.nipsa import services
 from h.nipsa import search
 
@@ -15,3 +16,6 @@ def includeme(config):
 
     # Register an additional filter with the API search module
     config.add_search_filter(search.Filter)
+
+    # Register an additional filter with the annotation export module
+    config.add_export_filter(export.Filter)
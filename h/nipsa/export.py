@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+
+import sqlalchemy as sa
+
+from h.models import Annotation
+from h.nipsa.services import flagged_userids
+
+
+class Filter(object):
+
+    """
+    Filter the annotations of NIPSA'd users out of annotation exports.
+
+    As with search, the authenticated user's own annotations are never
+    filtered out.
+    """
+
+    def __init__(self, request):
+        # Exports may be read after the request has ended, so the userid is
+        # looked up now.
+        self.userid = request.authenticated_userid
+
+    def __call__(self, query):
+        not_nipsad = Annotation.userid.notin_(flagged_userids())
+        if self.userid is not None:
+            not_nipsad = sa.or_(not_nipsad, Annotation.userid == self.userid)
+        return query.filter(not_nipsad)
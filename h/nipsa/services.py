@@ -1,5 +1,7 @@
 # -*- coding: utf-8 -*-
 
+import sqlalchemy as sa
+
 from h.models import User
 from h.nipsa import worker
 
@@ -11,8 +13,9 @@ class NipsaService(object):
     (NIPSA) flags on userids.
     """
 
-    def __init__(self, session):
+    def __init__(self, session, annotation_counts=None):
         self.session = session
+        self.annotation_counts = annotation_counts
 
     @property
     def flagged_users(self):
@@ -39,6 +42,7 @@ class NipsaService(object):
         """
         user.nipsa = True
         worker.add_nipsa.delay(user.userid)
+        self._refresh_counts(user)
 
     def unflag(self, user):
         """
@@ -50,8 +54,28 @@ class NipsaService(object):
         """
         user.nipsa = False
         worker.remove_nipsa.delay(user.userid)
+        self._refresh_counts(user)
+
+    def _refresh_counts(self, user):
+        # The annotations of NIPSA'd users aren't included in the
+        # materialized annotation counts.
+        if self.annotation_counts is not None:
+            self.annotation_counts.refresh_user(user.userid)
+
+
+def flagged_userids():
+    """
+    Return a query selecting the userids of all the NIPSA'd users.
+
+    This can be used as a subquery, for example to filter NIPSA'd users'
+    annotations out of a query without loading every NIPSA'd user.
+    """
+    return sa.select([sa.func.concat('acct:', User.username,
+                                     '@', User.authority)]) \
+        .where(User.nipsa.is_(True))
 
 
 def nipsa_factory(context, request):
     """Return a NipsaService instance for the passed context and request."""
-    return NipsaService(request.db)
+    return NipsaService(request.db,
+                        request.find_service(name='annotation_counts'))
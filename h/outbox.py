@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+"""
+A transactional outbox for annotation events.
+
+Normally annotation events are published once the response to the request
+which created, updated or deleted the annotation has been built (see
+:py:mod:`memex.eventqueue`), and their subscribers send them to the realtime
+message broker, queue the search indexer's Celery tasks and send any reply
+notifications, all on the web worker. The request is kept waiting for the
+broker and the mailer, and if the broker is down the events are lost.
+
+With the ``h.outbox`` setting enabled each annotation event is instead written
+to the ``outbox_event`` table (see :py:class:`h.models.OutboxEvent`) in the
+same transaction as the change it describes. The subscribers registered with
+:py:func:`add_subscriber` are then called by a separate relay process,
+``hypothesis outbox-relay``, which delivers the outbox's events in batches and
+only deletes them once they have been delivered. An event whose delivery
+fails is kept and retried, so every event is delivered at least once.
+
+Subscribers which only keep state in the web process itself up to date, such
+as its caches, still receive :py:class:`memex.events.AnnotationEvent` after
+the request as before.
+"""
+
+from __future__ import unicode_literals
+
+import logging
+
+from pyramid.settings import asbool
+
+from h import models
+from memex.eventqueue import EventQueue
+from memex.events import AnnotationEvent
+
+log = logging.getLogger(__name__)
+
+#: The default number of events delivered in each batch.
+DEFAULT_BATCH_SIZE = 100
+
+#: The default number of times delivering an event is attempted before the
+#: relay gives up on it. Events which it has given up on are kept in the
+#: outbox for inspection.
+DEFAULT_MAX_ATTEMPTS = 10
+
+
+class RelayedAnnotationEvent(object):
+
+    """An annotation event delivered from the outbox by the relay."""
+
+    def __init__(self, request, annotation_id, action, annotation_dict=None,
+                 src_client_id=None):
+        self.request = request
+        self.annotation_id = annotation_id
+        self.action = action
+        self.annotation_dict = annotation_dict
+        self.src_client_id = src_client_id
+
+
+class OutboxQueue(EventQueue):
+
+    """
+    An event queue which also writes annotation events to the outbox.
+
+    The outbox event is added to the request's database session, and so is
+    committed or rolled back together with the annotation change itself.
+    """
+
+    def __call__(self, event):
+        if isinstance(event, AnnotationEvent):
+            self.request.db.add(models.OutboxEvent(
+                annotation_id=event.annotation_id,
+                action=event.action,
+                annotation_dict=event.annotation_dict,
+                src_client_id=self.request.headers.get('X-Client-Id')))
+        super(OutboxQueue, self).__call__(event)
+
+
+def enabled(settings):
+    """Return whether annotation events are delivered through the outbox."""
+    return asbool(settings.get('h.outbox', False))
+
+
+def add_subscriber(config, subscriber):
+    """
+    Subscribe `subscriber` to annotation events which leave the web process.
+
+    With the outbox enabled `subscriber` is called by the relay with
+    :py:class:`RelayedAnnotationEvent`, otherwise after each request with
+    :py:class:`memex.events.AnnotationEvent`.
+    """
+    if enabled(config.registry.settings):
+        config.add_subscriber(subscriber, 'h.outbox.RelayedAnnotationEvent')
+    else:
+        config.add_subscriber(subscriber, 'memex.events.AnnotationEvent')
+
+
+def relay(request,
+          batch_size=DEFAULT_BATCH_SIZE,
+          max_attempts=DEFAULT_MAX_ATTEMPTS,
+          stats=None):
+    """
+    Deliver a batch of events from the outbox.
+
+    Each event is notified to the subscribers registered with
+    :py:func:`add_subscriber` in a transaction of its own, in which it is then
+    deleted. If delivering an event fails, its transaction is aborted (as the
+    subscriber may have left it unusable) and the failed attempt is counted
+    in a new transaction, so that no failure can undo the count and have the
+    event retried forever.
+
+    Returns the number of events which were delivered.
+    """
+    delivered = failed = 0
+    last_id = None
+    while delivered + failed < batch_size:
+        events = models.OutboxEvent.pending(request.db,
+                                            limit=1,
+                                            max_attempts=max_attempts,
+                                            after=last_id)
+        if not events:
+            break
+        event = events[0]
+        last_id = event.id
+
+        try:
+            request.registry.notify(RelayedAnnotationEvent(
+                request,
+                event.annotation_id,
+                event.action,
+                annotation_dict=event.annotation_dict,
+                src_client_id=event.src_client_id))
+            request.db.delete(event)
+            request.tm.commit()
+        except Exception:
+            log.exception('Failed to deliver %r.', event)
+            request.tm.abort()
+            _record_failure(request, last_id, max_attempts)
+            failed += 1
+        else:
+            delivered += 1
+
+    if stats is not None and (delivered or failed):
+        stats.incr('outbox.delivered', delivered)
+        stats.incr('outbox.failed', failed)
+
+    return delivered
+
+
+def _record_failure(request, event_id, max_attempts):
+    """Count a failed attempt to deliver the event `event_id` and commit it."""
+    event = (request.db.query(models.OutboxEvent)
+             .filter_by(id=event_id)
+             .with_for_update()
+             .one_or_none())
+    if event is not None:
+        event.attempts += 1
+        log.warn('Delivering %r failed (attempt %d of %d).',
+                 event, event.attempts, max_attempts)
+    request.tm.commit()
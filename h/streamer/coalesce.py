@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""
+Coalescing of rapid annotation events.
+
+Editing an annotation can produce a burst of ``update`` events for it, and for
+each of them the streamer fetches and presents the annotation and sends it to
+every interested client. As the streamer always fetches the annotation's
+current state, all but the last of these events are redundant by the time
+they are handled.
+
+A :py:class:`Coalescer` holds back each annotation event for a short window.
+Events for the same annotation which arrive within the window are merged into
+one, so that the annotation is only fetched and sent once with its latest
+state:
+
+- a ``create`` followed by ``update`` events becomes a single ``create``
+- ``update`` events followed by a ``delete`` become a single ``delete``
+- a ``create`` followed by a ``delete`` cancels out, and nothing is sent
+
+Events for different annotations don't affect each other, and the order of
+the events for the same annotation is kept.
+"""
+
+from __future__ import unicode_literals
+
+import gevent
+
+#: The actions of the events which are coalesced. Other events are passed on
+#: immediately.
+ACTIONS = ('create', 'update', 'delete')
+
+
+class Coalescer(object):
+
+    """Merges the events for the same annotation within a time window."""
+
+    def __init__(self, emit, window, stats=None):
+        """
+        Create a new coalescer.
+
+        :param emit: the function called with each event once its window has
+                     passed
+        :param window: the number of seconds for which events are held back
+        :type window: float
+        :param stats: an optional statsd client to report the number of
+                      coalesced events to
+        """
+        self.window = window
+        self._emit = emit
+        self._stats = stats
+
+        # The pending event and the timer which will emit it, by annotation id.
+        self._pending = {}
+
+    def add(self, event):
+        """Add the annotation event `event`, a realtime message payload."""
+        id_ = event.get('annotation_id')
+        if id_ is None or event.get('action') not in ACTIONS:
+            self._emit(event)
+            return
+
+        pending = self._pending.get(id_)
+        if pending is None:
+            timer = gevent.spawn_later(self.window, self._flush, id_)
+            self._pending[id_] = (event, timer)
+            return
+
+        if self._stats is not None:
+            self._stats.incr('streamer.coalesced')
+
+        earlier, timer = pending
+        merged = _merge(earlier, event)
+        if merged is None:
+            timer.kill(block=False)
+            del self._pending[id_]
+        else:
+            self._pending[id_] = (merged, timer)
+
+    def _flush(self, id_):
+        event, _ = self._pending.pop(id_)
+        self._emit(event)
+
+
+def _merge(earlier, later):
+    """Return the event which replaces two events, or None if they cancel."""
+    if earlier['action'] == 'create':
+        if later['action'] == 'delete':
+            return None
+        return dict(later, action='create')
+    return later
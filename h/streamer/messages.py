@@ -1,17 +1,21 @@
 # -*- coding: utf-8 -*-
 
-from collections import namedtuple
+from collections import namedtuple, OrderedDict
 import logging
 
 from gevent.queue import Full
 
 from h import realtime
 from h.realtime import Consumer
+from memex import presentation
 from memex import presenters
 from memex import storage
 from memex.links import LinksService
 from h.auth.util import translate_annotation_principals
 from h.nipsa.services import NipsaService
+from h.streamer import coalesce
+from h.streamer import replay
+from h.streamer import routing
 from h.streamer import websocket
 import h.sentry
 import h.stats
@@ -31,9 +35,25 @@ def process_messages(settings, routing_key, work_queue, raise_error=True):
     This sets up a :py:class:`h.realtime.Consumer` to route messages from
     `routing_key` to the passed `work_queue`, and starts it. The consumer
     should never return. If it does, this function will raise an exception.
+
+    If the ``h.streamer.coalesce_window`` setting is a positive number of
+    seconds, annotation events are coalesced within that window before being
+    queued (see :py:mod:`h.streamer.coalesce`).
+
+    Annotation events are numbered and kept in :py:data:`replay.BUFFER` as
+    they are queued, for reconnecting clients to catch up with.
+
+    If annotation messages are partitioned, the partitions wanted by the open
+    sockets are consumed as well as the unpartitioned routing key (see
+    :py:mod:`h.streamer.routing`), and the replay buffer is told which ones
+    are being consumed.
     """
 
     def _handler(payload):
+        if routing_key == 'annotation':
+            payload = dict(payload,
+                           epoch=replay.BUFFER.epoch,
+                           sequence=replay.BUFFER.append(payload))
         try:
             message = Message(topic=routing_key, payload=payload)
             work_queue.put(message, timeout=0.1)
@@ -44,17 +64,50 @@ def process_messages(settings, routing_key, work_queue, raise_error=True):
     conn = realtime.get_connection(settings)
     sentry_client = h.sentry.get_client(settings)
     statsd_client = h.stats.get_client(settings)
+
+    handler = _handler
+    window = float(settings.get('h.streamer.coalesce_window', 0))
+    if routing_key == 'annotation' and window > 0:
+        handler = coalesce.Coalescer(_handler, window, stats=statsd_client).add
+
+    routing_keys = None
+    on_routing_keys = None
+    partitions = realtime.get_partitions(settings)
+    if routing_key == 'annotation' and partitions:
+        def routing_keys():
+            return routing.routing_keys(all_sockets(), partitions)
+        on_routing_keys = replay.BUFFER.set_partitions
+
     consumer = Consumer(connection=conn,
                         routing_key=routing_key,
-                        handler=_handler,
+                        handler=handler,
                         sentry_client=sentry_client,
-                        statsd_client=statsd_client)
+                        statsd_client=statsd_client,
+                        routing_keys=routing_keys,
+                        on_routing_keys=on_routing_keys)
     consumer.run()
 
     if raise_error:
         raise RuntimeError('Realtime consumer quit unexpectedly!')
 
 
+def all_sockets(userids=None):
+    """
+    Return the open websockets, or those of the users `userids`.
+
+    This looks the sockets of the given users up in the index kept by
+    :py:class:`h.streamer.websocket.WebSocket`, so it takes time proportional
+    to their number, not to the number of all open sockets.
+    """
+    # N.B. We iterate over a non-weak list of instances because there's nothing
+    # to stop connections being added or dropped during iteration, and if that
+    # happens Python will throw a "Set changed size during iteration" error.
+    if userids is None:
+        return list(websocket.WebSocket.instances)
+    return [s for userid in userids
+            for s in websocket.WebSocket.for_userid(userid)]
+
+
 def handle_message(message, session, topic_handlers):
     """
     Deserialize and process a message from the reader.
@@ -65,6 +118,9 @@ def handle_message(message, session, topic_handlers):
     `None`, to signify that no message should be sent, or a JSON-serializable
     object. It is assumed that there is a 1:1 request-reply mapping between
     incoming messages and messages to be sent out over the websockets.
+
+    User events only concern the sockets of their user, so only those are
+    looked up (see :py:func:`all_sockets`).
     """
     try:
         handler = topic_handlers[message.topic]
@@ -72,10 +128,10 @@ def handle_message(message, session, topic_handlers):
         raise RuntimeError("Don't know how to handle message from topic: "
                            "{}".format(message.topic))
 
-    # N.B. We iterate over a non-weak list of instances because there's nothing
-    # to stop connections being added or dropped during iteration, and if that
-    # happens Python will throw a "Set changed size during iteration" error.
-    sockets = list(websocket.WebSocket.instances)
+    if message.topic == 'user':
+        sockets = all_sockets(userids=[message.payload.get('userid')])
+    else:
+        sockets = all_sockets()
     handler(message.payload, sockets, session)
 
 
@@ -104,6 +160,48 @@ def handle_annotation_event(message, sockets, session):
         socket.send_json(reply)
 
 
+def replay_annotation_events(socket, session, epoch, sequence):
+    """
+    Send `socket` the annotation events it missed after `sequence`.
+
+    Only the latest event for each annotation is sent, with the annotation's
+    current state, and only if it matches the socket's filter. The socket is
+    then sent a ``resume`` message whose ``ok`` field says whether the missed
+    events could be sent. If they couldn't (because they are no longer in the
+    buffer, because `epoch` isn't the epoch of this process's buffer,
+    because the socket hasn't set a filter yet, so that no events would match
+    it, or because the process hasn't been receiving the events of the
+    partitions the socket is watching since `sequence`) the client must
+    search for the annotations it shows again. Either way the ``epoch`` and
+    ``sequence`` of the message are the position from which the client can
+    resume next time.
+    """
+    buffer = replay.BUFFER
+    events = None
+    if (socket.filter is not None and
+            epoch == buffer.epoch and
+            isinstance(sequence, int) and
+            _partitions_consumed_since(socket, sequence)):
+        events = buffer.since(sequence)
+
+    if events is not None:
+        latest = OrderedDict()
+        for n, event in events:
+            latest.pop(event['annotation_id'], None)
+            latest[event['annotation_id']] = dict(event,
+                                                  epoch=buffer.epoch,
+                                                  sequence=n)
+        for event in latest.values():
+            handle_annotation_event(event, [socket], session)
+
+    socket.send_json({
+        'type': 'resume',
+        'ok': events is not None,
+        'epoch': buffer.epoch,
+        'sequence': buffer.sequence,
+    })
+
+
 def handle_user_event(message, sockets, _):
     for socket in sockets:
         reply = _generate_user_event(message, socket)
@@ -148,11 +246,7 @@ def _generate_annotation_event(message, socket, annotation, user_nipsad):
         if annotation is None:
             return None
 
-        base_url = socket.registry.settings.get('h.app_url',
-                                                'http://localhost:5000')
-        links_service = LinksService(base_url, socket.registry)
-        serialized = presenters.AnnotationJSONPresenter(annotation,
-                                                        links_service).asdict()
+        serialized = _present(socket.registry, annotation)
 
     userid = serialized.get('user')
     if user_nipsad and socket.authenticated_userid != userid:
@@ -168,9 +262,33 @@ def _generate_annotation_event(message, socket, annotation, user_nipsad):
     notification['payload'] = [serialized]
     if action == 'delete':
         notification['payload'] = [{'id': id_}]
+    if 'sequence' in message:
+        notification['epoch'] = message['epoch']
+        notification['sequence'] = message['sequence']
     return notification
 
 
+def _present(registry, annotation):
+    """
+    Present `annotation` in the API's JSON format.
+
+    The presentation is the same for every socket, so it is taken from the
+    presentation cache if possible.
+    """
+    base_url = registry.settings.get('h.app_url', 'http://localhost:5000')
+
+    def present(annotation):
+        links_service = LinksService(base_url, registry)
+        return presenters.AnnotationJSONPresenter(annotation,
+                                                  links_service).asdict()
+
+    cache = presentation.get_cache(registry)
+    if cache is None:
+        return present(annotation)
+    return cache.present(annotation, presentation.json_variant(base_url),
+                         present)
+
+
 def _generate_user_event(message, socket):
     """
     Get message about user event `message` to be sent to `socket`.
@@ -205,3 +323,12 @@ def _authorized_to_read(effective_principals, permissions):
     if set(read_principals).intersection(effective_principals):
         return True
     return False
+
+
+def _partitions_consumed_since(socket, sequence):
+    """Return whether the socket's partitions were consumed since `sequence`."""
+    partitions = realtime.get_partitions(socket.registry.settings)
+    if not partitions:
+        return True
+    routing_keys = routing.routing_keys([socket], partitions)
+    return replay.BUFFER.consumed_since(routing_keys, sequence)
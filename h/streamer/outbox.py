@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+"""
+Bounded outbound buffers for websocket clients.
+
+Writing to a websocket blocks until the client's connection has taken the
+data, so a client on a slow link would hold up whoever is writing to it. If
+that were the streamer's worker, fanning an annotation event out to every
+socket, one bad connection would delay the updates of all other clients.
+
+Instead, frames for a socket are put in its :py:class:`Outbox`, which never
+blocks, and are written to the socket by a greenlet of its own. The number of
+frames waiting in an outbox is bounded: when a frame is put in an outbox which
+is full, its policy decides what happens:
+
+``drop_oldest``
+    the oldest waiting frame is dropped to make room for the new one.
+
+``coalesce``
+    if a waiting frame is about the same annotation as the new one, it is
+    replaced by the new one, which supersedes it. Otherwise the oldest waiting
+    frame is dropped, as with ``drop_oldest``.
+
+``disconnect``
+    all waiting frames are dropped and the client is disconnected, so that it
+    can reconnect and catch up once its connection has improved.
+"""
+
+from __future__ import unicode_literals
+
+import collections
+import logging
+
+import gevent
+import gevent.event
+
+log = logging.getLogger(__name__)
+
+DROP_OLDEST = 'drop_oldest'
+COALESCE = 'coalesce'
+DISCONNECT = 'disconnect'
+
+POLICIES = (DROP_OLDEST, COALESCE, DISCONNECT)
+
+#: The default maximum number of frames waiting in an outbox.
+DEFAULT_SIZE = 128
+
+#: The number of frames dropped and of clients disconnected by all outboxes
+#: of this process since it started.
+totals = collections.Counter()
+
+
+class Outbox(object):
+
+    """A bounded buffer of frames to be sent to a websocket client."""
+
+    def __init__(self, send, maxsize=DEFAULT_SIZE, policy=DROP_OLDEST,
+                 on_overflow=None):
+        """
+        Create a new outbox.
+
+        :param send: the function which writes a frame to the client
+        :param maxsize: the maximum number of frames waiting to be sent
+        :type maxsize: int
+        :param policy: what to do when a frame is put in a full outbox, one of
+                       :py:data:`POLICIES`
+        :param on_overflow: a function of no arguments called when the outbox
+                            overflows with the ``disconnect`` policy, which
+                            should disconnect the client
+        """
+        if policy not in POLICIES:
+            raise ValueError('unknown outbox policy: {!r}'.format(policy))
+
+        self.maxsize = maxsize
+        self.policy = policy
+        self.closed = False
+        self.buffered_bytes = 0
+        self.dropped = 0
+
+        self._send = send
+        self._on_overflow = on_overflow
+        self._frames = collections.deque()
+        self._ready = gevent.event.Event()
+        self._greenlet = None
+
+    def __len__(self):
+        return len(self._frames)
+
+    def put(self, data, key=None):
+        """
+        Queue the frame `data` to be sent, without blocking.
+
+        :param data: the serialized frame
+        :param key: an optional hashable key, such that a waiting frame with
+                    the same key may be replaced by this one under the
+                    ``coalesce`` policy
+        """
+        if self.closed:
+            return
+
+        if len(self._frames) >= self.maxsize:
+            if not self._overflow(data, key):
+                return
+
+        self._frames.append((key, data))
+        self.buffered_bytes += len(data)
+        self._ready.set()
+
+        if self._greenlet is None:
+            self._greenlet = gevent.spawn(self._run)
+
+    def close(self):
+        """Drop all waiting frames and stop sending."""
+        self.closed = True
+        self._frames.clear()
+        self.buffered_bytes = 0
+        self._ready.set()
+
+    def _overflow(self, data, key):
+        """
+        Make room for the frame `data` in a full outbox.
+
+        Returns whether the frame should still be queued.
+        """
+        if self.policy == COALESCE and key is not None:
+            for i, (waiting_key, waiting_data) in enumerate(self._frames):
+                if waiting_key == key:
+                    self._frames[i] = (key, data)
+                    self.buffered_bytes += len(data) - len(waiting_data)
+                    self._drop(1)
+                    return False
+
+        if self.policy == DISCONNECT:
+            self._drop(len(self._frames) + 1)
+            self.close()
+            totals['disconnected'] += 1
+            if self._on_overflow is not None:
+                self._on_overflow()
+            return False
+
+        _, oldest = self._frames.popleft()
+        self.buffered_bytes -= len(oldest)
+        self._drop(1)
+        return True
+
+    def _drop(self, count):
+        self.dropped += count
+        totals['dropped'] += count
+
+    def _run(self):
+        while not self.closed:
+            if not self._frames:
+                self._ready.clear()
+                self._ready.wait()
+                continue
+
+            _, data = self._frames.popleft()
+            self.buffered_bytes -= len(data)
+            try:
+                self._send(data)
+            except Exception:
+                log.debug('failed to send to websocket client', exc_info=True)
+                self.close()
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""
+A buffer of recent annotation events for clients to catch up with.
+
+When a client's websocket drops it misses the annotation events sent while
+it is disconnected, and without a way to get them it has to search for all
+the annotations it shows again once it reconnects.
+
+The streamer numbers the annotation events it receives and keeps the most
+recent ones in a :py:class:`ReplayBuffer`. Every annotation notification sent
+to a client carries the ``epoch`` of the buffer and the ``sequence`` number
+of its event, and a reconnecting client can send these back in a ``resume``
+message to be sent the events it has missed (see
+:py:func:`h.streamer.messages.replay_annotation_events`).
+
+The buffer is kept in memory by each streamer process, so its sequence
+numbers only mean something to the process which assigned them. Each buffer
+has a random epoch, which tells a process whether a client was last connected
+to it: a client resuming from another epoch (because it reconnected to
+another process, or because the process was restarted), or from events which
+have since fallen out of the buffer, is told to search again instead.
+
+If annotation messages are partitioned (see :py:mod:`h.streamer.routing`) a
+process only receives the events of the partitions its clients are watching,
+and a client which was the only one watching a partition misses its events
+once it disconnects. The buffer therefore records when each partition started
+being consumed, and a client can only resume from a point since which all the
+partitions it is watching have been consumed.
+"""
+
+from __future__ import unicode_literals
+
+import collections
+import uuid
+
+#: The default number of events kept in the buffer.
+DEFAULT_SIZE = 1000
+
+
+class ReplayBuffer(object):
+
+    """A bounded buffer of recent events, numbered in order."""
+
+    def __init__(self, size=DEFAULT_SIZE):
+        self.epoch = uuid.uuid4().hex
+        self.sequence = 0
+        self._events = collections.deque(maxlen=size)
+        self._partitions = {}
+
+    def resize(self, size):
+        """Change the number of events kept, keeping the most recent ones."""
+        self._events = collections.deque(self._events, maxlen=size)
+
+    def append(self, event):
+        """Add `event` to the buffer and return its sequence number."""
+        self.sequence += 1
+        self._events.append((self.sequence, event))
+        return self.sequence
+
+    def since(self, sequence):
+        """
+        Return the events after the one numbered `sequence`.
+
+        Returns a list of ``(sequence, event)`` tuples in order, or None if
+        some of the events after `sequence` are no longer in the buffer, or if
+        `sequence` was never assigned.
+        """
+        if sequence < 0 or sequence > self.sequence:
+            return None
+
+        first = self.sequence - len(self._events) + 1
+        if sequence < first - 1:
+            return None
+
+        return [(n, e) for n, e in self._events if n > sequence]
+
+    def set_partitions(self, routing_keys):
+        """
+        Record the routing keys of the partitions being consumed.
+
+        The sequence number at which each partition started being consumed is
+        kept until it stops being consumed.
+        """
+        self._partitions = {key: self._partitions.get(key, self.sequence)
+                            for key in routing_keys}
+
+    def consumed_since(self, routing_keys, sequence):
+        """
+        Return whether all of `routing_keys` were consumed since `sequence`.
+
+        If not, events of the other partitions after `sequence` may have been
+        missed.
+        """
+        for key in routing_keys:
+            if key not in self._partitions:
+                return False
+            if self._partitions[key] > sequence:
+                return False
+        return True
+
+    def __len__(self):
+        return len(self._events)
+
+
+# The buffer of the annotation events received by this process.
+BUFFER = ReplayBuffer()
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""
+The realtime partitions the streamer's clients are interested in.
+
+When annotation messages are partitioned by document URI (see
+:py:func:`h.realtime.get_partitions`) each streamer process only consumes
+the partitions of the documents its clients are watching, so that adding
+streamer processes divides the work of handling annotation events between
+them rather than multiplying it.
+
+A client is watching a set of documents if its filter only matches
+annotations whose ``/uri`` is one of a set of URIs, as the filter set by the
+sidebar does. Clients with any other filter may be interested in annotations
+of any document, and while one is connected all partitions are consumed.
+
+The partitions are checked periodically, so a client may miss the events of
+a newly watched document made within a second or so of it setting its
+filter.
+"""
+
+from __future__ import unicode_literals
+
+from memex import uri
+
+from h import realtime
+
+#: The operators with which a ``/uri`` clause lists the URIs it matches.
+URI_OPERATORS = ('equals', 'one_of')
+
+
+def routing_keys(sockets, partitions):
+    """Return the routing keys of the partitions wanted by `sockets`."""
+    uris = set()
+    for socket in sockets:
+        if socket.filter is None:
+            # The socket isn't sent anything until it has set a filter.
+            continue
+        socket_uris = filter_uris(socket.filter.filter)
+        if socket_uris is None:
+            return set('annotation.{}'.format(p) for p in range(partitions))
+        uris.update(socket_uris)
+
+    return set(realtime.partition_routing_key(u, partitions) for u in uris)
+
+
+def filter_uris(filter_):
+    """
+    Return the normalized URIs of the annotations a filter can match.
+
+    Returns None if the filter can match annotations of any URI.
+    """
+    clauses = filter_.get('clauses', [])
+    uri_clauses = [c for c in clauses if _is_uri_clause(c)]
+    if not uri_clauses:
+        return None
+
+    policy = filter_.get('match_policy')
+    if policy == 'include_all':
+        # Every clause must match, so any one of the URI clauses will do.
+        uri_clauses = uri_clauses[:1]
+    elif policy != 'include_any' or len(uri_clauses) != len(clauses):
+        return None
+
+    uris = set()
+    for clause in uri_clauses:
+        values = clause['value']
+        if not isinstance(values, list):
+            values = [values]
+        uris.update(uri.normalize(v) for v in values)
+    return uris
+
+
+def _is_uri_clause(clause):
+    return (clause.get('field') == '/uri' and
+            clause.get('operator') in URI_OPERATORS)
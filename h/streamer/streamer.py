@@ -4,21 +4,99 @@ import logging
 import sys
 
 import gevent
+from gevent.queue import Full
 
 from h import db
 from h import stats
 from h.streamer import messages
+from h.streamer import outbox
+from h.streamer import replay
 from h.streamer import websocket
 
 log = logging.getLogger(__name__)
 
+#: The default number of shards the streamer's work is split between.
+DEFAULT_SHARDS = 4
+
+#: The maximum number of messages waiting in each of the work queues.
+SHARD_QUEUE_SIZE = 4096
+
+
+class WorkQueue(object):
+
+    """
+    The queues of messages for the streamer's workers to process.
+
+    Messages from client websockets are split between a number of shards, each
+    with its own queue and its own worker greenlet, so that a slow message
+    (for example one which waits on a slow database query) only holds up the
+    sockets of one shard. Every socket belongs to exactly one shard, whose
+    worker takes its messages in turn, so they are handled in order.
+
+    Messages from the realtime message queues concern every socket. They are
+    queued once, on a queue of their own, and a single worker delivers each
+    of them to all the sockets, so that the annotation of an event and its
+    user's NIPSA flag are only loaded once however many shards there are.
+
+    The size of each queue is bounded. If a message can't be queued because
+    its queue is full, it is dropped and counted in :py:attr:`dropped` (for
+    the shards) or :py:attr:`realtime_dropped`.
+    """
+
+    def __init__(self, shards=1, maxsize=SHARD_QUEUE_SIZE):
+        self.maxsize = maxsize
+        self.resize(shards)
+
+    def resize(self, shards):
+        """
+        Split the work from client websockets between `shards` shards.
+
+        This replaces the queues, and so must be done before any work is
+        queued.
+        """
+        self.queues = [gevent.queue.Queue(maxsize=self.maxsize)
+                       for _ in range(shards)]
+        self.dropped = [0] * shards
+        self.realtime = gevent.queue.Queue(maxsize=self.maxsize)
+        self.realtime_dropped = 0
+
+    def shard(self, socket):
+        """Return the index of the shard that `socket` belongs to."""
+        return hash(socket) % len(self.queues)
+
+    def put(self, message, timeout=None):
+        """
+        Queue `message` for the worker which must process it.
+
+        Raises :py:exc:`gevent.queue.Full` if the message had to be dropped
+        because its queue stayed full for `timeout` seconds.
+        """
+        if not isinstance(message, websocket.Message):
+            try:
+                self.realtime.put(message, timeout=timeout)
+            except Full:
+                self.realtime_dropped += 1
+                raise
+            return
+
+        shard = self.shard(message.socket)
+        try:
+            self.queues[shard].put(message, timeout=timeout)
+        except Full:
+            self.dropped[shard] += 1
+            raise
+
+    def qsize(self):
+        """Return the total number of messages waiting to be processed."""
+        return self.realtime.qsize() + sum(q.qsize() for q in self.queues)
+
+
 # Queue of messages to process, from both client websockets and message queues
 # to which the streamer is subscribed.
 #
-# The maxsize ensures that memory used by this queue is bounded. Producers
-# writing to the queue must consider their behaviour when the queue is full,
-# using .put(...) with a timeout or .put_nowait(...) as appropriate.
-WORK_QUEUE = gevent.queue.Queue(maxsize=4096)
+# Producers writing to the queue must consider their behaviour when the queue
+# is full, using .put(...) with a timeout.
+WORK_QUEUE = WorkQueue()
 
 # Message queues that the streamer processes messages from
 ANNOTATION_TOPIC = 'annotation'
@@ -38,6 +116,11 @@ def start(event):
     The function does not block.
     """
     settings = event.app.registry.settings
+    shards = int(settings.get('h.streamer.shards', DEFAULT_SHARDS))
+    WORK_QUEUE.resize(shards)
+    replay.BUFFER.resize(int(settings.get('h.streamer.replay_size',
+                                          replay.DEFAULT_SIZE)))
+
     greenlets = [
         # Start greenlets to process messages from RabbitMQ
         gevent.spawn(messages.process_messages,
@@ -50,9 +133,13 @@ def start(event):
                      WORK_QUEUE),
         # A greenlet to periodically report to statsd
         gevent.spawn(report_stats, settings),
-        # And one to process the queued work
-        gevent.spawn(process_work_queue, settings, WORK_QUEUE)
     ]
+    # And one to deliver the realtime messages, and one for each shard to
+    # process the messages from its websockets
+    greenlets.append(
+        gevent.spawn(process_work_queue, settings, WORK_QUEUE.realtime))
+    for queue in WORK_QUEUE.queues:
+        greenlets.append(gevent.spawn(process_work_queue, settings, queue))
 
     # Start a "greenlet of last resort" to monitor the worker greenlets and
     # bail if any unexpected errors occur.
@@ -113,10 +200,37 @@ def process_work_queue(settings, queue, session_factory=None):
 
 def report_stats(settings):
     client = stats.get_client(settings)
+    reported_dropped = {}
+    reported_totals = {}
     while True:
-        client.gauge('streamer.connected_clients',
-                     len(websocket.WebSocket.instances))
+        sockets = list(websocket.WebSocket.instances)
+        client.gauge('streamer.connected_clients', len(sockets))
+        client.gauge('streamer.outbox.buffered_bytes',
+                     sum(s.outbox.buffered_bytes for s in sockets))
+        client.gauge('streamer.outbox.buffered_frames',
+                     sum(len(s.outbox) for s in sockets))
+        for name in ('dropped', 'disconnected'):
+            count = outbox.totals[name]
+            if count != reported_totals.get(name, 0):
+                client.incr('streamer.outbox.{}'.format(name),
+                            count - reported_totals.get(name, 0))
+                reported_totals[name] = count
         client.gauge('streamer.queue_length', WORK_QUEUE.qsize())
+        client.gauge('streamer.realtime.queue_length',
+                     WORK_QUEUE.realtime.qsize())
+        dropped = WORK_QUEUE.realtime_dropped
+        if dropped != reported_totals.get('realtime_dropped', 0):
+            client.incr('streamer.realtime.dropped',
+                        dropped - reported_totals.get('realtime_dropped', 0))
+            reported_totals['realtime_dropped'] = dropped
+        for shard, queue in enumerate(WORK_QUEUE.queues):
+            client.gauge('streamer.shard.{}.queue_length'.format(shard),
+                         queue.qsize())
+            dropped = WORK_QUEUE.dropped[shard]
+            if dropped != reported_dropped.get(shard, 0):
+                client.incr('streamer.shard.{}.dropped'.format(shard),
+                            dropped - reported_dropped.get(shard, 0))
+                reported_dropped[shard] = dropped
         gevent.sleep(10)
 
 
@@ -8,7 +8,7 @@ from pyramid.view import view_config
 from ws4py.exc import HandshakeError
 from ws4py.server.wsgiutils import WebSocketWSGIApplication
 
-from h.streamer import streamer, websocket
+from h.streamer import outbox, streamer, websocket
 
 
 @view_config(route_name='ws')
@@ -23,9 +23,14 @@ def websocket_view(request):
             return httpexceptions.HTTPForbidden()
 
     # Provide environment which the WebSocket handler can use...
+    settings = request.registry.settings
     request.environ.update({
         'h.ws.authenticated_userid': request.authenticated_userid,
         'h.ws.effective_principals': request.effective_principals,
+        'h.ws.outbox_policy': settings.get('h.streamer.outbox_policy',
+                                           outbox.DROP_OLDEST),
+        'h.ws.outbox_size': settings.get('h.streamer.outbox_size',
+                                         outbox.DEFAULT_SIZE),
         'h.ws.registry': request.registry,
         'h.ws.streamer_work_queue': streamer.WORK_QUEUE,
     })
@@ -89,5 +94,12 @@ def error(context, request):
 def includeme(config):
     settings = config.registry.settings
     settings['origins'] = aslist(settings.get('origins', ''))
+    settings['h.streamer.outbox_size'] = int(settings.get(
+        'h.streamer.outbox_size', outbox.DEFAULT_SIZE))
+
+    policy = settings.get('h.streamer.outbox_policy', outbox.DROP_OLDEST)
+    if policy not in outbox.POLICIES:
+        raise ValueError('h.streamer.outbox_policy must be one of: {}'.format(
+            ', '.join(outbox.POLICIES)))
 
     config.scan(__name__)
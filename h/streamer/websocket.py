@@ -9,8 +9,9 @@ from gevent.queue import Full
 import jsonschema
 from ws4py.websocket import WebSocket as _WebSocket
 
-from memex import storage
+from memex import equivalence
 from h.streamer import filter
+from h.streamer import outbox
 
 log = logging.getLogger(__name__)
 
@@ -23,6 +24,9 @@ class WebSocket(_WebSocket):
     instances = weakref.WeakSet()
     origins = []
 
+    # The open websockets of each authenticated user, by userid
+    _by_userid = {}
+
     # Instance attributes
     client_id = None
     filter = None
@@ -39,8 +43,22 @@ class WebSocket(_WebSocket):
         self.effective_principals = environ['h.ws.effective_principals']
         self.registry = environ['h.ws.registry']
 
+        if self.authenticated_userid is not None:
+            sockets = self._by_userid.setdefault(self.authenticated_userid,
+                                                 weakref.WeakSet())
+            sockets.add(self)
+
         self._work_queue = environ['h.ws.streamer_work_queue']
 
+        # Frames are sent from the socket's outbox, so that writing to a slow
+        # client never blocks the streamer. The outbox only holds weak
+        # references to the socket, so that it doesn't keep it alive.
+        self.outbox = outbox.Outbox(
+            _weak_method(self, 'send'),
+            maxsize=environ.get('h.ws.outbox_size', outbox.DEFAULT_SIZE),
+            policy=environ.get('h.ws.outbox_policy', outbox.DROP_OLDEST),
+            on_overflow=_weak_method(self, '_disconnect_slow_client'))
+
     def __new__(cls, *args, **kwargs):
         instance = super(WebSocket, cls).__new__(cls, *args, **kwargs)
         cls.instances.add(instance)
@@ -54,15 +72,57 @@ class WebSocket(_WebSocket):
             log.warn('Streamer work queue full! Unable to queue message from '
                      'WebSocket client having waited 0.1s: giving up.')
 
+    @classmethod
+    def for_userid(cls, userid):
+        """Return the open websockets of the user `userid`."""
+        return list(cls._by_userid.get(userid, ()))
+
     def closed(self, code, reason=None):
         try:
             self.instances.remove(self)
         except KeyError:
             pass
 
+        sockets = self._by_userid.get(self.authenticated_userid)
+        if sockets is not None:
+            sockets.discard(self)
+            if not sockets:
+                del self._by_userid[self.authenticated_userid]
+
+        self.outbox.close()
+
     def send_json(self, payload):
         if not self.terminated:
-            self.send(json.dumps(payload))
+            self.outbox.put(json.dumps(payload), key=_coalesce_key(payload))
+
+    def _disconnect_slow_client(self):
+        log.warn('WebSocket client outbox full: disconnecting client.')
+        # Closing the connection (rather than sending a close frame, which
+        # would have to wait behind everything else sent to this client) ends
+        # the socket's read loop, which terminates the websocket.
+        self.close_connection()
+
+
+def _weak_method(obj, name):
+    """Return a function calling method `name` of `obj` while it is alive."""
+    ref = weakref.ref(obj)
+
+    def call(*args, **kwargs):
+        obj = ref()
+        if obj is not None:
+            return getattr(obj, name)(*args, **kwargs)
+
+    return call
+
+
+def _coalesce_key(payload):
+    """Return the key under which an outgoing message may be coalesced."""
+    if payload.get('type') != 'annotation-notification':
+        return None
+    try:
+        return ('annotation', payload['payload'][0]['id'])
+    except (KeyError, IndexError, TypeError):
+        return None
 
 
 def handle_message(message, session=None):
@@ -94,11 +154,19 @@ def handle_message(message, session=None):
 
             if session is not None:
                 # Add backend expands for clauses
-                _expand_clauses(session, payload)
+                resolver = equivalence.get_resolver(socket.registry)
+                _expand_clauses(session, resolver, payload)
 
             socket.filter = filter.FilterHandler(payload)
         elif msg_type == 'client_id':
             socket.client_id = data.get('value')
+        elif msg_type == 'resume':
+            # Imported here because h.streamer.messages imports this module.
+            from h.streamer import messages
+            messages.replay_annotation_events(socket,
+                                              session,
+                                              data.get('epoch'),
+                                              data.get('sequence'))
     except:
         # TODO: clean this up, catch specific errors, narrow the scope
         log.exception("Parsing filter: %s", data)
@@ -106,13 +174,13 @@ def handle_message(message, session=None):
         raise
 
 
-def _expand_clauses(session, payload):
+def _expand_clauses(session, resolver, payload):
     for clause in payload['clauses']:
         if clause['field'] == '/uri':
-            _expand_uris(session, clause)
+            _expand_uris(session, resolver, clause)
 
 
-def _expand_uris(session, clause):
+def _expand_uris(session, resolver, clause):
     uris = clause['value']
     expanded = set()
 
@@ -120,6 +188,6 @@ def _expand_uris(session, clause):
         uris = [uris]
 
     for item in uris:
-        expanded.update(storage.expand_uri(session, item))
+        expanded.update(resolver.expand(session, item))
 
     clause['value'] = list(expanded)
@@ -4,7 +4,9 @@
 from h import __version__
 from h import emails
 from h import mailer
+from h import realtime
 from memex import storage
+from memex import uri
 from h.notification import reply
 
 
@@ -30,12 +32,34 @@ def publish_annotation_event(event):
     data = {
         'action': event.action,
         'annotation_id': event.annotation_id,
-        'src_client_id': event.request.headers.get('X-Client-Id'),
+        'src_client_id': _src_client_id(event),
     }
     if event.annotation_dict:
         data['annotation_dict'] = event.annotation_dict
 
-    event.request.realtime.publish_annotation(data)
+    if not realtime.get_partitions(event.request.registry.settings):
+        event.request.realtime.publish_annotation(data)
+        return
+
+    # Partitioned messages are routed by the annotation's normalized URI.
+    target_uri = None
+    if event.annotation_dict and event.annotation_dict.get('uri'):
+        target_uri = uri.normalize(event.annotation_dict['uri'])
+    else:
+        annotation = storage.fetch_annotation(event.request.db,
+                                              event.annotation_id)
+        if annotation is not None:
+            target_uri = annotation.target_uri_normalized
+    event.request.realtime.publish_annotation(data, uri=target_uri)
+
+
+def _src_client_id(event):
+    # Events delivered from the outbox carry the client id of the request
+    # which made the change, as they are delivered by another process.
+    src_client_id = getattr(event, 'src_client_id', None)
+    if src_client_id is not None:
+        return src_client_id
+    return event.request.headers.get('X-Client-Id')
 
 
 def send_reply_notifications(event,
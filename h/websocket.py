@@ -170,9 +170,15 @@ def create_app(global_config, **settings):
     # among other things:
     #
     #   - the links service
+    #   - the URI equivalence resolver
     #   - the default presenters (and their link registrations)
+    #   - the cache of presented annotations
     #   - the `request.es` property
+    #   - the export filters registry (used by `h.nipsa`)
+    config.include('memex.equivalence')
+    config.include('memex.export')
     config.include('memex.links')
+    config.include('memex.presentation')
     config.include('memex.presenters')
     config.include('memex.search')
 
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+
+"""
+Benchmark rendering long, math-heavy annotations to sanitized HTML.
+
+Compares the single-pass sanitizer used by :py:func:`memex.markdown.render`,
+which sanitizes the HTML while parsing it for linkification, with the
+previous pipeline, which linkified the HTML and then parsed it again with
+:py:func:`bleach.clean`. Also times assigning unchanged text to an
+annotation, which no longer renders it again.
+"""
+
+import argparse
+import time
+
+import bleach
+from bleach import callbacks as linkify_callbacks
+
+from memex import markdown
+from memex.models import Annotation
+
+
+PARAGRAPH = (
+    'Recall that **Euler\'s identity** \\(e^{i\\pi} + 1 = 0\\) follows from '
+    '_the series_ for \\(e^x\\), see http://example.com/euler?ref={i} and '
+    '[the proof](https://example.org/proofs/{i}).\n\n'
+    '$$\\int_0^\\infty e^{-x^2} dx = \\frac{\\sqrt{\\pi}}{2}$$\n\n'
+    '* item with `code <b>{i}</b>` and \\(a_{i} < b_{i}\\)\n'
+    '* <em>inline html</em> <script>evil({i})</script>\n\n'
+)
+
+
+def make_text(paragraphs):
+    return ''.join(PARAGRAPH.replace('{i}', str(i))
+                   for i in range(paragraphs))
+
+
+def two_pass_sanitize(html):
+    linkified = bleach.linkify(html, callbacks=[
+        linkify_callbacks.target_blank,
+        markdown.linkify_rel,
+    ])
+    return bleach.clean(linkified,
+                        tags=markdown.ALLOWED_TAGS,
+                        attributes=markdown.ALLOWED_ATTRIBUTES)
+
+
+def timed(func, arg, repeat):
+    start = time.time()
+    for _ in range(repeat):
+        func(arg)
+    return (time.time() - start) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--paragraphs', type=int, default=50,
+                        help='number of paragraphs in each annotation')
+    parser.add_argument('--repeat', type=int, default=20,
+                        help='number of times to render each annotation')
+    args = parser.parse_args()
+
+    text = make_text(args.paragraphs)
+    html = markdown._get_markdown()(text)
+    print('annotation text {:.1f} KiB, '
+          'rendered markdown {:.1f} KiB'.format(len(text) / 1024.0,
+                                                len(html) / 1024.0))
+
+    markdown_time = timed(markdown._get_markdown(), text, args.repeat)
+    two_pass = timed(two_pass_sanitize, html, args.repeat)
+    single_pass = timed(markdown.sanitize, html, args.repeat)
+
+    annotation = Annotation(text=text)
+
+    def assign(value):
+        annotation.text = value
+
+    unchanged = timed(assign, text, args.repeat)
+
+    for name, seconds in [('markdown', markdown_time),
+                          ('two-pass sanitize', two_pass),
+                          ('single-pass sanitize', single_pass),
+                          ('unchanged text', unchanged)]:
+        print('{:22} {:9.2f} ms'.format(name, 1000 * seconds))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+
+"""
+Benchmark presenting a page of annotations in the API JSON format.
+
+Compares presenting each annotation with its own AnnotationJSONPresenter (as
+the API used to) with presenting the page with an AnnotationJSONBatchPresenter,
+and checks that both produce identical output. The default page size of 200 is
+the page size used by search and the activity pages.
+"""
+
+import argparse
+import datetime
+import random
+import timeit
+import uuid
+
+from pyramid import testing
+
+from memex import models
+from memex.links import LinksService
+from memex.presenters import AnnotationJSONBatchPresenter
+from memex.presenters import AnnotationJSONPresenter
+
+
+def make_annotations(count):
+    annotations = []
+    now = datetime.datetime.utcnow()
+    for i in range(count):
+        ann_id = uuid.uuid4().bytes.encode('base64').rstrip('=\n')
+        ann_id = ann_id.replace('+', '-').replace('/', '_')
+        updated = now - datetime.timedelta(seconds=random.randint(0, 10 ** 7),
+                                           microseconds=random.randint(0, 10 ** 6))
+        annotations.append(models.Annotation(
+            id=ann_id,
+            userid='acct:user{}@example.com'.format(i % 17),
+            groupid='__world__',
+            shared=bool(i % 3),
+            target_uri='http://example.com/articles/{}'.format(i % 23),
+            text='Annotation number {}'.format(i),
+            tags=['tag{}'.format(i % 5)],
+            created=updated - datetime.timedelta(days=1),
+            updated=updated,
+        ))
+    return annotations
+
+
+def make_links_service():
+    config = testing.setUp(settings={'h.bouncer_url': 'https://hyp.is'})
+    config.include('pyramid_services')
+    config.include('memex.links')
+    config.include('memex.presenters')
+    config.include('h.links')
+    config.add_route('api.annotation', '/api/annotations/{id}')
+    config.add_route('annotation', '/a/{id}')
+    config.commit()
+    return LinksService(base_url='https://hypothes.is',
+                        registry=config.registry)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--rows', type=int, default=200,
+                        help='number of annotations in each page')
+    parser.add_argument('--repeat', type=int, default=50,
+                        help='number of pages to present')
+    args = parser.parse_args()
+
+    annotations = make_annotations(args.rows)
+    links_service = make_links_service()
+
+    def present_each():
+        return [AnnotationJSONPresenter(a, links_service).asdict()
+                for a in annotations]
+
+    def present_batch():
+        return AnnotationJSONBatchPresenter(annotations, links_service).aslist()
+
+    if present_each() != present_batch():
+        raise SystemExit('Batch presenter output differs!')
+
+    for name, func in [('per-row', present_each), ('batch', present_batch)]:
+        elapsed = min(timeit.repeat(func, number=args.repeat, repeat=3))
+        print('{:8} {:8.2f} ms/page'.format(name,
+                                            1000 * elapsed / args.repeat))
+
+
+if __name__ == '__main__':
+    main()
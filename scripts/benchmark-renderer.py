@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+
+"""
+Benchmark rendering a page of search results as JSON.
+
+Compares Pyramid's ``json`` renderer, which serializes the whole response
+before sending any of it, with the ``streaming_json`` renderer, reporting the
+time until the first chunk of the body is available, the total time, and the
+peak size of any single piece of the body held in memory. The rows have large
+selectors and ``extra`` payloads, as annotations from some clients do.
+"""
+
+import argparse
+import json
+import time
+
+from pyramid import testing
+from pyramid.renderers import JSON
+
+from memex import renderers
+
+
+def make_rows(count, payload_size):
+    rows = []
+    for i in range(count):
+        rows.append({
+            'id': 'annotation{}'.format(i),
+            'text': 'Annotation number {}'.format(i),
+            'target': [{
+                'source': 'http://example.com/articles/{}'.format(i),
+                'selector': [{
+                    'type': 'TextQuoteSelector',
+                    'prefix': 'p' * payload_size,
+                    'exact': u'\xe9xact ' * (payload_size // 6),
+                    'suffix': 's' * payload_size,
+                }],
+            }],
+            'extra': {'blob': ['x' * 64] * (payload_size // 64)},
+        })
+    return {'total': count, 'rows': rows}
+
+
+def render_json(value, request):
+    renderer = JSON()(None)
+    start = time.time()
+    body = renderer(value, {'request': request})
+    if not isinstance(body, bytes):
+        body = body.encode('utf-8')
+    first = time.time() - start
+    return first, time.time() - start, len(body)
+
+
+def render_streaming(value, request):
+    renderer = renderers.StreamingJSON(None)
+    start = time.time()
+    first = None
+    largest = 0
+    for chunk in renderer(value, {'request': request}):
+        if first is None:
+            first = time.time() - start
+        largest = max(largest, len(chunk))
+    return first, time.time() - start, largest
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--rows', type=int, default=200,
+                        help='number of annotations in the page')
+    parser.add_argument('--payload-size', type=int, default=16 * 1024,
+                        help='approximate size of each selector and extra')
+    args = parser.parse_args()
+
+    value = make_rows(args.rows, args.payload_size)
+    request = testing.DummyRequest()
+
+    expected = json.dumps(value).encode('utf-8')
+    streamed = b''.join(renderers.StreamingJSON(None)(value,
+                                                      {'request': request}))
+    if streamed != expected:
+        raise SystemExit('Streaming renderer output differs!')
+
+    for name, func in [('json', render_json), ('streaming', render_streaming)]:
+        first, total, largest = func(value, request)
+        print('{:10} first byte {:7.2f} ms  total {:7.2f} ms  '
+              'largest piece {:8.1f} KiB'.format(name, 1000 * first,
+                                                 1000 * total,
+                                                 largest / 1024.0))
+
+
+if __name__ == '__main__':
+    main()
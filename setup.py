@@ -35,10 +35,10 @@ INSTALL_REQUIRES = [
     'jsonschema>=2.5.1,<2.6',
     'mistune>=0.7.3,<0.8',
     'psycopg2>=2.6.1,<2.7',
-    'pyparsing>=2.1.5,<2.2',
     'pyramid-services==0.4',
     'pyramid>=1.6,<1.7',
     'python-dateutil>=2.1',
+    'repoze.lru',
     'transaction',
     'zope.interface==4.2.0',
 ]
@@ -5,10 +5,15 @@ __version__ = '0.39.0+dev'
 
 
 def includeme(config):
+    config.include('memex.equivalence')
     config.include('memex.eventqueue')
+    config.include('memex.export')
     config.include('memex.links')
+    config.include('memex.presentation')
     config.include('memex.presenters')
+    config.include('memex.renderers')
     config.include('memex.search')
+    config.include('memex.sidebar')
     config.include('memex.views')
 
     config.add_route('api.index', '/')
@@ -26,3 +31,4 @@ def includeme(config):
                      factory='memex.resources:AnnotationFactory',
                      traverse='/{id}')
     config.add_route('api.search', '/search')
+    config.add_route('api.export', '/export')
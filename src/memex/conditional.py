@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""
+Cheap conditional request handling for views.
+
+:py:func:`h.tweens.conditional_http_tween_factory` can only generate an ETag
+once a view has done all its work and the whole response body has been
+serialized. Views whose responses are entirely determined by a few cheap
+"version" values (for example an annotation's id and last updated time) can
+instead derive their validators from those values with :py:func:`validators`,
+and pass them to :py:func:`not_modified` before doing any other work. If the
+client's copy is still current the view can then return a ``304 Not
+Modified`` response straight away.
+"""
+
+from __future__ import unicode_literals
+
+from collections import namedtuple
+import hashlib
+
+from pyramid.httpexceptions import HTTPNotModified
+from webob.datetime_utils import UTC
+from webob.datetime_utils import parse_date
+from webob.etag import ETagMatcher
+
+
+class Validators(namedtuple('Validators', ['etag', 'last_modified'])):
+
+    """
+    The validators of a response.
+
+    ``etag`` is a (weak) entity tag, and ``last_modified`` a naive UTC
+    datetime or None.
+    """
+
+
+def validators(version, last_modified=None):
+    """
+    Return validators for a response whose content is determined by `version`.
+
+    :param version: values which together identify the content of the
+                    response, such that whenever the content changes at least
+                    one of them does too
+    :type version: tuple
+
+    :param last_modified: the time the content of the response last changed
+    :type last_modified: datetime.datetime
+
+    :rtype: memex.conditional.Validators
+    """
+    key = '\x1f'.join('{}'.format(part) for part in version)
+    etag = hashlib.md5(key.encode('utf-8')).hexdigest()
+    return Validators(etag=etag, last_modified=last_modified)
+
+
+def annotation_validators(annotation):
+    """
+    Return validators for a response presenting only `annotation`.
+
+    Presentations include data from the annotation's document (such as its
+    title), so the document's id and last updated time are part of the
+    version too.
+    """
+    document = annotation.document
+    if document is None:
+        return validators((annotation.id, annotation.updated, None, None),
+                          last_modified=annotation.updated)
+
+    last_modified = annotation.updated
+    if document.updated is not None and (last_modified is None or
+                                         document.updated > last_modified):
+        last_modified = document.updated
+    return validators((annotation.id, annotation.updated,
+                       document.id, document.updated),
+                      last_modified=last_modified)
+
+
+def not_modified(request, validators):
+    """
+    Set `validators` on the response and check the request's preconditions.
+
+    Returns a ``304 Not Modified`` response if the client sent an
+    ``If-None-Match`` header matching the ETag or, failing that, an
+    ``If-Modified-Since`` header no earlier than the last modified time.
+    Otherwise returns None, and the view should build its response as usual.
+
+    Because the ETag is set on ``request.response``, the conditional tween
+    won't buffer and hash the body of the full response.
+    """
+    response = request.response
+    response.etag = (validators.etag, False)
+    if validators.last_modified is not None:
+        response.last_modified = validators.last_modified
+
+    if request.method not in ('GET', 'HEAD'):
+        return None
+    if not _is_current(request, validators):
+        return None
+
+    not_modified = HTTPNotModified()
+    for header in ('ETag', 'Last-Modified'):
+        if header in response.headers:
+            not_modified.headers[header] = response.headers[header]
+    return not_modified
+
+
+def _is_current(request, validators):
+    # If-None-Match takes precedence over If-Modified-Since. See RFC 7232,
+    # section 3.3.
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match is not None:
+        return validators.etag in ETagMatcher.parse(if_none_match, strong=False)
+
+    if_modified_since = parse_date(request.headers.get('If-Modified-Since'))
+    if if_modified_since is None or validators.last_modified is None:
+        return False
+
+    # HTTP dates have a resolution of one second.
+    last_modified = validators.last_modified.replace(microsecond=0,
+                                                     tzinfo=UTC)
+    return last_modified <= if_modified_since
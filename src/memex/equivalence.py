@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+"""
+Cached resolution of document equivalence classes.
+
+Given a URI, "expansion" is the process of finding all the URIs which we
+believe refer to the same underlying document (see :py:mod:`memex.uri`). This
+is needed for every ``uri`` search parameter and every streamer filter, and is
+comparatively expensive, so this module provides a resolver which keeps a
+bounded, expiring cache of recent expansions keyed by normalized URI.
+
+Entries are invalidated once a transaction which changed the equivalence class
+of a document (by adding document URIs to it, or by merging documents) has been
+committed. Changes committed by other processes are picked up once the cached
+entries expire.
+"""
+
+from __future__ import unicode_literals
+
+from collections import namedtuple
+import weakref
+
+import sqlalchemy as sa
+from repoze.lru import ExpiringLRUCache
+
+from memex import models
+from memex.models.document import CHANGED_URIS_KEY
+from memex.uri import normalize as uri_normalize
+
+RESOLVER_KEY = 'memex.equivalence.resolver'
+
+DEFAULT_CACHE_SIZE = 10000
+DEFAULT_CACHE_TTL = 300
+
+# All live resolvers in this process, so that committed changes to document
+# data can be propagated to each of them.
+_resolvers = weakref.WeakSet()
+
+
+class Equivalence(namedtuple('Equivalence', ['uris', 'normalized'])):
+
+    """
+    The expansion of a single normalized URI.
+
+    ``uris`` is a tuple of the raw URIs of the matching document, or None if
+    the URI is not expanded (because we don't know of a document for it, or
+    because it is the canonical URI of its document). ``normalized`` is the
+    set of normalized URIs.
+    """
+
+
+class EquivalenceResolver(object):
+
+    """A resolver for equivalent document URIs with a cache in front of it."""
+
+    def __init__(self, cache_size=DEFAULT_CACHE_SIZE, ttl=DEFAULT_CACHE_TTL):
+        """
+        Create a new resolver.
+
+        :param cache_size: the maximum number of cached expansions
+        :type cache_size: int
+
+        :param ttl: the number of seconds for which an expansion is cached
+        :type ttl: int
+        """
+        self._cache = ExpiringLRUCache(cache_size, default_timeout=ttl)
+        _resolvers.add(self)
+
+    def expand(self, session, uri):
+        """
+        Return all URIs which refer to the same underlying document as `uri`.
+
+        :param session: the database session
+        :type session: sqlalchemy.orm.session.Session
+
+        :param uri: a URI associated with the document
+        :type uri: unicode
+
+        :returns: a list of equivalent URIs
+        :rtype: list
+        """
+        equivalence = self._lookup(session, uri)
+        if equivalence.uris is None:
+            return [uri]
+        return list(equivalence.uris)
+
+    def expand_normalized(self, session, uri):
+        """
+        Return the normalized forms of all URIs equivalent to `uri`.
+
+        :param session: the database session
+        :type session: sqlalchemy.orm.session.Session
+
+        :param uri: a URI associated with the document
+        :type uri: unicode
+
+        :returns: a set of normalized URIs
+        :rtype: set
+        """
+        return set(self._lookup(session, uri).normalized)
+
+    def invalidate(self, normalized_uris):
+        """Drop cached expansions for the given normalized URIs."""
+        for uri in normalized_uris:
+            self._cache.invalidate(uri)
+
+    def clear(self):
+        """Drop all cached expansions."""
+        self._cache.clear()
+
+    @property
+    def stats(self):
+        """A dictionary of cache lookup statistics."""
+        return {'hits': self._cache.hits,
+                'misses': self._cache.misses,
+                'lookups': self._cache.lookups,
+                'evictions': self._cache.evictions}
+
+    def _lookup(self, session, uri):
+        key = uri_normalize(uri)
+        equivalence = self._cache.get(key)
+        if equivalence is None:
+            equivalence = _resolve(session, key)
+            self._cache.put(key, equivalence)
+        return equivalence
+
+
+def _resolve(session, normalized_uri):
+    """Expand a normalized URI using a single query for all document URIs."""
+    docuri = models.DocumentURI
+    matching_documents = (session.query(docuri.document_id)
+                                 .filter(docuri.uri_normalized == normalized_uri)
+                                 .subquery())
+    rows = (session.query(docuri.uri, docuri.uri_normalized, docuri.type)
+                   .filter(docuri.document_id.in_(matching_documents))
+                   .order_by(docuri.updated.desc())
+                   .all())
+
+    unexpanded = Equivalence(uris=None, normalized=frozenset([normalized_uri]))
+
+    if not rows:
+        return unexpanded
+
+    # We check if the match was a "canonical" link. If so, all annotations
+    # created on that page are guaranteed to have that as their target.source
+    # field, so we don't need to expand to other URIs and risk false positives.
+    for _, uri_normalized, type_ in rows:
+        if uri_normalized == normalized_uri and type_ == 'rel-canonical':
+            return unexpanded
+
+    return Equivalence(uris=tuple(r[0] for r in rows),
+                       normalized=frozenset(r[1] for r in rows))
+
+
+@sa.event.listens_for(sa.orm.Session, 'after_commit')
+def _invalidate_after_commit(session):
+    changed = session.info.pop(CHANGED_URIS_KEY, None)
+    if not changed:
+        return
+    for resolver in list(_resolvers):
+        resolver.invalidate(changed)
+
+
+def get_resolver(registry):
+    """Return the equivalence resolver configured for `registry`."""
+    return registry[RESOLVER_KEY]
+
+
+def equivalence_resolver_factory(context, request):
+    """Return the EquivalenceResolver for the passed context and request."""
+    return get_resolver(request.registry)
+
+
+def includeme(config):
+    settings = config.registry.settings
+    cache_size = int(settings.get('memex.equivalence.cache_size',
+                                  DEFAULT_CACHE_SIZE))
+    ttl = int(settings.get('memex.equivalence.cache_ttl', DEFAULT_CACHE_TTL))
+
+    config.registry[RESOLVER_KEY] = EquivalenceResolver(cache_size=cache_size,
+                                                        ttl=ttl)
+    config.register_service_factory(equivalence_resolver_factory,
+                                    name='uri_equivalence')
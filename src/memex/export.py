@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+"""
+Bulk export of annotations.
+
+An :py:class:`Export` describes a set of annotations (by user, group and/or
+document URI, optionally restricted to those readable by a set of principals)
+and can stream every matching annotation out of the database in a presented
+form, without the paging (and the growing offsets) that exporting through the
+search API requires.
+
+Annotations are read with a server-side cursor in batches of
+:py:data:`BATCH_SIZE`. The documents of each batch are loaded with a single
+additional query, and each batch is presented and then discarded before the
+next one is read, so that memory use stays constant however many annotations
+are exported.
+"""
+
+from __future__ import unicode_literals
+
+import itertools
+
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
+
+from memex import models
+from memex import storage
+from memex.presenters import AnnotationJSONBatchPresenter
+from memex.presenters import AnnotationJSONLDPresenter
+
+#: The number of annotations fetched from the database cursor at a time.
+BATCH_SIZE = 500
+
+#: The format in which annotations are presented by the annotation API.
+FORMAT_JSON = 'json'
+
+#: The draft Web Annotation Data Model format. See
+#: :py:class:`memex.presenters.AnnotationJSONLDPresenter`.
+FORMAT_JSONLD = 'jsonld'
+
+FORMATS = (FORMAT_JSON, FORMAT_JSONLD)
+
+FILTERS_KEY = 'memex.export.filters'
+
+
+class Export(object):
+
+    """A set of annotations to be exported."""
+
+    def __init__(self, user=None, group=None, uris=None, principals=None,
+                 filters=None):
+        """
+        Initialize a new export.
+
+        :param user: only export annotations by this userid
+        :type user: unicode
+
+        :param group: only export annotations in this group (by pubid)
+        :type group: unicode
+
+        :param uris: only export annotations of documents with one of these
+                     normalized URIs
+        :type uris: iterable
+
+        :param principals: if given, only export annotations which may be read
+                           by one of these principals (see
+                           :py:func:`memex.storage.readable_by`)
+        :type principals: list
+
+        :param filters: additional filters to apply to the export, each a
+                        callable which takes and returns a query (see
+                        :py:func:`get_filters`)
+        :type filters: list
+        """
+        self.user = user
+        self.group = group
+        self.uris = list(uris) if uris is not None else None
+        self.principals = principals
+        self.filters = filters or []
+
+    def query(self, session):
+        """Return a query for the annotations in this export, oldest first."""
+        query = session.query(models.Annotation)
+
+        if self.user is not None:
+            query = query.filter(models.Annotation.userid == self.user)
+        if self.group is not None:
+            query = query.filter(models.Annotation.groupid == self.group)
+        if self.uris is not None:
+            query = query.filter(
+                models.Annotation.target_uri_normalized.in_(self.uris))
+        if self.principals is not None:
+            query = query.filter(storage.readable_by(self.principals))
+        for filter_ in self.filters:
+            query = filter_(query)
+
+        return query.order_by(models.Annotation.created, models.Annotation.id)
+
+    def batches(self, session, batch_size=BATCH_SIZE):
+        """
+        Yield lists of the annotations in this export, with documents loaded.
+
+        Annotations are read with a server-side cursor, and are expunged from
+        `session` once the following batch is requested.
+        """
+        annotations = iter(self.query(session).yield_per(batch_size))
+        while True:
+            batch = list(itertools.islice(annotations, batch_size))
+            if not batch:
+                return
+            _load_documents(session, batch)
+            yield batch
+            session.expunge_all()
+
+    def present(self, session, links_service, format_=FORMAT_JSON,
+                batch_size=BATCH_SIZE):
+        """Yield each annotation in this export, presented in `format_`."""
+        for batch in self.batches(session, batch_size=batch_size):
+            if format_ == FORMAT_JSONLD:
+                for annotation in batch:
+                    yield AnnotationJSONLDPresenter(annotation,
+                                                    links_service).asdict()
+            else:
+                presenter = AnnotationJSONBatchPresenter(batch, links_service)
+                for annotation in presenter.aslist():
+                    yield annotation
+
+
+def get_filters(request):
+    """Return the export filters registered by users of this module."""
+    return [factory(request)
+            for factory in request.registry.get(FILTERS_KEY, [])]
+
+
+def stream(bind, export, links_service, format_=FORMAT_JSON):
+    """
+    Yield each annotation in `export`, read using a session of its own.
+
+    This allows the export to be consumed after the transaction of the request
+    which created it has ended (for example, as a response body). The session
+    is closed once the generator is exhausted or closed.
+
+    :param bind: the engine or connection to read from
+    """
+    session = Session(bind=bind)
+    try:
+        for annotation in export.present(session, links_service, format_):
+            yield annotation
+    finally:
+        session.close()
+
+
+def _load_documents(session, annotations):
+    """Load the documents of all `annotations` with a single query."""
+    uris = {a.target_uri_normalized for a in annotations}
+    rows = session.query(models.DocumentURI.uri_normalized, models.Document) \
+        .join(models.Document,
+              models.DocumentURI.document_id == models.Document.id) \
+        .filter(models.DocumentURI.uri_normalized.in_(uris))
+
+    documents = {}
+    for uri_normalized, document in rows:
+        documents.setdefault(uri_normalized, document)
+
+    for annotation in annotations:
+        document = documents.get(annotation.target_uri_normalized)
+        set_committed_value(annotation, 'document', document)
+
+
+def includeme(config):
+    # Allow users of this module to register additional export filter
+    # factories.
+    config.registry[FILTERS_KEY] = []
+    config.add_directive('add_export_filter',
+                         lambda c, f: c.registry[FILTERS_KEY].append(f))
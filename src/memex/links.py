@@ -5,10 +5,21 @@ Tools for generating links to domain objects.
 
 from __future__ import unicode_literals
 
+import functools
+import re
+
 from pyramid.request import Request
 
 LINK_GENERATORS_KEY = 'memex.links.link_generators'
 
+#: A stand-in for an annotation id when generating a link template. It is
+#: left untouched by URL generation and joining.
+ID_PLACEHOLDER = '__annotation_id__'
+
+# Annotation ids (and thread root ids) consist of URL-safe base64 characters
+# only, which are never escaped in generated URLs.
+_SAFE_ID_RE = re.compile(r'^[A-Za-z0-9_-]+$')
+
 
 class LinksService(object):
 
@@ -63,6 +74,103 @@ class LinksService(object):
                 links[name] = l
         return links
 
+    def compile(self):
+        """
+        Return a links object for generating links for many annotations.
+
+        The returned object has the same ``get`` and ``get_all`` methods as
+        this service, but generators which support it (see
+        :py:func:`add_annotation_link_generator`) have done any work which
+        doesn't depend on the annotation, such as route URL generation, once
+        up front.
+        """
+        generators = {}
+        for name, (g, hidden) in self.registry[LINK_GENERATORS_KEY].items():
+            compile_ = getattr(g, 'compile', None)
+            if compile_ is not None:
+                generators[name] = (compile_(self._request), hidden)
+            else:
+                generators[name] = (functools.partial(g, self._request), hidden)
+        return CompiledLinks(generators)
+
+
+class CompiledLinks(object):
+
+    """Link generators bound to a request, as returned by LinksService.compile."""
+
+    def __init__(self, generators):
+        self._generators = generators
+        self._visible = [(name, g) for name, (g, hidden) in generators.items()
+                         if not hidden]
+
+    def get(self, annotation, name):
+        """Get the link named `name` for the passed `annotation`."""
+        g, _ = self._generators[name]
+        return g(annotation)
+
+    def get_all(self, annotation):
+        """Get all (non-hidden) links for the passed `annotation`."""
+        links = {}
+        for name, g in self._visible:
+            l = g(annotation)
+            if l is not None:
+                links[name] = l
+        return links
+
+
+def compile_link_template(url):
+    """
+    Turn a URL containing :py:data:`ID_PLACEHOLDER` into a fast formatter.
+
+    Returns a function which takes an id and returns `url` with the
+    placeholder replaced by the id, or None if the id contains characters
+    which URL generation might have escaped, in which case the caller should
+    fall back to generating the link in full. Also returns None (rather than
+    a function) if `url` doesn't contain exactly one placeholder.
+    """
+    if url.count(ID_PLACEHOLDER) != 1:
+        return None
+
+    prefix, suffix = url.split(ID_PLACEHOLDER)
+    match = _SAFE_ID_RE.match
+
+    def format_link(id_):
+        if id_ and match(id_):
+            return prefix + id_ + suffix
+        return None
+
+    return format_link
+
+
+def route_link(route_name):
+    """
+    Return a link generator for a route which takes the annotation id as its
+    ``id`` parameter.
+
+    The generator supports compilation: the route URL is generated once with a
+    placeholder id, and links for individual annotations are produced by
+    string concatenation.
+    """
+    def generator(request, annotation):
+        return request.route_url(route_name, id=annotation.id)
+
+    def compile_(request):
+        template = compile_link_template(request.route_url(route_name,
+                                                           id=ID_PLACEHOLDER))
+        if template is None:
+            return functools.partial(generator, request)
+
+        def compiled(annotation):
+            link = template(annotation.id)
+            if link is None:
+                link = generator(request, annotation)
+            return link
+
+        return compiled
+
+    generator.compile = compile_
+    return generator
+
 
 def links_factory(context, request):
     """Return a LinksService instance for the passed context and request."""
@@ -84,6 +192,12 @@ def add_annotation_link_generator(registry, name, generator, hidden=False):
 
     If `hidden` is True, then the link generator will not be included in the
     default links output when rendering annotations.
+
+    A generator may also have a ``compile`` attribute: a callable which
+    accepts a request and returns a function of a single annotation which
+    generates the same link. This is used when presenting many annotations at
+    once, and allows work which doesn't depend on the annotation to be done
+    once rather than for every annotation (see :py:func:`route_link`).
     """
     if LINK_GENERATORS_KEY not in registry:
         registry[LINK_GENERATORS_KEY] = {}
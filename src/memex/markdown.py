@@ -6,6 +6,7 @@ import re
 
 import bleach
 from bleach import callbacks as linkify_callbacks
+from bleach.sanitizer import BleachSanitizer
 import mistune
 
 LINK_REL = 'nofollow noopener'
@@ -35,6 +36,29 @@ MARKDOWN_ATTRIBUTES = {
 }
 ALLOWED_ATTRIBUTES = dict(bleach.ALLOWED_ATTRIBUTES.items() + MARKDOWN_ATTRIBUTES.items())
 
+# The protocols allowed in link and image URLs. html5lib's default list
+# includes ``data:``, which can be used to smuggle scripts into a link.
+ALLOWED_PROTOCOLS = ['http', 'https', 'mailto']
+
+
+class _Sanitizer(BleachSanitizer):
+
+    """
+    The tokenizer with which rendered HTML is parsed.
+
+    This is the sanitizer that :py:func:`bleach.clean` would build for our
+    allowed tags and attributes. Passing it to :py:func:`bleach.linkify`
+    sanitizes the HTML as it is parsed for linkification, so the output only
+    has to be parsed and serialized once.
+    """
+
+    allowed_elements = ALLOWED_TAGS
+    allowed_attributes = ALLOWED_ATTRIBUTES
+    allowed_css_properties = bleach.ALLOWED_STYLES
+    allowed_protocols = ALLOWED_PROTOCOLS
+    strip_disallowed_elements = False
+    strip_html_comments = True
+
 # Singleton instance of the Markdown instance
 markdown = None
 
@@ -86,14 +110,10 @@ def render(text):
 
 
 def sanitize(text):
-    linkified = bleach.linkify(text, callbacks=[
-        linkify_callbacks.target_blank,
-        linkify_rel,
-    ])
-
-    return bleach.clean(linkified,
-                        tags=ALLOWED_TAGS,
-                        attributes=ALLOWED_ATTRIBUTES)
+    return bleach.linkify(text,
+                          callbacks=[linkify_callbacks.target_blank,
+                                     linkify_rel],
+                          tokenizer=_Sanitizer)
 
 
 def linkify_rel(attrs, new=False):
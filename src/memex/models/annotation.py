@@ -31,6 +31,8 @@ class Annotation(Base):
         #
         sa.Index('ix__annotation_tags', 'tags', postgresql_using='gin'),
         sa.Index('ix__annotation_updated', 'updated'),
+        sa.Index('ix__annotation_target_uri_normalized',
+                 'target_uri_normalized'),
     )
 
     #: Annotation ID: these are stored as UUIDs in the database, and mapped
@@ -128,6 +130,11 @@ class Annotation(Base):
 
     @text.setter
     def text(self, value):
+        # Rendering is comparatively expensive, and most updates to an
+        # annotation (for example changes to its tags or sharing) don't
+        # change its text.
+        if value == self._text and self._text_rendered is not None:
+            return
         self._text = value
         self._text_rendered = markdown.render(value)
 
@@ -18,6 +18,10 @@ from memex._compat import urlparse
 
 log = logging.getLogger(__name__)
 
+#: The key in ``session.info`` under which we collect the normalized URIs of
+#: documents whose set of equivalent URIs changed in the current transaction.
+CHANGED_URIS_KEY = 'memex.changed_document_uris'
+
 
 class ConcurrentUpdateError(transaction.interfaces.TransientError):
     """Raised when concurrent updates to document data conflict."""
@@ -273,6 +277,7 @@ def create_or_update_document_uri(session,
                              created=created,
                              updated=updated)
         session.add(docuri)
+        _record_equivalence_change(session, document)
     elif not docuri.document == document:
         log.warn("Found DocumentURI (id: %d)'s document_id (%d) doesn't match "
                  "given Document's id (%d)",
@@ -395,6 +400,8 @@ def merge_documents(session, documents, updated=None):
 
         session.delete(doc)
 
+    _record_equivalence_change(session, master)
+
     try:
         session.flush()
     except sa.exc.IntegrityError:
@@ -403,6 +410,12 @@ def merge_documents(session, documents, updated=None):
     return master
 
 
+def _record_equivalence_change(session, document):
+    """Record that the set of URIs of `document` has changed."""
+    changed = session.info.setdefault(CHANGED_URIS_KEY, set())
+    changed.update(u.uri_normalized for u in document.document_uris)
+
+
 def update_document_metadata(session,
                              annotation,
                              document_meta_dicts,
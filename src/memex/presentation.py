@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+"""
+A cache of presented annotations.
+
+The same unchanged annotation is presented over and over again: once for
+every API read and search results page it appears in, once for every socket
+of the streamer it is sent to, and once for every feed it is an entry of.
+Presenting an annotation isn't free (its links have to be generated, its
+timestamps formatted and its extra data copied), and the result only depends
+on the annotation itself, its document and the base URL of the links.
+
+The :py:class:`PresentationCache` keeps recent presentations keyed by the id
+and last updated time of the annotation and of its document, and by a
+"variant" identifying the format and the base URL. Changed annotations are
+then simply presented again under a new key, and their old presentations fall
+out of the cache in due course.
+
+Entries don't expire, so this relies on every change to an annotation's
+stored fields bumping its ``updated`` time. Changes made through the API do,
+and so must the statements which change annotations in bulk, such as those
+of the ``move-uri``, ``normalize-uris`` and ``render-annotations`` commands
+and of renaming a user. Anything which changes annotations without doing so
+has to :py:meth:`~PresentationCache.clear` the caches of every process.
+
+The presented ``permissions`` of an annotation are derived from its user,
+group and sharing, and they are the same whoever the presentation is for:
+checking whether a user may see an annotation is up to the caller, as it is
+without the cache.
+
+Cached presentations are shared, and must not be modified.
+"""
+
+from __future__ import unicode_literals
+
+from pyramid.settings import asbool
+from repoze.lru import LRUCache
+
+from memex.presenters import AnnotationJSONPresenter
+
+CACHE_KEY = 'memex.presentation.cache'
+
+DEFAULT_CACHE_SIZE = 10000
+
+
+class PresentationCache(object):
+
+    """A bounded cache of presented annotations."""
+
+    def __init__(self, cache_size=DEFAULT_CACHE_SIZE):
+        """
+        Create a new presentation cache.
+
+        :param cache_size: the maximum number of presentations to keep
+        :type cache_size: int
+        """
+        self._cache = LRUCache(cache_size)
+
+    def present(self, annotation, variant, present):
+        """
+        Return ``present(annotation)``, or the result of an earlier call.
+
+        :param annotation: the annotation to present
+        :type annotation: memex.models.Annotation
+
+        :param variant: a hashable value identifying the presentation, for
+                        example its format and the base URL of its links
+        :param present: a function which presents an annotation
+        """
+        key = _key(annotation, variant)
+        if key is None:
+            return present(annotation)
+
+        presented = self._cache.get(key)
+        if presented is None:
+            presented = present(annotation)
+            self._cache.put(key, presented)
+        return presented
+
+    def present_json(self, annotations, links_service, stats=None):
+        """
+        Return the JSON presentations of `annotations`.
+
+        The presentations are those of
+        :py:class:`memex.presenters.AnnotationJSONPresenter`, in the same
+        order as `annotations`.
+
+        :param links_service: the links service to present links with
+        :type links_service: memex.links.LinksService
+
+        :param stats: an optional statsd client to report the number of cache
+                      hits and misses to
+        """
+        variant = json_variant(links_service.base_url)
+        compiled = []
+        misses = []
+
+        def present(annotation):
+            if not compiled:
+                compiled.append(links_service.compile())
+            misses.append(annotation)
+            return AnnotationJSONPresenter(annotation, compiled[0]).asdict()
+
+        presented = [self.present(a, variant, present) for a in annotations]
+
+        if stats is not None and annotations:
+            stats.incr('memex.presentation_cache.hits',
+                       len(annotations) - len(misses))
+            stats.incr('memex.presentation_cache.misses', len(misses))
+
+        return presented
+
+    def clear(self):
+        """Drop all cached presentations."""
+        self._cache.clear()
+
+    @property
+    def stats(self):
+        """A dictionary of cache statistics."""
+        return {'hits': self._cache.hits,
+                'misses': self._cache.misses,
+                'lookups': self._cache.lookups,
+                'evictions': self._cache.evictions}
+
+
+def json_variant(base_url):
+    """
+    Return the variant of JSON presentations with links under `base_url`.
+
+    This is the variant under which :py:meth:`PresentationCache.present_json`
+    caches presentations, for use by callers which present annotations in the
+    API's JSON format themselves.
+    """
+    return ('json', base_url)
+
+
+def _key(annotation, variant):
+    """Return the cache key of a presentation, or None if there isn't one."""
+    if annotation.id is None or annotation.updated is None:
+        return None
+
+    document = annotation.document
+    if document is None:
+        return (variant, annotation.id, annotation.updated, None, None)
+    return (variant, annotation.id, annotation.updated,
+            document.id, document.updated)
+
+
+def present_json(registry, annotations, links_service, stats=None):
+    """
+    Return the JSON presentations of `annotations`.
+
+    This uses the presentation cache of `registry` if there is one, and
+    otherwise presents the annotations as
+    :py:class:`memex.presenters.AnnotationJSONBatchPresenter` does.
+    """
+    cache = get_cache(registry)
+    if cache is not None:
+        return cache.present_json(annotations, links_service, stats=stats)
+
+    links_service = links_service.compile()
+    return [AnnotationJSONPresenter(a, links_service).asdict()
+            for a in annotations]
+
+
+def get_cache(registry):
+    """Return the presentation cache configured for `registry`, or None."""
+    return registry.get(CACHE_KEY)
+
+
+def includeme(config):
+    settings = config.registry.settings
+    if not asbool(settings.get('memex.presentation_cache', True)):
+        return
+
+    cache_size = int(settings.get('memex.presentation_cache.size',
+                                  DEFAULT_CACHE_SIZE))
+    config.registry[CACHE_KEY] = PresentationCache(cache_size=cache_size)
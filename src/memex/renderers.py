@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+"""
+A streaming JSON renderer for list-shaped API responses.
+
+Pyramid's ``json`` renderer serializes the whole view result into a single
+string before any of it is sent. The ``streaming_json`` renderer registered
+here instead returns an iterator which encodes the result a piece at a time:
+top-level lists, tuples and generators (and those which are values of a
+top-level dictionary) are encoded one item at a time. Views can therefore
+return generators of rows, and the rendered output for a given value is
+byte-for-byte the same as that of :py:func:`json.dumps`.
+
+Clients which prefer ``application/x-ndjson`` get newline-delimited JSON
+instead: one line per item of a list-shaped result (or a single line for any
+other result).
+
+The function used to encode each item can be replaced with a faster one using
+the ``memex.json_encoder`` setting, which should be the dotted name of a
+callable with the same signature as :py:func:`json.dumps` when called with a
+single argument (for example ``simplejson.dumps``).
+"""
+
+from __future__ import unicode_literals
+
+import json
+import types
+
+from pyramid.path import DottedNameResolver
+from webob.acceptparse import MIMEAccept
+
+JSON_CONTENT_TYPE = 'application/json'
+NDJSON_CONTENT_TYPE = 'application/x-ndjson'
+
+ENCODER_KEY = 'memex.renderers.json_encoder'
+
+#: The approximate size in bytes of each chunk of output. The first item
+#: of each list is sent without waiting, so that the client receives data as
+#: soon as possible.
+CHUNK_SIZE = 16 * 1024
+
+_STREAMED_TYPES = (list, tuple, types.GeneratorType)
+
+# Yielded by the encoding generators to mark a point at which the output
+# produced so far should be sent without waiting for a full chunk.
+_FLUSH = object()
+
+
+class StreamingJSON(object):
+
+    """A renderer factory for the ``streaming_json`` renderer."""
+
+    def __init__(self, info):
+        self.info = info
+
+    def __call__(self, value, system):
+        request = system.get('request')
+        encode = json.dumps if request is None else get_encoder(request)
+
+        ndjson = request is not None and wants_ndjson(request)
+
+        if request is not None:
+            response = request.response
+            if response.content_type == response.default_content_type:
+                if ndjson:
+                    response.content_type = NDJSON_CONTENT_TYPE
+                else:
+                    response.content_type = JSON_CONTENT_TYPE
+            response.charset = 'UTF-8'
+
+        return render(value, ndjson=ndjson, encode=encode)
+
+
+def render(value, ndjson=False, encode=json.dumps):
+    """
+    Return an iterator over the encoded `value`, in chunks of UTF-8 bytes.
+
+    This is used by the ``streaming_json`` renderer, and may be used directly
+    by views which build their own streaming responses.
+
+    :param value: the value to encode
+    :param ndjson: whether to encode `value` as newline-delimited JSON
+    :type ndjson: bool
+    :param encode: the function used to encode each item as JSON
+    :type encode: callable
+    """
+    if ndjson:
+        pieces = _iter_ndjson(value, encode)
+    else:
+        pieces = _iter_json(value, encode)
+
+    return _chunked(pieces)
+
+
+def get_encoder(request):
+    """Return the configured function for encoding items as JSON."""
+    return request.registry.get(ENCODER_KEY, json.dumps)
+
+
+def wants_ndjson(request):
+    """Return True if the client prefers newline-delimited JSON."""
+    accept = request.headers.get('Accept')
+    if not accept:
+        return False
+    offers = [JSON_CONTENT_TYPE, NDJSON_CONTENT_TYPE]
+    return MIMEAccept(accept).best_match(offers) == NDJSON_CONTENT_TYPE
+
+
+def _iter_json(value, encode):
+    if isinstance(value, _STREAMED_TYPES):
+        for piece in _iter_array(value, encode):
+            yield piece
+    elif isinstance(value, dict):
+        yield '{'
+        for i, (key, item) in enumerate(value.items()):
+            if i > 0:
+                yield ', '
+            yield encode(key) + ': '
+            if isinstance(item, _STREAMED_TYPES):
+                for piece in _iter_array(item, encode):
+                    yield piece
+            else:
+                yield encode(item)
+        yield '}'
+    else:
+        yield encode(value)
+
+
+def _iter_array(items, encode):
+    yield '['
+    for i, item in enumerate(items):
+        if i > 0:
+            yield ', '
+        yield encode(item)
+        if i == 0:
+            yield _FLUSH
+    yield ']'
+
+
+def _iter_ndjson(value, encode):
+    if isinstance(value, _STREAMED_TYPES):
+        for i, item in enumerate(value):
+            yield encode(item) + '\n'
+            if i == 0:
+                yield _FLUSH
+    else:
+        yield encode(value) + '\n'
+
+
+def _chunked(pieces):
+    """Join encoded pieces into UTF-8 chunks of about CHUNK_SIZE bytes."""
+    buf = []
+    size = 0
+    for piece in pieces:
+        if piece is _FLUSH:
+            if buf:
+                yield b''.join(buf)
+                buf = []
+                size = 0
+            continue
+        if not isinstance(piece, bytes):
+            piece = piece.encode('utf-8')
+        buf.append(piece)
+        size += len(piece)
+        if size >= CHUNK_SIZE:
+            yield b''.join(buf)
+            buf = []
+            size = 0
+    if buf:
+        yield b''.join(buf)
+
+
+def includeme(config):
+    encoder = config.registry.settings.get('memex.json_encoder')
+    if encoder:
+        config.registry[ENCODER_KEY] = DottedNameResolver().maybe_resolve(encoder)
+
+    config.add_renderer('streaming_json', StreamingJSON)
@@ -8,7 +8,6 @@ class AnnotationFactory(object):
 
     def __getitem__(self, id):
         annotation = storage.fetch_annotation(self.request.db, id)
-        print id
         if annotation is None:
             raise KeyError()
         return annotation
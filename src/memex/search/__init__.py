@@ -5,8 +5,10 @@ from pyramid.settings import asbool
 from memex.search.client import Client
 from memex.search.config import configure_index
 from memex.search.core import Search
+from memex.search.core import COALESCER_KEY
 from memex.search.core import FILTERS_KEY
 from memex.search.core import MATCHERS_KEY
+from memex.singleflight import SingleFlight
 
 __all__ = ('Search',)
 
@@ -38,6 +40,11 @@ def includeme(config):
     config.add_directive('add_search_matcher',
                          lambda c, m: c.registry[MATCHERS_KEY].append(m))
 
+    # Unless disabled, identical concurrent searches share a single request
+    # to Elasticsearch.
+    if asbool(settings.get('memex.search.coalesce', True)):
+        config.registry[COALESCER_KEY] = SingleFlight()
+
     # Add a property to all requests for easy access to the elasticsearch
     # client. This can be used for direct or bulk access without having to
     # reread the settings.
@@ -1,4 +1,5 @@
 # -*- coding: utf-8 -*-
+import json
 import logging
 from collections import namedtuple
 
@@ -7,6 +8,11 @@ from memex.search import query
 FILTERS_KEY = 'memex.search.filters'
 MATCHERS_KEY = 'memex.search.matchers'
 
+#: The key in the registry under which the
+#: :py:class:`memex.singleflight.SingleFlight` used to coalesce identical
+#: concurrent searches is stored, if coalescing is enabled.
+COALESCER_KEY = 'memex.search.coalescer'
+
 log = logging.getLogger(__name__)
 
 SearchResult = namedtuple('SearchResult', [
@@ -43,13 +49,30 @@ class Search(object):
         :param params: the search parameters
         :type params: dict-like
 
+        If search coalescing is enabled, and an identical search (the same
+        Elasticsearch query, run on behalf of the same principals) is already
+        in progress, this waits for that search and returns its results.
+
         :returns: The search results
         :rtype: SearchResult
         """
-        total, annotation_ids, aggregations = self.search_annotations(params)
-        reply_ids = self.search_replies(annotation_ids)
+        coalescer = self.request.registry.get(COALESCER_KEY)
+        if coalescer is None:
+            return self._result(*self.search_annotations(params))
 
-        return SearchResult(total, annotation_ids, reply_ids, aggregations)
+        body = self._build(params)
+        key = (json.dumps(body, sort_keys=True),
+               self.separate_replies,
+               tuple(sorted(self.request.effective_principals)))
+        result, shared = coalescer.do(
+            key, lambda: self._result(*self._search_annotations(body)))
+
+        if shared:
+            stats = getattr(self.request, 'stats', None)
+            if stats is not None:
+                stats.incr('memex.search.coalesced')
+
+        return result
 
     def append_filter(self, filter_):
         """Append a search filter to the annotation and reply query."""
@@ -65,13 +88,18 @@ class Search(object):
         self.builder.append_aggregation(aggregation)
 
     def search_annotations(self, params):
+        return self._search_annotations(self._build(params))
+
+    def _build(self, params):
         if self.separate_replies:
             self.builder.append_filter(query.TopLevelAnnotationsFilter())
+        return self.builder.build(params)
 
+    def _search_annotations(self, body):
         response = self.es.conn.search(index=self.es.index,
                                        doc_type=self.es.t.annotation,
                                        _source=False,
-                                       body=self.builder.build(params))
+                                       body=body)
         total = response['hits']['total']
         annotation_ids = [hit['_id'] for hit in response['hits']['hits']]
         aggregations = self._parse_aggregation_results(response.get('aggregations', None))
@@ -95,6 +123,10 @@ class Search(object):
 
         return [hit['_id'] for hit in response['hits']['hits']]
 
+    def _result(self, total, annotation_ids, aggregations):
+        reply_ids = self.search_replies(annotation_ids)
+        return SearchResult(total, annotation_ids, reply_ids, aggregations)
+
     def _parse_aggregation_results(self, aggregations):
         if not aggregations:
             return {}
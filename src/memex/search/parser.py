@@ -3,18 +3,20 @@
 """
 The query parser which converts our subset of the Apache Lucene syntax and
 transforms it into a MultiDict structure that memex.search understands.
+
+The parser is a small hand-written tokenizer. It accepts exactly the grammar
+of the pyparsing-based parser it replaced, quirks included, and keeps the
+results of recently parsed query strings, as the same queries are parsed
+again and again by the activity pages.
 """
 
 from __future__ import unicode_literals
 
-from collections import namedtuple
+import re
 
-import pyparsing as pp
+from repoze.lru import LRUCache
 from webob.multidict import MultiDict
 
-# Enable memoizing of the parsing logic
-pp.ParserElement.enablePackrat()
-
 # Named fields we support when querying (e.g. `user:luke`)
 named_fields = ['user', 'tag', 'group', 'uri']
 
@@ -46,8 +48,23 @@ whitespace = set([
     "\u3000",  # ideographic space
 ])
 
-parser = None
-Match = namedtuple('Match', ['key', 'value'])
+#: The whitespace skipped between terms, and between a field name, the colon
+#: and the field's value. Other whitespace characters end a term but are not
+#: skipped, so parsing stops at them.
+skipped_whitespace = ' \n\t\r'
+
+#: The opening quote and contents of a quoted value, which must be followed
+#: by a closing quote. Quote characters are allowed in the contents if they
+#: are doubled or escaped with a backslash.
+_QUOTED = {
+    '"': re.compile(r'"(?:[^"\n\r\\]|(?:"")|(?:\\(?:[^x]|x[0-9a-fA-F]+)))*'),
+    "'": re.compile(r"'(?:[^'\n\r\\]|(?:'')|(?:\\(?:[^x]|x[0-9a-fA-F]+)))*"),
+}
+
+#: The number of recently parsed query strings whose results are kept.
+CACHE_SIZE = 500
+
+_cache = LRUCache(CACHE_SIZE)
 
 
 def parse(q):
@@ -67,13 +84,11 @@ def parse(q):
     Supported keys for fields are ``user``, ``group``, ``tag``, ``uri``.
     Any other search terms will get the key ``any``.
     """
-    parser = _get_parser()
-    parse_results = parser.parseString(q)
-
-    # The parser returns all matched strings, even the field names, we use a
-    # parse action to turn matches into a key/value pair (Match), but we need
-    # to filter out any other matches that the parser returns.
-    return MultiDict([m for m in parse_results if isinstance(m, Match)])
+    terms = _cache.get(q)
+    if terms is None:
+        terms = tuple(_parse(q))
+        _cache.put(q, terms)
+    return MultiDict(terms)
 
 
 def unparse(q):
@@ -96,40 +111,69 @@ def unparse(q):
     return ' '.join(terms)
 
 
-def _get_parser():
-    global parser
-    if parser is None:
-        parser = _make_parser()
-    return parser
+def _parse(q):
+    """Yield the (key, value) pairs of the terms of the query string `q`."""
+    # Tabs are expanded before parsing, as pyparsing (which we used to parse
+    # queries with) did.
+    q = q.expandtabs()
+    pos = 0
 
+    while True:
+        pos = _skip_whitespace(q, pos)
+        if pos == len(q):
+            return
 
-def _make_parser():
-    word = pp.CharsNotIn(''.join(whitespace))
-    word.skipWhitespace = True
+        key, value, end = _parse_field(q, pos)
+        if value is None:
+            key = 'any'
+            value, end = _parse_value(q, pos)
+        if value is None:
+            # The term starts with whitespace which isn't skipped. Ignore the
+            # rest of the query.
+            return
 
-    value = pp.MatchFirst([
-        pp.dblQuotedString.copy().setParseAction(pp.removeQuotes),
-        pp.sglQuotedString.copy().setParseAction(pp.removeQuotes),
-        pp.Empty() + pp.CharsNotIn(''.join(whitespace)),
-    ])
+        yield key, value
+        pos = end
 
-    expressions = []
 
+def _parse_field(q, pos):
+    """Parse a ``field:value`` term at `pos`, if there is one."""
     for field in named_fields:
-        exp = pp.Suppress(pp.CaselessLiteral(field) + ':') + \
-            value.copy().setParseAction(_decorate_match(field))
-        expressions.append(exp)
-
-    any_ = value.copy().setParseAction(_decorate_match('any'))
-    expressions.append(any_)
-
-    return pp.ZeroOrMore(pp.MatchFirst(expressions))
-
-
-def _decorate_match(key):
-    def parse_action_impl(t):
-        return Match(key, t[0])
-    return parse_action_impl
+        end = pos + len(field)
+        if q[pos:end].upper() != field.upper():
+            continue
+        end = _skip_whitespace(q, end)
+        if q[end:end + 1] != ':':
+            continue
+        value, end = _parse_value(q, end + 1)
+        if value is not None:
+            return field, value, end
+    return None, None, pos
+
+
+def _parse_value(q, pos):
+    """Parse a quoted or unquoted value at `pos`, if there is one."""
+    pos = _skip_whitespace(q, pos)
+
+    pattern = _QUOTED.get(q[pos:pos + 1])
+    if pattern is not None:
+        match = pattern.match(q, pos)
+        end = match.end()
+        if q[end:end + 1] == q[pos]:
+            return q[pos + 1:end], end + 1
+
+    end = pos
+    while end < len(q) and q[end] not in whitespace:
+        end += 1
+    if end == pos:
+        return None, pos
+    return q[pos:end], end
+
+
+def _skip_whitespace(q, pos):
+    while pos < len(q) and q[pos] in skipped_whitespace:
+        pos += 1
+    return pos
 
 
 def _escape_term(term):
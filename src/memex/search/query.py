@@ -1,6 +1,5 @@
 # -*- coding: utf-8 -*-
-from memex import storage
-from memex import uri
+from memex import equivalence
 
 LIMIT_DEFAULT = 20
 LIMIT_MAX = 200
@@ -171,12 +170,10 @@ class UriFilter(object):
         query_uris = [v for k, v in params.items() if k == 'uri']
         del params['uri']
 
+        resolver = self.request.find_service(name='uri_equivalence')
         uris = set()
         for query_uri in query_uris:
-            expanded = storage.expand_uri(self.request.db, query_uri)
-
-            us = [uri.normalize(u) for u in expanded]
-            uris.update(us)
+            uris.update(resolver.expand_normalized(self.request.db, query_uri))
 
         return {"terms": {"target.scope": list(uris)}}
 
@@ -0,0 +1,353 @@
+# -*- coding: utf-8 -*-
+"""
+A cache of the public sidebar payload of each document.
+
+The sidebar loads the annotations of a page with a search for the page's URI
+with separate replies. For a user who isn't logged in the response to this
+search is the same for every request for the same document, and building it
+is expensive: it takes a URI expansion, two searches, two database queries
+and the presentation of up to a few hundred annotations.
+
+The :py:class:`SidebarCache` keeps these responses, keyed by the set of
+equivalent URIs of the document (so that all URIs of a document share an
+entry) and the page size and ordering requested. When an annotation of a
+cached document is created, updated or deleted in this process the cached
+responses for that document are patched in place where that can be done
+exactly, and otherwise dropped so that the next request rebuilds them.
+
+As with :py:mod:`memex.equivalence`, changes made by other processes are only
+picked up once a cached entry expires, so entries are kept for a short time
+only. As a process which serves many requests may show responses which are
+up to that long out of date, the cache is only enabled with the
+``memex.sidebar_cache`` setting.
+"""
+
+from __future__ import unicode_literals
+
+from collections import namedtuple
+import threading
+
+from pyramid.settings import asbool
+from repoze.lru import ExpiringLRUCache
+import sqlalchemy as sa
+
+from memex import models
+from memex import presentation
+from memex import presenters
+from memex import storage
+from memex import uri
+from memex.events import AnnotationTransformEvent
+from memex.search import query
+
+CACHE_KEY = 'memex.sidebar.cache'
+
+#: The key in ``session.info`` under which we collect the normalized URIs that
+#: each annotation was moved away from in the current session, so that it can
+#: be removed from the cached responses of its old URIs.
+MOVED_URIS_KEY = 'memex.sidebar.moved_annotation_uris'
+
+DEFAULT_CACHE_SIZE = 1000
+DEFAULT_CACHE_TTL = 30
+
+#: The maximum number of replies returned by a search. See
+#: :py:meth:`memex.search.core.Search.search_replies`.
+REPLIES_LIMIT = 200
+
+#: The fields by which a cached response may be ordered. Both are timestamps
+#: which are presented in a format whose string ordering is chronological.
+SORT_FIELDS = ('created', 'updated')
+
+#: The search parameters of a sidebar request.
+_PARAMS = frozenset(['uri', '_separate_replies', 'limit', 'offset', 'sort',
+                     'order'])
+
+PUBLIC_GROUP = '__world__'
+
+
+class SidebarKey(namedtuple('SidebarKey', ['uris', 'limit', 'sort', 'order'])):
+
+    """
+    The key of a cached sidebar response.
+
+    ``uris`` is the frozenset of the normalized URIs of the document.
+    """
+
+
+class SidebarCache(object):
+
+    """A cache of the search responses of anonymous sidebar requests."""
+
+    def __init__(self, cache_size=DEFAULT_CACHE_SIZE, ttl=DEFAULT_CACHE_TTL):
+        self._cache = ExpiringLRUCache(cache_size, default_timeout=ttl)
+        self._lock = threading.Lock()
+
+        # The keys of the cached entries of each normalized URI. Keys whose
+        # entries have since been evicted are removed lazily.
+        self._keys = {}
+
+        self.patches = 0
+        self.invalidations = 0
+
+    def key(self, request, params):
+        """
+        Return the cache key for a search, or None if it can't be cached.
+
+        Only searches by a user who isn't logged in, for the first page of
+        top-level annotations (with separate replies) of a single URI, are
+        cached.
+        """
+        if request.authenticated_userid is not None:
+            return None
+
+        params = list(params.items())
+        names = [k for k, _ in params]
+        if set(names) - _PARAMS or names.count('uri') != 1:
+            return None
+
+        params = dict(params)
+        if not params.get('_separate_replies'):
+            return None
+        if query.extract_offset(params.copy()) != 0:
+            return None
+
+        sort = params.get('sort', 'updated')
+        order = params.get('order', 'desc')
+        if sort not in SORT_FIELDS or order not in ('asc', 'desc'):
+            return None
+
+        resolver = request.find_service(name='uri_equivalence')
+        uris = frozenset(resolver.expand_normalized(request.db, params['uri']))
+        return SidebarKey(uris=uris,
+                          limit=query.extract_limit(params.copy()),
+                          sort=sort,
+                          order=order)
+
+    def get(self, key):
+        """
+        Return the cached response for `key`, or None.
+
+        The response is a dictionary with ``total``, ``rows`` and ``replies``
+        keys. It must not be modified.
+        """
+        return self._cache.get(key)
+
+    def put(self, key, payload):
+        """Cache the response `payload` of the search `key`."""
+        with self._lock:
+            self._cache.put(key, payload)
+            for u in key.uris:
+                self._keys.setdefault(u, set()).add(key)
+
+    def annotation_changed(self, normalized_uri, annotation_id, presented,
+                           reply=False, created=False):
+        """
+        Update the cached responses for a created, updated or deleted annotation.
+
+        :param normalized_uri: the normalized target URI of the annotation
+        :param annotation_id: the id of the annotation
+        :param presented: the annotation as presented by the API if it can be
+                          read by anyone, or None if it has been deleted or
+                          can't
+        :param reply: whether the annotation is a reply
+        :param created: whether the annotation has just been created
+        """
+        with self._lock:
+            keys = self._keys.get(normalized_uri, set())
+            for key in list(keys):
+                payload = self._cache.get(key)
+                if payload is None:
+                    keys.discard(key)
+                    continue
+
+                if reply:
+                    patched = _patch_replies(payload, annotation_id, presented)
+                else:
+                    patched = _patch_rows(key, payload, annotation_id,
+                                          presented, created)
+
+                if patched is None:
+                    self._cache.invalidate(key)
+                    keys.discard(key)
+                    self.invalidations += 1
+                else:
+                    self._cache.put(key, patched)
+                    self.patches += 1
+
+            if not keys:
+                self._keys.pop(normalized_uri, None)
+
+    def clear(self):
+        """Drop all cached responses."""
+        with self._lock:
+            self._cache.clear()
+            self._keys.clear()
+
+    @property
+    def stats(self):
+        """A dictionary of cache statistics."""
+        return {'hits': self._cache.hits,
+                'misses': self._cache.misses,
+                'lookups': self._cache.lookups,
+                'evictions': self._cache.evictions,
+                'patches': self.patches,
+                'invalidations': self.invalidations}
+
+
+def _patch_rows(key, payload, annotation_id, presented, created):
+    """
+    Return `payload` with the new state of a top-level annotation, or None.
+
+    None is returned when the new payload can't be worked out from the old
+    one, for example when removing an annotation from a full page would bring
+    in an annotation from the next page.
+    """
+    total = payload['total']
+    complete = total == len(payload['rows'])
+    rows = [r for r in payload['rows'] if r['id'] != annotation_id]
+    was_row = len(rows) != len(payload['rows'])
+
+    if not was_row and not created:
+        # If the annotation has become visible we don't know its replies, and
+        # if the page isn't complete it may have been counted on a later page.
+        if presented is not None or not complete:
+            return None
+        return payload
+
+    if was_row:
+        total -= 1
+
+    if presented is not None:
+        position = _position(key, rows, presented)
+        if position < len(rows) or complete:
+            rows.insert(position, presented)
+        elif was_row:
+            # The annotation has moved to a later page.
+            return None
+        total += 1
+    elif not complete:
+        return None
+
+    rows = rows[:key.limit]
+    row_ids = {r['id'] for r in rows}
+    replies = [r for r in payload['replies']
+               if row_ids.intersection(r['references'])]
+
+    if len(replies) != len(payload['replies']) and \
+            len(payload['replies']) >= REPLIES_LIMIT:
+        return None
+
+    return {'total': total, 'rows': rows, 'replies': replies}
+
+
+def _patch_replies(payload, annotation_id, presented):
+    """Return `payload` with the new state of a reply, or None."""
+    if len(payload['replies']) >= REPLIES_LIMIT:
+        # We don't know which replies didn't fit in the response.
+        return None
+
+    replies = [r for r in payload['replies'] if r['id'] != annotation_id]
+    row_ids = {r['id'] for r in payload['rows']}
+    if presented is not None and row_ids.intersection(presented['references']):
+        replies.append(presented)
+        replies.sort(key=lambda r: r['updated'], reverse=True)
+
+    if len(replies) > REPLIES_LIMIT:
+        return None
+
+    return {'total': payload['total'],
+            'rows': payload['rows'],
+            'replies': replies}
+
+
+def _position(key, rows, presented):
+    """Return the index at which `presented` belongs in `rows`."""
+    value = presented[key.sort]
+    for i, row in enumerate(rows):
+        if key.order == 'desc' and value > row[key.sort]:
+            return i
+        if key.order == 'asc' and value < row[key.sort]:
+            return i
+    return len(rows)
+
+
+def _is_public(request, annotation):
+    """Return whether `annotation` is shown to users who aren't logged in."""
+    if not annotation.shared or annotation.groupid != PUBLIC_GROUP:
+        return False
+
+    # Search filters registered by the application (for example to hide the
+    # annotations of some users) act on the indexed form of the annotation.
+    indexed = presenters.AnnotationSearchIndexPresenter(annotation).asdict()
+    request.registry.notify(AnnotationTransformEvent(request, indexed))
+    return not indexed.get('nipsa', False)
+
+
+def update_sidebar_cache(event):
+    """Update the cached sidebar responses for an annotation event."""
+    cache = get_cache(event.request.registry)
+    if cache is None:
+        return
+
+    request = event.request
+    if event.action == 'delete':
+        if not event.annotation_dict or not event.annotation_dict.get('uri'):
+            return
+        cache.annotation_changed(
+            uri.normalize(event.annotation_dict['uri']),
+            event.annotation_id,
+            None,
+            reply=bool(event.annotation_dict.get('references')))
+        return
+
+    annotation = storage.fetch_annotation(request.db, event.annotation_id)
+    if annotation is None:
+        return
+
+    moved = request.db.info.get(MOVED_URIS_KEY, {}).pop(annotation.id, ())
+    for old_uri in moved:
+        if old_uri != annotation.target_uri_normalized:
+            cache.annotation_changed(old_uri,
+                                     annotation.id,
+                                     None,
+                                     reply=bool(annotation.references))
+
+    presented = None
+    if _is_public(request, annotation):
+        links_service = request.find_service(name='links')
+        presented = presentation.present_json(request.registry,
+                                              [annotation],
+                                              links_service)[0]
+    cache.annotation_changed(annotation.target_uri_normalized,
+                             annotation.id,
+                             presented,
+                             reply=bool(annotation.references),
+                             created=event.action == 'create')
+
+
+@sa.event.listens_for(sa.orm.Session, 'before_flush')
+def _record_moved_annotations(session, flush_context, instances):
+    for obj in session.dirty:
+        if not isinstance(obj, models.Annotation):
+            continue
+        history = sa.inspect(obj).attrs._target_uri_normalized.history
+        if history.deleted:
+            moved = session.info.setdefault(MOVED_URIS_KEY, {})
+            moved.setdefault(obj.id, set()).update(history.deleted)
+
+
+def get_cache(registry):
+    """Return the sidebar cache configured for `registry`, or None."""
+    return registry.get(CACHE_KEY)
+
+
+def includeme(config):
+    settings = config.registry.settings
+    if not asbool(settings.get('memex.sidebar_cache', False)):
+        return
+
+    cache_size = int(settings.get('memex.sidebar_cache.size',
+                                  DEFAULT_CACHE_SIZE))
+    ttl = int(settings.get('memex.sidebar_cache.ttl', DEFAULT_CACHE_TTL))
+    config.registry[CACHE_KEY] = SidebarCache(cache_size=cache_size, ttl=ttl)
+    config.add_subscriber('memex.sidebar.update_sidebar_cache',
+                          'memex.events.AnnotationEvent')
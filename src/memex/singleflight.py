@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""
+Coalescing of identical concurrent calls.
+
+When many clients make the same expensive request at once (for example when a
+popular page is shared and hundreds of sidebars search for its annotations at
+the same moment) there's no need to do the work once per request. A
+:py:class:`SingleFlight` lets the first caller for a given key do the work,
+while every other caller which arrives with the same key before it has
+finished waits for it and shares its result.
+
+Results are not cached: once a call has finished the next caller with the
+same key starts a new one.
+
+The implementation uses the locks and events of the :py:mod:`threading`
+module, which gevent's monkey patching (as done by gunicorn's gevent workers)
+replaces with cooperative versions, so it works with both threaded and gevent
+workers. With synchronous workers there are no concurrent calls and nothing is
+ever coalesced.
+"""
+
+from __future__ import unicode_literals
+
+import threading
+
+
+class _Call(object):
+
+    """A call in flight."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.finished = False
+        self.value = None
+        self.error = None
+
+
+class SingleFlight(object):
+
+    """A group of calls of which at most one per key is in flight at a time."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.executions = 0
+        self.coalesced = 0
+
+    def do(self, key, fn):
+        """
+        Call `fn` and return its result, unless a call for `key` is in flight.
+
+        If another call with the same `key` is already in flight, wait for it
+        to finish and return its result (or raise its exception) instead.
+
+        :param key: a hashable key identifying calls which are interchangeable
+        :param fn: a function of no arguments
+
+        :returns: a ``(result, shared)`` tuple, where ``shared`` is True if the
+                  result came from a call made by another caller
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = self._calls[key] = _Call()
+                self.executions += 1
+                leader = True
+            else:
+                self.coalesced += 1
+                leader = False
+
+        if leader:
+            return self._run(key, call, fn), False
+
+        call.done.wait()
+
+        # If the call was interrupted before it could produce a result (for
+        # example if its greenlet was killed) do the work ourselves.
+        if not call.finished:
+            return fn(), False
+        if call.error is not None:
+            raise call.error
+        return call.value, True
+
+    @property
+    def stats(self):
+        """A dictionary of call statistics."""
+        return {'executions': self.executions,
+                'coalesced': self.coalesced}
+
+    def _run(self, key, call, fn):
+        try:
+            call.value = fn()
+            call.finished = True
+            return call.value
+        except Exception as exc:
+            call.error = exc
+            call.finished = True
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
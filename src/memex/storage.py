@@ -9,6 +9,7 @@ assumed to be validated.
 
 from datetime import datetime
 
+import sqlalchemy as sa
 from pyramid import i18n
 from memex import schemas
 from memex import models
@@ -33,11 +34,11 @@ def fetch_annotation(session, id_):
     :rtype: memex.models.Annotation, NoneType
     """
     try:
-        val = session.query(models.Annotation).get(id_)
-        print val
         return session.query(models.Annotation).get(id_)
     except types.InvalidUUID:
         return None
+
+
 def fetch_url(session, id_):
     """
     Fetch the annotation with the given id.
@@ -112,6 +113,33 @@ def fetch_ordered_annotations(session, ids, query_processor=None):
     anns = sorted(query, key=lambda a: ordering.get(a.id))
     return anns
 
+
+def readable_by(principals):
+    """
+    Return a filter clause for annotations readable by one of `principals`.
+
+    This mirrors :py:meth:`memex.models.Annotation.__acl__`, so that the read
+    permission of many annotations can be checked in a single query: shared
+    annotations may be read by members of their group (and by anyone for the
+    public group), and private annotations only by their author.
+
+    :param principals: the effective principals of the reader
+    :type principals: list
+
+    :rtype: sqlalchemy.sql.expression.ClauseElement
+    """
+    groupids = {p[len('group:'):] for p in principals
+                if p.startswith('group:')}
+    groupids.add('__world__')
+
+    return sa.or_(
+        sa.and_(models.Annotation.shared == sa.true(),
+                models.Annotation.groupid.in_(groupids)),
+        sa.and_(models.Annotation.shared == sa.false(),
+                models.Annotation.userid.in_(list(principals))),
+    )
+
+
 def create_uri(request, data):
     """
     Create an annotation from passed data.
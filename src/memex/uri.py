@@ -64,6 +64,8 @@ elsewhere in the Hypothesis application. URI expansion is handled by
 """
 import re
 
+from repoze.lru import LRUCache
+
 from memex._compat import text_type
 from memex._compat import urlparse
 from memex._compat import url_quote, url_quote_plus
@@ -92,6 +94,11 @@ BLACKLISTED_QUERY_PARAMS = [re.compile(regex) for regex in set([
     r'^WT\..+$',
 ])]
 
+# A single regular expression equivalent to trying each of the
+# BLACKLISTED_QUERY_PARAMS in turn.
+_BLACKLISTED_QUERY_PARAMS_RE = re.compile(
+    '|'.join('(?:{})'.format(p.pattern) for p in BLACKLISTED_QUERY_PARAMS))
+
 # From RFC3986. The ABNF for path segments is
 #
 #   path-abempty  = *( "/" segment )
@@ -126,16 +133,53 @@ UNRESERVED_QUERY_VALUE = "-._~:@!$'()*,="
 # redirect your browser to https://via.hypothes.is/https://example.com.
 VIA_PREFIX = "https://via.hypothes.is/"
 
+# The number of recently normalized URIs whose normalized form we remember, and
+# the maximum length of URIs we are willing to remember (we don't want a few
+# enormous data: URIs to take up most of the memory used by the cache).
+NORMALIZE_CACHE_SIZE = 10000
+NORMALIZE_CACHE_MAX_LENGTH = 2048
+
+_normalize_cache = LRUCache(NORMALIZE_CACHE_SIZE)
+
+# Matches http(s) URLs which are already in normal form apart from their
+# scheme: a lower-case hostname without userinfo or port, and a path with
+# no trailing slash, no empty segments, and no characters needing
+# (de)escaping. There can be no query string or fragment.
+_SIMPLE_URL_RE = re.compile(
+    br"^https?://[a-z0-9.-]+(?:/[A-Za-z0-9\-._~:@!$&'()*+,;=]+)*\Z")
+
 
 def normalize(uristr):
     """Translate the given URI into a normalized form."""
+    normalized = _normalize_cache.get(uristr)
+    if normalized is None:
+        normalized = _normalize(uristr)
+        if len(uristr) <= NORMALIZE_CACHE_MAX_LENGTH:
+            _normalize_cache.put(uristr, normalized)
+    return normalized
+
+
+def _normalize(uristr):
     uristr = uristr.encode('utf-8')
 
     # Strip proxy prefix for proxied URLs
-    for scheme in URL_SCHEMES:
-        if uristr.startswith(VIA_PREFIX + scheme + ':'):
-            uristr = uristr[len(VIA_PREFIX):]
-            break
+    if uristr.startswith(VIA_PREFIX):
+        for scheme in URL_SCHEMES:
+            if uristr.startswith(VIA_PREFIX + scheme + ':'):
+                uristr = uristr[len(VIA_PREFIX):]
+                break
+
+    # If this isn't a URL, we don't perform any normalization. This is a fast
+    # path for URNs (and already-normalized "httpx" URLs): we know the scheme
+    # can't be http(s) without splitting the URI. URIs containing square
+    # brackets are left to `urlsplit`, which rejects invalid IPv6 hostnames.
+    is_http = uristr[:5].lower() == b'http:' or uristr[:6].lower() == b'https:'
+    if not is_http and b'[' not in uristr and b']' not in uristr:
+        return text_type(uristr, 'utf-8')
+
+    # Fast path for URLs where only the scheme needs changing.
+    if _SIMPLE_URL_RE.match(uristr):
+        return text_type(b'httpx' + uristr[uristr.index(b':'):], 'utf-8')
 
     # Try to extract the scheme
     uri = urlparse.urlsplit(uristr)
@@ -228,6 +272,10 @@ def _normalize_pathsegment(segment):
 def _normalize_query(uri):
     query = uri.query
 
+    # An empty query string can't be parsed, and so is preserved as it is.
+    if not query:
+        return query
+
     try:
         items = urlparse.parse_qsl(query, keep_blank_values=True, strict_parsing=True)
     except ValueError:
@@ -263,4 +311,4 @@ def _normalize_queryvalue(value):
 
 def _blacklisted_query_param(s):
     """Return True if the given string matches any BLACKLISTED_QUERY_PARAMS."""
-    return any(re.match(patt, s) for patt in BLACKLISTED_QUERY_PARAMS)
+    return _BLACKLISTED_QUERY_PARAMS_RE.match(s) is not None
@@ -19,20 +19,33 @@ objects and Pyramid ACLs in :mod:`memex.resources`.
 from pyramid import i18n
 from pyramid import security
 from pyramid.view import view_config
+from sqlalchemy.orm import defer
+from sqlalchemy.orm import load_only
 from sqlalchemy.orm import subqueryload
 from werkzeug.datastructures import MultiDict
+from memex import conditional
 from memex import cors
+from memex.db.types import InvalidUUID
 from memex import models
 from memex.events import AnnotationEvent
+from memex import export as export_lib
+from memex import presentation
+from memex.presenters import AnnotationJSONBatchPresenter
 from memex.presenters import AnnotationJSONPresenter
 from memex.renotedpresenters import UrlJSONPresenter
 from memex.presenters import AnnotationJSONLDPresenter
+from memex import renderers
 from memex import search as search_lib
 from memex import schemas
+from memex import sidebar
 from memex import storage
 
 _ = i18n.TranslationStringFactory(__package__)
 
+#: The maximum number of annotations which may be read in a single request to
+#: the bulk read API. This is the same as the maximum search page size.
+READ_MANY_LIMIT = 200
+
 cors_policy = cors.policy(
     allow_headers=(
         'Authorization',
@@ -138,26 +151,137 @@ def index(context, request):
     }
 
 
-@api_config(route_name='api.search')
+@api_config(route_name='api.search', renderer='streaming_json')
+@api_config(route_name='api.search',
+            renderer='streaming_json',
+            accept=renderers.NDJSON_CONTENT_TYPE)
 def search(request):
-    """Search the database for annotations matching with the given query."""
+    """
+    Search the database for annotations matching with the given query.
+
+    Clients which accept ``application/x-ndjson`` get one annotation per line
+    (the matching annotations followed by any separate replies) and the total
+    in the ``X-Total-Count`` header.
+
+    The ``fields`` parameter (for example ``fields=id,updated``) limits the
+    fields returned for each annotation to those given, plus the ``id``.
+    """
     params = request.params.copy()
-    print params
+
+    # Anonymous sidebar requests are answered from the sidebar cache.
+    cache = sidebar.get_cache(request.registry)
+    cache_key = cache.key(request, params) if cache is not None else None
+    if cache_key is not None:
+        payload = cache.get(cache_key)
+        if payload is None:
+            payload = _search(request, params)
+            cache.put(cache_key, payload)
+        return _search_response(request, payload, separate_replies=True)
+
+    separate_replies = bool(params.get('_separate_replies', False))
+    return _search_response(request,
+                            _search(request, params),
+                            separate_replies=separate_replies)
+
+
+def _search(request, params):
+    """Run a search and return its total, rows and (separate) replies."""
+    params = params.copy()
     separate_replies = params.pop('_separate_replies', False)
+    fields = _fields(params)
+    params.pop('fields', None)
     result = search_lib.Search(request, separate_replies=separate_replies) \
         .run(params)
 
+    # The annotations are presented here rather than lazily in the renderer,
+    # because the renderer's output is consumed after the request's
+    # transaction has ended. The renderer still avoids building the whole
+    # response body in memory.
+    rows = _present_annotations(request, result.annotation_ids, fields=fields)
+    replies = []
+    if separate_replies:
+        replies = _present_annotations(request, result.reply_ids,
+                                       fields=fields)
+
+    return {'total': result.total, 'rows': rows, 'replies': replies}
+
+
+def _search_response(request, payload, separate_replies):
+    if renderers.wants_ndjson(request):
+        request.response.headers['X-Total-Count'] = str(payload['total'])
+        return payload['rows'] + payload['replies']
+
     out = {
-        'total': result.total,
-        'rows': _present_annotations(request, result.annotation_ids)
+        'total': payload['total'],
+        'rows': payload['rows'],
     }
 
     if separate_replies:
-        out['replies'] = _present_annotations(request, result.reply_ids)
+        out['replies'] = payload['replies']
 
     return out
 
 
+@api_config(route_name='api.export', request_method='GET', accept=None)
+def export(request):
+    """
+    Stream every annotation matching the given query which the user may read.
+
+    The query is given by one or more of the ``user``, ``group`` and ``uri``
+    parameters. Annotations are returned oldest first, as newline-delimited
+    JSON in the format used by the rest of the API or, with
+    ``format=jsonld``, as a JSON-LD array of Web Annotations.
+    """
+    params = request.params
+    format_ = params.get('format', export_lib.FORMAT_JSON)
+    if format_ not in export_lib.FORMATS:
+        raise APIError(_('Unknown export format: {format}').format(
+            format=format_), status_code=400)
+
+    uris = None
+    if 'uri' in params:
+        resolver = request.find_service(name='uri_equivalence')
+        uris = set()
+        for uri in params.getall('uri'):
+            uris.update(resolver.expand_normalized(request.db, uri))
+
+    user = params.get('user')
+    group = params.get('group')
+    if user is None and group is None and uris is None:
+        raise APIError(_('An export must be limited by user, group or uri.'),
+                       status_code=400)
+
+    principals = list(request.effective_principals)
+    filters = export_lib.get_filters(request)
+    annotations_export = export_lib.Export(user=user,
+                                           group=group,
+                                           uris=uris,
+                                           principals=principals,
+                                           filters=filters)
+
+    # The annotations are read once the response body is consumed, after the
+    # request's transaction has ended, so the export uses a session of its own.
+    links_service = request.find_service(name='links')
+    annotations = export_lib.stream(request.db.get_bind(),
+                                    annotations_export,
+                                    links_service,
+                                    format_)
+
+    response = request.response
+    if format_ == export_lib.FORMAT_JSONLD:
+        response.content_type = 'application/ld+json'
+        response.content_type_params = {
+            'profile': AnnotationJSONLDPresenter.CONTEXT_URL}
+    else:
+        response.content_type = renderers.NDJSON_CONTENT_TYPE
+    response.charset = 'UTF-8'
+    response.app_iter = renderers.render(
+        annotations,
+        ndjson=format_ != export_lib.FORMAT_JSONLD,
+        encode=renderers.get_encoder(request))
+    return response
+
+
 @api_config(route_name='api.annotations',
             request_method='POST',
             effective_principals=security.Authenticated)
@@ -172,9 +296,48 @@ def create(request):
     
     _publish_annotation_event(request, annotation, 'create')
 
-    links_service = request.find_service(name='links')
-    presenter = AnnotationJSONPresenter(annotation, links_service)
-    return presenter.asdict()
+    return _present_annotation(request, annotation)
+
+
+@api_config(route_name='api.annotations',
+            request_method='GET',
+            renderer='streaming_json')
+def read_many(request):
+    """
+    Return the annotations with the given ``id`` parameters.
+
+    Annotations are returned in the order in which their ids were given.
+    Annotations which don't exist, or which the user may not read, are
+    omitted. The read permission of all the annotations is checked in the
+    same database query that loads them.
+
+    As with search, the ``fields`` parameter limits the fields returned for
+    each annotation.
+    """
+    ids = request.params.getall('id')
+    if not ids:
+        raise APIError(_('At least one annotation id must be given.'),
+                       status_code=400)
+    if len(ids) > READ_MANY_LIMIT:
+        raise APIError(_('At most {limit} annotations may be read at once.')
+                       .format(limit=READ_MANY_LIMIT), status_code=400)
+
+    principals = list(request.effective_principals)
+
+    def readable(query):
+        return query.filter(storage.readable_by(principals))
+
+    try:
+        rows = _present_annotations(request, ids,
+                                    query_processor=readable,
+                                    fields=_fields(request.params))
+    except InvalidUUID:
+        raise APIError(_('Invalid annotation id.'), status_code=400)
+
+    return {
+        'total': len(rows),
+        'rows': rows,
+    }
 
 
 @api_config(route_name='api.annotation',
@@ -182,11 +345,18 @@ def create(request):
             permission='read')
 def read(annotation, request):
     """Return the annotation (simply how it was stored in the database)."""
-    links_service = request.find_service(name='links')
-    print links_service
+    not_modified = conditional.not_modified(
+        request, conditional.annotation_validators(annotation))
+    if not_modified is not None:
+        return not_modified
+
+    fields = _fields(request.params)
+    if fields is None:
+        return _present_annotation(request, annotation)
 
-    presenter = AnnotationJSONPresenter(annotation, links_service)
-    print presenter
+    links_service = request.find_service(name='links')
+    presenter = AnnotationJSONPresenter(annotation, links_service,
+                                        fields=fields)
     return presenter.asdict()
 
 @api_config(route_name='api.url',
@@ -213,6 +383,11 @@ def renotedread(urldata, request):
             request_method='GET',
             permission='read')
 def read_jsonld(annotation, request):
+    not_modified = conditional.not_modified(
+        request, conditional.annotation_validators(annotation))
+    if not_modified is not None:
+        return not_modified
+
     request.response.content_type = 'application/ld+json'
     request.response.content_type_params = {
         'profile': AnnotationJSONLDPresenter.CONTEXT_URL}
@@ -237,9 +412,7 @@ def update(annotation, request):
 
     _publish_annotation_event(request, annotation, 'update')
 
-    links_service = request.find_service(name='links')
-    presenter = AnnotationJSONPresenter(annotation, links_service)
-    return presenter.asdict()
+    return _present_annotation(request, annotation)
 
 
 @api_config(route_name='api.annotation',
@@ -274,17 +447,60 @@ def _json_payload(request):
         raise PayloadError()
 
 
-def _present_annotations(request, ids):
-    """Load annotations by id from the database and present them."""
-    def eager_load_documents(query):
-        return query.options(
-            subqueryload(models.Annotation.document))
+def _fields(params):
+    """
+    Return the list of fields requested with the ``fields`` parameter.
+
+    Fields are given as a comma-separated list. Returns None if no fields were
+    requested.
+    """
+    value = params.get('fields', '')
+    fields = [field.strip() for field in value.split(',') if field.strip()]
+    return fields or None
+
+
+def _present_annotations(request, ids, query_processor=None, fields=None):
+    """
+    Load annotations by id from the database and present them.
+
+    Only the columns needed to present the requested `fields` are loaded, and
+    documents are eager-loaded if they are needed. The optional
+    `query_processor` is then applied to the query which loads the
+    annotations.
+    """
+    def load_for_presentation(query):
+        if AnnotationJSONPresenter.needs_document(fields):
+            query = query.options(
+                subqueryload(models.Annotation.document))
+        if fields is None:
+            query = query.options(defer(models.Annotation._text_rendered))
+        else:
+            query = query.options(
+                load_only(*AnnotationJSONPresenter.attributes(fields)))
+        if query_processor is not None:
+            query = query_processor(query)
+        return query
 
     annotations = storage.fetch_ordered_annotations(request.db, ids,
-                                                    query_processor=eager_load_documents)
+                                                    query_processor=load_for_presentation)
+    links_service = request.find_service(name='links')
+    if fields is None:
+        return presentation.present_json(request.registry,
+                                         annotations,
+                                         links_service,
+                                         stats=getattr(request, 'stats', None))
+    return AnnotationJSONBatchPresenter(annotations,
+                                        links_service,
+                                        fields=fields).aslist()
+
+
+def _present_annotation(request, annotation):
+    """Present a single annotation in the API's JSON format."""
     links_service = request.find_service(name='links')
-    return [AnnotationJSONPresenter(ann, links_service).asdict()
-            for ann in annotations]
+    return presentation.present_json(request.registry,
+                                     [annotation],
+                                     links_service,
+                                     stats=getattr(request, 'stats', None))[0]
 
 
 def _publish_annotation_event(request,
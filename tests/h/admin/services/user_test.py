@@ -2,12 +2,17 @@
 
 from __future__ import unicode_literals
 
+import datetime
+
 import mock
 import pytest
 
 from h import models
+from h.admin.services.user import DeleteUserService
 from h.admin.services.user import RenameUserService
+from h.admin.services.user import UserDeletionError
 from h.admin.services.user import UserRenameError
+from h.admin.services.user import make_deleter
 from h.admin.services.user import make_indexer
 
 
@@ -36,14 +41,77 @@ class TestRenameUserService(object):
 
     def test_rename_changes_the_users_annotations_userid(self, service, user, annotations, db_session):
         service.rename(user, 'panda')
+        db_session.expire_all()
 
         userids = [ann.userid for ann in db_session.query(models.Annotation)]
         assert set([user.userid]) == set(userids)
 
+    def test_rename_bumps_the_users_annotations_updated_time(self, service, user, factories, db_session):
+        before = datetime.datetime(2016, 1, 1)
+        annotation = factories.Annotation(userid=user.userid, updated=before)
+        db_session.flush()
+
+        service.rename(user, 'panda')
+        db_session.expire_all()
+
+        assert annotation.updated > before
+
     def test_rename_reindexes_the_users_annotations(self, service, user, annotations, indexer):
         service.rename(user, 'panda')
         indexer.assert_called_once_with({ann.id for ann in annotations})
 
+    def test_rename_reindexes_in_batches(self, service, user, annotations, indexer):
+        service.batch_size = 3
+
+        service.rename(user, 'panda')
+
+        batches = [c[0][0] for c in indexer.call_args_list]
+        assert [len(b) for b in batches] == [3, 3, 2]
+        assert set.union(*batches) == {ann.id for ann in annotations}
+
+    def test_rename_records_its_progress(self, service, user, annotations, db_session):
+        old_userid = user.userid
+
+        service.rename(user, 'panda')
+
+        job = db_session.query(models.Job).one()
+        assert job.type == 'rename_user'
+        assert job.userid == old_userid
+        assert job.finished
+        assert (job.processed, job.total) == (8, 8)
+
+    def test_rename_runs_the_given_job(self, service, user, annotations, db_session):
+        job = models.Job(type='rename_user', userid=user.userid,
+                         status=models.Job.QUEUED)
+        db_session.add(job)
+        db_session.flush()
+
+        service.rename(user, 'panda', job_id=job.id)
+
+        assert db_session.query(models.Job).one() == job
+        assert job.finished
+        assert (job.processed, job.total) == (8, 8)
+
+    def test_rename_survives_committing_each_batch(self, tm_request, factories,
+                                                   index):
+        tm_request.es = mock.MagicMock()
+        user = factories.User(username='giraffe')
+        tm_request.db.add(user)
+        tm_request.db.add_all(factories.Annotation.build_batch(5, userid=user.userid))
+        tm_request.db.flush()
+        tm_request.tm.commit()
+        user = tm_request.db.query(models.User).one()
+        service = RenameUserService(session=tm_request.db,
+                                    reindex=make_indexer(tm_request),
+                                    batch_size=2)
+
+        service.rename(user, 'panda')
+        tm_request.tm.commit()
+
+        job = tm_request.db.query(models.Job).one()
+        assert job.finished
+        assert job.processed == 5
+
     @pytest.fixture
     def indexer(self):
         return mock.Mock(spec_set=[])
@@ -75,6 +143,124 @@ class TestRenameUserService(object):
         return anns
 
 
+class TestDeleteUserService(object):
+    def test_check_returns_true_when_user_created_no_groups(self, service, user):
+        assert service.check(user) is True
+
+    def test_check_raises_when_user_created_a_group(self, service, user, factories):
+        factories.Group(creator=user)
+
+        with pytest.raises(UserDeletionError):
+            service.check(user)
+
+    def test_delete_checks_first(self, service, user, factories):
+        factories.Group(creator=user)
+
+        with pytest.raises(UserDeletionError):
+            service.delete(user)
+
+    def test_delete_deletes_the_user(self, service, user, db_session):
+        service.delete(user)
+        db_session.flush()
+
+        assert db_session.query(models.User).get(user.id) is None
+
+    def test_delete_disassociates_group_memberships(self, service, user, factories, db_session):
+        group = factories.Group()
+        group.members.append(user)
+        db_session.flush()
+
+        service.delete(user)
+
+        assert user not in group.members
+
+    def test_delete_deletes_the_users_annotations(self, service, user, annotations, db_session, factories):
+        other = factories.Annotation()
+
+        service.delete(user)
+
+        assert db_session.query(models.Annotation).all() == [other]
+
+    def test_delete_removes_annotations_from_index_in_batches(self, service, user, annotations, deleter):
+        service.batch_size = 5
+
+        service.delete(user)
+
+        batches = [c[0][0] for c in deleter.call_args_list]
+        assert [len(b) for b in batches] == [5, 3]
+        assert set.union(*batches) == {ann.id for ann in annotations}
+
+    def test_delete_records_its_progress(self, service, user, annotations, db_session):
+        service.delete(user)
+
+        job = db_session.query(models.Job).one()
+        assert job.type == 'delete_user'
+        assert job.finished
+        assert (job.processed, job.total) == (8, 8)
+
+    def test_delete_refreshes_the_counts_of_the_users_annotated_uris(
+            self, service, user, factories, annotation_counts):
+        factories.Annotation(userid=user.userid, shared=True,
+                             target_uri='http://example.com/')
+        factories.Annotation(userid=user.userid, shared=True,
+                             target_uri='http://example.com/')
+        factories.Annotation(userid=user.userid, shared=False,
+                             target_uri='http://example.org/')
+        factories.Annotation(shared=True, target_uri='http://example.net/')
+
+        service.delete(user)
+
+        annotation_counts.refresh.assert_called_once_with(
+            ['httpx://example.com'])
+
+    def test_delete_survives_committing_each_batch(self, tm_request, factories,
+                                                   index, annotation_counts):
+        tm_request.es = mock.MagicMock()
+        user = factories.User(username='giraffe')
+        tm_request.db.add(user)
+        tm_request.db.add_all(factories.Annotation.build_batch(5, userid=user.userid))
+        tm_request.db.flush()
+        tm_request.tm.commit()
+        user = tm_request.db.query(models.User).one()
+        service = DeleteUserService(session=tm_request.db,
+                                    delete_from_index=make_deleter(tm_request),
+                                    annotation_counts=annotation_counts,
+                                    batch_size=2)
+
+        service.delete(user)
+        tm_request.tm.commit()
+
+        assert tm_request.db.query(models.User).count() == 0
+        assert tm_request.db.query(models.Job).one().processed == 5
+
+    @pytest.fixture
+    def deleter(self):
+        return mock.Mock(spec_set=[])
+
+    @pytest.fixture
+    def annotation_counts(self):
+        return mock.Mock(spec_set=['refresh'])
+
+    @pytest.fixture
+    def service(self, pyramid_request, deleter, annotation_counts):
+        return DeleteUserService(session=pyramid_request.db,
+                                 delete_from_index=deleter,
+                                 annotation_counts=annotation_counts)
+
+    @pytest.fixture
+    def user(self, factories, db_session):
+        user = factories.User(username='giraffe')
+        db_session.add(user)
+        db_session.flush()
+        return user
+
+    @pytest.fixture
+    def annotations(self, user, factories, db_session):
+        anns = factories.Annotation.create_batch(8, userid=user.userid)
+        db_session.flush()
+        return anns
+
+
 class TestMakeIndexer(object):
     def test_it_indexes_the_given_ids(self, req, index):
         indexer = make_indexer(req)
@@ -96,6 +282,35 @@ class TestMakeIndexer(object):
         pyramid_request.es = mock.MagicMock()
         return pyramid_request
 
+
+class TestMakeDeleter(object):
+    def test_it_deletes_the_given_ids(self, req, index):
+        deleter = make_deleter(req)
+        deleter([1, 2, 3])
+
+        batch_deleter = index.BatchDeleter.return_value
+        batch_deleter.delete.assert_called_once_with([1, 2, 3])
+
+    def test_it_commits_before_deleting(self, req, index):
+        deleter = make_deleter(req)
+        deleter([1, 2, 3])
+
+        req.tm.commit.assert_called_once_with()
+
+    def test_it_skips_deleting_when_no_ids_given(self, req, index):
+        deleter = make_deleter(req)
+
+        deleter([])
+
+        assert not index.BatchDeleter.called
+
     @pytest.fixture
-    def index(self, patch):
-        return patch('h.admin.services.user.index')
+    def req(self, pyramid_request):
+        pyramid_request.tm = mock.MagicMock()
+        pyramid_request.es = mock.MagicMock()
+        return pyramid_request
+
+
+@pytest.fixture
+def index(patch):
+    return patch('h.admin.services.user.index')
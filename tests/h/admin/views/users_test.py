@@ -5,10 +5,11 @@ from __future__ import unicode_literals
 import mock
 from mock import Mock
 from mock import MagicMock
-from mock import call
 from pyramid import httpexceptions
 import pytest
+import transaction
 
+from h import models
 from h.admin.views import users as views
 
 users_index_fixtures = pytest.mark.usefixtures('User')
@@ -18,7 +19,8 @@ users_index_fixtures = pytest.mark.usefixtures('User')
 def test_users_index(pyramid_request):
     result = views.users_index(pyramid_request)
 
-    assert result == {'username': None, 'user': None, 'user_meta': {}}
+    assert result == {'username': None, 'user': None, 'user_meta': {},
+                      'jobs': []}
 
 
 @users_index_fixtures
@@ -64,7 +66,8 @@ def test_users_index_no_user_found(User, pyramid_request):
 
     result = views.users_index(pyramid_request)
 
-    assert result == {'username': "bob", 'user': None, 'user_meta': {}}
+    assert result == {'username': "bob", 'user': None, 'user_meta': {},
+                      'jobs': []}
 
 
 @users_index_fixtures
@@ -78,9 +81,21 @@ def test_users_index_user_found(User, pyramid_request, db_session, factories):
         'username': "bob",
         'user': user,
         'user_meta': {'annotations_count': 0},
+        'jobs': [],
     }
 
 
+@users_index_fixtures
+def test_users_index_lists_recent_jobs(pyramid_request, db_session):
+    job = models.Job(type='delete_user', userid='acct:bob@example.com')
+    db_session.add(job)
+    db_session.flush()
+
+    result = views.users_index(pyramid_request)
+
+    assert result['jobs'] == [job]
+
+
 users_activate_fixtures = pytest.mark.usefixtures('User', 'ActivationEvent')
 
 
@@ -149,7 +164,16 @@ def test_users_activate_redirects(User, pyramid_request):
     assert isinstance(result, httpexceptions.HTTPFound)
 
 
-users_delete_fixtures = pytest.mark.usefixtures('User', 'delete_user')
+users_delete_fixtures = pytest.mark.usefixtures('user',
+                                                'delete_service',
+                                                'worker')
+
+
+@pytest.fixture
+def user(User):
+    user = User.get_by_username.return_value
+    user.userid = 'acct:bob@example.com'
+    return user
 
 
 @users_delete_fixtures
@@ -163,107 +187,75 @@ def test_users_delete_user_not_found_error(User, pyramid_request):
 
 
 @users_delete_fixtures
-def test_users_delete_deletes_user(User, delete_user, pyramid_request):
+def test_users_delete_checks_user(User, delete_service, pyramid_request):
     pyramid_request.params = {"username": "bob"}
-    user = MagicMock()
-
-    User.get_by_username.return_value = user
+    user = User.get_by_username.return_value
 
     views.users_delete(pyramid_request)
 
-    delete_user.assert_called_once_with(pyramid_request, user)
+    delete_service.check.assert_called_once_with(user)
 
 
 @users_delete_fixtures
-def test_users_delete_group_creator_error(User, delete_user, pyramid_request):
+def test_users_delete_queues_a_job(pyramid_request):
     pyramid_request.params = {"username": "bob"}
-    user = MagicMock()
-
-    User.get_by_username.return_value = user
-    delete_user.side_effect = views.UserDeletionError('group creator error')
 
     views.users_delete(pyramid_request)
 
-    assert pyramid_request.session.peek_flash('error') == [
-        'group creator error'
-    ]
-
-delete_user_fixtures = pytest.mark.usefixtures('api_storage',
-                                               'elasticsearch_helpers',
-                                               'models',
-                                               'user_created_no_groups')
-
-
-@delete_user_fixtures
-def test_delete_user_raises_when_group_creator(models, pyramid_request):
-    user = Mock()
-
-    models.Group.created_by.return_value.count.return_value = 10
-
-    with pytest.raises(views.UserDeletionError):
-        views.delete_user(pyramid_request, user)
+    job = pyramid_request.db.query(models.Job).one()
+    assert (job.type, job.userid) == ('delete_user', 'acct:bob@example.com')
+    assert job.status == models.Job.QUEUED
 
 
-@delete_user_fixtures
-def test_delete_user_disassociate_group_memberships(fake_db_session, pyramid_request):
-    pyramid_request.db = fake_db_session
-    user = Mock(groups=[Mock()])
-
-    views.delete_user(pyramid_request, user)
-
-    assert user.groups == []
-
+@users_delete_fixtures
+def test_users_delete_queues_deletion_after_commit(user, worker, pyramid_request):
+    pyramid_request.params = {"username": "bob"}
 
-@delete_user_fixtures
-def test_delete_user_queries_annotations(elasticsearch_helpers, factories, fake_db_session, pyramid_request):
-    pyramid_request.db = fake_db_session
-    user = factories.User(username=u'bob')
+    views.users_delete(pyramid_request)
 
-    views.delete_user(pyramid_request, user)
+    assert not worker.delete_user.delay.called
+    pyramid_request.tm.commit()
+    job = pyramid_request.db.query(models.Job).one()
+    worker.delete_user.delay.assert_called_once_with(user.id, job.id)
+    assert pyramid_request.session.peek_flash('success')
 
-    elasticsearch_helpers.scan.assert_called_once_with(
-        client=pyramid_request.es.conn,
-        query={
-            'query': {
-                'filtered': {
-                    'filter': {'term': {'user': u'acct:bob@example.com'}},
-                    'query': {'match_all': {}}
-                }
-            }
-        }
-    )
 
+@users_delete_fixtures
+def test_users_delete_group_creator_error(User, delete_service, worker, pyramid_request):
+    pyramid_request.params = {"username": "bob"}
+    delete_service.check.side_effect = views.UserDeletionError('group creator error')
 
-@delete_user_fixtures
-def test_delete_user_deletes_annotations(api_storage, elasticsearch_helpers, fake_db_session, pyramid_request):
-    pyramid_request.db = fake_db_session
-    user = MagicMock()
-    annotation_1 = {'_id': 'annotation-1'}
-    annotation_2 = {'_id': 'annotation-2'}
+    views.users_delete(pyramid_request)
 
-    elasticsearch_helpers.scan.return_value = [annotation_1, annotation_2]
+    assert pyramid_request.session.peek_flash('error') == [
+        'group creator error'
+    ]
+    assert not worker.delete_user.delay.called
 
-    views.delete_user(pyramid_request, user)
 
-    assert api_storage.delete_annotation.mock_calls == [
-        call(pyramid_request.db, 'annotation-1'),
-        call(pyramid_request.db, 'annotation-2')
-    ]
+users_rename_fixtures = pytest.mark.usefixtures('user',
+                                                'rename_service',
+                                                'worker')
 
 
-@delete_user_fixtures
-def test_delete_user_deletes_user(fake_db_session, pyramid_request):
-    pyramid_request.db = fake_db_session
-    user = MagicMock()
+@users_rename_fixtures
+def test_users_rename_queues_the_rename_after_commit(user, worker, pyramid_request):
+    pyramid_request.params = {"username": "bob", "new_username": "panda"}
 
-    views.delete_user(pyramid_request, user)
+    views.users_rename(pyramid_request)
 
-    assert user in pyramid_request.db.deleted
+    job = pyramid_request.db.query(models.Job).one()
+    assert (job.type, job.userid) == ('rename_user', 'acct:bob@example.com')
+    assert job.status == models.Job.QUEUED
+    assert not worker.rename_user.delay.called
+    pyramid_request.tm.commit()
+    worker.rename_user.delay.assert_called_once_with(user.id, 'panda', job.id)
 
 
 @pytest.fixture
 def pyramid_request(pyramid_request):
     pyramid_request.es = mock.MagicMock()
+    pyramid_request.tm = transaction.TransactionManager()
     return pyramid_request
 
 
@@ -283,26 +275,19 @@ def User(patch):
 
 
 @pytest.fixture
-def api_storage(patch):
-    return patch('h.admin.views.users.storage')
-
-
-@pytest.fixture
-def delete_user(patch):
-    return patch('h.admin.views.users.delete_user')
-
-
-@pytest.fixture
-def elasticsearch_helpers(patch):
-    return patch('h.admin.views.users.es_helpers')
+def delete_service(pyramid_config):
+    service = Mock(spec_set=['check', 'delete'])
+    pyramid_config.register_service(service, name='delete_user')
+    return service
 
 
 @pytest.fixture
-def models(patch):
-    return patch('h.admin.views.users.models')
+def rename_service(pyramid_config):
+    service = Mock(spec_set=['check', 'rename'])
+    pyramid_config.register_service(service, name='rename_user')
+    return service
 
 
 @pytest.fixture
-def user_created_no_groups(models):
-    # By default, pretend that all users are the creators of 0 groups.
-    models.Group.created_by.return_value.count.return_value = 0
+def worker(patch):
+    return patch('h.admin.views.users.worker')
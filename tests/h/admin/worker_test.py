@@ -4,6 +4,7 @@ from __future__ import unicode_literals
 
 import pytest
 
+from h import models
 from h.admin import worker
 
 
@@ -23,7 +24,72 @@ class TestRenameUser(object):
 
         worker.rename_user(user.id, 'panda')
 
-        service.rename.assert_called_once_with(user, 'panda')
+        service.rename.assert_called_once_with(user, 'panda', job_id=None)
+
+    def test_it_runs_the_given_job(self, celery, user):
+        service = celery.request.find_service.return_value
+
+        worker.rename_user(user.id, 'panda', 7)
+
+        service.rename.assert_called_once_with(user, 'panda', job_id=7)
+
+    def test_it_marks_the_job_failed_when_the_rename_fails(self, celery, user,
+                                                           job):
+        service = celery.request.find_service.return_value
+        service.rename.side_effect = ValueError('broken')
+
+        with pytest.raises(ValueError):
+            worker.rename_user(user.id, 'panda', job.id)
+
+        assert job.status == models.Job.FAILED
+        celery.request.tm.abort.assert_called_once_with()
+        celery.request.tm.commit.assert_called_once_with()
+
+    def test_it_marks_the_job_failed_when_the_user_is_missing(self, celery,
+                                                              job):
+        with pytest.raises(ValueError):
+            worker.rename_user(4, 'panda', job.id)
+
+        assert job.status == models.Job.FAILED
+
+    @pytest.fixture
+    def user(self, factories, db_session):
+        user = factories.User(username='giraffe')
+        db_session.add(user)
+        db_session.flush()
+        return user
+
+    @pytest.fixture
+    def celery(self, patch, db_session):
+        cel = patch('h.admin.worker.celery', autospec=False)
+        cel.request.db = db_session
+        return cel
+
+
+class TestDeleteUser(object):
+    def test_it_raises_when_user_cannot_be_found(self, celery):
+        with pytest.raises(ValueError) as err:
+            worker.delete_user(4)
+        assert err.value.message == 'Could not find user with id 4'
+
+    def test_it_deletes_the_user(self, celery, user):
+        service = celery.request.find_service.return_value
+
+        worker.delete_user(user.id)
+
+        celery.request.find_service.assert_called_once_with(name='delete_user')
+        service.delete.assert_called_once_with(user, job_id=None)
+
+    def test_it_marks_the_job_failed_when_the_deletion_fails(self, celery,
+                                                             user, job):
+        service = celery.request.find_service.return_value
+        service.delete.side_effect = ValueError('broken')
+
+        with pytest.raises(ValueError):
+            worker.delete_user(user.id, job.id)
+
+        assert job.status == models.Job.FAILED
+        celery.request.tm.commit.assert_called_once_with()
 
     @pytest.fixture
     def user(self, factories, db_session):
@@ -37,3 +103,12 @@ class TestRenameUser(object):
         cel = patch('h.admin.worker.celery', autospec=False)
         cel.request.db = db_session
         return cel
+
+
+@pytest.fixture
+def job(db_session):
+    job = models.Job(type='rename_user', userid='acct:giraffe@example.com',
+                     status=models.Job.RUNNING)
+    db_session.add(job)
+    db_session.flush()
+    return job
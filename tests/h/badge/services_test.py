@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import mock
+import pytest
+
+from h.badge.services import AnnotationCountService
+from h.badge.services import CHANGED_URIS_KEY
+from h.badge.services import annotation_counts_factory
+from h.models import AnnotationCount
+
+
+class TestAnnotationCountService(object):
+
+    def test_count_returns_0_for_unknown_uris(self, svc):
+        assert svc.count('http://example.com/') == 0
+
+    def test_count_returns_the_number_of_public_annotations(self, svc, factories):
+        factories.Annotation.create_batch(2, target_uri='http://example.com/',
+                                          shared=True)
+        svc.rebuild()
+
+        assert svc.count('http://example.com/') == 2
+
+    def test_count_normalizes_the_uri(self, svc, factories):
+        factories.Annotation(target_uri='http://example.com/', shared=True)
+        svc.rebuild()
+
+        assert svc.count('https://example.com') == 1
+
+    def test_count_only_counts_the_given_groups(self, svc, factories):
+        factories.Annotation(target_uri='http://example.com/', shared=True)
+        factories.Annotation.create_batch(2, target_uri='http://example.com/',
+                                          groupid='rebels', shared=True)
+        svc.rebuild()
+
+        assert svc.count('http://example.com/', groupids=['rebels']) == 2
+        assert svc.count('http://example.com/',
+                         groupids=['__world__', 'rebels']) == 3
+
+    def test_count_does_not_count_private_annotations(self, svc, factories):
+        factories.Annotation(target_uri='http://example.com/', shared=False)
+        svc.rebuild()
+
+        assert svc.count('http://example.com/') == 0
+
+    def test_count_does_not_count_annotations_by_nipsad_users(self, svc,
+                                                              factories, user):
+        user.nipsa = True
+        factories.Annotation(target_uri='http://example.com/', shared=True,
+                             userid=user.userid)
+        svc.rebuild()
+
+        assert svc.count('http://example.com/') == 0
+
+    def test_count_sums_equivalent_uris(self, db_session, factories):
+        factories.Annotation(target_uri='http://example.com/', shared=True)
+        factories.Annotation(target_uri='http://example.org/', shared=True)
+        uri_equivalence = mock.Mock(spec_set=['expand_normalized'])
+        uri_equivalence.expand_normalized.return_value = {
+            'httpx://example.com', 'httpx://example.org'}
+        svc = AnnotationCountService(db_session, uri_equivalence)
+        svc.rebuild()
+
+        assert svc.count('http://example.com/') == 2
+        uri_equivalence.expand_normalized.assert_called_once_with(
+            db_session, 'http://example.com/')
+
+    def test_refresh_recounts_the_given_uris(self, svc, factories):
+        ann = factories.Annotation(target_uri='http://example.com/',
+                                   shared=True)
+        svc.refresh(['httpx://example.com'])
+        assert svc.count('http://example.com/') == 1
+
+        ann.shared = False
+        svc.refresh(['httpx://example.com'])
+
+        assert svc.count('http://example.com/') == 0
+
+    def test_refresh_leaves_other_uris_alone(self, svc, factories):
+        factories.Annotation(target_uri='http://example.com/', shared=True)
+        factories.Annotation(target_uri='http://example.org/', shared=True)
+        svc.rebuild()
+        factories.Annotation(target_uri='http://example.org/', shared=True)
+
+        svc.refresh(['httpx://example.com'])
+
+        assert svc.count('http://example.org/') == 1
+
+    def test_refresh_is_idempotent(self, svc, factories):
+        factories.Annotation(target_uri='http://example.com/', shared=True)
+
+        svc.refresh(['httpx://example.com'])
+        svc.refresh(['httpx://example.com'])
+
+        assert svc.count('http://example.com/') == 1
+
+    def test_refresh_user_recounts_the_users_uris(self, svc, factories, user):
+        factories.Annotation(target_uri='http://example.com/', shared=True,
+                             userid=user.userid)
+        svc.rebuild()
+        user.nipsa = True
+
+        svc.refresh_user(user.userid)
+
+        assert svc.count('http://example.com/') == 0
+
+    def test_rebuild_replaces_all_counts(self, svc, db_session, factories):
+        db_session.add(AnnotationCount(uri='httpx://example.net',
+                                       groupid='__world__',
+                                       count=7))
+        factories.Annotation(target_uri='http://example.com/', shared=True)
+
+        svc.rebuild()
+
+        counts = db_session.query(AnnotationCount).all()
+        assert [(c.uri, c.groupid, c.count) for c in counts] == [
+            ('httpx://example.com', '__world__', 1)]
+
+    @pytest.fixture
+    def svc(self, db_session):
+        return AnnotationCountService(db_session)
+
+    @pytest.fixture
+    def user(self, db_session, factories):
+        user = factories.User()
+        db_session.add(user)
+        db_session.flush()
+        return user
+
+
+class TestRecordMovedAnnotations(object):
+
+    def test_it_records_the_previous_uri_of_moved_annotations(self, db_session,
+                                                              factories):
+        ann = factories.Annotation(target_uri='http://example.com/')
+        db_session.flush()
+
+        ann.target_uri = 'http://example.org/'
+        db_session.flush()
+
+        assert db_session.info[CHANGED_URIS_KEY] == {'httpx://example.com'}
+
+    def test_it_ignores_other_changes(self, db_session, factories):
+        ann = factories.Annotation(target_uri='http://example.com/')
+        db_session.flush()
+
+        ann.shared = not ann.shared
+        db_session.flush()
+
+        assert CHANGED_URIS_KEY not in db_session.info
+
+    @pytest.fixture(autouse=True)
+    def clear_info(self, db_session):
+        db_session.info.pop(CHANGED_URIS_KEY, None)
+        yield
+        db_session.info.pop(CHANGED_URIS_KEY, None)
+
+
+def test_annotation_counts_factory(pyramid_config, pyramid_request):
+    uri_equivalence = mock.Mock()
+    pyramid_config.register_service(uri_equivalence, name='uri_equivalence')
+
+    svc = annotation_counts_factory(None, pyramid_request)
+
+    assert isinstance(svc, AnnotationCountService)
+    assert svc.session == pyramid_request.db
+    assert svc.uri_equivalence == uri_equivalence
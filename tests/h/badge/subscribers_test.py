@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import mock
+import pytest
+
+from h.badge import subscribers
+from h.badge.services import CHANGED_URIS_KEY
+
+
+@pytest.mark.usefixtures('refresh_annotation_counts')
+class TestUpdateAnnotationCounts(object):
+
+    @pytest.mark.parametrize('action', ['create', 'update'])
+    def test_it_refreshes_the_annotations_uri(self, action,
+                                              refresh_annotation_counts,
+                                              factories, pyramid_request):
+        ann = factories.Annotation(target_uri='http://example.com/')
+        event = mock.Mock(request=pyramid_request,
+                          annotation_id=ann.id,
+                          action=action)
+
+        subscribers.update_annotation_counts(event)
+
+        refresh_annotation_counts.delay.assert_called_once_with(
+            ['httpx://example.com'])
+
+    def test_it_refreshes_the_uris_annotations_were_moved_from(
+            self, refresh_annotation_counts, db_session, factories,
+            pyramid_request):
+        ann = factories.Annotation(target_uri='http://example.com/')
+        ann.target_uri = 'http://example.org/'
+        db_session.flush()
+        event = mock.Mock(request=pyramid_request,
+                          annotation_id=ann.id,
+                          action='update')
+
+        subscribers.update_annotation_counts(event)
+
+        refresh_annotation_counts.delay.assert_called_once_with(
+            ['httpx://example.com', 'httpx://example.org'])
+        assert CHANGED_URIS_KEY not in db_session.info
+
+    def test_it_refreshes_the_uri_of_deleted_annotations(
+            self, refresh_annotation_counts, pyramid_request):
+        event = mock.Mock(request=pyramid_request,
+                          annotation_id='deleted-id',
+                          annotation_dict={'uri': 'http://example.com/'},
+                          action='delete')
+
+        subscribers.update_annotation_counts(event)
+
+        refresh_annotation_counts.delay.assert_called_once_with(
+            ['httpx://example.com'])
+
+    def test_it_does_nothing_when_no_uris_are_affected(
+            self, refresh_annotation_counts, pyramid_request):
+        event = mock.Mock(request=pyramid_request,
+                          annotation_id='missing-id',
+                          action='update')
+
+        subscribers.update_annotation_counts(event)
+
+        assert not refresh_annotation_counts.delay.called
+
+    @pytest.fixture
+    def refresh_annotation_counts(self, patch):
+        return patch('h.badge.subscribers.worker.refresh_annotation_counts')
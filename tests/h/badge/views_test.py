@@ -6,33 +6,61 @@ from pyramid import httpexceptions
 from h.badge import views
 
 
-badge_fixtures = pytest.mark.usefixtures('models', 'search_lib')
+badge_fixtures = pytest.mark.usefixtures('models', 'annotation_counts')
 
 
 @badge_fixtures
-def test_badge_returns_number_from_search(models, search_run):
-    request = mock.Mock(params={'uri': 'test_uri'})
+def test_badge_returns_number_from_annotation_counts(models,
+                                                     annotation_counts,
+                                                     pyramid_request):
+    pyramid_request.params['uri'] = 'test_uri'
     models.Blocklist.is_blocked.return_value = False
-    search_run.return_value = mock.Mock(total=29)
+    annotation_counts.count.return_value = 29
 
-    result = views.badge(request)
+    result = views.badge(pyramid_request)
 
-    search_run.assert_called_once_with({'uri': 'test_uri', 'limit': 0})
+    annotation_counts.count.assert_called_once_with('test_uri')
     assert result == {'total': 29}
 
 
 @badge_fixtures
-def test_badge_returns_0_if_blocked(models, search_run):
-    request = mock.Mock(params={'uri': 'test_uri'})
+def test_badge_returns_0_if_blocked(models, annotation_counts, pyramid_request):
+    pyramid_request.params['uri'] = 'test_uri'
     models.Blocklist.is_blocked.return_value = True
-    search_run.return_value = {'total': 29}
+    annotation_counts.count.return_value = 29
 
-    result = views.badge(request)
+    result = views.badge(pyramid_request)
 
-    assert not search_run.called
+    assert not annotation_counts.count.called
     assert result == {'total': 0}
 
 
+@badge_fixtures
+def test_badge_coalesces_identical_requests(models, annotation_counts,
+                                            coalescer, pyramid_request):
+    pyramid_request.params['uri'] = 'test_uri'
+    models.Blocklist.is_blocked.return_value = False
+    annotation_counts.count.return_value = 29
+    coalescer.do.side_effect = lambda key, fn: (fn(), False)
+
+    result = views.badge(pyramid_request)
+
+    assert coalescer.do.call_args[0][0] == 'test_uri'
+    assert result == {'total': 29}
+
+
+@badge_fixtures
+def test_badge_counts_coalesced_requests(coalescer, pyramid_request):
+    pyramid_request.params['uri'] = 'test_uri'
+    pyramid_request.stats = mock.Mock()
+    coalescer.do.return_value = (29, True)
+
+    result = views.badge(pyramid_request)
+
+    pyramid_request.stats.incr.assert_called_once_with('badge.coalesced')
+    assert result == {'total': 29}
+
+
 @badge_fixtures
 def test_badge_raises_if_no_uri():
     with pytest.raises(httpexceptions.HTTPBadRequest):
@@ -45,10 +73,15 @@ def models(patch):
 
 
 @pytest.fixture
-def search_lib(patch):
-    return patch('h.badge.views.search')
+def annotation_counts(pyramid_config):
+    service = mock.Mock(spec_set=['count'])
+    pyramid_config.register_service(service, name='annotation_counts')
+    return service
 
 
 @pytest.fixture
-def search_run(search_lib):
-    return search_lib.Search.return_value.run
+def coalescer(pyramid_request):
+    coalescer = mock.Mock(spec_set=['do'])
+    pyramid_request.registry[views.COALESCER_KEY] = coalescer
+    yield coalescer
+    del pyramid_request.registry[views.COALESCER_KEY]
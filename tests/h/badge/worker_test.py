@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import pytest
+
+from h.badge import worker
+
+
+class TestRefreshAnnotationCounts(object):
+
+    def test_it_refreshes_the_counts_of_the_uris(self, celery):
+        worker.refresh_annotation_counts(['httpx://example.com'])
+
+        celery.request.find_service.assert_called_once_with(
+            name='annotation_counts')
+        counts = celery.request.find_service.return_value
+        counts.refresh.assert_called_once_with(['httpx://example.com'])
+
+    @pytest.fixture
+    def celery(self, patch):
+        return patch('h.badge.worker.celery', autospec=False)
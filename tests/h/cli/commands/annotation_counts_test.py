@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+
+import mock
+
+from h.cli.commands import annotation_counts
+
+
+def test_rebuild_rebuilds_the_counts(cli, pyramid_config, pyramid_request):
+    service = mock.Mock(spec_set=['rebuild'])
+    pyramid_config.register_service(service, name='annotation_counts')
+    pyramid_request.tm = mock.Mock()
+
+    result = cli.invoke(annotation_counts.annotation_counts, ['rebuild'],
+                        obj={'bootstrap': lambda: pyramid_request})
+
+    assert result.exit_code == 0
+    service.rebuild.assert_called_once_with()
+    pyramid_request.tm.commit.assert_called_once_with()
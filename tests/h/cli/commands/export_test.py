@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+
+import json
+
+import mock
+import pytest
+
+from h.cli.commands import export
+from h.nipsa import export as nipsa_export
+
+
+@pytest.mark.usefixtures('links_service')
+class TestExport(object):
+
+    def test_it_writes_the_annotations_as_ndjson(self, cli, req, factories):
+        anns = factories.Annotation.create_batch(2, groupid='rebels')
+        factories.Annotation(groupid='empire')
+
+        result = cli.invoke(export.export, ['--group', 'rebels'],
+                            obj={'bootstrap': lambda: req})
+
+        assert result.exit_code == 0
+        lines = result.output.splitlines()
+        assert [json.loads(l)['id'] for l in lines] == [a.id for a in anns]
+
+    def test_it_writes_the_annotations_as_jsonld(self, cli, req, factories):
+        factories.Annotation.create_batch(2, groupid='rebels')
+
+        result = cli.invoke(export.export,
+                            ['--group', 'rebels', '--format', 'jsonld'],
+                            obj={'bootstrap': lambda: req})
+
+        assert result.exit_code == 0
+        annotations = json.loads(result.output)
+        assert [a['type'] for a in annotations] == ['Annotation', 'Annotation']
+
+    def test_it_applies_the_registered_export_filters(self, cli, req,
+                                                      factories, db_session,
+                                                      pyramid_config):
+        pyramid_config.include('memex.export')
+        pyramid_config.add_export_filter(nipsa_export.Filter)
+        troll = factories.User(username='troll', nipsa=True)
+        db_session.add(troll)
+        ann = factories.Annotation(groupid='rebels')
+        factories.Annotation(groupid='rebels', userid=troll.userid)
+
+        result = cli.invoke(export.export, ['--group', 'rebels'],
+                            obj={'bootstrap': lambda: req})
+
+        assert result.exit_code == 0
+        lines = result.output.splitlines()
+        assert [json.loads(l)['id'] for l in lines] == [ann.id]
+
+    def test_it_requires_a_query(self, cli, req):
+        result = cli.invoke(export.export, [], obj={'bootstrap': lambda: req})
+
+        assert result.exit_code != 0
+        assert 'at least one of' in result.output
+
+    @pytest.fixture
+    def links_service(self, pyramid_config):
+        service = mock.Mock(spec_set=['compile', 'get', 'get_all'])
+        service.compile.return_value = service
+        service.get.return_value = 'http://example.com/link'
+        service.get_all.return_value = {}
+        pyramid_config.register_service(service, name='links')
+        return service
+
+
+@pytest.fixture
+def req(pyramid_request):
+    return pyramid_request
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import datetime
+
+import mock
+import pytest
+
+from memex import models
+from h.badge.services import AnnotationCountService
+from h.cli.commands import move_uri
+from h.models import AnnotationCount
+
+
+@pytest.mark.usefixtures('BatchIndexer', 'annotation_counts')
+class TestMoveAnnotations(object):
+
+    def test_it_moves_matching_annotations(self, req, factories):
+        annotation = factories.Annotation(target_uri='http://example.org/')
+        other = factories.Annotation(target_uri='http://example.net/')
+        ids = annotation.id, other.id
+        req.tm.commit()
+
+        move_uri.move_annotations(req, 'http://example.org', 'https://example.com/')
+
+        annotation, other = [req.db.query(models.Annotation).get(id_)
+                             for id_ in ids]
+        assert annotation.target_uri == 'https://example.com/'
+        assert annotation.target_uri_normalized == 'httpx://example.com'
+        assert other.target_uri == 'http://example.net/'
+
+    def test_it_bumps_the_updated_time_of_moved_annotations(self, req,
+                                                            factories):
+        before = datetime.datetime(2016, 1, 1)
+        annotation = factories.Annotation(target_uri='http://example.org/',
+                                          updated=before)
+        id_ = annotation.id
+        req.tm.commit()
+
+        move_uri.move_annotations(req, 'http://example.org/',
+                                  'https://example.com/')
+
+        assert req.db.query(models.Annotation).get(id_).updated > before
+
+    def test_it_commits_each_batch(self, req, factories):
+        factories.Annotation.create_batch(5, target_uri='http://example.org/')
+        req.tm.commit()
+        req.tm.commit = mock.Mock(wraps=req.tm.commit)
+
+        total = move_uri.move_annotations(req, 'http://example.org/',
+                                          'https://example.com/', batch_size=2)
+
+        assert total == 5
+        assert req.db.query(models.Annotation).filter_by(
+            target_uri='https://example.com/').count() == 5
+        # Three batches, plus the final empty one, each committed along with
+        # the reindex which follows it, and then the refreshed counts.
+        assert req.tm.commit.call_count == 8
+
+    def test_it_reindexes_each_batch(self, req, factories, BatchIndexer):
+        annotations = factories.Annotation.create_batch(
+            3, target_uri='http://example.org/')
+        ids = sorted([a.id for a in annotations],
+                     key=lambda id_: models.Annotation.id.type.process_bind_param(id_, None))
+        req.tm.commit()
+
+        move_uri.move_annotations(req, 'http://example.org/',
+                                  'https://example.com/', batch_size=2)
+
+        indexer = BatchIndexer.return_value
+        assert indexer.index.call_args_list == [mock.call(ids[:2]),
+                                                mock.call(ids[2:])]
+
+    def test_it_moves_the_annotation_counts(self, req, factories,
+                                            annotation_counts):
+        factories.Annotation.create_batch(2, target_uri='http://example.org/',
+                                          shared=True)
+        annotation_counts.rebuild()
+        req.tm.commit()
+
+        move_uri.move_annotations(req, 'http://example.org/',
+                                  'https://example.com/')
+
+        counts = {c.uri: c.count for c in req.db.query(AnnotationCount)}
+        assert counts == {'httpx://example.com': 2}
+
+    @pytest.fixture
+    def BatchIndexer(self, patch):
+        return patch('h.cli.commands.move_uri.BatchIndexer')
+
+    @pytest.fixture
+    def annotation_counts(self, pyramid_config, req):
+        service = AnnotationCountService(req.db)
+        pyramid_config.register_service(service, name='annotation_counts')
+        return service
+
+
+class TestMoveDocumentURIs(object):
+
+    def test_it_moves_claimants(self, req):
+        docuri = models.DocumentURI(claimant='http://example.org/',
+                                    uri='http://example.org/page',
+                                    type='highwire-pdf')
+        req.db.add(models.Document(document_uris=[docuri]))
+        req.tm.commit()
+
+        total = move_uri.move_document_uri_claimants(req, 'http://example.org/',
+                                                     'https://example.com/')
+
+        docuri = req.db.query(models.DocumentURI).one()
+        assert total == 1
+        assert docuri.claimant == 'https://example.com/'
+        assert docuri.claimant_normalized == 'httpx://example.com'
+        assert docuri.uri == 'http://example.org/page'
+
+    def test_it_moves_self_claims_and_canonical_uris_only(self, req):
+        self_claim = models.DocumentURI(claimant='http://example.org/',
+                                        uri='http://example.org/',
+                                        type='self-claim')
+        other = models.DocumentURI(claimant='http://example.net/',
+                                   uri='http://example.org/',
+                                   type='highwire-pdf')
+        req.db.add(models.Document(document_uris=[self_claim, other]))
+        req.tm.commit()
+
+        move_uri.move_document_uri_canonical_self_claims(req, 'http://example.org/',
+                                                         'https://example.com/')
+
+        types = {d.type: d.uri for d in req.db.query(models.DocumentURI)}
+        assert types == {'self-claim': 'https://example.com/',
+                         'highwire-pdf': 'http://example.org/'}
+
+
+def test_merge_new_documents_merges_documents_sharing_the_new_uri(req):
+    req.db.add_all([
+        models.Document(document_uris=[models.DocumentURI(claimant='http://example.com/',
+                                                          uri='http://example.com/')]),
+        models.Document(document_uris=[models.DocumentURI(claimant='http://example.net/',
+                                                          uri='https://example.com/')]),
+    ])
+    req.tm.commit()
+
+    move_uri.merge_new_documents(req, 'https://example.com/')
+
+    assert req.db.query(models.Document).count() == 1
+
+
+@pytest.fixture
+def req(tm_request, factories):
+    # Create the tests' rows in the request's own session, so that they can
+    # be committed along with the changes made by the commands.
+    factories.SESSION = tm_request.db
+    tm_request.es = mock.MagicMock()
+    return tm_request
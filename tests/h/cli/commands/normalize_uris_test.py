@@ -2,11 +2,16 @@
 
 from __future__ import unicode_literals
 
+import datetime
+
 import mock
 import pytest
 
 from memex import models
+from h.badge.services import AnnotationCountService
 from h.cli.commands import normalize_uris
+from h.cli.progress import Progress
+from h.models import AnnotationCount
 
 
 def test_it_normalizes_document_uris_uri(req):
@@ -25,6 +30,7 @@ def test_it_normalizes_document_uris_uri(req):
     req.db.flush()
 
     normalize_uris.normalize_document_uris(req)
+    req.db.expire_all()
 
     assert docuri_1.uri_normalized == 'httpx://example.org'
     assert docuri_2.uri_normalized == 'httpx://example.org'
@@ -46,6 +52,7 @@ def test_it_normalizes_document_uris_claimant(req):
     req.db.flush()
 
     normalize_uris.normalize_document_uris(req)
+    req.db.expire_all()
 
     assert docuri_1.claimant_normalized == 'httpx://example.org'
     assert docuri_2.claimant_normalized == 'httpx://example.org'
@@ -104,6 +111,7 @@ def test_it_normalizes_document_meta_claimant(req):
     req.db.flush()
 
     normalize_uris.normalize_document_meta(req)
+    req.db.expire_all()
 
     assert docmeta_1.claimant_normalized == 'httpx://example.org'
     assert docmeta_2.claimant_normalized == 'httpx://example.net'
@@ -130,6 +138,127 @@ def test_it_deletes_duplicate_document_meta_objects(req):
     assert req.db.query(models.DocumentMeta).count() == 1
 
 
+def test_it_merges_documents_of_duplicate_document_uris(req):
+    docuri_1 = models.DocumentURI(_claimant='http://example.org/',
+                                  _claimant_normalized='http://example.org',
+                                  _uri='http://example.org/',
+                                  _uri_normalized='http://example.org',
+                                  type='self-claim')
+    docuri_2 = models.DocumentURI(_claimant='https://example.org/',
+                                  _claimant_normalized='https://example.org',
+                                  _uri='https://example.org/',
+                                  _uri_normalized='https://example.org',
+                                  type='self-claim')
+    document_1 = models.Document(document_uris=[docuri_1])
+    document_2 = models.Document(document_uris=[docuri_2],
+                                 meta=[models.DocumentMeta(claimant='http://example.org/',
+                                                           type='title',
+                                                           value=['Test Title'])])
+
+    req.db.add_all([document_1, document_2])
+    req.db.flush()
+    document_1_id = document_1.id
+
+    normalize_uris.normalize_document_uris(req)
+    req.db.expire_all()
+
+    assert [d.id for d in req.db.query(models.Document)] == [document_1_id]
+    assert req.db.query(models.DocumentMeta).one().document_id == document_1_id
+
+
+def test_it_processes_document_uris_in_batches(req):
+    docuris = [models.DocumentURI(_claimant='http://example.org/',
+                                  _claimant_normalized='http://example.org',
+                                  _uri='http://example.org/{}'.format(i),
+                                  _uri_normalized='http://example.org/{}'.format(i),
+                                  type='self-claim')
+               for i in range(5)]
+
+    req.db.add(models.Document(document_uris=docuris))
+    req.db.flush()
+
+    normalize_uris.normalize_document_uris(req, batch_size=2)
+    req.db.expire_all()
+
+    assert req.tm.commit.call_count == 4
+    assert [d.uri_normalized for d in docuris] == [
+        'httpx://example.org/{}'.format(i) for i in range(5)]
+
+
+def test_it_records_progress(req, tmpdir):
+    docuri = models.DocumentURI(claimant='http://example.org/',
+                                uri='http://example.org/',
+                                type='self-claim')
+    req.db.add(models.Document(document_uris=[docuri]))
+    req.db.flush()
+    progress = Progress(str(tmpdir.join('state.json')))
+
+    normalize_uris.normalize_document_uris(req, progress)
+
+    resumed = Progress(str(tmpdir.join('state.json')))
+    assert resumed.get('document_uri') == docuri.id
+
+
+def test_it_resumes_after_the_last_recorded_row(req):
+    docuri_1 = models.DocumentURI(_claimant='http://example.org/',
+                                  _claimant_normalized='http://example.org',
+                                  _uri='http://example.org/',
+                                  _uri_normalized='http://example.org',
+                                  type='self-claim')
+    docuri_2 = models.DocumentURI(_claimant='http://example.org/',
+                                  _claimant_normalized='http://example.org',
+                                  _uri='http://example.net/',
+                                  _uri_normalized='http://example.net',
+                                  type='self-claim')
+    req.db.add(models.Document(document_uris=[docuri_1, docuri_2]))
+    req.db.flush()
+    progress = Progress()
+    progress.update(document_uri=docuri_1.id)
+
+    normalize_uris.normalize_document_uris(req, progress)
+    req.db.expire_all()
+
+    assert docuri_1.uri_normalized == 'http://example.org'
+    assert docuri_2.uri_normalized == 'httpx://example.net'
+
+
+def test_it_commits_its_changes(tm_request):
+    docuri = models.DocumentURI(_claimant='http://example.org/',
+                                _claimant_normalized='http://example.org',
+                                _uri='http://example.org/',
+                                _uri_normalized='http://example.org',
+                                type='self-claim')
+    docmeta = models.DocumentMeta(_claimant='http://example.org/',
+                                  _claimant_normalized='http://example.org',
+                                  type='title',
+                                  value=['Test Title'])
+    tm_request.db.add(models.Document(document_uris=[docuri], meta=[docmeta]))
+    tm_request.tm.commit()
+
+    normalize_uris.normalize_document_uris(tm_request)
+    normalize_uris.normalize_document_meta(tm_request)
+
+    docuri = tm_request.db.query(models.DocumentURI).one()
+    docmeta = tm_request.db.query(models.DocumentMeta).one()
+    assert docuri.uri_normalized == 'httpx://example.org'
+    assert docmeta.claimant_normalized == 'httpx://example.org'
+
+
+def test_it_normalizes_with_the_given_map_function(req):
+    docmeta = models.DocumentMeta(_claimant='http://example.org/',
+                                  _claimant_normalized='http://example.org',
+                                  type='title',
+                                  value=['Test Title'])
+    req.db.add(models.Document(meta=[docmeta]))
+    req.db.flush()
+    map_ = mock.Mock(side_effect=map)
+
+    normalize_uris.normalize_document_meta(req, map_=map_)
+
+    map_.assert_called_once_with(normalize_uris._normalize_row,
+                                 [(docmeta.id, 'http://example.org/')])
+
+
 @pytest.mark.usefixtures('index')
 def test_it_normalizes_annotation_target_uri(req):
     annotation_1 = models.Annotation(userid='luke',
@@ -143,11 +272,33 @@ def test_it_normalizes_annotation_target_uri(req):
     req.db.flush()
 
     normalize_uris.normalize_annotations(req)
+    req.db.expire_all()
 
     assert annotation_1.target_uri_normalized == 'httpx://example.org'
     assert annotation_2.target_uri_normalized == 'httpx://example.net'
 
 
+@pytest.mark.usefixtures('index')
+def test_it_bumps_the_updated_time_of_changed_annotations(req):
+    before = datetime.datetime(2016, 1, 1)
+    annotation_1 = models.Annotation(userid='luke',
+                                     updated=before,
+                                     _target_uri='http://example.org/',
+                                     _target_uri_normalized='http://example.org')
+    annotation_2 = models.Annotation(userid='luke',
+                                     updated=before,
+                                     target_uri='http://example.net/')
+
+    req.db.add_all([annotation_1, annotation_2])
+    req.db.flush()
+
+    normalize_uris.normalize_annotations(req)
+    req.db.expire_all()
+
+    assert annotation_1.updated > before
+    assert annotation_2.updated == before
+
+
 def test_it_reindexes_changed_annotations(req, index):
     annotation_1 = models.Annotation(userid='luke',
                                      _target_uri='http://example.org/',
@@ -185,6 +336,52 @@ def test_it_skips_reindexing_unaltered_annotations(req, index):
     indexer.index.assert_called_once_with(set([annotation_2.id]))
 
 
+@pytest.mark.usefixtures('index')
+def test_it_moves_the_counts_of_changed_annotations(req, annotation_counts):
+    annotation = models.Annotation(userid='luke',
+                                   shared=True,
+                                   _target_uri='http://example.org/',
+                                   _target_uri_normalized='http://example.org')
+    req.db.add(annotation)
+    req.db.flush()
+    annotation_counts.rebuild()
+
+    normalize_uris.normalize_annotations(req)
+
+    counts = {c.uri: c.count for c in req.db.query(AnnotationCount)}
+    assert counts == {'httpx://example.org': 1}
+
+
+def test_it_reindexes_pending_annotations_first(req, index):
+    progress = Progress()
+    progress.update(reindex=['some-id'])
+    indexer = index.BatchIndexer.return_value
+    indexer.index.return_value = None
+
+    normalize_uris.normalize_annotations(req, progress)
+
+    indexer.index.assert_called_once_with(set(['some-id']))
+    assert progress.get('reindex') == []
+
+
+def test_command_starts_its_workers_before_bootstrapping(cli, patch, req):
+    Pool = patch('h.cli.commands.normalize_uris.multiprocessing.Pool')
+    for name in ('normalize_document_uris', 'normalize_document_meta',
+                 'normalize_annotations'):
+        patch('h.cli.commands.normalize_uris.' + name)
+
+    def bootstrap():
+        # The workers mustn't inherit the application's database connections.
+        assert Pool.called
+        return req
+
+    result = cli.invoke(normalize_uris.normalize_uris, ['--workers', '2'],
+                        obj={'bootstrap': bootstrap})
+
+    assert result.exit_code == 0
+    Pool.return_value.terminate.assert_called_once_with()
+
+
 @pytest.fixture
 def req(pyramid_request):
     pyramid_request.tm = mock.MagicMock()
@@ -192,6 +389,13 @@ def req(pyramid_request):
     return pyramid_request
 
 
+@pytest.fixture(autouse=True)
+def annotation_counts(pyramid_config, req):
+    service = AnnotationCountService(req.db)
+    pyramid_config.register_service(service, name='annotation_counts')
+    return service
+
+
 @pytest.fixture
 def index(patch):
     return patch('h.cli.commands.normalize_uris.index')
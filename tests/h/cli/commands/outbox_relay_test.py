@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+
+import mock
+import pytest
+
+from h.cli.commands import outbox_relay
+
+
+def test_deliver_delivers_batches_until_the_outbox_is_empty(req, relay):
+    relay.side_effect = [2, 2, 1]
+
+    delivered = outbox_relay.deliver(req, batch_size=2)
+
+    assert delivered == 5
+    assert relay.call_count == 3
+
+
+def test_deliver_stops_when_a_batch_is_not_fully_delivered(req, relay):
+    relay.side_effect = [2, 0, 2]
+
+    delivered = outbox_relay.deliver(req, batch_size=2)
+
+    assert delivered == 2
+    assert relay.call_count == 2
+
+
+def test_command_delivers_the_waiting_events_once(cli, req, relay):
+    relay.return_value = 3
+
+    result = cli.invoke(outbox_relay.outbox_relay,
+                        ['--once', '--batch-size', '10'],
+                        obj={'bootstrap': lambda: req})
+
+    assert result.exit_code == 0
+    assert result.output == 'Delivered 3 events\n'
+    relay.assert_called_once_with(req, batch_size=10, max_attempts=10,
+                                  stats=None)
+
+
+def test_command_publishes_realtime_messages_synchronously(cli, req, relay):
+    relay.return_value = 0
+
+    cli.invoke(outbox_relay.outbox_relay, ['--once'],
+               obj={'bootstrap': lambda: req})
+
+    assert not req.registry['h.realtime.sender'].background
+
+
+@pytest.fixture
+def relay(patch):
+    return patch('h.cli.commands.outbox_relay.outbox.relay')
+
+
+@pytest.fixture
+def req(pyramid_request):
+    pyramid_request.tm = mock.MagicMock()
+    return pyramid_request
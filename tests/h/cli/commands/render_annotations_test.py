@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+
+import mock
+import pytest
+
+from h import models
+from h.cli.commands import render_annotations
+from h.cli.progress import Progress
+from memex.presentation import PresentationCache
+
+
+def test_it_rerenders_stale_annotations(req, stale_annotations):
+    ids = stale_annotations('**foo**')
+
+    render_annotations.rerender(req)
+
+    assert rendered(req, ids) == ['<p><strong>foo</strong></p>\n']
+
+
+def test_it_bumps_the_updated_time_of_rerendered_annotations(
+        req, stale_annotations):
+    ids = stale_annotations('foo')
+    before = req.db.query(models.Annotation).get(ids[0]).updated
+    req.tm.commit()
+
+    render_annotations.rerender(req)
+
+    assert req.db.query(models.Annotation).get(ids[0]).updated > before
+
+
+def test_cached_presentations_are_not_served_after_rerendering(
+        req, stale_annotations):
+    ids = stale_annotations('foo')
+    cache = PresentationCache()
+
+    def present(annotation):
+        return cache.present(annotation, 'variant',
+                             lambda a: a.text_rendered)
+
+    assert present(req.db.query(models.Annotation).get(ids[0])) == 'stale'
+    req.tm.commit()
+
+    render_annotations.rerender(req)
+
+    annotation = req.db.query(models.Annotation).get(ids[0])
+    assert present(annotation) == '<p>foo</p>\n'
+
+
+def test_it_counts_the_annotations_checked_and_changed(req, factories,
+                                                       stale_annotations):
+    stale_annotations('foo')
+    factories.Annotation(text='bar')
+    req.db.flush()
+    req.tm.commit()
+
+    result = render_annotations.rerender(req)
+
+    assert result == (2, 1)
+
+
+def test_it_commits_each_batch(req, stale_annotations):
+    ids = stale_annotations('foo', 'bar', 'baz')
+    req.tm.commit = mock.Mock(wraps=req.tm.commit)
+
+    render_annotations.rerender(req, batch_size=2)
+
+    assert req.tm.commit.call_count == 3
+    assert 'stale' not in rendered(req, ids)
+
+
+def test_it_resumes_after_the_last_processed_annotation(req,
+                                                        stale_annotations):
+    stale_annotations('foo', 'bar')
+    query = req.db.query(models.Annotation.id).order_by(models.Annotation.id)
+    ids = [id_ for id_, in query]
+    progress = Progress()
+    progress.update(annotation=ids[0])
+
+    render_annotations.rerender(req, progress)
+
+    assert rendered(req, ids)[0] == 'stale'
+    assert rendered(req, ids)[1] != 'stale'
+    assert progress.get('annotation') == ids[1]
+
+
+def test_command_reports_the_number_rerendered(cli, req, stale_annotations):
+    stale_annotations('foo')
+
+    result = cli.invoke(render_annotations.render_annotations,
+                        ['--workers', '1'],
+                        obj={'bootstrap': lambda: req})
+
+    assert result.exit_code == 0
+    assert result.output == 'Re-rendered 1 of 1 annotations\n'
+
+
+def test_command_starts_its_workers_before_bootstrapping(cli, patch, req):
+    Pool = patch('h.cli.commands.render_annotations.multiprocessing.Pool')
+    rerender = patch('h.cli.commands.render_annotations.rerender')
+    rerender.return_value = (0, 0)
+
+    def bootstrap():
+        # The workers mustn't inherit the application's database connections.
+        assert Pool.called
+        return req
+
+    result = cli.invoke(render_annotations.render_annotations,
+                        ['--workers', '2'],
+                        obj={'bootstrap': bootstrap})
+
+    assert result.exit_code == 0
+    Pool.return_value.terminate.assert_called_once_with()
+
+
+def rendered(req, ids):
+    """Return the stored rendered text of the annotations with `ids`."""
+    rows = (req.db.query(models.Annotation.id,
+                         models.Annotation.text_rendered)
+            .filter(models.Annotation.id.in_(ids)))
+    text_rendered = dict(rows)
+    return [text_rendered[id_] for id_ in ids]
+
+
+@pytest.fixture
+def stale_annotations(req, factories):
+    """Commit annotations with the given texts and stale renderings."""
+    def stale_annotations(*texts):
+        annotations = [factories.Annotation(text=text) for text in texts]
+        for annotation in annotations:
+            annotation._text_rendered = 'stale'
+        req.db.flush()
+        ids = [a.id for a in annotations]
+        req.tm.commit()
+        return ids
+    return stale_annotations
+
+
+@pytest.fixture
+def req(tm_request, factories):
+    # Create the tests' rows in the request's own session, so that they can
+    # be committed along with the changes made by the command.
+    factories.SESSION = tm_request.db
+    return tm_request
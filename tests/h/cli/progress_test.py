@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+
+from h.cli.progress import Progress
+
+
+class TestProgress(object):
+
+    def test_get_returns_the_default_for_unknown_keys(self):
+        assert Progress().get('annotation', 'default') == 'default'
+
+    def test_update_records_the_state(self):
+        progress = Progress()
+
+        progress.update(annotation='foo')
+
+        assert progress.get('annotation') == 'foo'
+
+    def test_it_persists_the_state_to_the_given_file(self, tmpdir):
+        path = str(tmpdir.join('state.json'))
+
+        Progress(path).update(annotation='foo', document=5)
+
+        resumed = Progress(path)
+        assert resumed.get('annotation') == 'foo'
+        assert resumed.get('document') == 5
+        assert not tmpdir.join('state.json.tmp').exists()
@@ -14,6 +14,8 @@ import pytest
 
 import click.testing
 import sqlalchemy
+import transaction
+import zope.sqlalchemy
 from pyramid import testing
 from pyramid.request import apply_request_extensions
 from sqlalchemy.orm import sessionmaker
@@ -21,6 +23,7 @@ from sqlalchemy.orm import sessionmaker
 from h import db
 from h import form
 from h.settings import database_url
+from memex import db as api_db
 
 TEST_DATABASE_URL = database_url(os.environ.get('TEST_DATABASE_URL',
                                                 'postgresql://postgres@localhost/htest'))
@@ -241,3 +244,29 @@ def pyramid_settings():
     return {
         'sqlalchemy.url': TEST_DATABASE_URL
     }
+
+
+@pytest.yield_fixture
+def tm_request(db_engine, pyramid_request):
+    """
+    A request whose database session is managed by a real transaction manager.
+
+    Code which changes the database with plain SQL statements must tell the
+    session about them, or the transaction manager silently rolls them back
+    when it is asked to commit. Unlike ``db_session``, this session really
+    commits, so all rows are deleted again afterwards.
+    """
+    tm = transaction.TransactionManager()
+    session = Session(bind=db_engine)
+    zope.sqlalchemy.register(session, transaction_manager=tm)
+    pyramid_request.tm = tm
+    pyramid_request.db = session
+
+    yield pyramid_request
+
+    tm.abort()
+    session.close()
+    with db_engine.begin() as conn:
+        for base in (db.Base, api_db.Base):
+            for table in reversed(base.metadata.sorted_tables):
+                conn.execute(table.delete())
@@ -15,3 +15,35 @@ def test_tag_uri_for_annotation(factories):
         annotation_url=mock.Mock(return_value="http://example.com/a/12345"))
 
     assert tag_uri == "tag:example.com,2015-09:" + annotation.id
+
+
+def test_present_entries_presents_each_annotation(factories):
+    annotations = factories.Annotation.create_batch(2)
+
+    entries = util.present_entries(annotations, lambda a: a.id)
+
+    assert entries == [a.id for a in annotations]
+
+
+def test_present_entries_uses_the_cache(factories):
+    annotation = factories.Annotation()
+    cache = mock.Mock(spec_set=['present'])
+    present = mock.Mock()
+
+    entries = util.present_entries([annotation], present, cache=cache,
+                                   variant='feed')
+
+    cache.present.assert_called_once_with(annotation, 'feed', present)
+    assert entries == [cache.present.return_value]
+
+
+def test_present_entries_does_not_cache_untitled_documents(factories):
+    annotation = factories.Annotation()
+    annotation.document.title = None
+    cache = mock.Mock(spec_set=['present'])
+
+    entries = util.present_entries([annotation], lambda a: a.id, cache=cache,
+                                   variant='feed')
+
+    assert not cache.present.called
+    assert entries == [annotation.id]
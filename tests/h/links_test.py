@@ -76,6 +76,32 @@ def test_incontext_link_skips_uri_for_pdfs_with_no_document(pyramid_request):
     assert link == 'https://hyp.is/123'
 
 
+@pytest.mark.parametrize('thread_root_id,target_uri', [
+    ('123', 'http://example.com/foo/bar'),
+    ('AbC-_09zZ', 'urn:x-pdf:the-fingerprint'),
+    ('needs escaping?', 'something_not_a_url'),
+])
+def test_compiled_incontext_link_matches_incontext_link(pyramid_request,
+                                                        thread_root_id,
+                                                        target_uri):
+    annotation = FakeAnnotation()
+    annotation.thread_root_id = thread_root_id
+    annotation.target_uri = target_uri
+
+    compiled = links.incontext_link.compile(pyramid_request)
+
+    assert compiled(annotation) == links.incontext_link(pyramid_request,
+                                                        annotation)
+
+
+def test_compiled_incontext_link_returns_none_without_bouncer_url(pyramid_request):
+    del pyramid_request.registry.settings['h.bouncer_url']
+
+    compiled = links.incontext_link.compile(pyramid_request)
+
+    assert compiled(FakeAnnotation()) is None
+
+
 @pytest.fixture
 def pyramid_settings(pyramid_settings):
     pyramid_settings.update({
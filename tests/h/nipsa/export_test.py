@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from h import models
+from h.nipsa import export
+
+
+class TestFilter(object):
+
+    def test_it_filters_out_nipsad_users_annotations(self, db_session,
+                                                     factories,
+                                                     pyramid_request, users):
+        ann = factories.Annotation(userid=users['dominic'].userid)
+        factories.Annotation(userid=users['renata'].userid)
+
+        result = export.Filter(pyramid_request)(db_session.query(models.Annotation))
+
+        assert result.all() == [ann]
+
+    def test_it_does_not_filter_out_the_users_own_annotations(self,
+                                                              db_session,
+                                                              factories,
+                                                              pyramid_config,
+                                                              pyramid_request,
+                                                              users):
+        pyramid_config.testing_securitypolicy(users['renata'].userid)
+        anns = [factories.Annotation(userid=users['renata'].userid),
+                factories.Annotation(userid=users['dominic'].userid)]
+        factories.Annotation(userid=users['cecilia'].userid)
+
+        result = export.Filter(pyramid_request)(db_session.query(models.Annotation))
+
+        assert set(result) == set(anns)
+
+
+@pytest.fixture
+def users(db_session, factories):
+    users = {
+        'renata': factories.User(username='renata', nipsa=True),
+        'cecilia': factories.User(username='cecilia', nipsa=True),
+        'dominic': factories.User(username='dominic', nipsa=False),
+    }
+    db_session.add_all(users.values())
+    db_session.flush()
+    return users
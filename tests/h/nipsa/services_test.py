@@ -2,9 +2,11 @@
 
 from __future__ import unicode_literals
 
+import mock
 import pytest
 
 from h.nipsa.services import NipsaService
+from h.nipsa.services import flagged_userids
 from h.nipsa.services import nipsa_factory
 
 
@@ -56,12 +58,43 @@ class TestNipsaService(object):
 
         worker.remove_nipsa.delay.assert_called_once_with('acct:renata@example.com')
 
+    def test_flag_refreshes_annotation_counts(self, db_session, users):
+        annotation_counts = mock.Mock(spec_set=['refresh_user'])
+        svc = NipsaService(db_session, annotation_counts)
+
+        svc.flag(users['dominic'])
+
+        annotation_counts.refresh_user.assert_called_once_with(
+            'acct:dominic@example.com')
+
+    def test_unflag_refreshes_annotation_counts(self, db_session, users):
+        annotation_counts = mock.Mock(spec_set=['refresh_user'])
+        svc = NipsaService(db_session, annotation_counts)
+
+        svc.unflag(users['renata'])
+
+        annotation_counts.refresh_user.assert_called_once_with(
+            'acct:renata@example.com')
+
+
+@pytest.mark.usefixtures('users')
+def test_flagged_userids_selects_the_nipsad_userids(db_session):
+    userids = [userid for userid, in db_session.execute(flagged_userids())]
+
+    assert set(userids) == {'acct:renata@example.com',
+                            'acct:cecilia@example.com'}
+
+
+def test_nipsa_factory(pyramid_config, pyramid_request):
+    annotation_counts = mock.Mock()
+    pyramid_config.register_service(annotation_counts,
+                                    name='annotation_counts')
 
-def test_nipsa_factory(pyramid_request):
     svc = nipsa_factory(None, pyramid_request)
 
     assert isinstance(svc, NipsaService)
     assert svc.session == pyramid_request.db
+    assert svc.annotation_counts == annotation_counts
 
 
 @pytest.fixture
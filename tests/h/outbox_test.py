@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import threading
+
+import mock
+import pytest
+from sqlalchemy.orm import Session
+
+from h import models
+from h import outbox
+from h.outbox import OutboxQueue
+from h.outbox import RelayedAnnotationEvent
+from memex.events import AnnotationEvent
+
+ANNOTATION_ID = 'AVYBsLj7CsNCU8tWCHgRmw'
+
+
+class TestOutboxQueue(object):
+
+    def test_it_writes_annotation_events_to_the_outbox(self, pyramid_request):
+        pyramid_request.headers['X-Client-Id'] = 'client_id'
+        queue = OutboxQueue(pyramid_request)
+
+        queue(AnnotationEvent(pyramid_request, ANNOTATION_ID, 'delete',
+                              {'id': 'ann_id'}))
+
+        event = pyramid_request.db.query(models.OutboxEvent).one()
+        assert event.annotation_id == ANNOTATION_ID
+        assert event.action == 'delete'
+        assert event.annotation_dict == {'id': 'ann_id'}
+        assert event.src_client_id == 'client_id'
+
+    def test_it_still_queues_events_for_after_the_request(self,
+                                                          pyramid_request):
+        queue = OutboxQueue(pyramid_request)
+        annotation_event = AnnotationEvent(pyramid_request, ANNOTATION_ID,
+                                           'create')
+        other_event = mock.Mock()
+
+        queue(annotation_event)
+        queue(other_event)
+
+        assert list(queue.queue) == [annotation_event, other_event]
+
+    def test_it_only_writes_annotation_events(self, pyramid_request):
+        queue = OutboxQueue(pyramid_request)
+
+        queue(mock.Mock())
+
+        assert pyramid_request.db.query(models.OutboxEvent).count() == 0
+
+
+class TestAddSubscriber(object):
+
+    def test_it_subscribes_to_annotation_events(self, pyramid_config):
+        pyramid_config.add_subscriber = mock.Mock()
+
+        outbox.add_subscriber(pyramid_config, 'foo.bar')
+
+        pyramid_config.add_subscriber.assert_called_once_with(
+            'foo.bar', 'memex.events.AnnotationEvent')
+
+    def test_it_subscribes_to_relayed_events_with_the_outbox(self,
+                                                             pyramid_config):
+        pyramid_config.registry.settings['h.outbox'] = 'true'
+        pyramid_config.add_subscriber = mock.Mock()
+
+        outbox.add_subscriber(pyramid_config, 'foo.bar')
+
+        pyramid_config.add_subscriber.assert_called_once_with(
+            'foo.bar', 'h.outbox.RelayedAnnotationEvent')
+
+
+class TestRelay(object):
+
+    def test_it_notifies_the_events_in_order(self, add_events, req,
+                                             subscriber):
+        add_events('create', 'update')
+
+        outbox.relay(req)
+
+        assert [e.action for e in subscriber.events] == ['create', 'update']
+        event = subscriber.events[0]
+        assert isinstance(event, RelayedAnnotationEvent)
+        assert event.request is req
+        assert event.annotation_id == ANNOTATION_ID
+        assert event.src_client_id == 'client_id'
+
+    def test_it_deletes_delivered_events(self, add_events, req, subscriber):
+        add_events('create', 'update')
+
+        delivered = outbox.relay(req)
+
+        assert delivered == 2
+        assert req.db.query(models.OutboxEvent).count() == 0
+
+    def test_it_commits_each_event(self, add_events, req, subscriber):
+        add_events('create', 'update')
+        req.tm.commit = mock.Mock(wraps=req.tm.commit)
+
+        outbox.relay(req)
+
+        assert req.tm.commit.call_count == 2
+
+    def test_it_delivers_a_batch_at_a_time(self, add_events, req, subscriber):
+        add_events('create', 'update', 'delete')
+
+        delivered = outbox.relay(req, batch_size=2)
+
+        assert delivered == 2
+        assert [e.action for e in subscriber.events] == ['create', 'update']
+
+    def test_it_skips_events_locked_by_another_relay(self, add_events, req,
+                                                     subscriber, db_engine):
+        add_events('create', 'update')
+        other = Session(bind=db_engine)
+        (other.query(models.OutboxEvent)
+         .filter_by(action='create')
+         .with_for_update()
+         .one())
+        # Release the lock eventually, rather than waiting forever, if the
+        # relay waits for it.
+        release = threading.Timer(2, other.rollback)
+        release.start()
+
+        try:
+            delivered = outbox.relay(req)
+        finally:
+            release.cancel()
+            release.join()
+            other.close()
+
+        assert delivered == 1
+        assert [e.action for e in subscriber.events] == ['update']
+
+    def test_it_keeps_events_which_failed(self, add_events, req, subscriber):
+        add_events('create', 'update')
+        subscriber.side_effect = [ValueError('broker down'), None]
+
+        delivered = outbox.relay(req)
+
+        assert delivered == 1
+        assert [e.action for e in subscriber.events] == ['update']
+        event = req.db.query(models.OutboxEvent).one()
+        assert event.action == 'create'
+        assert event.attempts == 1
+
+    def test_it_counts_failures_which_break_the_transaction(self, add_events,
+                                                            req, subscriber):
+        add_events('create')
+
+        def break_the_transaction():
+            req.db.execute('SELECT * FROM no_such_table')
+        subscriber.side_effect = [break_the_transaction]
+
+        outbox.relay(req)
+        req.tm.abort()
+
+        event = req.db.query(models.OutboxEvent).one()
+        assert event.attempts == 1
+
+    def test_it_gives_up_on_events_after_max_attempts(self, add_events, req,
+                                                      subscriber):
+        add_events('create', attempts=3)
+
+        outbox.relay(req, max_attempts=3)
+
+        assert subscriber.events == []
+
+    def test_it_reports_stats(self, add_events, req, subscriber):
+        add_events('create', 'update')
+        subscriber.side_effect = [ValueError('broker down'), None]
+        stats = mock.Mock(spec_set=['incr'])
+
+        outbox.relay(req, stats=stats)
+
+        stats.incr.assert_has_calls([mock.call('outbox.delivered', 1),
+                                     mock.call('outbox.failed', 1)])
+
+    @pytest.fixture
+    def add_events(self, req):
+        def add_events(*actions, **kwargs):
+            req.db.add_all([models.OutboxEvent(annotation_id=ANNOTATION_ID,
+                                               action=action,
+                                               src_client_id='client_id',
+                                               **kwargs)
+                            for action in actions])
+            req.db.flush()
+            req.tm.commit()
+        return add_events
+
+    @pytest.fixture
+    def req(self, tm_request):
+        return tm_request
+
+    @pytest.fixture
+    def subscriber(self, pyramid_config):
+        subscriber = Subscriber()
+        pyramid_config.add_subscriber(subscriber, RelayedAnnotationEvent)
+        return subscriber
+
+
+class Subscriber(object):
+
+    """
+    A subscriber which records the events it receives.
+
+    Each item of `side_effect` is used for one event, in turn: an exception is
+    raised, and a function is called before the event is recorded.
+    """
+
+    def __init__(self):
+        self.events = []
+        self.side_effect = []
+
+    def __call__(self, event):
+        if self.side_effect:
+            effect = self.side_effect.pop(0)
+            if isinstance(effect, Exception):
+                raise effect
+            if effect is not None:
+                effect()
+        self.events.append(event)
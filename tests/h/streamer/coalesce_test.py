@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import gevent
+import mock
+import pytest
+
+from h.streamer.coalesce import Coalescer
+
+
+class TestCoalescer(object):
+
+    def test_it_holds_events_back_for_the_window(self, coalescer, emitted):
+        coalescer.add(event('a', 'update'))
+
+        assert emitted == []
+        gevent.sleep(0.02)
+        assert emitted == [event('a', 'update')]
+
+    def test_it_emits_the_latest_update(self, coalescer, emitted):
+        coalescer.add(event('a', 'update', src='one'))
+        coalescer.add(event('a', 'update', src='two'))
+        gevent.sleep(0.02)
+
+        assert emitted == [event('a', 'update', src='two')]
+
+    def test_create_then_update_is_a_create(self, coalescer, emitted):
+        coalescer.add(event('a', 'create'))
+        coalescer.add(event('a', 'update', src='two'))
+        gevent.sleep(0.02)
+
+        assert emitted == [event('a', 'create', src='two')]
+
+    def test_update_then_delete_is_a_delete(self, coalescer, emitted):
+        coalescer.add(event('a', 'update'))
+        coalescer.add(event('a', 'delete'))
+        gevent.sleep(0.02)
+
+        assert emitted == [event('a', 'delete')]
+
+    def test_create_then_delete_cancels_out(self, coalescer, emitted):
+        coalescer.add(event('a', 'create'))
+        coalescer.add(event('a', 'update'))
+        coalescer.add(event('a', 'delete'))
+        gevent.sleep(0.02)
+
+        assert emitted == []
+
+    def test_a_new_event_after_cancelling_gets_a_new_window(self, emitted):
+        coalescer = Coalescer(emitted.append, 0.1)
+        coalescer.add(event('a', 'create'))
+        coalescer.add(event('a', 'delete'))
+        coalescer.add(event('b', 'update'))
+        gevent.sleep(0.05)
+        coalescer.add(event('a', 'update'))
+        gevent.sleep(0.075)
+
+        assert emitted == [event('b', 'update')]
+        gevent.sleep(0.1)
+        assert emitted == [event('b', 'update'), event('a', 'update')]
+
+    def test_it_keeps_annotations_apart(self, coalescer, emitted):
+        coalescer.add(event('a', 'update'))
+        coalescer.add(event('b', 'update'))
+        gevent.sleep(0.02)
+
+        assert sorted(e['annotation_id'] for e in emitted) == ['a', 'b']
+
+    def test_it_passes_other_events_on_immediately(self, coalescer, emitted):
+        coalescer.add(event('a', 'read'))
+
+        assert emitted == [event('a', 'read')]
+
+    def test_it_reports_coalesced_events(self, emitted):
+        stats = mock.Mock(spec_set=['incr'])
+        coalescer = Coalescer(emitted.append, 0.01, stats=stats)
+
+        coalescer.add(event('a', 'update'))
+        coalescer.add(event('a', 'update'))
+
+        stats.incr.assert_called_once_with('streamer.coalesced')
+
+    @pytest.fixture
+    def coalescer(self, emitted):
+        return Coalescer(emitted.append, 0.01)
+
+    @pytest.fixture
+    def emitted(self):
+        return []
+
+
+def event(id_, action, src='client'):
+    return {'annotation_id': id_, 'action': action, 'src_client_id': src}
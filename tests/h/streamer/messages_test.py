@@ -7,6 +7,10 @@ from pyramid import security
 from pyramid import registry
 
 from h.streamer import messages
+from h.streamer import replay
+from h.streamer import routing
+from h.streamer.replay import ReplayBuffer
+from memex import presentation
 
 
 class FakeSocket(object):
@@ -47,7 +51,9 @@ class TestProcessMessages(object):
                                               routing_key=mock.ANY,
                                               handler=mock.ANY,
                                               sentry_client=fake_sentry.get_client.return_value,
-                                              statsd_client=mock.ANY)
+                                              statsd_client=mock.ANY,
+                                              routing_keys=mock.ANY,
+                                              on_routing_keys=mock.ANY)
 
     def test_creates_statsd_client(self, fake_stats, fake_consumer, queue):
         settings = {}
@@ -63,7 +69,9 @@ class TestProcessMessages(object):
                                               routing_key=mock.ANY,
                                               handler=mock.ANY,
                                               sentry_client=mock.ANY,
-                                              statsd_client=fake_stats.get_client.return_value)
+                                              statsd_client=fake_stats.get_client.return_value,
+                                              routing_keys=mock.ANY,
+                                              on_routing_keys=mock.ANY)
 
     def test_passes_routing_key_to_consumer(self, fake_consumer, queue):
         messages.process_messages({}, 'foobar', queue, raise_error=False)
@@ -72,7 +80,9 @@ class TestProcessMessages(object):
                                               routing_key='foobar',
                                               handler=mock.ANY,
                                               sentry_client=mock.ANY,
-                                              statsd_client=mock.ANY)
+                                              statsd_client=mock.ANY,
+                                              routing_keys=None,
+                                              on_routing_keys=None)
 
     def test_initializes_new_connection(self, fake_realtime, fake_consumer, queue):
         settings = {}
@@ -87,7 +97,9 @@ class TestProcessMessages(object):
                                               routing_key=mock.ANY,
                                               handler=mock.ANY,
                                               sentry_client=mock.ANY,
-                                              statsd_client=mock.ANY)
+                                              statsd_client=mock.ANY,
+                                              routing_keys=mock.ANY,
+                                              on_routing_keys=mock.ANY)
 
     def test_runs_consumer(self, fake_consumer, queue):
         messages.process_messages({}, 'foobar', queue, raise_error=False)
@@ -104,6 +116,67 @@ class TestProcessMessages(object):
         assert result.topic == 'foobar'
         assert result.payload == {'foo': 'bar'}
 
+    def test_message_handler_numbers_annotation_events(self, fake_consumer,
+                                                       queue):
+        messages.process_messages({}, 'annotation', queue, raise_error=False)
+        message_handler = fake_consumer.call_args[1]['handler']
+        message_handler({'annotation_id': 'abc', 'action': 'update'})
+        result = queue.get_nowait()
+
+        assert result.payload['epoch'] == replay.BUFFER.epoch
+        assert result.payload['sequence'] == replay.BUFFER.sequence
+        assert replay.BUFFER.since(result.payload['sequence'] - 1) == [
+            (result.payload['sequence'],
+             {'annotation_id': 'abc', 'action': 'update'})]
+
+    def test_consumes_wanted_partitions_if_partitioned(self, fake_consumer,
+                                                       queue, patch):
+        routing = patch('h.streamer.messages.routing')
+        settings = {'h.realtime.partitions': '8'}
+        messages.process_messages(settings, 'annotation', queue,
+                                  raise_error=False)
+        routing_keys = fake_consumer.call_args[1]['routing_keys']
+
+        result = routing_keys()
+
+        routing.routing_keys.assert_called_once_with(mock.ANY, 8)
+        assert result == routing.routing_keys.return_value
+
+    def test_records_the_partitions_consumed_if_partitioned(self,
+                                                            fake_consumer,
+                                                            queue):
+        settings = {'h.realtime.partitions': '8'}
+        messages.process_messages(settings, 'annotation', queue,
+                                  raise_error=False)
+
+        on_routing_keys = fake_consumer.call_args[1]['on_routing_keys']
+        assert on_routing_keys == replay.BUFFER.set_partitions
+
+    def test_does_not_partition_user_messages(self, fake_consumer, queue):
+        settings = {'h.realtime.partitions': '8'}
+        messages.process_messages(settings, 'user', queue, raise_error=False)
+
+        assert fake_consumer.call_args[1]['routing_keys'] is None
+        assert fake_consumer.call_args[1]['on_routing_keys'] is None
+
+    def test_it_does_not_coalesce_by_default(self, fake_consumer, queue):
+        messages.process_messages({}, 'annotation', queue, raise_error=False)
+        message_handler = fake_consumer.call_args[1]['handler']
+        message_handler({'annotation_id': 'abc', 'action': 'update'})
+
+        assert queue.qsize() == 1
+
+    def test_it_coalesces_annotation_events(self, fake_consumer, queue):
+        settings = {'h.streamer.coalesce_window': '0.01'}
+        messages.process_messages(settings, 'annotation', queue,
+                                  raise_error=False)
+        message_handler = fake_consumer.call_args[1]['handler']
+        message_handler({'annotation_id': 'abc', 'action': 'update'})
+        message_handler({'annotation_id': 'abc', 'action': 'update'})
+
+        assert queue.get(timeout=1).topic == 'annotation'
+        assert queue.empty()
+
     @pytest.fixture
     def fake_sentry(self, patch):
         return patch('h.sentry')
@@ -136,6 +209,21 @@ class TestHandleMessage(object):
 
         handler.assert_called_once_with(message.payload, list(websocket.instances), session)
 
+    def test_calls_user_handler_with_sockets_of_user(self, websocket):
+        handler = mock.Mock(return_value=None)
+        session = mock.sentinel.db_session
+        message = messages.Message(topic='user', payload={'userid': 'amy'})
+        websocket.instances = [FakeSocket('a'), FakeSocket('b')]
+        websocket.for_userid.return_value = [FakeSocket('c')]
+
+        messages.handle_message(message, session,
+                                topic_handlers={'user': handler})
+
+        websocket.for_userid.assert_called_once_with('amy')
+        handler.assert_called_once_with(message.payload,
+                                        websocket.for_userid.return_value,
+                                        session)
+
     @pytest.fixture
     def websocket(self, patch):
         return patch('h.streamer.websocket.WebSocket')
@@ -194,6 +282,24 @@ class TestHandleAnnotationEvent(object):
             links_service.return_value)
         assert presenters.AnnotationJSONPresenter.return_value.asdict.called
 
+    def test_it_presents_the_annotation_once_for_all_sockets(self,
+                                                             links_service,
+                                                             presenters):
+        message = {'action': '_', 'annotation_id': '_', 'src_client_id': '_'}
+        sockets = [FakeSocket('giraffe'), FakeSocket('elephant')]
+        sockets[0].registry[presentation.CACHE_KEY] = (
+            presentation.PresentationCache())
+        sockets[1].registry = sockets[0].registry
+        presenters.AnnotationJSONPresenter.return_value.asdict.return_value = (
+            self.serialized_annotation())
+
+        messages.handle_annotation_event(message, sockets,
+                                         mock.sentinel.db_session)
+
+        assert presenters.AnnotationJSONPresenter.call_count == 1
+        assert links_service.call_count == 1
+        assert all(s.send_json_payloads for s in sockets)
+
     def test_notification_format(self, presenter_asdict):
         """Check the format of the returned notification in the happy case."""
         message = {
@@ -213,6 +319,23 @@ class TestHandleAnnotationEvent(object):
             'options': {'action': 'update'},
         }
 
+    def test_notification_includes_the_sequence_number(self, presenter_asdict):
+        message = {
+            'annotation_id': 'panda',
+            'action': 'update',
+            'src_client_id': 'pigeon',
+            'epoch': 'abc',
+            'sequence': 12,
+        }
+        socket = FakeSocket('giraffe')
+        presenter_asdict.return_value = self.serialized_annotation()
+
+        messages.handle_annotation_event(message, [socket],
+                                         mock.sentinel.db_session)
+
+        assert socket.send_json_payloads[0]['epoch'] == 'abc'
+        assert socket.send_json_payloads[0]['sequence'] == 12
+
     def test_no_send_for_sender_socket(self, presenter_asdict):
         """Should return None if the socket's client_id matches the message's."""
         message = {'src_client_id': 'pigeon', 'annotation_id': '_', 'action': '_'}
@@ -407,6 +530,169 @@ class TestHandleAnnotationEvent(object):
         return service
 
 
+class TestReplayAnnotationEvents(object):
+    def test_it_sends_the_missed_events(self, buffer, handle_annotation_event):
+        socket = FakeSocket('giraffe')
+        buffer.append(event('a'))
+        buffer.append(event('b'))
+        buffer.append(event('c'))
+
+        messages.replay_annotation_events(socket, mock.sentinel.db_session,
+                                          buffer.epoch, 1)
+
+        assert handle_annotation_event.call_args_list == [
+            mock.call(event('b', epoch=buffer.epoch, sequence=2),
+                      [socket],
+                      mock.sentinel.db_session),
+            mock.call(event('c', epoch=buffer.epoch, sequence=3),
+                      [socket],
+                      mock.sentinel.db_session),
+        ]
+        assert socket.send_json_payloads == [{
+            'type': 'resume',
+            'ok': True,
+            'epoch': buffer.epoch,
+            'sequence': 3,
+        }]
+
+    def test_it_sends_only_the_latest_event_of_each_annotation(
+            self, buffer, handle_annotation_event):
+        buffer.append(event('a'))
+        buffer.append(event('b'))
+        buffer.append(event('a', action='delete'))
+
+        messages.replay_annotation_events(FakeSocket('giraffe'),
+                                          mock.sentinel.db_session,
+                                          buffer.epoch, 0)
+
+        sent = [c[0][0] for c in handle_annotation_event.call_args_list]
+        assert [(e['annotation_id'], e['action']) for e in sent] == [
+            ('b', 'update'), ('a', 'delete')]
+
+    def test_it_asks_for_a_full_resync_if_events_were_evicted(
+            self, buffer, handle_annotation_event):
+        buffer.resize(1)
+        socket = FakeSocket('giraffe')
+        buffer.append(event('a'))
+        buffer.append(event('b'))
+        buffer.append(event('c'))
+
+        messages.replay_annotation_events(socket, mock.sentinel.db_session,
+                                          buffer.epoch, 1)
+
+        assert not handle_annotation_event.called
+        assert socket.send_json_payloads[0]['ok'] is False
+        assert socket.send_json_payloads[0]['sequence'] == 3
+
+    @pytest.mark.parametrize('epoch,sequence', [
+        ('another epoch', 0),
+        (None, None),
+        ('this epoch', 'zero'),
+    ])
+    def test_it_asks_for_a_full_resync_for_unknown_positions(
+            self, buffer, handle_annotation_event, epoch, sequence):
+        if epoch == 'this epoch':
+            epoch = buffer.epoch
+        socket = FakeSocket('giraffe')
+        buffer.append(event('a'))
+
+        messages.replay_annotation_events(socket, mock.sentinel.db_session,
+                                          epoch, sequence)
+
+        assert not handle_annotation_event.called
+        assert socket.send_json_payloads[0]['ok'] is False
+        assert socket.send_json_payloads[0]['epoch'] == buffer.epoch
+
+    def test_it_sends_the_missed_events_of_partitions_consumed_throughout(
+            self, buffer, handle_annotation_event):
+        socket = partitioned_socket()
+        buffer.set_partitions(routing.routing_keys([socket], 8))
+        buffer.append(event('a'))
+        buffer.append(event('b'))
+
+        messages.replay_annotation_events(socket, mock.sentinel.db_session,
+                                          buffer.epoch, 1)
+
+        assert handle_annotation_event.call_count == 1
+        assert socket.send_json_payloads[0]['ok'] is True
+
+    def test_it_asks_for_a_full_resync_if_partitions_were_not_consumed(
+            self, buffer, handle_annotation_event):
+        # The socket was the only one watching its partition, so the partition
+        # stopped being consumed when the client disconnected.
+        socket = partitioned_socket()
+        buffer.set_partitions(routing.routing_keys([socket], 8))
+        buffer.append(event('a'))
+        buffer.set_partitions(set())
+        buffer.append(event('b'))
+
+        messages.replay_annotation_events(socket, mock.sentinel.db_session,
+                                          buffer.epoch, 1)
+
+        assert not handle_annotation_event.called
+        assert socket.send_json_payloads[0]['ok'] is False
+
+    def test_it_asks_for_a_full_resync_if_partitions_were_consumed_later(
+            self, buffer, handle_annotation_event):
+        socket = partitioned_socket()
+        buffer.append(event('a'))
+        buffer.append(event('b'))
+        buffer.set_partitions(routing.routing_keys([socket], 8))
+        buffer.append(event('c'))
+
+        messages.replay_annotation_events(socket, mock.sentinel.db_session,
+                                          buffer.epoch, 1)
+
+        assert not handle_annotation_event.called
+        assert socket.send_json_payloads[0]['ok'] is False
+
+    def test_it_asks_for_a_full_resync_if_no_filter_was_set(
+            self, buffer, handle_annotation_event):
+        # The client sent its resume message before its filter, so none of
+        # the missed events would have been sent to it.
+        socket = FakeSocket('giraffe')
+        socket.filter = None
+        buffer.append(event('a'))
+        buffer.append(event('b'))
+
+        messages.replay_annotation_events(socket, mock.sentinel.db_session,
+                                          buffer.epoch, 1)
+
+        assert not handle_annotation_event.called
+        assert socket.send_json_payloads == [{
+            'type': 'resume',
+            'ok': False,
+            'epoch': buffer.epoch,
+            'sequence': 2,
+        }]
+
+    @pytest.fixture
+    def buffer(self, patch):
+        replay = patch('h.streamer.messages.replay')
+        replay.BUFFER = ReplayBuffer()
+        return replay.BUFFER
+
+    @pytest.fixture
+    def handle_annotation_event(self, patch):
+        return patch('h.streamer.messages.handle_annotation_event')
+
+
+def partitioned_socket():
+    """Return a socket watching one document, with partitioned messages."""
+    socket = FakeSocket('giraffe')
+    socket.filter.filter = {
+        'match_policy': 'include_any',
+        'clauses': [{'field': '/uri', 'operator': 'one_of',
+                     'value': ['http://example.com/']}],
+    }
+    socket.registry.settings['h.realtime.partitions'] = '8'
+    return socket
+
+
+def event(id_, action='update', **kwargs):
+    return dict({'annotation_id': id_, 'action': action}, **kwargs)
+
+
 class TestHandleUserEvent(object):
     def test_sends_session_change_when_joining_or_leaving_group(self):
         session_model = mock.Mock()
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import gevent
+import mock
+import pytest
+
+from h.streamer import outbox
+from h.streamer.outbox import Outbox
+
+
+class TestOutbox(object):
+
+    def test_it_sends_frames_in_order(self, sent):
+        box = Outbox(sent.append)
+
+        box.put('one')
+        box.put('two')
+        gevent.sleep(0)
+
+        assert sent == ['one', 'two']
+
+    def test_put_does_not_wait_for_the_client(self):
+        send = mock.Mock(side_effect=lambda data: gevent.sleep(10))
+        box = Outbox(send)
+
+        with gevent.Timeout(1):
+            for i in range(10):
+                box.put('frame')
+
+        box.close()
+
+    def test_it_counts_buffered_bytes_and_frames(self, sent):
+        box = Outbox(sent.append)
+
+        box.put('one')
+        box.put('three')
+
+        assert len(box) == 2
+        assert box.buffered_bytes == 8
+
+        gevent.sleep(0)
+
+        assert len(box) == 0
+        assert box.buffered_bytes == 0
+
+    def test_drop_oldest_drops_the_oldest_frame(self, sent):
+        box = Outbox(sent.append, maxsize=2, policy=outbox.DROP_OLDEST)
+
+        for data in ['one', 'two', 'three']:
+            box.put(data)
+        gevent.sleep(0)
+
+        assert sent == ['two', 'three']
+        assert box.dropped == 1
+
+    def test_coalesce_replaces_a_frame_with_the_same_key(self, sent):
+        box = Outbox(sent.append, maxsize=2, policy=outbox.COALESCE)
+
+        box.put('a1', key='a')
+        box.put('b1', key='b')
+        box.put('a2', key='a')
+        gevent.sleep(0)
+
+        assert sent == ['a2', 'b1']
+        assert box.dropped == 1
+
+    def test_coalesce_drops_the_oldest_frame_if_no_key_matches(self, sent):
+        box = Outbox(sent.append, maxsize=2, policy=outbox.COALESCE)
+
+        box.put('a1', key='a')
+        box.put('b1', key='b')
+        box.put('c1', key='c')
+        gevent.sleep(0)
+
+        assert sent == ['b1', 'c1']
+
+    def test_coalesce_only_applies_when_full(self, sent):
+        box = Outbox(sent.append, maxsize=3, policy=outbox.COALESCE)
+
+        box.put('a1', key='a')
+        box.put('a2', key='a')
+        gevent.sleep(0)
+
+        assert sent == ['a1', 'a2']
+
+    def test_disconnect_drops_everything_and_calls_on_overflow(self, sent):
+        on_overflow = mock.Mock()
+        box = Outbox(sent.append, maxsize=2, policy=outbox.DISCONNECT,
+                     on_overflow=on_overflow)
+
+        for data in ['one', 'two', 'three']:
+            box.put(data)
+        gevent.sleep(0)
+
+        on_overflow.assert_called_once_with()
+        assert sent == []
+        assert box.closed
+        assert box.dropped == 3
+
+    def test_it_updates_the_process_totals(self, sent):
+        before = outbox.totals['dropped']
+        box = Outbox(sent.append, maxsize=1)
+
+        box.put('one')
+        box.put('two')
+
+        assert outbox.totals['dropped'] == before + 1
+
+    def test_it_stops_sending_when_sending_fails(self):
+        send = mock.Mock(side_effect=RuntimeError('terminated'))
+        box = Outbox(send)
+
+        box.put('one')
+        gevent.sleep(0)
+        box.put('two')
+        gevent.sleep(0)
+
+        assert send.call_count == 1
+        assert box.closed
+
+    def test_close_drops_waiting_frames(self, sent):
+        box = Outbox(sent.append)
+        box.put('one')
+
+        box.close()
+        gevent.sleep(0)
+
+        assert sent == []
+        assert box.buffered_bytes == 0
+
+    def test_it_rejects_unknown_policies(self):
+        with pytest.raises(ValueError):
+            Outbox(mock.Mock(), policy='bounce')
+
+    @pytest.fixture
+    def sent(self):
+        return []
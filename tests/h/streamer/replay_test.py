@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+from h.streamer.replay import ReplayBuffer
+
+
+class TestReplayBuffer(object):
+
+    def test_append_numbers_events_in_order(self):
+        buffer = ReplayBuffer()
+
+        assert [buffer.append(e) for e in 'abc'] == [1, 2, 3]
+        assert buffer.sequence == 3
+
+    def test_since_returns_the_later_events(self):
+        buffer = ReplayBuffer()
+        for e in 'abc':
+            buffer.append(e)
+
+        assert buffer.since(1) == [(2, 'b'), (3, 'c')]
+
+    def test_since_the_latest_event_is_empty(self):
+        buffer = ReplayBuffer()
+        buffer.append('a')
+
+        assert buffer.since(1) == []
+
+    def test_since_returns_none_for_evicted_events(self):
+        buffer = ReplayBuffer(size=2)
+        for e in 'abcd':
+            buffer.append(e)
+
+        assert buffer.since(1) is None
+        assert buffer.since(2) == [(3, 'c'), (4, 'd')]
+
+    def test_since_returns_none_for_unassigned_numbers(self):
+        buffer = ReplayBuffer()
+        buffer.append('a')
+
+        assert buffer.since(2) is None
+        assert buffer.since(-1) is None
+
+    def test_resize_keeps_the_most_recent_events(self):
+        buffer = ReplayBuffer()
+        for e in 'abc':
+            buffer.append(e)
+
+        buffer.resize(2)
+
+        assert len(buffer) == 2
+        assert buffer.since(1) == [(2, 'b'), (3, 'c')]
+
+    def test_buffers_have_different_epochs(self):
+        assert ReplayBuffer().epoch != ReplayBuffer().epoch
+
+    def test_consumed_since_is_true_for_partitions_consumed_since_then(self):
+        buffer = ReplayBuffer()
+        buffer.append('a')
+        buffer.set_partitions({'annotation.1'})
+        buffer.append('b')
+        buffer.set_partitions({'annotation.1', 'annotation.2'})
+
+        assert buffer.consumed_since({'annotation.1'}, 1)
+        assert buffer.consumed_since({'annotation.1', 'annotation.2'}, 2)
+        assert buffer.consumed_since(set(), 0)
+
+    def test_consumed_since_is_false_for_partitions_consumed_later(self):
+        buffer = ReplayBuffer()
+        buffer.append('a')
+        buffer.set_partitions({'annotation.1'})
+
+        assert not buffer.consumed_since({'annotation.1'}, 0)
+
+    def test_consumed_since_is_false_for_partitions_not_consumed(self):
+        buffer = ReplayBuffer()
+        buffer.set_partitions({'annotation.1'})
+        buffer.append('a')
+        buffer.set_partitions(set())
+
+        assert not buffer.consumed_since({'annotation.1'}, 0)
+        assert not buffer.consumed_since({'annotation.2'}, 1)
+
+    def test_partitions_consumed_again_start_afresh(self):
+        buffer = ReplayBuffer()
+        buffer.set_partitions({'annotation.1'})
+        buffer.append('a')
+        buffer.set_partitions(set())
+        buffer.append('b')
+        buffer.set_partitions({'annotation.1'})
+
+        assert not buffer.consumed_since({'annotation.1'}, 1)
+        assert buffer.consumed_since({'annotation.1'}, 2)
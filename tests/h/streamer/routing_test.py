@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import mock
+import pytest
+
+from h import realtime
+from h.streamer import routing
+from h.streamer.filter import FilterHandler
+
+
+class TestRoutingKeys(object):
+
+    def test_returns_the_partitions_of_the_watched_uris(self):
+        sockets = [socket(uri_filter(['http://example.com/a'])),
+                   socket(uri_filter(['http://example.com/b']))]
+
+        result = routing.routing_keys(sockets, 64)
+
+        assert result == {
+            realtime.partition_routing_key('httpx://example.com/a', 64),
+            realtime.partition_routing_key('httpx://example.com/b', 64),
+        }
+
+    def test_returns_all_partitions_for_unrestricted_filters(self):
+        sockets = [socket(uri_filter(['http://example.com/a'])),
+                   socket({'match_policy': 'include_all',
+                           'clauses': [],
+                           'actions': {}})]
+
+        result = routing.routing_keys(sockets, 3)
+
+        assert result == {'annotation.0', 'annotation.1', 'annotation.2'}
+
+    def test_ignores_sockets_without_filters(self):
+        assert routing.routing_keys([socket(None)], 3) == set()
+
+
+class TestFilterURIs(object):
+
+    def test_returns_the_normalized_uris_of_the_sidebar_filter(self):
+        filter_ = uri_filter(['https://Example.com/a#frag',
+                              'https://example.com/b'])
+
+        assert routing.filter_uris(filter_) == {'httpx://example.com/a',
+                                                'httpx://example.com/b'}
+
+    def test_accepts_a_single_uri(self):
+        filter_ = uri_filter('https://example.com/a', operator='equals')
+
+        assert routing.filter_uris(filter_) == {'httpx://example.com/a'}
+
+    def test_uses_one_uri_clause_of_include_all_filters(self):
+        filter_ = uri_filter(['https://example.com/a'], policy='include_all')
+        filter_['clauses'].append({'field': '/user',
+                                   'operator': 'equals',
+                                   'value': 'acct:amy@example.com'})
+
+        assert routing.filter_uris(filter_) == {'httpx://example.com/a'}
+
+    @pytest.mark.parametrize('policy', ['include_any', 'exclude_any',
+                                        'exclude_all'])
+    def test_returns_none_for_filters_matching_other_annotations(self, policy):
+        filter_ = uri_filter(['https://example.com/a'], policy=policy)
+        filter_['clauses'].append({'field': '/user',
+                                   'operator': 'equals',
+                                   'value': 'acct:amy@example.com'})
+
+        assert routing.filter_uris(filter_) is None
+
+    def test_returns_none_without_uri_clauses(self):
+        filter_ = {'match_policy': 'include_any',
+                   'clauses': [{'field': '/uri',
+                                'operator': 'matches',
+                                'value': 'example'}],
+                   'actions': {}}
+
+        assert routing.filter_uris(filter_) is None
+
+
+def uri_filter(uris, policy='include_any', operator='one_of'):
+    return {'match_policy': policy,
+            'clauses': [{'field': '/uri', 'operator': operator,
+                         'value': uris}],
+            'actions': {}}
+
+
+def socket(filter_):
+    socket_ = mock.Mock(spec_set=['filter'])
+    socket_.filter = FilterHandler(filter_) if filter_ is not None else None
+    return socket_
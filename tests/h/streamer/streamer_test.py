@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 
+from gevent.queue import Full
 import mock
 from mock import call
 import pytest
@@ -105,6 +106,94 @@ def test_process_work_queue_calls_close_after_rollback(session):
     ]
 
 
+class TestWorkQueue(object):
+
+    def test_it_queues_websocket_messages_on_the_socket_shard(self, sockets):
+        work_queue = streamer.WorkQueue(shards=4)
+        message = websocket.Message(socket=sockets[0], payload='bar')
+
+        work_queue.put(message)
+
+        shard = work_queue.shard(sockets[0])
+        assert [q.qsize() for q in work_queue.queues] == [
+            1 if i == shard else 0 for i in range(4)]
+
+    def test_it_keeps_the_order_of_the_messages_of_a_socket(self, sockets):
+        work_queue = streamer.WorkQueue(shards=4)
+        message1 = websocket.Message(socket=sockets[0], payload='1')
+        message2 = websocket.Message(socket=sockets[0], payload='2')
+
+        work_queue.put(message1)
+        work_queue.put(message2)
+
+        queue = work_queue.queues[work_queue.shard(sockets[0])]
+        assert [queue.get(), queue.get()] == [message1, message2]
+
+    def test_it_queues_realtime_messages_once(self):
+        work_queue = streamer.WorkQueue(shards=4)
+        message = messages.Message(topic='foo', payload='bar')
+
+        work_queue.put(message)
+
+        assert work_queue.realtime.get_nowait() == message
+        assert work_queue.qsize() == 0
+
+    def test_it_counts_dropped_messages_per_shard(self):
+        work_queue = streamer.WorkQueue(shards=2, maxsize=1)
+        socket = mock.sentinel.SOCKET
+        shard = work_queue.shard(socket)
+        work_queue.put(websocket.Message(socket=socket, payload='1'))
+
+        with pytest.raises(Full):
+            work_queue.put(websocket.Message(socket=socket, payload='2'),
+                           timeout=0.01)
+
+        assert work_queue.dropped[shard] == 1
+        assert work_queue.dropped[1 - shard] == 0
+
+    def test_it_counts_dropped_realtime_messages(self):
+        work_queue = streamer.WorkQueue(shards=2, maxsize=1)
+        work_queue.put(messages.Message(topic='foo', payload='1'))
+
+        with pytest.raises(Full):
+            work_queue.put(messages.Message(topic='foo', payload='2'),
+                           timeout=0.01)
+
+        assert work_queue.realtime_dropped == 1
+        assert work_queue.dropped == [0, 0]
+
+    def test_a_full_shard_does_not_hold_up_realtime_messages(self):
+        work_queue = streamer.WorkQueue(shards=2, maxsize=1)
+        socket = mock.sentinel.SOCKET
+        work_queue.put(websocket.Message(socket=socket, payload='1'))
+
+        work_queue.put(messages.Message(topic='foo', payload='bar'),
+                       timeout=0.01)
+
+        assert work_queue.realtime.qsize() == 1
+
+    def test_qsize_is_the_total_of_all_queues(self):
+        work_queue = streamer.WorkQueue(shards=3)
+
+        work_queue.put(messages.Message(topic='foo', payload='bar'))
+        work_queue.put(websocket.Message(socket=mock.sentinel.SOCKET,
+                                         payload='1'))
+
+        assert work_queue.qsize() == 2
+
+    def test_resize(self):
+        work_queue = streamer.WorkQueue()
+
+        work_queue.resize(5)
+
+        assert len(work_queue.queues) == 5
+        assert work_queue.dropped == [0] * 5
+
+    @pytest.fixture
+    def sockets(self):
+        return [mock.Mock(spec_set=[]) for _ in range(10)]
+
+
 @pytest.fixture
 def session():
     return mock.Mock(spec_set=['close', 'commit', 'execute', 'rollback'])
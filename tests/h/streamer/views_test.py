@@ -57,6 +57,27 @@ def test_websocket_view_adds_work_queue_to_environ(pyramid_request):
     assert env['h.ws.streamer_work_queue'] == streamer.WORK_QUEUE
 
 
+def test_websocket_view_adds_outbox_settings_to_environ(pyramid_request):
+    pyramid_request.registry.settings.update({
+        'h.streamer.outbox_policy': 'coalesce',
+        'h.streamer.outbox_size': 10,
+    })
+    pyramid_request.get_response = lambda _: None
+
+    views.websocket_view(pyramid_request)
+    env = pyramid_request.environ
+
+    assert env['h.ws.outbox_policy'] == 'coalesce'
+    assert env['h.ws.outbox_size'] == 10
+
+
+def test_includeme_rejects_unknown_outbox_policies(pyramid_config):
+    pyramid_config.registry.settings['h.streamer.outbox_policy'] = 'bounce'
+
+    with pytest.raises(ValueError):
+        views.includeme(pyramid_config)
+
+
 @pytest.fixture
 def pyramid_request(pyramid_request):
     pyramid_request.registry.settings.update({'origins': []})
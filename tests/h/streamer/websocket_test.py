@@ -3,12 +3,15 @@
 from collections import namedtuple
 import json
 
+import gevent
 import mock
 import pytest
 from gevent.queue import Queue
 from pyramid import security
 
 from h.streamer import websocket
+from h.streamer.replay import ReplayBuffer
+from memex import equivalence
 
 
 FakeMessage = namedtuple('FakeMessage', ['data'])
@@ -40,6 +43,31 @@ def test_websocket_removes_self_from_instance_list_when_closed(fake_environ):
     client1.closed(1000)
 
 
+def test_websocket_indexes_instances_by_userid(fake_environ):
+    client = websocket.WebSocket(mock.Mock(), environ=fake_environ)
+    fake_environ['h.ws.authenticated_userid'] = 'amy'
+    other = websocket.WebSocket(mock.Mock(), environ=fake_environ)
+
+    assert websocket.WebSocket.for_userid('janet') == [client]
+    assert websocket.WebSocket.for_userid('amy') == [other]
+
+
+def test_websocket_does_not_index_anonymous_instances(fake_environ):
+    fake_environ['h.ws.authenticated_userid'] = None
+    websocket.WebSocket(mock.Mock(), environ=fake_environ)
+
+    assert websocket.WebSocket.for_userid(None) == []
+
+
+def test_websocket_removes_self_from_userid_index_when_closed(fake_environ):
+    client = websocket.WebSocket(mock.Mock(), environ=fake_environ)
+
+    client.closed(1000)
+
+    assert websocket.WebSocket.for_userid('janet') == []
+    assert 'janet' not in websocket.WebSocket._by_userid
+
+
 def test_socket_enqueues_incoming_messages(fake_environ):
     socket = mock.Mock()
     client = websocket.WebSocket(socket, environ=fake_environ)
@@ -53,6 +81,58 @@ def test_socket_enqueues_incoming_messages(fake_environ):
     assert result.payload == 'client data'
 
 
+def test_send_json_puts_serialized_payload_in_outbox(fake_environ):
+    client = websocket.WebSocket(mock.Mock(), environ=fake_environ)
+    client.outbox = mock.Mock(spec_set=['put', 'close'])
+
+    client.send_json({'type': 'session-change'})
+
+    client.outbox.put.assert_called_once_with('{"type": "session-change"}',
+                                              key=None)
+
+
+def test_send_json_coalesces_annotation_notifications_by_id(fake_environ):
+    client = websocket.WebSocket(mock.Mock(), environ=fake_environ)
+    client.outbox = mock.Mock(spec_set=['put', 'close'])
+
+    client.send_json({'type': 'annotation-notification',
+                      'payload': [{'id': 'abc'}]})
+
+    client.outbox.put.assert_called_once_with(mock.ANY,
+                                              key=('annotation', 'abc'))
+
+
+def test_socket_configures_outbox_from_environ(fake_environ):
+    fake_environ['h.ws.outbox_size'] = 7
+    fake_environ['h.ws.outbox_policy'] = 'disconnect'
+
+    client = websocket.WebSocket(mock.Mock(), environ=fake_environ)
+
+    assert client.outbox.maxsize == 7
+    assert client.outbox.policy == 'disconnect'
+
+
+def test_socket_closes_outbox_when_closed(fake_environ):
+    client = websocket.WebSocket(mock.Mock(), environ=fake_environ)
+
+    client.closed(1000)
+
+    assert client.outbox.closed
+
+
+def test_socket_closes_connection_when_outbox_overflows(fake_environ):
+    sock = mock.Mock()
+    fake_environ['h.ws.outbox_size'] = 1
+    fake_environ['h.ws.outbox_policy'] = 'disconnect'
+    client = websocket.WebSocket(sock, environ=fake_environ)
+
+    client.send_json({})
+    client.send_json({})
+
+    sock.shutdown.assert_called_once_with(mock.ANY)
+    sock.close.assert_called_once_with()
+
+
 def test_socket_sets_auth_data_from_environ(fake_environ):
     socket = mock.Mock()
     client = websocket.WebSocket(socket, environ=fake_environ)
@@ -78,6 +158,7 @@ def test_socket_send_json(fake_environ, fake_json, fake_socket_send):
 
     payload = {'foo': 'bar'}
     client.send_json(payload)
+    gevent.sleep(0)
 
     fake_json.dumps.assert_called_once_with(payload)
     fake_socket_send.assert_called_once_with(client, fake_json.dumps.return_value)
@@ -107,6 +188,45 @@ def test_handle_message_sets_socket_client_id_for_client_id_messages():
     assert socket.client_id == 'abcd1234'
 
 
+def test_handle_message_replays_missed_events_for_resume_messages(patch):
+    replay_annotation_events = patch(
+        'h.streamer.messages.replay_annotation_events')
+    socket = mock.Mock()
+    message = websocket.Message(socket=socket, payload=json.dumps({
+        'messageType': 'resume',
+        'epoch': 'abc',
+        'sequence': 12,
+    }))
+
+    websocket.handle_message(message, mock.sentinel.db_session)
+
+    replay_annotation_events.assert_called_once_with(socket,
+                                                     mock.sentinel.db_session,
+                                                     'abc',
+                                                     12)
+
+
+def test_handle_message_asks_for_a_resync_when_resuming_before_filtering():
+    buffer = ReplayBuffer()
+    buffer.append({'annotation_id': 'a', 'action': 'create'})
+    socket = mock.Mock(filter=None)
+    message = websocket.Message(socket=socket, payload=json.dumps({
+        'messageType': 'resume',
+        'epoch': buffer.epoch,
+        'sequence': 0,
+    }))
+
+    with mock.patch('h.streamer.replay.BUFFER', buffer):
+        websocket.handle_message(message, mock.sentinel.db_session)
+
+    socket.send_json.assert_called_once_with({
+        'type': 'resume',
+        'ok': False,
+        'epoch': buffer.epoch,
+        'sequence': 1,
+    })
+
+
 def test_handle_message_sets_socket_filter_for_filter_messages():
     socket = mock.Mock()
     socket.filter = None
@@ -127,13 +247,13 @@ def test_handle_message_sets_socket_filter_for_filter_messages():
     assert socket.filter is not None
 
 
-@mock.patch('memex.storage.expand_uri')
-def test_handle_message_expands_uris_in_uri_filter_with_session(expand_uri):
-    expand_uri.return_value = ['http://example.com',
-                               'http://example.com/alter',
-                               'http://example.com/print']
+def test_handle_message_expands_uris_in_uri_filter_with_session(resolver):
+    resolver.expand.return_value = ['http://example.com',
+                                    'http://example.com/alter',
+                                    'http://example.com/print']
     session = mock.sentinel.db_session
     socket = mock.Mock()
+    socket.registry = {equivalence.RESOLVER_KEY: resolver}
     socket.filter = None
     message = websocket.Message(socket=socket, payload=json.dumps({
         'filter': {
@@ -157,11 +277,11 @@ def test_handle_message_expands_uris_in_uri_filter_with_session(expand_uri):
     assert 'http://example.com/print' in uri_values
 
 
-@mock.patch('memex.storage.expand_uri')
-def test_handle_message_expands_uris_using_passed_session(expand_uri):
-    expand_uri.return_value = ['http://example.com', 'http://example.org/']
+def test_handle_message_expands_uris_using_passed_session(resolver):
+    resolver.expand.return_value = ['http://example.com', 'http://example.org/']
     session = mock.sentinel.db_session
     socket = mock.Mock()
+    socket.registry = {equivalence.RESOLVER_KEY: resolver}
     socket.filter = None
     message = websocket.Message(socket=socket, payload=json.dumps({
         'filter': {
@@ -177,7 +297,12 @@ def test_handle_message_expands_uris_using_passed_session(expand_uri):
 
     websocket.handle_message(message, session=session)
 
-    expand_uri.assert_called_once_with(session, 'http://example.com')
+    resolver.expand.assert_called_once_with(session, 'http://example.com')
+
+
+@pytest.fixture
+def resolver():
+    return mock.Mock(spec_set=['expand', 'expand_normalized'])
 
 
 @pytest.fixture
@@ -5,6 +5,7 @@ import mock
 import pytest
 
 from h import subscribers
+from h.outbox import RelayedAnnotationEvent
 from memex.events import AnnotationEvent
 
 
@@ -43,6 +44,64 @@ class TestPublishAnnotationEvent:
             'annotation_dict': annotation_dict
         })
 
+    def test_it_uses_the_client_id_of_relayed_events(self, pyramid_request):
+        pyramid_request.realtime = mock.Mock()
+        event = RelayedAnnotationEvent(pyramid_request,
+                                       'test_annotation_id',
+                                       'create',
+                                       src_client_id='client_id')
+
+        subscribers.publish_annotation_event(event)
+
+        event.request.realtime.publish_annotation.assert_called_once_with({
+            'action': 'create',
+            'annotation_id': 'test_annotation_id',
+            'src_client_id': 'client_id'
+        })
+
+    def test_it_routes_by_the_annotation_uri_if_partitioned(self,
+                                                            event,
+                                                            fetch_annotation):
+        event.request.registry.settings['h.realtime.partitions'] = 8
+        fetch_annotation.return_value.target_uri_normalized = (
+            'httpx://example.com')
+
+        subscribers.publish_annotation_event(event)
+
+        fetch_annotation.assert_called_once_with(event.request.db,
+                                                 'test_annotation_id')
+        event.request.realtime.publish_annotation.assert_called_once_with(
+            mock.ANY, uri='httpx://example.com')
+
+    def test_it_routes_deletes_by_the_annotation_dict_uri(self,
+                                                          event,
+                                                          fetch_annotation):
+        event.request.registry.settings['h.realtime.partitions'] = 8
+        annotation_dict = {'uri': 'https://example.com/#frag'}
+        type(event).annotation_dict = mock.PropertyMock(
+            return_value=annotation_dict)
+
+        subscribers.publish_annotation_event(event)
+
+        assert not fetch_annotation.called
+        event.request.realtime.publish_annotation.assert_called_once_with(
+            mock.ANY, uri='httpx://example.com')
+
+    def test_it_publishes_unroutable_events_if_partitioned(self,
+                                                           event,
+                                                           fetch_annotation):
+        event.request.registry.settings['h.realtime.partitions'] = 8
+        fetch_annotation.return_value = None
+
+        subscribers.publish_annotation_event(event)
+
+        event.request.realtime.publish_annotation.assert_called_once_with(
+            mock.ANY, uri=None)
+
+    @pytest.fixture
+    def fetch_annotation(self, patch):
+        return patch('h.subscribers.storage.fetch_annotation')
+
     @pytest.fixture
     def event(self, pyramid_request):
         pyramid_request.realtime = mock.Mock()
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import datetime
+
+import mock
+import pytest
+
+from memex import conditional
+
+
+class TestValidators(object):
+
+    def test_etag_depends_on_every_part_of_the_version(self):
+        etags = {conditional.validators(version).etag
+                 for version in [('a', 1), ('a', 2), ('b', 1), ('a',)]}
+
+        assert len(etags) == 4
+
+    def test_etag_is_stable(self):
+        assert (conditional.validators(('a', 1)).etag ==
+                conditional.validators(('a', 1)).etag)
+
+    def test_annotation_validators_use_id_and_updated(self):
+        annotation = mock.Mock(id='abc', updated=UPDATED, document=None)
+
+        result = conditional.annotation_validators(annotation)
+
+        assert result == conditional.validators(('abc', UPDATED, None, None),
+                                                last_modified=UPDATED)
+
+    def test_annotation_validators_change_with_the_document(self):
+        document = mock.Mock(id=1, updated=UPDATED)
+        annotation = mock.Mock(id='abc', updated=UPDATED, document=document)
+        before = conditional.annotation_validators(annotation)
+
+        document.updated = UPDATED + datetime.timedelta(hours=1)
+        after = conditional.annotation_validators(annotation)
+
+        assert after.etag != before.etag
+        assert after.last_modified == document.updated
+
+
+class TestNotModified(object):
+
+    def test_it_sets_the_validators_on_the_response(self, pyramid_request, validators):
+        conditional.not_modified(pyramid_request, validators)
+
+        assert pyramid_request.response.etag == validators.etag
+        assert pyramid_request.response.headers['ETag'] == 'W/"{}"'.format(validators.etag)
+        assert pyramid_request.response.headers['Last-Modified'] == (
+            'Fri, 01 Jan 2016 12:30:45 GMT')
+
+    def test_it_returns_none_without_preconditions(self, pyramid_request, validators):
+        assert conditional.not_modified(pyramid_request, validators) is None
+
+    @pytest.mark.parametrize('if_none_match', [
+        '"{etag}"',
+        'W/"{etag}"',
+        '"other", W/"{etag}"',
+        '*',
+    ])
+    def test_it_returns_304_if_the_etag_matches(self, pyramid_request, validators,
+                                                if_none_match):
+        pyramid_request.headers['If-None-Match'] = if_none_match.format(
+            etag=validators.etag)
+
+        result = conditional.not_modified(pyramid_request, validators)
+
+        assert result.status_code == 304
+        assert result.headers['ETag'] == 'W/"{}"'.format(validators.etag)
+        assert result.headers['Last-Modified'] == 'Fri, 01 Jan 2016 12:30:45 GMT'
+
+    def test_it_returns_none_if_the_etag_does_not_match(self, pyramid_request, validators):
+        pyramid_request.headers['If-None-Match'] = '"other"'
+
+        assert conditional.not_modified(pyramid_request, validators) is None
+
+    def test_if_none_match_takes_precedence(self, pyramid_request, validators):
+        pyramid_request.headers['If-None-Match'] = '"other"'
+        pyramid_request.headers['If-Modified-Since'] = 'Fri, 01 Jan 2016 12:30:45 GMT'
+
+        assert conditional.not_modified(pyramid_request, validators) is None
+
+    @pytest.mark.parametrize('if_modified_since,expected', [
+        ('Fri, 01 Jan 2016 12:30:44 GMT', None),
+        ('Fri, 01 Jan 2016 12:30:45 GMT', 304),
+        ('Sat, 02 Jan 2016 00:00:00 GMT', 304),
+        ('not a date', None),
+    ])
+    def test_it_compares_if_modified_since(self, pyramid_request, validators,
+                                           if_modified_since, expected):
+        pyramid_request.headers['If-Modified-Since'] = if_modified_since
+
+        result = conditional.not_modified(pyramid_request, validators)
+
+        assert getattr(result, 'status_code', None) == expected
+
+    def test_it_ignores_preconditions_for_other_methods(self, pyramid_request, validators):
+        pyramid_request.method = 'PUT'
+        pyramid_request.headers['If-None-Match'] = '*'
+
+        assert conditional.not_modified(pyramid_request, validators) is None
+
+    @pytest.fixture
+    def validators(self):
+        return conditional.validators(('abc', UPDATED), last_modified=UPDATED)
+
+
+UPDATED = datetime.datetime(2016, 1, 1, 12, 30, 45, 123456)
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import pytest
+
+from memex import equivalence
+from memex.models.document import CHANGED_URIS_KEY
+from memex.models.document import Document, DocumentURI
+
+
+class TestEquivalenceResolver(object):
+
+    def test_expand_no_document(self, db_session, resolver):
+        assert resolver.expand(db_session, 'http://example.com/') == [
+            'http://example.com/']
+
+    def test_expand_doesnt_expand_canonical_uris(self, db_session, resolver):
+        document = Document(document_uris=[
+            DocumentURI(uri='http://foo.com/', claimant='http://example.com'),
+            DocumentURI(uri='http://bar.com/', claimant='http://example.com'),
+            DocumentURI(uri='http://example.com/', type='rel-canonical',
+                        claimant='http://example.com'),
+        ])
+        db_session.add(document)
+        db_session.flush()
+
+        assert resolver.expand(db_session, 'http://example.com/') == [
+            'http://example.com/']
+
+    def test_expand_document_uris(self, db_session, resolver):
+        self._add_document(db_session)
+
+        assert sorted(resolver.expand(db_session, 'http://foo.com/')) == [
+            'http://bar.com/',
+            'http://foo.com/',
+        ]
+
+    def test_expand_normalized_returns_normalized_uris(self, db_session, resolver):
+        self._add_document(db_session)
+
+        assert resolver.expand_normalized(db_session, 'http://foo.com/') == {
+            'httpx://bar.com',
+            'httpx://foo.com',
+        }
+
+    def test_expand_normalized_no_document(self, db_session, resolver):
+        assert resolver.expand_normalized(db_session, 'http://foo.com/') == {
+            'httpx://foo.com'}
+
+    def test_it_caches_by_normalized_uri(self, db_session, resolver):
+        resolver.expand(db_session, 'http://foo.com/')
+        resolver.expand(db_session, 'https://foo.com')
+
+        assert resolver.stats['hits'] == 1
+        assert resolver.stats['misses'] == 1
+
+    def test_invalidate_drops_cached_expansions(self, db_session, resolver):
+        resolver.expand(db_session, 'http://foo.com/')
+        self._add_document(db_session)
+
+        resolver.invalidate(['httpx://foo.com'])
+
+        assert len(resolver.expand(db_session, 'http://foo.com/')) == 2
+
+    def test_commit_invalidates_changed_uris(self, db_session, resolver):
+        resolver.expand(db_session, 'http://foo.com/')
+        self._add_document(db_session)
+        db_session.info[CHANGED_URIS_KEY] = {'httpx://foo.com'}
+
+        equivalence._invalidate_after_commit(db_session)
+
+        assert len(resolver.expand(db_session, 'http://foo.com/')) == 2
+        assert CHANGED_URIS_KEY not in db_session.info
+
+    def test_cached_expansion_is_stale_without_invalidation(self, db_session, resolver):
+        resolver.expand(db_session, 'http://foo.com/')
+        self._add_document(db_session)
+
+        assert resolver.expand(db_session, 'http://foo.com/') == [
+            'http://foo.com/']
+
+    def _add_document(self, db_session):
+        document = Document(document_uris=[
+            DocumentURI(uri='http://foo.com/', claimant='http://bar.com'),
+            DocumentURI(uri='http://bar.com/', claimant='http://bar.com'),
+        ])
+        db_session.add(document)
+        db_session.flush()
+
+    @pytest.fixture
+    def resolver(self):
+        return equivalence.EquivalenceResolver(cache_size=10, ttl=60)
+
+
+class TestIncludeMe(object):
+
+    def test_it_configures_the_resolver_from_settings(self, pyramid_config):
+        pyramid_config.registry.settings['memex.equivalence.cache_size'] = '5'
+
+        equivalence.includeme(pyramid_config)
+
+        resolver = equivalence.get_resolver(pyramid_config.registry)
+        assert isinstance(resolver, equivalence.EquivalenceResolver)
+
+    def test_it_registers_the_service(self, pyramid_config, pyramid_request):
+        equivalence.includeme(pyramid_config)
+
+        svc = pyramid_request.find_service(name='uri_equivalence')
+
+        assert svc is equivalence.get_resolver(pyramid_config.registry)
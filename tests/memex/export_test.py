@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import mock
+import pytest
+import sqlalchemy
+
+from memex import export
+from memex import presenters
+
+
+class TestExport(object):
+
+    def test_query_filters_by_user(self, db_session, factories):
+        ann = factories.Annotation(userid='acct:luke@example.com')
+        factories.Annotation(userid='acct:leia@example.com')
+
+        result = export.Export(user='acct:luke@example.com').query(db_session)
+
+        assert result.all() == [ann]
+
+    def test_query_filters_by_group(self, db_session, factories):
+        ann = factories.Annotation(groupid='rebels')
+        factories.Annotation(groupid='empire')
+
+        result = export.Export(group='rebels').query(db_session)
+
+        assert result.all() == [ann]
+
+    def test_query_filters_by_uris(self, db_session, factories):
+        ann = factories.Annotation(target_uri='http://example.com/')
+        factories.Annotation(target_uri='http://example.net/')
+
+        result = export.Export(uris=['httpx://example.com']).query(db_session)
+
+        assert result.all() == [ann]
+
+    def test_query_orders_annotations_oldest_first(self, db_session, factories):
+        anns = factories.Annotation.create_batch(3, groupid='rebels')
+        for i, ann in enumerate(anns):
+            ann.created = ann.created.replace(year=2010 - i)
+        db_session.flush()
+
+        result = export.Export(group='rebels').query(db_session)
+
+        assert result.all() == list(reversed(anns))
+
+    def test_query_only_returns_readable_annotations(self, db_session, factories):
+        public = factories.Annotation(shared=True, groupid='__world__')
+        factories.Annotation(shared=True, groupid='empire')
+
+        result = export.Export(principals=['system.Everyone']).query(db_session)
+
+        assert result.all() == [public]
+
+    def test_query_does_not_check_permissions_without_principals(self,
+                                                                 db_session,
+                                                                 factories):
+        anns = [factories.Annotation(shared=False),
+                factories.Annotation(shared=True, groupid='empire')]
+
+        result = export.Export().query(db_session)
+
+        assert set(result) == set(anns)
+
+    def test_query_applies_the_given_filters(self, db_session, factories):
+        ann = factories.Annotation(groupid='rebels')
+        factories.Annotation(groupid='empire')
+
+        def rebels_only(query):
+            return query.filter_by(groupid='rebels')
+
+        result = export.Export(filters=[rebels_only]).query(db_session)
+
+        assert result.all() == [ann]
+
+    def test_batches_yields_all_annotations_in_batches(self, db_session, factories):
+        factories.Annotation.create_batch(5, groupid='rebels')
+
+        batches = list(export.Export(group='rebels').batches(db_session,
+                                                             batch_size=2))
+
+        assert [len(b) for b in batches] == [2, 2, 1]
+
+    def test_batches_loads_documents(self, db_session, factories):
+        factories.Annotation.create_batch(3, groupid='rebels')
+        expected = {a.id: a.document
+                    for a in export.Export(group='rebels').query(db_session)}
+        db_session.expire_all()
+
+        statements = []
+        listener = lambda *args: statements.append(args)
+        conn = db_session.get_bind()
+        for batch in export.Export(group='rebels').batches(db_session):
+            sqlalchemy.event.listen(conn, 'before_cursor_execute', listener)
+            documents = {a.id: a.document for a in batch}
+            sqlalchemy.event.remove(conn, 'before_cursor_execute', listener)
+
+        assert statements == []
+
+        assert {id_: d.id for id_, d in documents.items()} == {
+            id_: d.id for id_, d in expected.items()}
+
+    def test_present_returns_api_json(self, db_session, factories, links_service):
+        ann = factories.Annotation(groupid='rebels')
+        expected = presenters.AnnotationJSONPresenter(ann, links_service).asdict()
+
+        result = list(export.Export(group='rebels').present(db_session,
+                                                            links_service))
+
+        assert result == [expected]
+
+    def test_present_returns_jsonld(self, db_session, factories, links_service):
+        ann = factories.Annotation(groupid='rebels')
+        expected = presenters.AnnotationJSONLDPresenter(ann, links_service).asdict()
+
+        result = list(export.Export(group='rebels').present(
+            db_session, links_service, export.FORMAT_JSONLD))
+
+        assert result == [expected]
+
+
+class TestStream(object):
+
+    def test_it_reads_with_its_own_session(self, db_session, factories, links_service):
+        ann = factories.Annotation(groupid='rebels')
+        expected = presenters.AnnotationJSONPresenter(ann, links_service).asdict()
+
+        result = export.stream(db_session.get_bind(),
+                               export.Export(group='rebels'),
+                               links_service)
+
+        assert list(result) == [expected]
+
+    def test_it_closes_the_session_when_closed(self, db_session, factories,
+                                               links_service, Session):
+        factories.Annotation(groupid='rebels')
+
+        result = export.stream(db_session.get_bind(),
+                               export.Export(group='rebels'),
+                               links_service)
+        next(result)
+        result.close()
+
+        Session.return_value.close.assert_called_once_with()
+
+    @pytest.fixture
+    def Session(self, patch, db_session):
+        Session = patch('memex.export.Session')
+        Session.return_value = mock.Mock(wraps=db_session)
+        return Session
+
+
+class TestGetFilters(object):
+
+    def test_it_returns_the_registered_filters_for_the_request(self,
+                                                               pyramid_config,
+                                                               pyramid_request):
+        pyramid_config.include('memex.export')
+        factory = mock.Mock()
+        pyramid_config.add_export_filter(factory)
+
+        filters = export.get_filters(pyramid_request)
+
+        factory.assert_called_once_with(pyramid_request)
+        assert filters == [factory.return_value]
+
+    def test_it_returns_no_filters_if_none_are_registered(self,
+                                                          pyramid_request):
+        assert export.get_filters(pyramid_request) == []
+
+
+@pytest.fixture
+def links_service(pyramid_config):
+    service = mock.Mock(spec_set=['compile', 'get', 'get_all'])
+    service.compile.return_value = service
+    service.get.return_value = 'http://example.com/link'
+    service.get_all.return_value = {}
+    return service
@@ -5,6 +5,7 @@ from __future__ import unicode_literals
 import mock
 import pytest
 
+from memex import links
 from memex.links import LinksService
 from memex.links import add_annotation_link_generator
 from memex.links import links_factory
@@ -63,6 +64,79 @@ class TestLinksService(object):
         assert 'returnsnone' not in result
 
 
+class TestLinksServiceCompile(object):
+    def test_get_returns_same_links_as_service(self, registry):
+        annotation = mock.Mock(id='abc123')
+        svc = LinksService(base_url='http://example.com', registry=registry)
+
+        compiled = svc.compile()
+
+        for name in ['giraffe', 'kiwi', 'namedroute', 'paramroute', 'idroute']:
+            assert compiled.get(annotation, name) == svc.get(annotation, name)
+
+    def test_get_all_returns_same_links_as_service(self, registry):
+        annotation = mock.Mock(id='abc123')
+        svc = LinksService(base_url='http://example.com', registry=registry)
+
+        assert svc.compile().get_all(annotation) == svc.get_all(annotation)
+
+    def test_it_compiles_generators_once(self, registry):
+        compile_ = mock.Mock(return_value=lambda a: 'http://compiled.com')
+        generator = mock.Mock(spec_set=['__call__', 'compile'], compile=compile_)
+        add_annotation_link_generator(registry, 'compiled', generator)
+        svc = LinksService(base_url='http://example.com', registry=registry)
+
+        compiled = svc.compile()
+        compiled.get_all(mock.sentinel.annotation)
+        compiled.get_all(mock.sentinel.annotation)
+
+        assert compile_.call_count == 1
+        assert not generator.called
+        assert compiled.get_all(mock.sentinel.annotation)['compiled'] == 'http://compiled.com'
+
+
+class TestRouteLink(object):
+    def test_it_generates_route_url(self, pyramid_request, registry):
+        generator = links.route_link('param.route')
+
+        link = generator(pyramid_request, mock.Mock(id='abc123'))
+
+        assert link == 'http://example.com/annotations/abc123'
+
+    @pytest.mark.parametrize('id_', [
+        'abc123',
+        'AbC-_09zZ',
+        'with space',
+        'with/slash',
+        'ünicode',
+        '',
+    ])
+    def test_compiled_matches_uncompiled(self, pyramid_request, registry, id_):
+        generator = links.route_link('param.route')
+        annotation = mock.Mock(id=id_)
+
+        compiled = generator.compile(pyramid_request)
+
+        assert compiled(annotation) == generator(pyramid_request, annotation)
+
+
+class TestCompileLinkTemplate(object):
+    def test_it_substitutes_the_id(self):
+        template = links.compile_link_template('http://example.com/a/' +
+                                               links.ID_PLACEHOLDER + '/b')
+
+        assert template('abc') == 'http://example.com/a/abc/b'
+
+    def test_it_returns_none_for_ids_needing_escaping(self):
+        template = links.compile_link_template('http://example.com/a/' +
+                                               links.ID_PLACEHOLDER)
+
+        assert template('a b') is None
+
+    def test_it_returns_none_without_a_placeholder(self):
+        assert links.compile_link_template('http://example.com/') is None
+
+
 class TestLinksFactory(object):
     def test_returns_links_service(self, pyramid_request):
         svc = links_factory(None, pyramid_request)
@@ -114,5 +188,9 @@ def registry(pyramid_config):
                                   'paramroute',
                                   lambda r, a: r.route_url('param.route', id=a.id),
                                   hidden=True)
+    add_annotation_link_generator(registry,
+                                  'idroute',
+                                  links.route_link('param.route'),
+                                  hidden=True)
 
     return registry
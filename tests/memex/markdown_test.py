@@ -76,6 +76,30 @@ class TestSanitize(object):
     def test_it_escapes_evil_html(self, text, expected):
         assert markdown.sanitize(text) == expected
 
+    @pytest.mark.parametrize("url", [
+        "javascript:alert('evil')",
+        'JavaScript:alert(1)',
+        'data:text/html;base64,PHNjcmlwdD5ldmlsKCk8L3NjcmlwdD4=',
+        'DATA:text/html,<script>evil()</script>',
+    ])
+    def test_it_strips_links_with_disallowed_protocols(self, url):
+        text = '<a href="{}">foobar</a> <img src="{}">'.format(url, url)
+
+        assert markdown.sanitize(text) == '<a>foobar</a> <img>'
+
+    @pytest.mark.parametrize("text,expected", [
+        ('<div>foobar</div>', '&lt;div&gt;foobar&lt;/div&gt;'),
+        ('<div>foobar', '&lt;div&gt;foobar'),
+        ('<p>foo<table>bar</p>', '<p>foo&lt;table&gt;bar</p>'),
+    ])
+    def test_it_escapes_disallowed_tags_as_written(self, text, expected):
+        assert markdown.sanitize(text) == expected
+
+    def test_it_sanitizes_linkified_text(self):
+        actual = markdown.sanitize('<p>http://example.org/<script>evil()</script></p>')
+        assert '<script>' not in actual
+        assert 'href="http://example.org/"' in actual
+
     def test_it_adds_target_blank_and_rel_nofollow_to_links(self):
         actual = markdown.sanitize('<a href="https://example.org">Hello</a>')
         expected = '<a href="https://example.org" rel="nofollow noopener" target="_blank">Hello</a>'
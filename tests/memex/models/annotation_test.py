@@ -90,6 +90,24 @@ def test_text_setter_renders_markdown(markdown):
     annotation.text_rendered == markdown.render.return_value
 
 
+def test_text_setter_does_not_rerender_unchanged_text(markdown):
+    annotation = Annotation(text='foobar')
+    markdown.render.reset_mock()
+
+    annotation.text = 'foobar'
+
+    assert not markdown.render.called
+
+
+def test_text_setter_renders_changed_text(markdown):
+    annotation = Annotation(text='foobar')
+    markdown.render.reset_mock()
+
+    annotation.text = 'bazqux'
+
+    markdown.render.assert_called_once_with('bazqux')
+
+
 def test_acl_private():
     ann = Annotation(shared=False, userid='saoirse')
     actual = ann.__acl__()
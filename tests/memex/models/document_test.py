@@ -289,6 +289,30 @@ class TestCreateOrUpdateDocumentURI(object):
         assert document_uri.created > created
         assert document_uri.updated > updated
 
+    def test_it_records_the_changed_equivalence_class(self, db_session):
+        document_ = document.Document()
+        db_session.add(document.DocumentURI(
+            claimant='http://example.com/claimant',
+            uri='http://example.com/claimant',
+            type='self-claim',
+            document=document_))
+
+        document.create_or_update_document_uri(
+            session=db_session,
+            claimant='http://example.com/claimant',
+            uri='http://example.org/alternate',
+            type='rel-alternate',
+            content_type='',
+            document=document_,
+            created=now(),
+            updated=now(),
+        )
+
+        assert db_session.info[document.CHANGED_URIS_KEY] == {
+            'httpx://example.com/claimant',
+            'httpx://example.org/alternate',
+        }
+
     def test_it_denormalizes_http_uri_to_document_when_none(self, db_session):
         uri = 'http://example.com/example_uri.html'
 
@@ -620,6 +644,13 @@ class TestMergeDocuments(object):
         assert len(master.meta) == 2
         assert len(duplicate.meta) == 0
 
+    def test_merge_documents_records_the_changed_equivalence_class(self, db_session, merge_data):
+        document.merge_documents(db_session, merge_data)
+
+        assert db_session.info[document.CHANGED_URIS_KEY] == {
+            'httpx://en.wikipedia.org/wiki/Main_Page',
+        }
+
     def test_raises_retryable_error_when_flush_fails(self, db_session, merge_data, monkeypatch):
         def err():
             raise sa.exc.IntegrityError(None, None, None)
@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import datetime
+
+import mock
+import pytest
+
+from memex import presentation
+from memex.presentation import PresentationCache
+from memex.presenters import AnnotationJSONPresenter
+
+
+class TestPresentationCache(object):
+
+    def test_present_returns_the_presentation(self, cache, factories):
+        annotation = factories.Annotation()
+
+        result = cache.present(annotation, 'variant', present)
+
+        assert result == {'id': annotation.id}
+
+    def test_present_reuses_earlier_presentations(self, cache, factories):
+        annotation = factories.Annotation()
+        present_ = mock.Mock(return_value={})
+
+        first = cache.present(annotation, 'variant', present_)
+        second = cache.present(annotation, 'variant', present_)
+
+        assert present_.call_count == 1
+        assert first is second
+
+    def test_present_presents_again_when_the_annotation_is_updated(self, cache,
+                                                                   factories):
+        annotation = factories.Annotation(text='old')
+        cache.present(annotation, 'variant', present_text)
+
+        annotation.text = 'new'
+        annotation.updated = annotation.updated + datetime.timedelta(seconds=1)
+
+        assert cache.present(annotation, 'variant', present_text) == 'new'
+
+    def test_present_presents_again_when_the_document_is_updated(self, cache,
+                                                                 factories):
+        annotation = factories.Annotation()
+        document = annotation.document
+        cache.present(annotation, 'variant', present_title)
+
+        document.title = 'New title'
+        document.updated = document.updated + datetime.timedelta(seconds=1)
+
+        assert cache.present(annotation, 'variant', present_title) == 'New title'
+
+    def test_present_keeps_variants_apart(self, cache, factories):
+        annotation = factories.Annotation()
+        cache.present(annotation, 'one', lambda a: 'one')
+
+        assert cache.present(annotation, 'two', lambda a: 'two') == 'two'
+
+    def test_present_does_not_cache_unsaved_annotations(self, cache, factories):
+        annotation = factories.Annotation.build(id=None)
+        present_ = mock.Mock(return_value={})
+
+        cache.present(annotation, 'variant', present_)
+        cache.present(annotation, 'variant', present_)
+
+        assert present_.call_count == 2
+
+    def test_present_json_presents_as_the_JSON_presenter(self, cache, factories,
+                                                         links_service):
+        annotations = factories.Annotation.create_batch(2)
+
+        result = cache.present_json(annotations, links_service)
+
+        assert result == [AnnotationJSONPresenter(a, links_service).asdict()
+                          for a in annotations]
+
+    def test_present_json_only_compiles_links_for_misses(self, cache, factories,
+                                                         links_service):
+        annotations = factories.Annotation.create_batch(2)
+        cache.present_json(annotations, links_service)
+        links_service.compile.reset_mock()
+
+        cache.present_json(annotations, links_service)
+
+        assert not links_service.compile.called
+
+    def test_present_json_keys_by_base_url(self, cache, factories,
+                                           links_service):
+        annotation = factories.Annotation()
+        cache.present_json([annotation], links_service)
+        links_service.base_url = 'https://example.org'
+        links_service.compile.reset_mock()
+
+        cache.present_json([annotation], links_service)
+
+        assert links_service.compile.called
+
+    def test_present_json_reports_hits_and_misses(self, cache, factories,
+                                                  links_service):
+        annotations = factories.Annotation.create_batch(3)
+        cache.present_json(annotations[:1], links_service)
+        stats = mock.Mock(spec_set=['incr'])
+
+        cache.present_json(annotations, links_service, stats=stats)
+
+        stats.incr.assert_has_calls([
+            mock.call('memex.presentation_cache.hits', 1),
+            mock.call('memex.presentation_cache.misses', 2),
+        ])
+
+    def test_stats(self, cache, factories):
+        annotation = factories.Annotation()
+        cache.present(annotation, 'variant', present)
+        cache.present(annotation, 'variant', present)
+
+        assert cache.stats == {'hits': 1, 'misses': 1, 'lookups': 2,
+                               'evictions': 0}
+
+    def test_it_evicts_the_least_recently_used_presentations(self, factories):
+        cache = PresentationCache(cache_size=1)
+        annotations = factories.Annotation.create_batch(2)
+
+        for annotation in annotations:
+            cache.present(annotation, 'variant', present)
+
+        assert cache.stats['evictions'] == 1
+
+    def test_clear(self, cache, factories):
+        annotation = factories.Annotation()
+        present_ = mock.Mock(return_value={})
+        cache.present(annotation, 'variant', present_)
+
+        cache.clear()
+        cache.present(annotation, 'variant', present_)
+
+        assert present_.call_count == 2
+
+    @pytest.fixture
+    def cache(self):
+        return PresentationCache()
+
+
+class TestPresentJSON(object):
+
+    def test_it_uses_the_cache(self, factories, links_service,
+                               pyramid_config):
+        cache = mock.Mock(spec_set=['present_json'])
+        pyramid_config.registry[presentation.CACHE_KEY] = cache
+        annotations = [factories.Annotation()]
+
+        result = presentation.present_json(pyramid_config.registry,
+                                           annotations,
+                                           links_service,
+                                           stats=mock.sentinel.stats)
+
+        cache.present_json.assert_called_once_with(annotations, links_service,
+                                                   stats=mock.sentinel.stats)
+        assert result == cache.present_json.return_value
+
+    def test_it_presents_without_a_cache(self, factories, links_service,
+                                         pyramid_config):
+        annotations = factories.Annotation.create_batch(2)
+
+        result = presentation.present_json(pyramid_config.registry,
+                                           annotations,
+                                           links_service)
+
+        assert result == [AnnotationJSONPresenter(a, links_service).asdict()
+                          for a in annotations]
+
+
+class TestIncludeMe(object):
+
+    def test_it_registers_the_cache(self, pyramid_config):
+        pyramid_config.registry.settings['memex.presentation_cache.size'] = '5'
+
+        presentation.includeme(pyramid_config)
+
+        cache = presentation.get_cache(pyramid_config.registry)
+        assert isinstance(cache, PresentationCache)
+
+    def test_it_can_be_disabled(self, pyramid_config):
+        pyramid_config.registry.settings['memex.presentation_cache'] = 'false'
+
+        presentation.includeme(pyramid_config)
+
+        assert presentation.get_cache(pyramid_config.registry) is None
+
+
+def present(annotation):
+    return {'id': annotation.id}
+
+
+def present_text(annotation):
+    return annotation.text
+
+
+def present_title(annotation):
+    return annotation.document.title
+
+
+@pytest.fixture
+def links_service():
+    service = mock.Mock(spec_set=['base_url', 'get', 'get_all', 'compile'])
+    service.base_url = 'http://example.com'
+    service.get_all.return_value = {}
+    # Compiled links behave just like the service itself.
+    service.compile.return_value = service
+    return service
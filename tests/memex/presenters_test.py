@@ -7,6 +7,7 @@ import pytest
 
 from memex import models
 from memex.presenters import AnnotationBasePresenter
+from memex.presenters import AnnotationJSONBatchPresenter
 from memex.presenters import AnnotationJSONPresenter
 from memex.presenters import AnnotationSearchIndexPresenter
 from memex.presenters import AnnotationJSONLDPresenter
@@ -186,6 +187,121 @@ class TestAnnotationJSONPresenter(object):
         return patch('memex.presenters.DocumentJSONPresenter.asdict')
 
 
+class TestAnnotationJSONBatchPresenter(object):
+    def test_aslist_matches_presenting_each_annotation(self, factories, fake_links_service):
+        annotations = [factories.Annotation(), factories.Annotation(shared=False)]
+
+        result = AnnotationJSONBatchPresenter(annotations,
+                                              fake_links_service).aslist()
+
+        assert result == [AnnotationJSONPresenter(a, fake_links_service).asdict()
+                          for a in annotations]
+
+    def test_aslist_compiles_links_once(self, factories):
+        links_service = mock.Mock(spec_set=['compile'])
+        annotations = [factories.Annotation(), factories.Annotation()]
+
+        result = AnnotationJSONBatchPresenter(annotations,
+                                              links_service).aslist()
+
+        links_service.compile.assert_called_once_with()
+        compiled = links_service.compile.return_value
+        assert [r['links'] for r in result] == [compiled.get_all.return_value] * 2
+
+
+    def test_aslist_presents_only_the_requested_fields(self, factories,
+                                                       fake_links_service):
+        annotations = [factories.Annotation(), factories.Annotation()]
+
+        result = AnnotationJSONBatchPresenter(annotations, fake_links_service,
+                                              fields=['text']).aslist()
+
+        assert result == [{'id': a.id, 'text': a.text} for a in annotations]
+
+    def test_aslist_does_not_compile_links_unless_requested(self, factories):
+        links_service = mock.Mock(spec_set=['compile'])
+
+        AnnotationJSONBatchPresenter([factories.Annotation()], links_service,
+                                     fields=['text']).aslist()
+
+        assert not links_service.compile.called
+
+
+class TestAnnotationJSONPresenterFields(object):
+
+    @pytest.mark.parametrize('fields', [
+        ['id'],
+        ['created', 'updated', 'user'],
+        ['uri', 'text', 'tags', 'group'],
+        ['permissions', 'target', 'document', 'links'],
+        ['references', 'extra-1'],
+    ])
+    def test_it_presents_the_same_values_as_the_full_format(self, annotation,
+                                                           fake_links_service,
+                                                           fields):
+        full = AnnotationJSONPresenter(annotation, fake_links_service).asdict()
+
+        result = AnnotationJSONPresenter(annotation, fake_links_service,
+                                         fields=fields).asdict()
+
+        assert result == {k: full[k] for k in ['id'] + fields}
+
+    def test_it_omits_empty_references(self, annotation, fake_links_service):
+        annotation.references = []
+
+        result = AnnotationJSONPresenter(annotation, fake_links_service,
+                                         fields=['references']).asdict()
+
+        assert result == {'id': annotation.id}
+
+    def test_it_omits_missing_extra_fields(self, annotation, fake_links_service):
+        result = AnnotationJSONPresenter(annotation, fake_links_service,
+                                         fields=['nonexistent']).asdict()
+
+        assert result == {'id': annotation.id}
+
+    def test_it_does_not_present_unrequested_fields(self, annotation,
+                                                    fake_links_service):
+        AnnotationJSONPresenter(annotation, fake_links_service,
+                                fields=['text']).asdict()
+
+        assert fake_links_service.last_annotation is None
+
+    @pytest.mark.parametrize('fields,expected', [
+        (['text'], {'id', '_text'}),
+        (['permissions'], {'id', 'userid', 'shared', 'groupid'}),
+        (['target', 'foo'], {'id', '_target_uri', 'target_selectors', 'extra'}),
+    ])
+    def test_attributes(self, fields, expected):
+        assert AnnotationJSONPresenter.attributes(fields) == expected
+
+    @pytest.mark.parametrize('fields,expected', [
+        (None, True),
+        (['document'], True),
+        (['links'], True),
+        (['id', 'text', 'target'], False),
+    ])
+    def test_needs_document(self, fields, expected):
+        assert AnnotationJSONPresenter.needs_document(fields) == expected
+
+    @pytest.fixture
+    def annotation(self):
+        return mock.Mock(
+            id='the-id',
+            created=datetime.datetime(2016, 2, 24, 18, 3, 25, 768),
+            updated=datetime.datetime(2016, 2, 29, 10, 24, 5, 564),
+            userid='acct:luke@hypothes.is',
+            target_uri='http://example.com',
+            text='It is magical!',
+            tags=['magic'],
+            groupid='__world__',
+            shared=True,
+            target_selectors=[{'TestSelector': 'foobar'}],
+            references=['referenced-id-1', 'referenced-id-2'],
+            extra={'extra-1': 'foo', 'extra-2': 'bar'},
+            document=None)
+
+
 @pytest.mark.usefixtures('DocumentSearchIndexPresenter')
 class TestAnnotationSearchIndexPresenter(object):
 
@@ -404,6 +520,16 @@ def test_utc_iso8601():
     assert utc_iso8601(t) == '2016-02-24T18:03:25.007685+00:00'
 
 
+@pytest.mark.parametrize('t', [
+    datetime.datetime(2016, 2, 24, 18, 3, 25, 7685),
+    datetime.datetime(2016, 2, 24),
+    datetime.datetime(1999, 12, 31, 23, 59, 59, 999999),
+    datetime.datetime(1900, 1, 1, 0, 0, 0, 1),
+])
+def test_utc_iso8601_matches_strftime(t):
+    assert utc_iso8601(t) == t.strftime('%Y-%m-%dT%H:%M:%S.%f+00:00')
+
+
 def test_utc_iso8601_ignores_timezone():
     t = datetime.datetime(2016, 2, 24, 18, 03, 25, 7685, Berlin())
     assert utc_iso8601(t) == '2016-02-24T18:03:25.007685+00:00'
@@ -449,6 +575,9 @@ class FakeLinksService(object):
         self.last_annotation = annotation
         return {'giraffe': 'http://giraffe.com', 'toad': 'http://toad.net'}
 
+    def compile(self):
+        return self
+
 
 @pytest.fixture
 def fake_links_service():
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import json
+
+import mock
+import pytest
+
+from memex import renderers
+
+
+class TestStreamingJSON(object):
+
+    @pytest.mark.parametrize('value', [
+        [],
+        [{'id': 'a', 'text': 'ünïcode'}, {'id': 'b'}],
+        ('a', 'b'),
+        {'total': 2, 'rows': [1, 2], 'replies': []},
+        {'status': 'okay'},
+        'just a string',
+        None,
+    ])
+    def test_output_matches_json_dumps(self, pyramid_request, value):
+        body = render(pyramid_request, value)
+
+        assert body == json.dumps(value).encode('utf-8')
+
+    def test_it_encodes_generators_as_arrays(self, pyramid_request):
+        body = render(pyramid_request, (i for i in range(3)))
+
+        assert json.loads(body) == [0, 1, 2]
+
+    def test_it_encodes_generators_inside_a_dict(self, pyramid_request):
+        body = render(pyramid_request, {'rows': (i for i in range(3))})
+
+        assert json.loads(body) == {'rows': [0, 1, 2]}
+
+    def test_it_sends_the_first_row_without_waiting(self, pyramid_request):
+        chunks = list(call_renderer(pyramid_request, ['a', 'b', 'c']))
+
+        assert chunks[0] == b'["a"'
+        assert b''.join(chunks) == b'["a", "b", "c"]'
+
+    def test_it_splits_large_output_into_chunks(self, pyramid_request):
+        rows = ['x' * 1024 for _ in range(100)]
+
+        chunks = list(call_renderer(pyramid_request, rows))
+
+        assert len(chunks) > 2
+        assert all(len(c) < renderers.CHUNK_SIZE + 2048 for c in chunks)
+        assert json.loads(b''.join(chunks)) == rows
+
+    def test_it_sets_the_json_content_type(self, pyramid_request):
+        render(pyramid_request, [])
+
+        assert pyramid_request.response.content_type == 'application/json'
+        assert pyramid_request.response.charset == 'UTF-8'
+
+    def test_it_renders_ndjson_if_the_client_prefers_it(self, pyramid_request):
+        pyramid_request.headers['Accept'] = 'application/x-ndjson'
+
+        body = render(pyramid_request, [{'id': 'a'}, {'id': 'b'}])
+
+        assert body == b'{"id": "a"}\n{"id": "b"}\n'
+        assert pyramid_request.response.content_type == 'application/x-ndjson'
+
+    def test_it_renders_non_list_values_as_one_ndjson_line(self, pyramid_request):
+        pyramid_request.headers['Accept'] = 'application/x-ndjson'
+
+        body = render(pyramid_request, {'status': 'failure'})
+
+        assert body == b'{"status": "failure"}\n'
+
+    def test_it_does_not_override_a_content_type_set_by_the_view(self, pyramid_request):
+        pyramid_request.response.content_type = 'application/ld+json'
+
+        render(pyramid_request, [])
+
+        assert pyramid_request.response.content_type == 'application/ld+json'
+
+    def test_it_uses_the_configured_encoder(self, pyramid_request):
+        encoder = mock.Mock(return_value='"encoded"')
+        pyramid_request.registry[renderers.ENCODER_KEY] = encoder
+
+        body = render(pyramid_request, [1, 2])
+
+        assert body == b'["encoded", "encoded"]'
+        assert encoder.call_args_list == [mock.call(1), mock.call(2)]
+
+
+class TestWantsNDJSON(object):
+
+    @pytest.mark.parametrize('accept,expected', [
+        (None, False),
+        ('*/*', False),
+        ('application/json', False),
+        ('application/x-ndjson', True),
+        ('application/json;q=0.5, application/x-ndjson', True),
+    ])
+    def test_it(self, pyramid_request, accept, expected):
+        if accept is not None:
+            pyramid_request.headers['Accept'] = accept
+
+        assert renderers.wants_ndjson(pyramid_request) == expected
+
+
+def test_includeme_resolves_the_configured_encoder(pyramid_config):
+    pyramid_config.registry.settings['memex.json_encoder'] = 'json.dumps'
+
+    pyramid_config.include('memex.renderers')
+
+    assert pyramid_config.registry[renderers.ENCODER_KEY] is json.dumps
+
+
+def call_renderer(request, value):
+    renderer = renderers.StreamingJSON(info=None)
+    return renderer(value, {'request': request})
+
+
+def render(request, value):
+    return b''.join(call_renderer(request, value))
@@ -43,6 +43,40 @@ class TestSearch(object):
 
         assert result == core.SearchResult(total, annotation_ids, reply_ids, aggregations)
 
+    def test_run_coalesces_identical_searches(self, pyramid_request, coalescer):
+        search = core.Search(pyramid_request)
+        search.builder = mock.Mock()
+        search.builder.build.return_value = {'query': 'body'}
+        coalescer.do.return_value = (mock.sentinel.result, False)
+
+        result = search.run({})
+
+        assert result == mock.sentinel.result
+        key = coalescer.do.call_args[0][0]
+        assert key == ('{"query": "body"}', False,
+                       tuple(sorted(pyramid_request.effective_principals)))
+
+    def test_run_coalesced_search_searches_annotations_and_replies(
+            self, pyramid_request, coalescer, search_replies):
+        pyramid_request.es.conn.search.return_value = {
+            'hits': {'total': 1, 'hits': [{'_id': 'id-1'}]}}
+        search_replies.return_value = ['reply-1']
+        search = core.Search(pyramid_request)
+
+        search.run({})
+        _, fn = coalescer.do.call_args[0]
+
+        assert fn() == core.SearchResult(1, ['id-1'], ['reply-1'], {})
+
+    def test_run_counts_coalesced_searches(self, pyramid_request, coalescer):
+        pyramid_request.stats = mock.Mock()
+        coalescer.do.return_value = (mock.sentinel.result, True)
+
+        core.Search(pyramid_request).run({})
+
+        pyramid_request.stats.incr.assert_called_once_with(
+            'memex.search.coalesced')
+
     def test_search_annotations_includes_replies_by_default(self, pyramid_request, query):
         search = core.Search(pyramid_request)
         search.search_annotations({})
@@ -177,6 +211,14 @@ class TestSearch(object):
 
         search.builder.append_aggregation.assert_called_once_with(aggregation)
 
+    @pytest.fixture
+    def coalescer(self, pyramid_request):
+        coalescer = mock.Mock(spec_set=['do'])
+        coalescer.do.return_value = (mock.sentinel.result, False)
+        pyramid_request.registry[core.COALESCER_KEY] = coalescer
+        yield coalescer
+        del pyramid_request.registry[core.COALESCER_KEY]
+
     @pytest.fixture
     def search_annotations(self, patch):
         return patch('memex.search.core.Search.search_annotations')
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""
+The parser replaced one built with pyparsing, and must parse every query
+exactly as it did. These tests compare the two parsers, and are skipped if
+pyparsing isn't installed.
+"""
+
+from __future__ import unicode_literals
+
+from collections import namedtuple
+
+import pytest
+from hypothesis import strategies as st
+from hypothesis import given
+from webob.multidict import MultiDict
+
+from memex.search import parser
+
+pp = pytest.importorskip('pyparsing')
+Match = namedtuple('Match', ['key', 'value'])
+
+
+def _make_reference_parser():
+    def decorate_match(key):
+        return lambda t: Match(key, t[0])
+
+    value = pp.MatchFirst([
+        pp.dblQuotedString.copy().setParseAction(pp.removeQuotes),
+        pp.sglQuotedString.copy().setParseAction(pp.removeQuotes),
+        pp.Empty() + pp.CharsNotIn(''.join(parser.whitespace)),
+    ])
+
+    expressions = []
+    for field in parser.named_fields:
+        exp = pp.Suppress(pp.CaselessLiteral(field) + ':') + \
+            value.copy().setParseAction(decorate_match(field))
+        expressions.append(exp)
+    expressions.append(value.copy().setParseAction(decorate_match('any')))
+
+    return pp.ZeroOrMore(pp.MatchFirst(expressions))
+
+
+reference_parser = _make_reference_parser()
+
+
+def reference_parse(q):
+    results = reference_parser.parseString(q)
+    return MultiDict([m for m in results if isinstance(m, Match)])
+
+
+query_pieces = st.one_of(
+    st.sampled_from(parser.named_fields + ['USER', 'Tag', 'bogus']),
+    st.sampled_from([':', '"', "'", '""', "''", '\\', '\\"', '\\x4f']),
+    st.sampled_from(sorted(parser.whitespace)),
+    st.text(alphabet='ab:\'"\\ ', max_size=5),
+    st.text(max_size=5),
+)
+
+
+@given(st.lists(query_pieces, max_size=12).map(''.join))
+@pytest.mark.fuzz
+def test_parse_matches_the_reference_parser(text):
+    assert parser.parse(text) == reference_parse(text)
+
+
+@given(st.text())
+@pytest.mark.fuzz
+def test_parse_matches_the_reference_parser_on_any_text(text):
+    assert parser.parse(text) == reference_parse(text)
+
+
+@pytest.mark.parametrize("query", [
+    'user : luke',
+    'user:\u00a0luke',
+    'foo\u00a0bar baz',
+    'tag:"a\tb" c\td',
+    "tag:'it''s' \"say \\\"hi\\\"\"",
+    'uſer:luke',
+    'user:',
+    '  \n tag:foo\r\n',
+])
+def test_parse_matches_the_reference_parser_on_edge_cases(query):
+    assert parser.parse(query) == reference_parse(query)
@@ -113,6 +113,13 @@ def test_parse_with_any_nonwhitespace_text(kw, value):
     assert result.get(kw) == value
 
 
+def test_parse_returns_a_new_multidict_each_time():
+    result = parser.parse('tag:foo')
+    result.add('tag', 'bar')
+
+    assert parser.parse('tag:foo') == MultiDict([('tag', 'foo')])
+
+
 @pytest.mark.parametrize("query", [
     # Plain dictionary
     {'user': 'luke'},
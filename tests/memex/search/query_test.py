@@ -289,7 +289,6 @@ class TestGroupFilter(object):
 
 
 class TestUriFilter(object):
-    @pytest.mark.usefixtures('uri')
     def test_inactive_when_no_uri_param(self):
         """
         When there's no `uri` parameter, return None.
@@ -299,69 +298,64 @@ class TestUriFilter(object):
 
         assert urifilter({"foo": "bar"}) is None
 
-    def test_expands_and_normalizes_into_terms_filter(self, storage):
+    def test_expands_into_terms_filter(self, pyramid_request, resolver):
         """
         Uses a `terms` filter against target.scope to filter for URI.
 
         UriFilter should use a `terms` filter against the normalized version of the
         target source field, which we store in `target.scope`.
 
-        It should expand the input URI before searching, and normalize the results
-        of the expansion.
+        It should expand the input URI before searching, using the normalized
+        URIs returned by the equivalence resolver.
         """
-        request = mock.Mock()
-        storage.expand_uri.side_effect = lambda _, x: [
-            "http://giraffes.com/",
-            "https://elephants.com/",
-        ]
+        resolver.expand_normalized.side_effect = lambda _, x: {
+            "httpx://giraffes.com",
+            "httpx://elephants.com",
+        }
 
-        urifilter = query.UriFilter(request)
+        urifilter = query.UriFilter(pyramid_request)
 
         result = urifilter({"uri": "http://example.com/"})
         query_uris = result["terms"]["target.scope"]
 
-        storage.expand_uri.assert_called_with(request.db, "http://example.com/")
+        resolver.expand_normalized.assert_called_with(pyramid_request.db,
+                                                      "http://example.com/")
         assert sorted(query_uris) == sorted(["httpx://giraffes.com",
                                              "httpx://elephants.com"])
 
-    def test_queries_multiple_uris(self, storage):
+    def test_queries_multiple_uris(self, pyramid_request, resolver):
         """
         Uses a `terms` filter against target.scope to filter for URI.
 
         When multiple "uri" fields are supplied, the normalized URIs of all of
         them should be collected into a set and sent in the query.
         """
-        request = mock.Mock()
         params = multidict.MultiDict()
         params.add("uri", "http://example.com")
         params.add("uri", "http://example.net")
-        storage.expand_uri.side_effect = [
-            ["http://giraffes.com/", "https://elephants.com/"],
-            ["http://tigers.com/", "https://elephants.com/"],
+        resolver.expand_normalized.side_effect = [
+            {"httpx://giraffes.com", "httpx://elephants.com"},
+            {"httpx://tigers.com", "httpx://elephants.com"},
         ]
 
-        urifilter = query.UriFilter(request)
+        urifilter = query.UriFilter(pyramid_request)
 
         result = urifilter(params)
         query_uris = result["terms"]["target.scope"]
 
-        storage.expand_uri.assert_any_call(request.db, "http://example.com")
-        storage.expand_uri.assert_any_call(request.db, "http://example.net")
+        resolver.expand_normalized.assert_any_call(pyramid_request.db,
+                                                   "http://example.com")
+        resolver.expand_normalized.assert_any_call(pyramid_request.db,
+                                                   "http://example.net")
         assert sorted(query_uris) == sorted(["httpx://giraffes.com",
                                              "httpx://elephants.com",
                                              "httpx://tigers.com"])
 
     @pytest.fixture
-    def storage(self, patch):
-        storage = patch('memex.search.query.storage')
-        storage.expand_uri.side_effect = lambda x: [x]
-        return storage
-
-    @pytest.fixture
-    def uri(self, patch):
-        uri = patch('memex.search.query.uri')
-        uri.normalize.side_effect = lambda x: x
-        return uri
+    def resolver(self, pyramid_config):
+        resolver = mock.Mock(spec_set=['expand', 'expand_normalized'])
+        pyramid_config.register_service(resolver, name='uri_equivalence')
+        return resolver
 
 
 class TestUserFilter(object):
@@ -0,0 +1,360 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import mock
+import pytest
+
+from memex import sidebar
+from memex.sidebar import SidebarCache
+from memex.sidebar import SidebarKey
+
+
+class TestSidebarCacheKey(object):
+
+    def test_it_returns_a_key_for_sidebar_requests(self, cache, pyramid_request,
+                                                   uri_equivalence):
+        params = {'uri': 'http://example.com/', '_separate_replies': 'true',
+                  'limit': '200', 'sort': 'created', 'order': 'asc'}
+
+        key = cache.key(pyramid_request, params)
+
+        assert key == SidebarKey(uris=frozenset(['httpx://example.com',
+                                                 'httpx://example.org']),
+                                 limit=200,
+                                 sort='created',
+                                 order='asc')
+        uri_equivalence.expand_normalized.assert_called_once_with(
+            pyramid_request.db, 'http://example.com/')
+
+    def test_it_uses_the_default_limit_and_order(self, cache, pyramid_request):
+        key = cache.key(pyramid_request, {'uri': 'http://example.com/',
+                                          '_separate_replies': 'true'})
+
+        assert (key.limit, key.sort, key.order) == (20, 'updated', 'desc')
+
+    @pytest.mark.parametrize('params', [
+        {'uri': 'http://example.com/'},
+        {'uri': 'http://example.com/', '_separate_replies': ''},
+        {'uri': 'http://example.com/', '_separate_replies': 'true',
+         'offset': '200'},
+        {'uri': 'http://example.com/', '_separate_replies': 'true',
+         'user': 'luke'},
+        {'uri': 'http://example.com/', '_separate_replies': 'true',
+         'fields': 'id'},
+        {'uri': 'http://example.com/', '_separate_replies': 'true',
+         'sort': 'id'},
+        {'_separate_replies': 'true'},
+    ])
+    def test_it_returns_None_for_other_searches(self, cache, params,
+                                                pyramid_request):
+        assert cache.key(pyramid_request, params) is None
+
+    def test_it_returns_None_for_multiple_uris(self, cache, pyramid_request):
+        params = mock.Mock()
+        params.items.return_value = [('uri', 'http://example.com/'),
+                                     ('uri', 'http://example.org/'),
+                                     ('_separate_replies', 'true')]
+
+        assert cache.key(pyramid_request, params) is None
+
+    def test_it_returns_None_for_logged_in_users(self, cache, pyramid_config,
+                                                 pyramid_request):
+        pyramid_config.testing_securitypolicy('acct:luke@example.com')
+
+        key = cache.key(pyramid_request, {'uri': 'http://example.com/',
+                                          '_separate_replies': 'true'})
+
+        assert key is None
+
+    @pytest.fixture
+    def uri_equivalence(self, pyramid_config):
+        service = mock.Mock(spec_set=['expand_normalized'])
+        service.expand_normalized.return_value = {'httpx://example.com',
+                                                  'httpx://example.org'}
+        pyramid_config.register_service(service, name='uri_equivalence')
+        return service
+
+    @pytest.fixture(autouse=True)
+    def _uri_equivalence(self, uri_equivalence):
+        return uri_equivalence
+
+
+class TestSidebarCache(object):
+
+    def test_get_returns_what_was_put(self, cache):
+        cache.put(KEY, payload())
+
+        assert cache.get(KEY) == payload()
+
+    def test_get_returns_None_for_unknown_keys(self, cache):
+        assert cache.get(KEY) is None
+
+    def test_annotation_changed_inserts_new_annotations_in_order(self, cache):
+        cache.put(KEY, payload(total=2, rows=[row('b', 3), row('c', 1)]))
+
+        cache.annotation_changed(URI, 'a', row('a', 2), created=True)
+
+        assert ids(cache.get(KEY)) == ['b', 'a', 'c']
+        assert cache.get(KEY)['total'] == 3
+
+    def test_annotation_changed_orders_ascending(self, cache):
+        key = KEY._replace(order='asc')
+        cache.put(key, payload(total=2, rows=[row('b', 1), row('c', 3)]))
+
+        cache.annotation_changed(URI, 'a', row('a', 2), created=True)
+
+        assert ids(cache.get(key)) == ['b', 'a', 'c']
+
+    def test_annotation_changed_pushes_rows_off_full_pages(self, cache):
+        key = KEY._replace(limit=2)
+        cache.put(key, payload(total=2,
+                               rows=[row('b', 3), row('c', 1)],
+                               replies=[reply('r', 'c')]))
+
+        cache.annotation_changed(URI, 'a', row('a', 4), created=True)
+
+        assert ids(cache.get(key)) == ['a', 'b']
+        assert cache.get(key)['total'] == 3
+        assert cache.get(key)['replies'] == []
+
+    def test_annotation_changed_counts_new_annotations_on_later_pages(self,
+                                                                      cache):
+        key = KEY._replace(limit=2)
+        cache.put(key, payload(total=5, rows=[row('b', 3), row('c', 2)]))
+
+        cache.annotation_changed(URI, 'a', row('a', 1), created=True)
+
+        assert ids(cache.get(key)) == ['b', 'c']
+        assert cache.get(key)['total'] == 6
+
+    def test_annotation_changed_ignores_new_private_annotations(self, cache):
+        cache.put(KEY, payload(total=1, rows=[row('b', 3)]))
+
+        cache.annotation_changed(URI, 'a', None, created=True)
+
+        assert cache.get(KEY) == payload(total=1, rows=[row('b', 3)])
+
+    def test_annotation_changed_replaces_updated_annotations(self, cache):
+        cache.put(KEY, payload(total=2, rows=[row('a', 3), row('b', 2)]))
+        updated = row('b', 4, text='new')
+
+        cache.annotation_changed(URI, 'b', updated)
+
+        assert cache.get(KEY)['rows'] == [updated, row('a', 3)]
+        assert cache.get(KEY)['total'] == 2
+
+    def test_annotation_changed_removes_deleted_annotations(self, cache):
+        cache.put(KEY, payload(total=2,
+                               rows=[row('a', 3), row('b', 2)],
+                               replies=[reply('r', 'b')]))
+
+        cache.annotation_changed(URI, 'b', None)
+
+        assert ids(cache.get(KEY)) == ['a']
+        assert cache.get(KEY)['total'] == 1
+        assert cache.get(KEY)['replies'] == []
+
+    def test_annotation_changed_drops_pages_it_cannot_patch(self, cache):
+        key = KEY._replace(limit=2)
+        cache.put(key, payload(total=5, rows=[row('a', 3), row('b', 2)]))
+
+        # Removing a row from a full page would bring in one from the next.
+        cache.annotation_changed(URI, 'b', None)
+
+        assert cache.get(key) is None
+        assert cache.stats['invalidations'] == 1
+
+    def test_annotation_changed_drops_pages_when_annotations_become_public(
+            self, cache):
+        cache.put(KEY, payload(total=1, rows=[row('a', 3)]))
+
+        cache.annotation_changed(URI, 'b', row('b', 4))
+
+        assert cache.get(KEY) is None
+
+    def test_annotation_changed_adds_replies(self, cache):
+        cache.put(KEY, payload(total=1, rows=[row('a', 3)]))
+        new_reply = reply('r', 'a')
+
+        cache.annotation_changed(URI, 'r', new_reply, reply=True, created=True)
+
+        assert cache.get(KEY)['replies'] == [new_reply]
+        assert cache.get(KEY)['total'] == 1
+
+    def test_annotation_changed_ignores_replies_to_other_annotations(self,
+                                                                     cache):
+        cache.put(KEY, payload(total=1, rows=[row('a', 3)]))
+
+        cache.annotation_changed(URI, 'r', reply('r', 'x'), reply=True,
+                                 created=True)
+
+        assert cache.get(KEY)['replies'] == []
+
+    def test_annotation_changed_removes_deleted_replies(self, cache):
+        cache.put(KEY, payload(total=1, rows=[row('a', 3)],
+                               replies=[reply('r', 'a')]))
+
+        cache.annotation_changed(URI, 'r', None, reply=True)
+
+        assert cache.get(KEY)['replies'] == []
+
+    def test_annotation_changed_patches_every_page_of_the_uri(self, cache):
+        other = KEY._replace(sort='created')
+        cache.put(KEY, payload())
+        cache.put(other, payload())
+
+        cache.annotation_changed(URI, 'a', row('a', 1), created=True)
+
+        assert ids(cache.get(KEY)) == ['a']
+        assert ids(cache.get(other)) == ['a']
+        assert cache.stats['patches'] == 2
+
+    def test_annotation_changed_ignores_other_uris(self, cache):
+        cache.put(KEY, payload())
+
+        cache.annotation_changed('httpx://example.net', 'a', row('a', 1),
+                                 created=True)
+
+        assert cache.get(KEY) == payload()
+
+    def test_annotation_changed_does_not_modify_cached_payloads(self, cache):
+        original = payload(total=1, rows=[row('b', 3)])
+        cache.put(KEY, original)
+
+        cache.annotation_changed(URI, 'a', row('a', 1), created=True)
+
+        assert original == payload(total=1, rows=[row('b', 3)])
+
+
+@pytest.mark.usefixtures('links_service')
+class TestUpdateSidebarCache(object):
+
+    def test_it_adds_new_public_annotations(self, cache, factories,
+                                            pyramid_request):
+        ann = factories.Annotation(target_uri='http://example.com/',
+                                   shared=True, groupid='__world__')
+        cache.put(KEY, payload())
+
+        sidebar.update_sidebar_cache(event(pyramid_request, ann.id, 'create'))
+
+        assert ids(cache.get(KEY)) == [ann.id]
+
+    def test_it_ignores_new_group_annotations(self, cache, factories,
+                                              pyramid_request):
+        ann = factories.Annotation(target_uri='http://example.com/',
+                                   shared=True, groupid='rebels')
+        cache.put(KEY, payload())
+
+        sidebar.update_sidebar_cache(event(pyramid_request, ann.id, 'create'))
+
+        assert cache.get(KEY) == payload()
+
+    def test_it_ignores_annotations_hidden_by_transform_subscribers(
+            self, cache, factories, pyramid_config, pyramid_request):
+        def flag(event):
+            event.annotation_dict['nipsa'] = True
+        pyramid_config.add_subscriber(flag,
+                                      'memex.events.AnnotationTransformEvent')
+        ann = factories.Annotation(target_uri='http://example.com/',
+                                   shared=True, groupid='__world__')
+        cache.put(KEY, payload())
+
+        sidebar.update_sidebar_cache(event(pyramid_request, ann.id, 'create'))
+
+        assert cache.get(KEY) == payload()
+
+    def test_it_removes_deleted_annotations(self, cache, pyramid_request):
+        cache.put(KEY, payload(total=1, rows=[row('a', 1)]))
+
+        sidebar.update_sidebar_cache(event(
+            pyramid_request, 'a', 'delete',
+            annotation_dict={'id': 'a', 'uri': 'http://example.com/'}))
+
+        assert cache.get(KEY) == payload()
+
+    def test_it_removes_moved_annotations_from_their_old_uri(
+            self, cache, db_session, factories, pyramid_request):
+        ann = factories.Annotation(target_uri='http://example.com/',
+                                   shared=True, groupid='__world__')
+        cache.put(KEY, payload(total=1, rows=[row(ann.id, 1)]))
+        ann.target_uri = 'http://example.org/'
+        db_session.flush()
+
+        sidebar.update_sidebar_cache(event(pyramid_request, ann.id, 'update'))
+
+        assert cache.get(KEY) == payload()
+        assert db_session.info[sidebar.MOVED_URIS_KEY] == {}
+
+    def test_it_does_nothing_without_a_cache(self, pyramid_request):
+        pyramid_request.registry.pop(sidebar.CACHE_KEY, None)
+
+        sidebar.update_sidebar_cache(event(pyramid_request, 'a', 'create'))
+
+    @pytest.fixture
+    def cache(self, cache, pyramid_request):
+        pyramid_request.registry[sidebar.CACHE_KEY] = cache
+        yield cache
+        pyramid_request.registry.pop(sidebar.CACHE_KEY, None)
+
+    @pytest.fixture
+    def links_service(self, pyramid_config):
+        service = mock.Mock(spec_set=['get', 'get_all', 'compile'])
+        service.get.return_value = 'http://example.com/link'
+        service.get_all.return_value = {}
+        # Compiled links behave just like the service itself.
+        service.compile.return_value = service
+        pyramid_config.register_service(service, name='links')
+        return service
+
+
+class TestIncludeme(object):
+
+    def test_it_disables_the_cache_by_default(self, pyramid_config):
+        sidebar.includeme(pyramid_config)
+
+        assert sidebar.get_cache(pyramid_config.registry) is None
+
+    def test_it_enables_the_cache_with_the_setting(self, pyramid_config):
+        pyramid_config.registry.settings['memex.sidebar_cache'] = 'true'
+
+        sidebar.includeme(pyramid_config)
+
+        assert isinstance(sidebar.get_cache(pyramid_config.registry),
+                          SidebarCache)
+
+
+URI = 'httpx://example.com'
+KEY = SidebarKey(uris=frozenset([URI]), limit=20, sort='updated', order='desc')
+
+
+def row(id_, updated, **kwargs):
+    timestamp = '2016-10-0{}T12:00:00+00:00'.format(updated)
+    row = {'id': id_, 'created': timestamp, 'updated': timestamp}
+    row.update(kwargs)
+    return row
+
+
+def reply(id_, parent):
+    return {'id': id_, 'updated': '2016-10-01T12:00:00+00:00',
+            'references': [parent]}
+
+
+def payload(total=0, rows=None, replies=None):
+    return {'total': total, 'rows': rows or [], 'replies': replies or []}
+
+
+def ids(payload):
+    return [r['id'] for r in payload['rows']]
+
+
+def event(request, annotation_id, action, annotation_dict=None):
+    return mock.Mock(request=request,
+                     annotation_id=annotation_id,
+                     action=action,
+                     annotation_dict=annotation_dict)
+
+
+@pytest.fixture
+def cache():
+    return SidebarCache()
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import threading
+
+import pytest
+
+from memex.singleflight import SingleFlight
+
+
+class Interrupted(BaseException):
+    pass
+
+
+class TestSingleFlight(object):
+
+    def test_do_returns_the_result_of_the_call(self, flight):
+        assert flight.do('key', lambda: 42) == (42, False)
+
+    def test_do_raises_the_exception_of_the_call(self, flight):
+        def fail():
+            raise ValueError('boom')
+
+        with pytest.raises(ValueError):
+            flight.do('key', fail)
+
+    def test_do_does_not_cache_results(self, flight):
+        results = iter([1, 2])
+
+        flight.do('key', lambda: next(results))
+
+        assert flight.do('key', lambda: next(results)) == (2, False)
+        assert flight.stats == {'executions': 2, 'coalesced': 0}
+
+    def test_concurrent_calls_share_a_result(self, flight, in_flight):
+        calls = []
+
+        def fn():
+            calls.append(1)
+            return 'result'
+
+        leader = in_flight('key', fn)
+        followers = [in_flight.follow('key', fn) for _ in range(3)]
+        in_flight.release()
+
+        assert leader.join() == ('result', False)
+        assert [f.join() for f in followers] == [('result', True)] * 3
+        assert len(calls) == 1
+        assert flight.stats == {'executions': 1, 'coalesced': 3}
+
+    def test_concurrent_calls_with_other_keys_are_not_coalesced(self, flight,
+                                                                 in_flight):
+        leader = in_flight('key', lambda: 'result')
+
+        assert flight.do('other', lambda: 'other') == ('other', False)
+
+        in_flight.release()
+        leader.join()
+
+    def test_concurrent_calls_share_an_exception(self, flight, in_flight):
+        def fail():
+            raise ValueError('boom')
+
+        leader = in_flight('key', fail)
+        follower = in_flight.follow('key', fail)
+        in_flight.release()
+
+        assert isinstance(leader.join(), ValueError)
+        assert isinstance(follower.join(), ValueError)
+
+    def test_followers_do_the_work_if_the_call_is_interrupted(self, flight,
+                                                              in_flight):
+        def interrupt():
+            raise Interrupted()
+
+        leader = in_flight('key', interrupt)
+        follower = in_flight.follow('key', lambda: 'result')
+        in_flight.release()
+
+        assert isinstance(leader.join(), Interrupted)
+        assert follower.join() == ('result', False)
+
+    @pytest.fixture
+    def flight(self):
+        return SingleFlight()
+
+    @pytest.fixture
+    def in_flight(self, flight):
+        return InFlight(flight)
+
+
+class Caller(threading.Thread):
+
+    """Calls ``flight.do`` in a thread, capturing the result or exception."""
+
+    def __init__(self, flight, key, fn):
+        super(Caller, self).__init__()
+        self.daemon = True
+        self.flight = flight
+        self.key = key
+        self.fn = fn
+        self.outcome = None
+
+    def run(self):
+        try:
+            self.outcome = self.flight.do(self.key, self.fn)
+        except BaseException as exc:
+            self.outcome = exc
+
+    def join(self):
+        super(Caller, self).join(5)
+        assert not self.is_alive()
+        return self.outcome
+
+
+class InFlight(object):
+
+    """Starts calls which stay in flight until released."""
+
+    def __init__(self, flight):
+        self.flight = flight
+        self.started = threading.Event()
+        self.released = threading.Event()
+
+    def __call__(self, key, fn):
+        def held():
+            self.started.set()
+            self.released.wait(5)
+            return fn()
+
+        caller = Caller(self.flight, key, held)
+        caller.start()
+        self.started.wait(5)
+        return caller
+
+    def follow(self, key, fn):
+        """Start a call which waits on the call in flight."""
+        coalesced = self.flight.coalesced
+        caller = Caller(self.flight, key, fn)
+        caller.start()
+        while self.flight.coalesced == coalesced:
+            threading.Event().wait(0.001)
+        return caller
+
+    def release(self):
+        self.released.set()
@@ -61,6 +61,42 @@ class TestFetchOrderedAnnotations(object):
                                                             query_processor=only_maria)
 
 
+class TestReadableBy(object):
+
+    def test_it_matches_annotations_the_principals_may_read(self, db_session):
+        public = Annotation(userid='leia', shared=True, groupid='__world__')
+        in_group = Annotation(userid='leia', shared=True, groupid='rebels')
+        own = Annotation(userid='luke', shared=False, groupid='empire')
+        db_session.add_all([
+            public,
+            in_group,
+            own,
+            Annotation(userid='leia', shared=True, groupid='empire'),
+            Annotation(userid='leia', shared=False, groupid='rebels'),
+        ])
+        db_session.flush()
+        principals = ['system.Everyone', 'system.Authenticated', 'luke',
+                      'group:rebels']
+
+        result = db_session.query(Annotation).filter(
+            storage.readable_by(principals))
+
+        assert set(result) == {public, in_group, own}
+
+    def test_it_matches_public_annotations_for_anonymous_readers(self, db_session):
+        public = Annotation(userid='leia', shared=True, groupid='__world__')
+        db_session.add_all([
+            public,
+            Annotation(userid='leia', shared=False, groupid='__world__'),
+        ])
+        db_session.flush()
+
+        result = db_session.query(Annotation).filter(
+            storage.readable_by(['system.Everyone']))
+
+        assert result.all() == [public]
+
+
 class TestExpandURI(object):
 
     def test_expand_uri_no_document(self, db_session):
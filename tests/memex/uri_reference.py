@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+"""
+The original implementation of :py:func:`memex.uri.normalize`.
+
+This is kept, unchanged, so that the optimised implementation can be checked
+to give identical results.
+"""
+
+import re
+
+from memex._compat import text_type
+from memex._compat import urlparse
+from memex._compat import url_quote, url_quote_plus
+from memex._compat import url_unquote, url_unquote_plus
+from memex.uri import BLACKLISTED_QUERY_PARAMS
+from memex.uri import UNRESERVED_PATHSEGMENT
+from memex.uri import UNRESERVED_QUERY_NAME
+from memex.uri import UNRESERVED_QUERY_VALUE
+from memex.uri import URL_SCHEMES
+from memex.uri import VIA_PREFIX
+
+
+def normalize(uristr):
+    """Translate the given URI into a normalized form."""
+    uristr = uristr.encode('utf-8')
+
+    # Strip proxy prefix for proxied URLs
+    for scheme in URL_SCHEMES:
+        if uristr.startswith(VIA_PREFIX + scheme + ':'):
+            uristr = uristr[len(VIA_PREFIX):]
+            break
+
+    # Try to extract the scheme
+    uri = urlparse.urlsplit(uristr)
+
+    # If this isn't a URL, we don't perform any normalization
+    if uri.scheme.lower() not in URL_SCHEMES:
+        return text_type(uristr, 'utf-8')
+
+    # Don't perform normalization on URLs with no hostname.
+    if uri.hostname is None:
+        return text_type(uristr, 'utf-8')
+
+    scheme = _normalize_scheme(uri)
+    netloc = _normalize_netloc(uri)
+    path = _normalize_path(uri)
+    query = _normalize_query(uri)
+    fragment = None
+
+    uri = urlparse.SplitResult(scheme, netloc, path, query, fragment)
+
+    return text_type(uri.geturl(), 'utf-8')
+
+
+def _normalize_scheme(uri):
+    scheme = uri.scheme
+
+    if scheme in URL_SCHEMES:
+        scheme = 'httpx'
+
+    return scheme
+
+
+def _normalize_netloc(uri):
+    netloc = uri.netloc
+    ipv6_hostname = '[' in netloc and ']' in netloc
+
+    username = uri.username
+    password = uri.password
+    hostname = uri.hostname
+    port = uri.port
+
+    # Normalise hostname to lower case
+    hostname = hostname.lower()
+
+    # Remove port if default for the scheme
+    if uri.scheme == 'http' and port == 80:
+        port = None
+    elif uri.scheme == 'https' and port == 443:
+        port = None
+
+    # Put it all back together again...
+    userinfo = None
+    if username is not None:
+        userinfo = username
+    if password is not None:
+        userinfo += ':' + password
+
+    if ipv6_hostname:
+        hostname = '[' + hostname + ']'
+
+    hostinfo = hostname
+    if port is not None:
+        hostinfo += ':' + str(port)
+
+    if userinfo is not None:
+        netloc = '@'.join([userinfo, hostinfo])
+    else:
+        netloc = hostinfo
+
+    return netloc
+
+
+def _normalize_path(uri):
+    path = uri.path
+
+    while path.endswith('/'):
+        path = path[:-1]
+
+    segments = path.split('/')
+    segments = [_normalize_pathsegment(s) for s in segments]
+    path = '/'.join(segments)
+
+    return path
+
+
+def _normalize_pathsegment(segment):
+    return url_quote(url_unquote(segment), safe=UNRESERVED_PATHSEGMENT)
+
+
+def _normalize_query(uri):
+    query = uri.query
+
+    try:
+        items = urlparse.parse_qsl(query, keep_blank_values=True, strict_parsing=True)
+    except ValueError:
+        # If we can't parse the query string, we better preserve it as it was.
+        return query
+
+    # Python sorts are stable, so preserving relative ordering of items with
+    # the same key doesn't require any work from us
+    items = sorted(items, key=lambda x: x[0])
+
+    # Remove query params that are blacklisted
+    items = [i for i in items if not _blacklisted_query_param(i[0])]
+
+    # Normalise percent-encoding for query items
+    query = _normalize_queryitems(items)
+
+    return query
+
+
+def _normalize_queryitems(items):
+    segments = ['='.join([_normalize_queryname(i[0]),
+                          _normalize_queryvalue(i[1])]) for i in items]
+    return '&'.join(segments)
+
+
+def _normalize_queryname(name):
+    return url_quote_plus(url_unquote_plus(name), safe=UNRESERVED_QUERY_NAME)
+
+
+def _normalize_queryvalue(value):
+    return url_quote_plus(url_unquote_plus(value), safe=UNRESERVED_QUERY_VALUE)
+
+
+def _blacklisted_query_param(s):
+    """Return True if the given string matches any BLACKLISTED_QUERY_PARAMS."""
+    return any(re.match(patt, s) for patt in BLACKLISTED_QUERY_PARAMS)
@@ -2,11 +2,15 @@
 
 from __future__ import unicode_literals
 
+from hypothesis import strategies as st
+from hypothesis import given, settings
 import pytest
 
 from memex import uri
 from memex._compat import text_type
 
+from .uri_reference import normalize as reference_normalize
+
 TEST_URLS = [
     # Should replace http and https protocol with httpx
     ("https://example.org", "httpx://example.org"),
@@ -177,3 +181,62 @@ def test_normalize(url_in, url_out):
 @pytest.mark.parametrize("url,_", TEST_URLS)
 def test_normalize_returns_unicode(url, _):
     assert isinstance(uri.normalize(url), text_type)
+
+
+@pytest.mark.parametrize("url,_", TEST_URLS)
+def test_normalize_returns_cached_result(url, _):
+    first = uri.normalize(url)
+
+    assert uri.normalize(url) is first
+
+
+def test_normalize_does_not_cache_very_long_uris():
+    url = 'http://example.com/' + 'a' * uri.NORMALIZE_CACHE_MAX_LENGTH
+
+    assert uri.normalize(url) is not uri.normalize(url)
+
+
+@pytest.mark.parametrize("url,_", TEST_URLS)
+def test_normalize_matches_reference_implementation(url, _):
+    assert uri._normalize(url) == reference_normalize(url)
+
+
+_via_prefix = st.sampled_from(['', '', uri.VIA_PREFIX])
+_scheme = st.sampled_from(['http', 'https', 'HTTP', 'HtTpS', 'httpx', 'ftp',
+                           'urn', 'file', 'h1', ''])
+_separator = st.sampled_from(['://', '://', ':', ':///', '//', ''])
+_userinfo = st.sampled_from(['', '', 'alice@', 'Bob:S3cret@', ':@'])
+_host = st.sampled_from(['example.com', 'EXAMPLE.com', 'a.b-c.org',
+                         '[fe80::3e15:c2ff:fed6:d198]', '127.0.0.1', '',
+                         'xn--n3h.example', 'ex_ample.com'])
+_port = st.sampled_from(['', '', ':80', ':443', ':8080', ':', ':0'])
+_fragment = st.sampled_from(['', '#', '#foo', '#!/bar?x=1'])
+_chars = st.text(
+    alphabet=st.sampled_from(list("aZ09-._~:@!$&'()*+,;=%/?[] \t") +
+                             ['%2F', '%7E', '%e2%99%a5', '%zz', '%',
+                              '\u2603', '\u0643', '\n']),
+    max_size=12)
+_param_name = st.one_of(_chars, st.sampled_from(['gclid', 'utm_source',
+                                                 'utm_term', 'WT.mc_id',
+                                                 'WT.', 'gclid_x', 'a', 'b']))
+_query = st.one_of(
+    st.just(''),
+    st.lists(st.tuples(_param_name, _chars), max_size=5).map(
+        lambda items: '?' + '&'.join('='.join(i) for i in items)),
+    _chars.map(lambda q: '?' + q))
+_url = st.builds(lambda *parts: ''.join(parts),
+                 _via_prefix, _scheme, _separator, _userinfo, _host, _port,
+                 st.lists(_chars, max_size=4).map('/'.join),
+                 _query, _fragment)
+
+
+@settings(max_examples=2000)
+@given(st.one_of(_url, st.text()))
+def test_normalize_matches_reference_implementation_on_random_urls(url):
+    try:
+        expected = reference_normalize(url)
+    except Exception as e:
+        with pytest.raises(type(e)):
+            uri._normalize(url)
+    else:
+        assert uri._normalize(url) == expected
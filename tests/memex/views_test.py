@@ -2,11 +2,15 @@
 
 import mock
 import pytest
+import sqlalchemy
 
+from pyramid import security
 from pyramid import testing
+from webob.multidict import MultiDict
 
 from memex import models
 from memex import presenters
+from memex import sidebar
 from memex import views
 from memex.schemas import ValidationError
 from memex.search.core import SearchResult
@@ -132,6 +136,107 @@ class TestSearch(object):
 
         assert views.search(pyramid_request) == expected
 
+    def test_it_renders_only_the_requested_fields(self, pyramid_request, search_run):
+        ann = models.Annotation(userid='luke', text='Hello', extra={'foo': 'bar'})
+        pyramid_request.db.add(ann)
+        pyramid_request.db.flush()
+        pyramid_request.db.expunge_all()
+        search_run.return_value = SearchResult(1, [ann.id], [], {})
+        pyramid_request.params = {'fields': 'user,foo'}
+
+        statements = []
+        conn = pyramid_request.db.get_bind()
+
+        @sqlalchemy.event.listens_for(conn, 'before_cursor_execute')
+        def record(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        result = views.search(pyramid_request)
+        sqlalchemy.event.remove(conn, 'before_cursor_execute', record)
+
+        assert result['rows'] == [{'id': ann.id, 'user': 'luke', 'foo': 'bar'}]
+        assert len(statements) == 1
+        assert 'annotation.text' not in statements[0]
+        assert 'annotation.target_selectors' not in statements[0]
+
+    def test_it_does_not_search_by_fields(self, pyramid_request, search_lib):
+        pyramid_request.params = {'fields': 'id', 'user': 'luke'}
+
+        views.search(pyramid_request)
+
+        search_lib.Search.return_value.run.assert_called_once_with({'user': 'luke'})
+
+    def test_it_renders_rows_and_replies_as_a_list_for_ndjson(self,
+                                                             links_service,
+                                                             pyramid_request,
+                                                             search_run):
+        ann = models.Annotation(userid='luke')
+        pyramid_request.db.add(ann)
+        pyramid_request.db.flush()
+        reply = models.Annotation(userid='sarah', references=[ann.id])
+        pyramid_request.db.add(reply)
+        pyramid_request.db.flush()
+        search_run.return_value = SearchResult(7, [ann.id], [reply.id], {})
+        pyramid_request.params = {'_separate_replies': '1'}
+        pyramid_request.headers['Accept'] = 'application/x-ndjson'
+
+        result = views.search(pyramid_request)
+
+        assert result == [
+            presenters.AnnotationJSONPresenter(ann, links_service).asdict(),
+            presenters.AnnotationJSONPresenter(reply, links_service).asdict(),
+        ]
+        assert pyramid_request.response.headers['X-Total-Count'] == '7'
+
+    def test_it_returns_cached_sidebar_responses(self, pyramid_request,
+                                                 search_lib, sidebar_cache):
+        pyramid_request.params = {'uri': 'http://example.com/',
+                                  '_separate_replies': 'true'}
+        sidebar_cache.get.return_value = {'total': 1,
+                                          'rows': [{'id': 'a'}],
+                                          'replies': [{'id': 'r'}]}
+
+        result = views.search(pyramid_request)
+
+        sidebar_cache.key.assert_called_once_with(pyramid_request,
+                                                  pyramid_request.params)
+        sidebar_cache.get.assert_called_once_with(sidebar_cache.key.return_value)
+        assert result == {'total': 1,
+                          'rows': [{'id': 'a'}],
+                          'replies': [{'id': 'r'}]}
+        assert not search_lib.Search.called
+
+    def test_it_caches_sidebar_responses(self, pyramid_request, search_run,
+                                         sidebar_cache):
+        pyramid_request.params = {'uri': 'http://example.com/',
+                                  '_separate_replies': 'true'}
+        sidebar_cache.get.return_value = None
+        search_run.return_value = SearchResult(0, [], [], {})
+
+        result = views.search(pyramid_request)
+
+        sidebar_cache.put.assert_called_once_with(
+            sidebar_cache.key.return_value,
+            {'total': 0, 'rows': [], 'replies': []})
+        assert result == {'total': 0, 'rows': [], 'replies': []}
+
+    def test_it_does_not_cache_other_searches(self, pyramid_request, search_run,
+                                              sidebar_cache):
+        sidebar_cache.key.return_value = None
+        search_run.return_value = SearchResult(0, [], [], {})
+
+        views.search(pyramid_request)
+
+        assert not sidebar_cache.get.called
+        assert not sidebar_cache.put.called
+
+    @pytest.fixture
+    def sidebar_cache(self, pyramid_request):
+        cache = mock.Mock(spec_set=['key', 'get', 'put'])
+        pyramid_request.registry[sidebar.CACHE_KEY] = cache
+        yield cache
+        del pyramid_request.registry[sidebar.CACHE_KEY]
+
     @pytest.fixture
     def search_lib(self, patch):
         return patch('memex.views.search_lib')
@@ -145,9 +250,94 @@ class TestSearch(object):
         return patch('memex.views.storage')
 
 
+@pytest.mark.usefixtures('links_service', 'uri_equivalence')
+class TestExport(object):
+
+    def test_it_exports_the_matching_readable_annotations(self,
+                                                          pyramid_config,
+                                                          pyramid_request,
+                                                          export_lib):
+        pyramid_config.testing_securitypolicy('acct:luke@example.com',
+                                              groupids=['group:rebels'])
+        pyramid_request.params = {'user': 'acct:luke@example.com',
+                                  'group': 'rebels'}
+
+        views.export(pyramid_request)
+
+        export_lib.get_filters.assert_called_once_with(pyramid_request)
+        export_lib.Export.assert_called_once_with(
+            user='acct:luke@example.com',
+            group='rebels',
+            uris=None,
+            principals=[security.Everyone,
+                        security.Authenticated,
+                        'acct:luke@example.com',
+                        'group:rebels'],
+            filters=export_lib.get_filters.return_value)
+
+    def test_it_expands_uris(self, pyramid_request, export_lib, uri_equivalence):
+        pyramid_request.params = MultiDict([('uri', 'http://example.com/'),
+                                            ('uri', 'http://example.org/')])
+        uri_equivalence.expand_normalized.side_effect = lambda _, u: {u + 'x'}
+
+        views.export(pyramid_request)
+
+        _, kwargs = export_lib.Export.call_args
+        assert kwargs['uris'] == {'http://example.com/x', 'http://example.org/x'}
+
+    def test_it_streams_ndjson(self, pyramid_request, export_lib):
+        pyramid_request.params = {'group': 'rebels'}
+        export_lib.stream.return_value = (a for a in [{'id': 'a'}, {'id': 'b'}])
+
+        response = views.export(pyramid_request)
+
+        assert response.content_type == 'application/x-ndjson'
+        assert b''.join(response.app_iter) == b'{"id": "a"}\n{"id": "b"}\n'
+
+    def test_it_streams_jsonld(self, pyramid_request, export_lib):
+        pyramid_request.params = {'group': 'rebels', 'format': 'jsonld'}
+        export_lib.stream.return_value = (a for a in [{'id': 'a'}, {'id': 'b'}])
+
+        response = views.export(pyramid_request)
+
+        assert response.content_type == 'application/ld+json'
+        assert b''.join(response.app_iter) == b'[{"id": "a"}, {"id": "b"}]'
+        _, _, _, format_ = export_lib.stream.call_args[0]
+        assert format_ == 'jsonld'
+
+    def test_it_raises_for_unknown_formats(self, pyramid_request):
+        pyramid_request.params = {'group': 'rebels', 'format': 'csv'}
+
+        with pytest.raises(views.APIError) as exc:
+            views.export(pyramid_request)
+
+        assert exc.value.status_code == 400
+
+    def test_it_raises_if_the_export_is_unrestricted(self, pyramid_request):
+        with pytest.raises(views.APIError) as exc:
+            views.export(pyramid_request)
+
+        assert exc.value.status_code == 400
+
+    @pytest.fixture
+    def export_lib(self, patch):
+        export_lib = patch('memex.views.export_lib')
+        export_lib.FORMAT_JSON = 'json'
+        export_lib.FORMAT_JSONLD = 'jsonld'
+        export_lib.FORMATS = ('json', 'jsonld')
+        return export_lib
+
+    @pytest.fixture
+    def uri_equivalence(self, pyramid_config):
+        service = mock.Mock(spec_set=['expand_normalized'])
+        pyramid_config.register_service(service, name='uri_equivalence')
+        return service
+
+
 @pytest.mark.usefixtures('AnnotationEvent',
                          'AnnotationJSONPresenter',
                          'links_service',
+                         'presentation',
                          'schemas',
                          'storage')
 class TestCreate(object):
@@ -205,16 +395,18 @@ class TestCreate(object):
 
         assert exc.value.message == 'asplode'
 
-    def test_it_inits_AnnotationJSONPresenter(self,
-                                              AnnotationJSONPresenter,
-                                              links_service,
-                                              pyramid_request,
-                                              storage):
+    def test_it_presents_the_annotation(self,
+                                        links_service,
+                                        presentation,
+                                        pyramid_request,
+                                        storage):
         views.create(pyramid_request)
 
-        AnnotationJSONPresenter.assert_called_once_with(
-            storage.create_annotation.return_value,
-            links_service)
+        presentation.present_json.assert_called_once_with(
+            pyramid_request.registry,
+            [storage.create_annotation.return_value],
+            links_service,
+            stats=mock.ANY)
 
     def test_it_publishes_annotation_event(self,
                                            AnnotationEvent,
@@ -231,13 +423,13 @@ class TestCreate(object):
             AnnotationEvent.return_value)
 
     def test_it_returns_presented_annotation(self,
-                                             AnnotationJSONPresenter,
+                                             presentation,
                                              pyramid_request):
+        presentation.present_json.return_value = [mock.sentinel.presented]
+
         result = views.create(pyramid_request)
 
-        AnnotationJSONPresenter.return_value.asdict.assert_called_once_with()
-        assert result == (
-            AnnotationJSONPresenter.return_value.asdict.return_value)
+        assert result == mock.sentinel.presented
 
     @pytest.fixture
     def pyramid_request(self, pyramid_request):
@@ -246,27 +438,129 @@ class TestCreate(object):
         return pyramid_request
 
 
-@pytest.mark.usefixtures('AnnotationJSONPresenter', 'links_service')
+@pytest.mark.usefixtures('AnnotationJSONPresenter',
+                         'conditional',
+                         'links_service',
+                         'presentation')
 class TestRead(object):
 
+    def test_it_returns_not_modified_if_the_client_copy_is_current(self,
+                                                                  AnnotationJSONPresenter,
+                                                                  conditional,
+                                                                  pyramid_request):
+        annotation = mock.Mock()
+        conditional.not_modified.return_value = mock.sentinel.not_modified
+
+        result = views.read(annotation, pyramid_request)
+
+        conditional.annotation_validators.assert_called_once_with(annotation)
+        conditional.not_modified.assert_called_once_with(
+            pyramid_request, conditional.annotation_validators.return_value)
+        assert result == conditional.not_modified.return_value
+        assert not AnnotationJSONPresenter.called
+
     def test_it_returns_presented_annotation(self,
-                                             AnnotationJSONPresenter,
                                              links_service,
+                                             presentation,
                                              pyramid_request):
         annotation = mock.Mock()
-        presenter = mock.Mock()
-        AnnotationJSONPresenter.return_value = presenter
+        presentation.present_json.return_value = [mock.sentinel.presented]
 
         result = views.read(annotation, pyramid_request)
 
-        AnnotationJSONPresenter.assert_called_once_with(annotation,
-                                                        links_service)
-        assert result == presenter.asdict()
+        presentation.present_json.assert_called_once_with(
+            pyramid_request.registry, [annotation], links_service,
+            stats=mock.ANY)
+        assert result == mock.sentinel.presented
+
+    def test_it_presents_only_the_requested_fields(self,
+                                                   AnnotationJSONPresenter,
+                                                   links_service,
+                                                   pyramid_request):
+        annotation = mock.Mock()
+        pyramid_request.params = {'fields': 'id, updated,text'}
+
+        views.read(annotation, pyramid_request)
+
+        AnnotationJSONPresenter.assert_called_once_with(
+            annotation, links_service, fields=['id', 'updated', 'text'])
+
+
+@pytest.mark.usefixtures('links_service')
+class TestReadMany(object):
+
+    def test_it_returns_the_annotations_in_the_order_requested(self,
+                                                               links_service,
+                                                               pyramid_request):
+        anns = [models.Annotation(userid='luke', shared=True, groupid='__world__')
+                for _ in range(3)]
+        pyramid_request.db.add_all(anns)
+        pyramid_request.db.flush()
+        pyramid_request.params = MultiDict([('id', anns[2].id),
+                                            ('id', anns[0].id)])
+
+        result = views.read_many(pyramid_request)
+
+        assert result == {
+            'total': 2,
+            'rows': [
+                presenters.AnnotationJSONPresenter(anns[2], links_service).asdict(),
+                presenters.AnnotationJSONPresenter(anns[0], links_service).asdict(),
+            ]
+        }
+
+    def test_it_omits_annotations_the_user_may_not_read(self,
+                                                        pyramid_config,
+                                                        pyramid_request):
+        pyramid_config.testing_securitypolicy('acct:luke@example.com')
+        own = models.Annotation(userid='acct:luke@example.com', shared=False)
+        other = models.Annotation(userid='acct:leia@example.com', shared=False)
+        pyramid_request.db.add_all([own, other])
+        pyramid_request.db.flush()
+        pyramid_request.params = MultiDict([('id', own.id), ('id', other.id)])
+
+        result = views.read_many(pyramid_request)
+
+        assert [r['id'] for r in result['rows']] == [own.id]
+
+    def test_it_omits_annotations_which_do_not_exist(self, pyramid_request):
+        pyramid_request.params = MultiDict([('id', 'Qe7fpc5ZRgWy0RSHEP9UNg')])
+
+        result = views.read_many(pyramid_request)
+
+        assert result == {'total': 0, 'rows': []}
 
+    @pytest.mark.parametrize('ids', [
+        [],
+        ['Qe7fpc5ZRgWy0RSHEP9UNg'] * (views.READ_MANY_LIMIT + 1),
+        ['not-an-id'],
+    ])
+    def test_it_raises_for_invalid_ids(self, pyramid_request, ids):
+        pyramid_request.params = MultiDict([('id', id_) for id_ in ids])
 
-@pytest.mark.usefixtures('AnnotationJSONLDPresenter', 'links_service')
+        with pytest.raises(views.APIError) as exc:
+            views.read_many(pyramid_request)
+
+        assert exc.value.status_code == 400
+
+
+@pytest.mark.usefixtures('AnnotationJSONLDPresenter', 'conditional', 'links_service')
 class TestReadJSONLD(object):
 
+    def test_it_returns_not_modified_if_the_client_copy_is_current(self,
+                                                                  AnnotationJSONLDPresenter,
+                                                                  conditional,
+                                                                  pyramid_request):
+        annotation = mock.Mock()
+        conditional.not_modified.return_value = mock.sentinel.not_modified
+
+        result = views.read_jsonld(annotation, pyramid_request)
+
+        conditional.not_modified.assert_called_once_with(
+            pyramid_request, conditional.annotation_validators.return_value)
+        assert result == conditional.not_modified.return_value
+        assert not AnnotationJSONLDPresenter.called
+
     def test_it_sets_correct_content_type(self, AnnotationJSONLDPresenter, pyramid_request):
         AnnotationJSONLDPresenter.CONTEXT_URL = 'http://foo.com/context.jsonld'
 
@@ -302,6 +596,7 @@ class TestReadJSONLD(object):
 @pytest.mark.usefixtures('AnnotationEvent',
                          'AnnotationJSONPresenter',
                          'links_service',
+                         'presentation',
                          'schemas',
                          'storage')
 class TestUpdate(object):
@@ -382,31 +677,27 @@ class TestUpdate(object):
         pyramid_request.notify_after_commit.assert_called_once_with(
             AnnotationEvent.return_value)
 
-    def test_it_inits_a_presenter(self,
-                                  AnnotationJSONPresenter,
-                                  links_service,
-                                  pyramid_request,
-                                  storage):
-        views.update(mock.Mock(), pyramid_request)
-
-        AnnotationJSONPresenter.assert_any_call(
-            storage.update_annotation.return_value,
-            links_service)
-
-    def test_it_dictizes_the_presenter(self,
-                                       AnnotationJSONPresenter,
-                                       pyramid_request):
+    def test_it_presents_the_annotation(self,
+                                        links_service,
+                                        presentation,
+                                        pyramid_request,
+                                        storage):
         views.update(mock.Mock(), pyramid_request)
 
-        AnnotationJSONPresenter.return_value.asdict.assert_called_with()
+        presentation.present_json.assert_called_once_with(
+            pyramid_request.registry,
+            [storage.update_annotation.return_value],
+            links_service,
+            stats=mock.ANY)
 
     def test_it_returns_a_presented_dict(self,
-                                         AnnotationJSONPresenter,
+                                         presentation,
                                          pyramid_request):
+        presentation.present_json.return_value = [mock.sentinel.presented]
+
         returned = views.update(mock.Mock(), pyramid_request)
 
-        assert returned == (
-            AnnotationJSONPresenter.return_value.asdict.return_value)
+        assert returned == mock.sentinel.presented
 
     @pytest.fixture
     def pyramid_request(self, pyramid_request):
@@ -473,13 +764,27 @@ def AnnotationJSONPresenter(patch):
     return patch('memex.views.AnnotationJSONPresenter')
 
 
+@pytest.fixture
+def conditional(patch):
+    conditional = patch('memex.views.conditional')
+    conditional.not_modified.return_value = None
+    return conditional
+
+
 @pytest.fixture
 def links_service(pyramid_config):
-    service = mock.Mock(spec_set=['get', 'get_all'])
+    service = mock.Mock(spec_set=['get', 'get_all', 'compile'])
+    # Compiled links behave just like the service itself.
+    service.compile.return_value = service
     pyramid_config.register_service(service, name='links')
     return service
 
 
+@pytest.fixture
+def presentation(patch):
+    return patch('memex.views.presentation')
+
+
 @pytest.fixture
 def pyramid_request(pyramid_request):
     pyramid_request.notify_after_commit = mock.Mock(spec_set=[])